@@ -3,8 +3,8 @@ import json
 import logging
 import os
 
-import msal
-import requests
+from ValidateDocument.credentials import acquire_graph_token
+from ValidateDocument.graph_client import get_graph_client
 
 
 def _get_graph_token() -> str:
@@ -20,15 +20,7 @@ def _get_graph_token() -> str:
             "(or SP_TENANT_ID, SP_CLIENT_ID, SP_CLIENT_SECRET)."
         )
 
-    authority = f"https://login.microsoftonline.com/{tenant_id}"
-    app = msal.ConfidentialClientApplication(
-        client_id, authority=authority, client_credential=client_secret
-    )
-    result = app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
-
-    if "access_token" in result:
-        return result["access_token"]
-    raise Exception(f"Failed to acquire token: {result.get('error_description', result)}")
+    return acquire_graph_token(tenant_id, client_id, client_secret)
 
 
 def _get_site_id(token: str) -> str:
@@ -42,8 +34,8 @@ def _get_site_id(token: str) -> str:
     site_path = "/" + "/".join(parts[1:]) if len(parts) > 1 else ""
 
     headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-    resp = requests.get(
-        f"https://graph.microsoft.com/v1.0/sites/{hostname}:{site_path}",
+    resp = get_graph_client().get(
+        f"/sites/{hostname}:{site_path}",
         headers=headers,
     )
     resp.raise_for_status()
@@ -56,8 +48,8 @@ def _get_list_id(token: str, site_id: str) -> str:
     headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
 
     # Try by display name first
-    resp = requests.get(
-        f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists",
+    resp = get_graph_client().get(
+        f"/sites/{site_id}/lists",
         headers=headers,
         params={"$filter": f"displayName eq '{list_name}'"},
     )
@@ -77,8 +69,8 @@ def list_columns() -> list[dict]:
         site_id = _get_site_id(token)
         list_id = _get_list_id(token, site_id)
         headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-        resp = requests.get(
-            f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/columns",
+        resp = get_graph_client().get(
+            f"/sites/{site_id}/lists/{list_id}/columns",
             headers=headers,
         )
         resp.raise_for_status()
@@ -119,8 +111,8 @@ def submit_to_sharepoint(params: dict) -> str:
 
         logging.info(f"[MaceyBot SP] Creating list item: {json.dumps(item_data)}")
 
-        resp = requests.post(
-            f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items",
+        resp = get_graph_client().post(
+            f"/sites/{site_id}/lists/{list_id}/items",
             headers=headers,
             json=item_data,
         )
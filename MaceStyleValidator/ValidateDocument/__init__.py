@@ -4,28 +4,34 @@ import logging
 import json
 import os
 import base64
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 
-from .config import get_graph_token, ENABLE_FUNCTION_SHAREPOINT_WRITES
+from .config import (
+    get_graph_token, ENABLE_FUNCTION_SHAREPOINT_WRITES, MAX_FILE_SIZE_BYTES, WRITE_BACK_MODE, VALIDATOR_VERSION
+)
 from .sharepoint_client import (
-    get_site_id, fetch_validation_rules, download_file, upload_file,
-    update_validation_status, update_drive_item_fields
+    fetch_validation_rules, download_file, update_validation_status, FileTooLargeError
+)
+from .upload_session import stream_size
+from .transport import parse_validation_request, document_fields, wants_multipart, multipart_response
+from .report import generate_report, final_status as get_final_status, status_description, document_links
+from .write_back import new_job, run_write_back, submit_background, report_path
+from .core import is_supported, validate_file
+from .result_cache import (
+    get_result_cache, file_digest, rules_fingerprint, content_key, idempotency_key, IN_FLIGHT_WAIT_SECONDS,
 )
-from .report import generate_report
-from .sharepoint_results import save_validation_result, update_document_metadata
-from .word_validator import validate_word_document
-from .visio_validator import validate_visio_document
-from .excel_validator import validate_excel_document
-from .powerpoint_validator import validate_powerpoint_document
 from .access_control import check_access, get_caller_identity
+from .deadline import Deadline, current_deadline, set_current_deadline, reset_current_deadline
 from .monitoring import (
-    ValidationMetrics, generate_request_id, emit_audit_event, emit_alert, track_phase
+    ValidationMetrics, generate_request_id, emit_audit_event, emit_alert, track_phase,
+    set_current_metrics, reset_current_metrics, submit_in_context
 )
 
 
 def main(req: func.HttpRequest) -> func.HttpResponse:
     request_id = generate_request_id()
-    logging.info(f'=== STYLE VALIDATION v5.1.0-governed [{request_id}] ===')
+    logging.info(f'=== STYLE VALIDATION v{VALIDATOR_VERSION} [{request_id}] ===')
 
     # Access control (SOC 2 CC6.1)
     denied = check_access(req)
@@ -38,259 +44,190 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
         return denied
 
     caller = get_caller_identity(req)
+    metrics_token = None
+    deadline_token = None
+    cache = get_result_cache()
+    run_key = None
+    owns_run = False
 
     try:
-        # 1. Parse request
-        req_body = req.get_json()
+        # 1. Parse request (JSON with base64 fileContent, raw octet-stream or multipart/form-data)
+        req_body, file_bytes = parse_validation_request(req)
         logging.info(f"[{request_id}] Request keys: {list(req_body.keys())}")
 
-        item_id = req_body.get('itemId') or req_body.get('ID')
-        file_name = (req_body.get('fileName') or
-                     req_body.get('FileLeafRef') or
-                     req_body.get('Name'))
+        item_id, file_name, file_url = document_fields(req_body)
         file_extension = os.path.splitext(file_name)[1].lower() if file_name else ''
         file_content_base64 = req_body.get('fileContent')
-        file_url = (req_body.get('fileUrl') or
-                    req_body.get('FileRef') or
-                    req_body.get('ServerRelativeUrl') or
-                    req_body.get('fileRef'))
 
         # Initialise metrics tracking (SOC 2 CC7.2)
         metrics = ValidationMetrics(request_id=request_id, filename=file_name or "unknown", caller=caller)
         metrics.file_type = file_extension
-
-        logging.info(f"[{request_id}] File: {file_name}, ID: {item_id}, Has content: {bool(file_content_base64)}, URL: {file_url}")
-
-        # 2. Get Graph API token
-        with track_phase(metrics, "auth"):
-            token = get_graph_token()
-        metrics.sharepoint_calls += 1
-        logging.info(f'[{request_id}] Token acquired')
-
-        # 3. Update status to "Validating..." (skipped when the flow owns writes)
-        if ENABLE_FUNCTION_SHAREPOINT_WRITES:
+        # Graph calls (graph_client) record their latency into this request's metrics
+        metrics_token = set_current_metrics(metrics)
+        # Time budget (deadline.py): once it runs low, validation starts no new
+        # work and the response is a partial result rather than a timeout
+        deadline = Deadline()
+        if deadline.budget_seconds > 0:
+            deadline_token = set_current_deadline(deadline)
+
+        # Idempotency: a Power Automate retry of the same run gets the response
+        # already sent (no re-validation, no second round of SharePoint writes).
+        # While the original call is still running the retry waits for it, but
+        # no longer than its own time budget.
+        run_id = req.headers.get('x-ms-workflow-run-id')
+        if cache and run_id:
+            run_key = idempotency_key(run_id, file_name, item_id, "multipart" if wants_multipart(req) else "json")
+            budget = current_deadline()
+            wait_seconds = min(IN_FLIGHT_WAIT_SECONDS, max(budget.remaining(), 0)) if budget else IN_FLIGHT_WAIT_SECONDS
+            owns_run, replay = cache.begin(run_key, timeout=wait_seconds)
+            if replay:
+                logging.info(f"[{request_id}] Replaying response for workflow run {run_id}")
+                emit_audit_event({"event_type": "validation_replayed", "request_id": request_id,
+                                  "workflow_run_id": run_id, "filename": file_name, "caller": caller})
+                return func.HttpResponse(replay["body"], headers={"Content-Type": replay["content_type"]},
+                                         status_code=200)
+
+        logging.info(f"[{request_id}] File: {file_name}, ID: {item_id}, Has content: {bool(file_content_base64) or file_bytes is not None}, URL: {file_url}")
+
+        # Inline content over the size limit is refused before any I/O starts
+        if file_bytes is not None:
+            inline_size = len(file_bytes)
+        elif file_content_base64:
+            inline_size = len(file_content_base64) * 3 // 4 - file_content_base64[-2:].count('=')
+        else:
+            inline_size = 0
+        if inline_size > MAX_FILE_SIZE_BYTES:
+            return _too_large(metrics, FileTooLargeError(inline_size, MAX_FILE_SIZE_BYTES))
+
+        # 2-5. Pre-validation I/O, overlapped. The Style Rules fetch uses its own
+        # token and does not need the document, so it runs on a worker thread
+        # while this thread acquires the Graph token and gets the file; the
+        # "Validating..." status write goes out alongside the download.
+        prefetch = ThreadPoolExecutor(max_workers=2, thread_name_prefix="msv-prefetch")
+        wait_for_prefetch = True
+        try:
+            rules_future = submit_in_context(prefetch, _timed, metrics, "fetch_rules", fetch_validation_rules, None)
+
+            # 2. Get Graph API token
+            with track_phase(metrics, "auth"):
+                token = get_graph_token()
+            logging.info(f'[{request_id}] Token acquired')
+
+            # 3. Update status to "Validating..." (skipped when the flow owns writes)
+            if ENABLE_FUNCTION_SHAREPOINT_WRITES:
+                submit_in_context(prefetch, _set_initial_status, token, item_id)
+
+            # 5. Get file content
             try:
-                update_validation_status(token, item_id, "Validating...", None)
-            except Exception as e:
-                logging.warning(f"Could not set initial status: {e}")
-
-        # 4. Fetch validation rules
-        with track_phase(metrics, "fetch_rules"):
-            rules = fetch_validation_rules(token)
-        metrics.sharepoint_calls += 1
+                if file_bytes is not None:
+                    metrics.file_size_bytes = len(file_bytes)
+                    file_stream = BytesIO(file_bytes)
+                    logging.info(f"[{request_id}] File received as binary, size: {len(file_bytes)} bytes")
+                elif file_content_base64:
+                    file_bytes = base64.b64decode(file_content_base64)
+                    metrics.file_size_bytes = len(file_bytes)
+                    file_stream = BytesIO(file_bytes)
+                    logging.info(f"[{request_id}] File decoded from base64, size: {len(file_bytes)} bytes")
+                elif file_url:
+                    with track_phase(metrics, "download"):
+                        file_stream = download_file(token, file_url, max_bytes=MAX_FILE_SIZE_BYTES)
+                    metrics.file_size_bytes = stream_size(file_stream)
+                else:
+                    raise ValueError("Either fileContent or fileUrl must be provided")
+            except FileTooLargeError as e:
+                # Answer now: a rules fetch already running cannot be stopped,
+                # so it is left to finish on its own thread
+                wait_for_prefetch = False
+                return _too_large(metrics, e)
+
+            # 4. Validation rules (fetched concurrently above)
+            rules = rules_future.result()
+        finally:
+            prefetch.shutdown(wait=wait_for_prefetch, cancel_futures=not wait_for_prefetch)
         metrics.rules_loaded = len(rules)
         metrics.ai_rules_count = sum(1 for r in rules if r.get('use_ai', False))
         logging.info(f"[{request_id}] Loaded {len(rules)} rules ({metrics.ai_rules_count} AI)")
 
-        # 5. Get file content
-        MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
-
-        if file_content_base64:
-            file_bytes = base64.b64decode(file_content_base64)
-            metrics.file_size_bytes = len(file_bytes)
-            if len(file_bytes) > MAX_FILE_SIZE:
-                metrics.fail(f"File too large: {len(file_bytes)} bytes")
-                emit_audit_event(metrics.to_audit_entry())
-                return func.HttpResponse(
-                    json.dumps({"error": f"File too large ({len(file_bytes)} bytes). Maximum allowed is 50 MB."}),
-                    mimetype="application/json",
-                    status_code=413
-                )
-            file_stream = BytesIO(file_bytes)
-            logging.info(f"[{request_id}] File decoded from base64, size: {len(file_bytes)} bytes")
-        elif file_url:
-            with track_phase(metrics, "download"):
-                file_stream = download_file(token, file_url)
-            metrics.sharepoint_calls += 1
-        else:
-            raise ValueError("Either fileContent or fileUrl must be provided")
-
-        # 6. Validate based on file type
-        logging.info(f'[{request_id}] Validating {file_extension} document...')
-        metrics.start_phase("validation")
-
-        if file_extension in ['.docx', '.doc', '.docm', '.dotx', '.dotm']:
-            result = validate_word_document(file_stream, rules)
-            fixed_stream = BytesIO()
-            result['document'].save(fixed_stream)
-            fixed_stream.seek(0)
-
-        elif file_extension in ['.vsdx', '.vsd']:
-            result = validate_visio_document(file_stream, rules)
-            import tempfile
-            tmp_out_path = None
-            try:
-                with tempfile.NamedTemporaryFile(suffix='.vsdx', delete=False) as tmp_out:
-                    tmp_out_path = tmp_out.name
-                result['document'].save_vsdx(tmp_out_path)
-                fixed_stream = BytesIO(open(tmp_out_path, 'rb').read())
-            finally:
-                if tmp_out_path:
-                    try:
-                        os.unlink(tmp_out_path)
-                    except Exception:
-                        pass
-
-        elif file_extension in ['.xlsx', '.xls', '.xlsm']:
-            result = validate_excel_document(file_stream, rules)
-            fixed_stream = BytesIO()
-            result['document'].save(fixed_stream)
-            fixed_stream.seek(0)
-
-        elif file_extension in ['.pptx', '.ppt', '.pptm', '.potx', '.potm']:
-            result = validate_powerpoint_document(file_stream, rules)
-            fixed_stream = BytesIO()
-            result['document'].save(fixed_stream)
-            fixed_stream.seek(0)
-
-        else:
+        # 6. Validate based on file type, unless these exact bytes were already
+        # validated against the same rules (result cache)
+        if not is_supported(file_extension):
             return func.HttpResponse(
                 json.dumps({"error": f"Unsupported file type: {file_extension}"}),
                 mimetype="application/json",
                 status_code=400
             )
 
-        metrics.end_phase()
-
-        # 7. Upload fixed file if fixes were applied (skipped when the flow owns writes)
-        if file_url and result['fixes_applied'] and ENABLE_FUNCTION_SHAREPOINT_WRITES:
-            logging.info(f'[{request_id}] Uploading fixed document ({len(result["fixes_applied"])} fixes)...')
-            with track_phase(metrics, "upload_fixed"):
-                _web_url, _item_id = upload_file(token, fixed_stream, file_url)
-            metrics.sharepoint_calls += 1
-        elif result['fixes_applied'] and not ENABLE_FUNCTION_SHAREPOINT_WRITES:
-            logging.info(f'[{request_id}] Skipping fixed-file upload (flow owns writes); returning fixedFileContent')
-        elif not file_url:
-            logging.info(f'[{request_id}] Skipping upload (no file URL)')
+        result_key = cached = None
+        if cache:
+            with track_phase(metrics, "result_cache"):
+                result_key = content_key(file_digest(file_stream), rules_fingerprint(rules))
+                cached = cache.get(result_key)
+            metrics.result_cache = "hit" if cached else "miss"
+
+        if cached:
+            logging.info(f'[{request_id}] Identical document already validated against these rules; reusing result')
+            result = {'issues': cached['issues'], 'fixes_applied': cached['fixes_applied']}
+            fixed_stream = BytesIO(cached.get('fixed_bytes') or b'')
         else:
-            logging.info(f'[{request_id}] No fixes to upload')
-
-        # 8. Generate and upload report
-        # Build an absolute, browser-openable URL to the source document for the report back-link.
-        # Robust to whatever the flow sends: a full URL, a server-relative path (FileRef,
-        # /sites/<site>/...), or a site-relative path (/<lib>/...).
-        document_url = None
-        if file_url:
-            if file_url.startswith('http'):
-                document_url = file_url
-            elif file_url.startswith('/'):
-                _site = os.environ.get('SHAREPOINT_SITE_URL', '').rstrip('/')
-                _host = 'https://' + _site.split('//', 1)[-1].split('/', 1)[0] if _site else ''
-                _site_path = _site[len(_host):] if _host else ''  # e.g. /sites/MaceWayControlCentre
-                if _site_path and file_url.startswith(_site_path):
-                    document_url = _host + file_url          # already server-relative incl. /sites/<site>
-                elif _site:
-                    document_url = _site + file_url          # site-relative (no /sites/<site> prefix)
-        # Library = the document's parent folder
-        library_url = document_url.rsplit('/', 1)[0] if document_url else None
+            logging.info(f'[{request_id}] Validating {file_extension} document...')
+            metrics.start_phase("validation")
+            result, fixed_stream = validate_file(file_extension, file_stream, rules)
+            metrics.end_phase()
+            metrics.skipped_checks = list(deadline.skipped)
+            # A partial result is not the document's result, and neither is one
+            # the AI failed on: validate it in full next time
+            if cache and not deadline.partial and result['ai_complete']:
+                cache.put(result_key, {
+                    'issues': result['issues'],
+                    'fixes_applied': result['fixes_applied'],
+                    'fixed_bytes': fixed_stream.getvalue() if result['fixes_applied'] else None,
+                })
+
+        # 7. Generate report, linking back to the document and its library
+        document_url, library_url = document_links(file_url)
         report_html = generate_report(file_name, result['issues'], result['fixes_applied'],
-                                      document_url=document_url, library_url=library_url)
+                                      document_url=document_url, library_url=library_url,
+                                      skipped=deadline.skipped)
         report_url = None
-        report_drive_item_id = None
-
-        report_stream = BytesIO(report_html.encode('utf-8'))
-        report_filename = f"{os.path.splitext(file_name)[0]}_ValidationReport.html"
-        if file_url:
-            report_folder = os.path.dirname(file_url)
-            report_path = f"{report_folder}/{report_filename}" if report_folder else f"/{report_filename}"
-        else:
-            report_path = f"/Validation Reports/{report_filename}"
 
-        if ENABLE_FUNCTION_SHAREPOINT_WRITES:
-            try:
-                with track_phase(metrics, "upload_report"):
-                    report_url, report_drive_item_id = upload_file(token, report_stream, report_path)
-                metrics.sharepoint_calls += 1
-                metrics.report_uploaded = True
-                logging.info(f"[{request_id}] Report uploaded: {report_url}")
-            except Exception as e:
-                logging.error(f"[{request_id}] Failed to upload report: {e}")
-        else:
-            logging.info(f"[{request_id}] Skipping report upload (flow owns writes); returning reportHtml")
+        remaining = [i for i in result['issues'] if isinstance(i, dict)]
+        final_status = get_final_status(result['issues'], result['fixes_applied'], skipped=deadline.skipped)
 
-        # 9. Save validation result to SharePoint list (skipped when the flow owns writes)
+        # 8-10. Upload the fixed file and report (concurrently), save the validation
+        # result, link it from the document and set the final status. Inline, or
+        # journalled and finished in the background (skipped when the flow owns writes)
         validation_result_info = None
+        write_back_pending = False
         if ENABLE_FUNCTION_SHAREPOINT_WRITES:
-            try:
-                site_id = get_site_id(token)
-                remaining = [i for i in result['issues'] if isinstance(i, dict)]
-                if len(remaining) == 0:
-                    # Not "Passed" — needs a human to actually confirm it. And not
-                    # "Validate Now", which is the trigger value meaning "please
-                    # validate this" — writing that back would re-arm the flow.
-                    result_status = "Auto-Fixed — Awaiting Review"
-                elif len(result['fixes_applied']) > 0:
-                    result_status = "Review Required"
-                else:
-                    result_status = "Failed"
-
-                # Update report file metadata (ValidationStatus + counts)
-                if report_drive_item_id:
-                    try:
-                        update_drive_item_fields(token, report_drive_item_id, {
-                            "ValidationStatus": result_status,
-                            "IssuesFound": len(result['issues']),
-                            "IssuesFixed": len(result['fixes_applied'])
-                        })
-                    except Exception as e:
-                        logging.warning(f"Could not update report metadata: {e}")
-
-                validation_result_info = save_validation_result(
-                    token=token,
-                    site_id=site_id,
-                    filename=file_name,
-                    issues_count=len(result['issues']),
-                    fixes_count=len(result['fixes_applied']),
-                    status=result_status,
-                    html_report=report_html,
-                    report_url=report_url
-                )
-                logging.info(f"Validation result saved: {validation_result_info['list_item_url']}")
-
-                # Update document metadata with link to validation result
-                if file_url:
-                    update_document_metadata(token, site_id, file_url, validation_result_info['list_item_url'])
-                elif item_id:
-                    _update_metadata_by_item_id(token, site_id, item_id, validation_result_info['list_item_url'])
-
-            except Exception as e:
-                logging.error(f"Failed to save validation result: {e}")
-
-        # 10. Update final validation status (skipped when the flow owns writes)
-        remaining = [i for i in result['issues'] if isinstance(i, dict)]
-        if len(remaining) == 0:
-            # Not "Passed" — needs a human to actually confirm it. And not
-            # "Validate Now", which is the trigger value meaning "please validate
-            # this" — writing that back would re-arm the flow.
-            final_status = "Auto-Fixed — Awaiting Review"
-        elif len(result['fixes_applied']) > 0:
-            final_status = "Review Required"
+            fixed_bytes = None
+            if result['fixes_applied'] and file_url:
+                fixed_stream.seek(0)
+                fixed_bytes = fixed_stream.read()
+            job = new_job(request_id, file_name, file_url, item_id, final_status,
+                          len(result['issues']), len(result['fixes_applied']),
+                          report_html, report_path(file_name, file_url), fixed_bytes)
+            if WRITE_BACK_MODE == "background":
+                submit_background(job, token)
+                write_back_pending = True
+            else:
+                errors = run_write_back(job, token)
+                if errors:
+                    metrics.write_back_errors = errors
+                report_url = (job["done"].get("upload_report") or {}).get("web_url")
+                validation_result_info = job["done"].get("save_results")
         else:
-            final_status = "Failed"
-        if ENABLE_FUNCTION_SHAREPOINT_WRITES:
-            try:
-                update_validation_status(token, item_id, final_status, report_url)
-            except Exception as e:
-                logging.warning(f"Could not set final status: {e}")
+            logging.info(f"[{request_id}] Skipping SharePoint writes (flow owns writes); returning reportHtml")
 
         # 11. Emit audit event and return response
         metrics.complete(status=final_status, issues=len(result['issues']), fixes=len(result['fixes_applied']))
         emit_audit_event(metrics.to_audit_entry())
         logging.info(f'=== VALIDATION COMPLETE [{request_id}]: {final_status} ({metrics.duration_ms}ms) ===')
 
-        issues_count = len(result['issues'])
         fixes_count = len(result['fixes_applied'])
-        remaining_count = len(remaining)
         # Total issues found = still-unfixed + auto-fixed (matches report.py's total_issues_found)
-        total_found = remaining_count + fixes_count
-        if fixes_count > 0 and remaining_count == 0:
-            description = f"{final_status} — {fixes_count} issue{'s' if fixes_count != 1 else ''} auto-fixed"
-        elif fixes_count > 0:
-            description = f"{final_status} — {fixes_count} fixed, {remaining_count} remaining"
-        elif issues_count > 0:
-            description = f"{final_status} — {issues_count} issue{'s' if issues_count != 1 else ''} found"
-        else:
-            description = f"{final_status} — no issues found"
+        total_found = len(remaining) + fixes_count
+        description = status_description(final_status, result['issues'], result['fixes_applied'],
+                                          skipped=deadline.skipped)
 
         from datetime import datetime, timezone
         response_data = {
@@ -321,13 +258,34 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             "reportFileName": f"{os.path.splitext(file_name)[0]}_ValidationReport.html",
             "reportHtml": report_html
         }
+        if write_back_pending:
+            response_data["writeBack"] = "pending"
+        if deadline.partial:
+            response_data["partial"] = True
+            response_data["skipped"] = deadline.skipped
+
+        if wants_multipart(req):
+            # Binary response: no base64 copy of the fixed file, no HTML inside JSON
+            report_html = response_data.pop("reportHtml")
+            fixed_bytes = None
+            if result['fixes_applied']:
+                fixed_stream.seek(0)
+                fixed_bytes = fixed_stream.read()
+            body, content_type = multipart_response(
+                response_data, fixed_bytes, file_name, report_html, response_data["reportFileName"])
+            if run_key:
+                cache.put(run_key, {"body": body, "content_type": content_type})
+            return func.HttpResponse(body, headers={"Content-Type": content_type}, status_code=200)
 
         if result['fixes_applied']:
             fixed_stream.seek(0)
             response_data["fixedFileContent"] = base64.b64encode(fixed_stream.read()).decode('utf-8')
 
+        body = json.dumps(response_data)
+        if run_key:
+            cache.put(run_key, {"body": body.encode('utf-8'), "content_type": "application/json"})
         return func.HttpResponse(
-            json.dumps(response_data),
+            body,
             mimetype="application/json",
             status_code=200
         )
@@ -353,23 +311,33 @@ def main(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json",
             status_code=500
         )
+    finally:
+        if owns_run:
+            cache.finish(run_key)
+        if deadline_token is not None:
+            reset_current_deadline(deadline_token)
+        if metrics_token is not None:
+            reset_current_metrics(metrics_token)
 
 
-def _update_metadata_by_item_id(token, site_id, item_id, validation_result_url):
-    """Update document metadata using item_id when file_url is not available"""
-    import requests
-    from .config import DOC_LIBRARY_LIST_ID
+def _timed(metrics, phase, fn, *args):
+    with track_phase(metrics, phase):
+        return fn(*args)
 
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{DOC_LIBRARY_LIST_ID}/items/{item_id}/fields"
-    data = {
-        "ValidationResultLink": json.dumps({
-            "Description": "View Validation Result",
-            "Url": validation_result_url
-        })
-    }
-    resp = requests.patch(url, headers=headers, json=data)
-    if resp.status_code >= 400:
-        logging.warning(f"Failed to update ValidationResultLink via item_id: {resp.status_code} {resp.text}")
-    else:
-        logging.info("Document metadata updated with validation result link")
+
+def _set_initial_status(token, item_id):
+    try:
+        update_validation_status(token, item_id, "Validating...", None)
+    except Exception as e:
+        logging.warning(f"Could not set initial status: {e}")
+
+
+def _too_large(metrics, e):
+    metrics.file_size_bytes = e.size
+    metrics.fail(str(e))
+    emit_audit_event(metrics.to_audit_entry())
+    return func.HttpResponse(
+        json.dumps({"error": str(e)}),
+        mimetype="application/json",
+        status_code=413
+    )
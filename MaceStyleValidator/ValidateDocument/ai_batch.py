@@ -0,0 +1,298 @@
+"""Offline AI batch mode for library-wide re-validation
+
+When the rules change, every document in a library has to be validated again,
+and validating them one by one pays for a synchronous AI call per chunk of
+every document. A sweep runs in three steps instead:
+
+1. add() reads each queued Word document and collects the paragraphs its AI
+   rules would see (the same selection as validate_word_document), once per
+   distinct paragraph across the whole queue;
+2. run() looks them up in the AI correction cache (ai_cache.py), sends the
+   rest as chunks through the provider's asynchronous batch interface
+   (Anthropic Message Batches or Azure OpenAI Batch), polls until the jobs
+   end and writes the edits to the cache. Batch jobs usually take minutes to
+   hours: a caller with a short time budget (the library sweep) calls
+   submit() instead, keeps the jobs it returns, and calls collect() on a
+   later run until they have ended;
+3. validate() validates the queued documents as usual. Their AI corrections
+   now come from the cache, so no synchronous AI call is made, except for
+   paragraphs whose batch request failed.
+
+Foundry has no batch interface, so its paragraphs go through the ordinary
+concurrent path (ai_client.correct_paragraphs), which fills the same cache.
+ai_stub.AIStub answers both batch interfaces locally, for the tests and
+scripts/bench_ai_batch.py.
+"""
+import json
+import logging
+import os
+import time
+from io import BytesIO
+
+from docx import Document
+
+from .ai_cache import get_ai_cache, correction_key, get_many, put_many
+from .ai_client import (
+    get_ai_client, correct_paragraphs, chunk_paragraphs, build_system_prompt, build_dynamic_prompt,
+    request_params, read_response, parse_edits, cache_entries, rules_prompt_hash,
+)
+from .config import (
+    ENABLE_CLAUDE_AI, AI_PROVIDER, AI_BATCH_MAX_REQUESTS, AI_BATCH_POLL_SECONDS, AI_BATCH_TIMEOUT_SECONDS,
+)
+from .core import WORD_EXTENSIONS, validate_file
+from .monitoring import current_metrics
+from .word_validator import split_word_rules, select_ai_paragraphs
+
+# Azure OpenAI batch states after which the job will not change again
+_AZURE_FINAL = ("completed", "failed", "expired", "cancelled")
+
+
+class AIBatch:
+    """The AI work of a queue of documents, run as provider batch jobs.
+
+        batch = AIBatch(rules)
+        for name, data in documents:
+            batch.add(name, data)
+        batch.run()
+        for name, result, fixed_stream in batch.validate():
+            ...
+    """
+
+    def __init__(self, rules, poll_seconds=None, timeout_seconds=None, sleep=time.sleep):
+        self.rules = rules
+        self.ai_rules, _ = split_word_rules(rules)
+        self.poll_seconds = AI_BATCH_POLL_SECONDS if poll_seconds is None else poll_seconds
+        self.timeout_seconds = AI_BATCH_TIMEOUT_SECONDS if timeout_seconds is None else timeout_seconds
+        self.sleep = sleep
+        self.documents = []   # (name, extension, bytes)
+        self.texts = {}       # AI cache key -> paragraph text, one per distinct paragraph
+        self.keys = {}        # document name -> AI cache keys of its paragraphs
+        self.stats = {'documents': 0, 'paragraphs': 0, 'distinct': 0, 'cached': 0, 'submitted': 0,
+                      'requests': 0, 'jobs': 0, 'errors': []}
+        self._prompt_hash = rules_prompt_hash(self.ai_rules) if self.ai_rules else None
+
+    def add(self, name, file_bytes):
+        """Queue a document and collect its AI work (Word documents only)."""
+        extension = os.path.splitext(name)[1].lower()
+        self.documents.append((name, extension, file_bytes))
+        self.stats['documents'] += 1
+        if not self.ai_rules or extension not in WORD_EXTENSIONS:
+            return
+        try:
+            doc = Document(BytesIO(file_bytes))
+        except Exception as e:
+            logging.warning(f"AI batch: cannot read {name}, leaving it to validation: {e}")
+            return
+        all_paras, positions = select_ai_paragraphs(doc, self.ai_rules)
+        keys = self.keys.setdefault(name, set())
+        for pos in positions:
+            text = all_paras[pos].text
+            key = correction_key(self._prompt_hash, text)
+            self.texts[key] = text
+            keys.add(key)
+        self.stats['paragraphs'] += len(positions)
+        self.stats['distinct'] = len(self.texts)
+
+    def run(self):
+        """Answer the collected paragraphs into the AI cache, waiting for the
+        batch jobs (cancelled after timeout_seconds). Returns the stats."""
+        jobs = self.submit()
+        if jobs is not None:
+            deadline = time.monotonic() + self.timeout_seconds
+            while not collect(jobs, self.stats):
+                if time.monotonic() >= deadline:
+                    cancel(jobs, self.stats, f"did not finish in {self.timeout_seconds:.0f}s")
+                    break
+                self.sleep(self.poll_seconds)
+        for error in self.stats['errors']:
+            logging.error(f"AI batch request failed: {error}")
+        return self.stats
+
+    def submit(self):
+        """Send the collected paragraphs not already in the AI cache as
+        provider batch jobs, without waiting for them. Returns the jobs as a
+        JSON-serialisable dict for collect() - which may be called by a later
+        run, as the jobs go on at the provider - or None when there is nothing
+        to wait for (all cached, AI off, or Foundry, whose paragraphs are
+        corrected directly here)."""
+        if not self.texts or not ENABLE_CLAUDE_AI:
+            return None
+        cache = get_ai_cache()
+        if cache is None:
+            raise RuntimeError("AI batch mode needs the AI correction cache (AI_CACHE_MAX_MB > 0)")
+        found = get_many(cache, self.texts)
+        pending = {key: text for key, text in self.texts.items() if found[key] is None}
+        self.stats['cached'] = len(self.texts) - len(pending)
+        logging.info(f"AI batch: {self.stats['paragraphs']} paragraph(s) in {self.stats['documents']} "
+                     f"document(s), {len(self.texts)} distinct, {len(pending)} not cached")
+        if not pending:
+            return None
+        client = get_ai_client()
+        if client is None:
+            return None
+        self.stats['submitted'] = len(pending)
+
+        if AI_PROVIDER == "foundry":
+            logging.info("AI batch: Foundry has no batch interface, sending the paragraphs directly")
+            self._correct(pending.values())
+            return None
+
+        keys = {f"p{n}": key for n, key in enumerate(pending)}
+        chunks = chunk_paragraphs({pid: pending[key] for pid, key in keys.items()})
+        system = build_system_prompt(self.ai_rules)
+        requests = {f"chunk-{n}": request_params(build_dynamic_prompt(chunk), system)
+                    for n, chunk in enumerate(chunks)}
+        ids = list(requests)
+        jobs = [_submit(client, {cid: requests[cid] for cid in ids[i:i + AI_BATCH_MAX_REQUESTS]})
+                for i in range(0, len(ids), AI_BATCH_MAX_REQUESTS)]
+        self.stats['requests'] = len(requests)
+        self.stats['jobs'] = len(jobs)
+        logging.info(f"AI batch: {len(requests)} request(s) submitted as {len(jobs)} job(s)")
+        return {"provider": AI_PROVIDER, "jobs": jobs, "ended": [], "submitted_at": time.time(),
+                "chunks": dict(zip(requests, chunks)), "keys": keys}
+
+    def run_direct(self):
+        """Answer the collected paragraphs now, through the worker's AI client
+        (ai_client.correct_paragraphs: cache, parallel chunks and failover as for
+        a single document), rather than as batch jobs. Returns the stats."""
+        if not self.texts or not ENABLE_CLAUDE_AI or get_ai_cache() is None:
+            return self.stats
+        logging.info(f"AI batch: {self.stats['paragraphs']} paragraph(s) in {self.stats['documents']} "
+                     f"document(s), {len(self.texts)} distinct, sent directly")
+        try:
+            return self._correct(self.texts.values())
+        except Exception as e:
+            # Every chunk failed: validation sends the paragraphs again itself
+            self.stats['errors'].append(str(e))
+            logging.error(f"AI batch: direct correction failed: {e}")
+            return self.stats
+
+    def _correct(self, texts):
+        result = correct_paragraphs(self.ai_rules, {f"p{n}": text for n, text in enumerate(texts)})
+        self.stats['errors'].extend(result['errors'] if result else [])
+        return self.stats
+
+    def entries(self, name):
+        """{AI cache key: entry} for the queued document's paragraphs already
+        answered, for a validation run with its own cache (another process)."""
+        cache = get_ai_cache()
+        keys = self.keys.get(name)
+        if not keys or cache is None:
+            return {}
+        return {key: entry for key, entry in get_many(cache, keys).items() if entry is not None}
+
+    def validate(self):
+        """Validate the queued documents, yielding (name, result, fixed_stream)."""
+        for name, extension, file_bytes in self.documents:
+            try:
+                result, fixed_stream = validate_file(extension, BytesIO(file_bytes), self.rules)
+            except Exception as e:
+                logging.error(f"AI batch: validation of {name} failed: {e}")
+                continue
+            yield name, result, fixed_stream
+
+
+def collect(jobs, stats):
+    """Check jobs from AIBatch.submit() once, without waiting: the edits of
+    each job that has ended go to the AI cache and the job is marked ended in
+    `jobs`. Returns True once every job has ended. Failed requests are added
+    to stats['errors'] (their paragraphs are left to validation)."""
+    provider = jobs["provider"]
+    client = get_ai_client(provider)
+    if client is None:
+        raise RuntimeError(f"No AI client for {provider} to collect batch jobs with")
+    cache = get_ai_cache()
+    for job_id in jobs["jobs"]:
+        if job_id in jobs["ended"] or not _finished(client, job_id, provider):
+            continue
+        metrics = current_metrics()
+        new_entries = {}
+        for cid, response in _results(client, job_id, provider).items():
+            chunk = jobs["chunks"].get(cid)
+            if chunk is None:
+                continue
+            try:
+                if isinstance(response, str):
+                    raise RuntimeError(response)
+                text, in_tok, out_tok, cached_tok = read_response(response, provider)
+                chunk_edits = parse_edits(chunk, text)
+            except Exception as e:
+                stats['errors'].append(f"{cid}: {e}")
+                continue
+            if metrics:
+                metrics.record_claude_usage(in_tok or 0, out_tok or 0, cached_input_tokens=cached_tok)
+            for pid, entry in cache_entries(chunk, chunk_edits, in_tok or 0, out_tok or 0).items():
+                new_entries[jobs["keys"][pid]] = entry
+        if new_entries and cache is not None:
+            put_many(cache, new_entries)
+        jobs["ended"].append(job_id)
+    return len(jobs["ended"]) == len(jobs["jobs"])
+
+
+def cancel(jobs, stats, reason):
+    """Cancel the jobs from AIBatch.submit() that have not ended."""
+    client = get_ai_client(jobs["provider"])
+    for job_id in jobs["jobs"]:
+        if job_id in jobs["ended"]:
+            continue
+        stats['errors'].append(f"job {job_id} {reason}")
+        if client is not None:
+            _cancel(client, job_id, jobs["provider"])
+
+
+def _submit(client, params_by_id):
+    """Create one provider batch job for {custom_id: request params}; returns its ID."""
+    if AI_PROVIDER == "azure_openai":
+        lines = [json.dumps({"custom_id": cid, "method": "POST", "url": "/chat/completions", "body": params},
+                            ensure_ascii=False)
+                 for cid, params in params_by_id.items()]
+        upload = client.files.create(file=("macestyle-batch.jsonl", "\n".join(lines).encode("utf-8")),
+                                     purpose="batch")
+        return client.batches.create(input_file_id=upload.id, endpoint="/chat/completions",
+                                     completion_window="24h").id
+    batch = client.messages.batches.create(
+        requests=[{"custom_id": cid, "params": params} for cid, params in params_by_id.items()])
+    return batch.id
+
+
+def _finished(client, job_id, provider):
+    if provider == "azure_openai":
+        return client.batches.retrieve(job_id).status in _AZURE_FINAL
+    return client.messages.batches.retrieve(job_id).processing_status == "ended"
+
+
+def _cancel(client, job_id, provider):
+    try:
+        if provider == "azure_openai":
+            client.batches.cancel(job_id)
+        else:
+            client.messages.batches.cancel(job_id)
+    except Exception as e:
+        logging.warning(f"AI batch: could not cancel job {job_id}: {e}")
+
+
+def _results(client, job_id, provider):
+    """{custom_id: completion response, or an error message} for a finished job."""
+    responses = {}
+    if provider == "azure_openai":
+        from openai.types.chat import ChatCompletion
+        job = client.batches.retrieve(job_id)
+        for file_id in (job.output_file_id, job.error_file_id):
+            if not file_id:
+                continue
+            for line in client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                row = json.loads(line)
+                response = row.get("response") or {}
+                if response.get("status_code") == 200:
+                    responses[row["custom_id"]] = ChatCompletion.model_validate(response["body"])
+                else:
+                    responses[row["custom_id"]] = str(row.get("error") or response.get("body") or "failed")
+        return responses
+    for entry in client.messages.batches.results(job_id):
+        if entry.result.type == "succeeded":
+            responses[entry.custom_id] = entry.result.message
+        else:
+            responses[entry.custom_id] = f"{entry.result.type}: {getattr(entry.result, 'error', '')}"
+    return responses
@@ -0,0 +1,90 @@
+"""AI correction cache
+
+Mace documents share a lot of text (disclaimers, standard clauses, template
+headings), and every validation used to pay tokens to correct it again. This
+cache sits in front of the AI calls in ai_client.correct_paragraphs: a
+paragraph already corrected by the same provider and model under the same AI
+rules reuses that correction (its list of edits), whichever document it came
+from.
+
+Key = provider + CLAUDE_MODEL + hash of the prompt built from the AI rules +
+the paragraph text (Unicode NFC, outer whitespace stripped). Entries live in
+a per-worker LRU bounded by AI_CACHE_MAX_MB, optionally written through to a
+local directory or blob container (AI_CACHE_STORE=local|blob) shared by every
+worker. Each entry remembers the tokens its share of the original call cost,
+so a hit can report the tokens saved.
+"""
+import hashlib
+import logging
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+from .config import (
+    AI_PROVIDER, CLAUDE_MODEL, AI_CACHE_MAX_MB, AI_CACHE_STORE, AI_CACHE_DIR, AI_CACHE_TTL_SECONDS,
+)
+from .result_cache import ResultCache, LocalResultStore, BlobResultStore
+from .worker import WorkerSingleton
+
+# Concurrent reads/writes against a shared store (one blob or file per paragraph)
+STORE_CONCURRENCY = 16
+
+
+def split_whitespace(text):
+    """(leading whitespace, NFC-normalised core, trailing whitespace)."""
+    core = text.strip()
+    start = text.find(core) if core else len(text)
+    return text[:start], unicodedata.normalize("NFC", core), text[start + len(core):]
+
+
+def correction_key(prompt_hash, text):
+    """Cache key for correcting `text` under the AI rule prompt `prompt_hash`."""
+    _lead, core, _trail = split_whitespace(text)
+    raw = f"{AI_PROVIDER}\x00{CLAUDE_MODEL}\x00{prompt_hash}\x00{core}"
+    return f"ai-{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+
+def get_many(cache, keys):
+    """cache.get() for every key ({key: entry or None}), concurrently when
+    misses may have to go to a shared store."""
+    keys = list(dict.fromkeys(keys))
+    if cache.store is None or len(keys) < 2:
+        return {key: cache.get(key) for key in keys}
+    with ThreadPoolExecutor(max_workers=STORE_CONCURRENCY, thread_name_prefix="msv-aicache") as pool:
+        return dict(zip(keys, pool.map(cache.get, keys)))
+
+
+def put_many(cache, entries):
+    """cache.put() for every {key: entry}, concurrently when there is a store."""
+    if cache.store is None or len(entries) < 2:
+        for key, entry in entries.items():
+            cache.put(key, entry)
+        return
+    with ThreadPoolExecutor(max_workers=STORE_CONCURRENCY, thread_name_prefix="msv-aicache") as pool:
+        list(pool.map(lambda item: cache.put(*item), entries.items()))
+
+
+def _default_store():
+    if AI_CACHE_STORE == "local":
+        return LocalResultStore(AI_CACHE_DIR)
+    if AI_CACHE_STORE == "blob":
+        try:
+            return BlobResultStore("macestyle-ai-cache")
+        except Exception as e:
+            logging.warning(f"AI cache blob store unavailable, using memory only: {e}")
+    return None
+
+
+_cache = WorkerSingleton(lambda: ResultCache(AI_CACHE_MAX_MB * 1024 * 1024, _default_store(),
+                                             ttl_seconds=AI_CACHE_TTL_SECONDS))
+
+
+def get_ai_cache():
+    """The worker-wide AI correction cache (None when AI_CACHE_MAX_MB is 0)."""
+    if AI_CACHE_MAX_MB <= 0:
+        return None
+    return _cache.get()
+
+
+def set_ai_cache(cache):
+    """Use `cache` for AI corrections (tests)."""
+    _cache.set(cache)
@@ -1,17 +1,29 @@
 """Centralised Claude AI client for style validation"""
 import os
 import json
+import hashlib
 import logging
-from anthropic import Anthropic
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from anthropic import Anthropic, DefaultHttpxClient
 from .config import (
     ENABLE_CLAUDE_AI, AI_PROVIDER, CLAUDE_MODEL, CLAUDE_MAX_TOKENS, CLAUDE_TEMPERATURE,
+    AI_FALLBACK_PROVIDERS, AI_FALLBACK_MODELS,
+    AI_CHUNK_TOKENS, AI_MAX_PARALLEL, AI_PROMPT_CACHING, AI_CHUNK_SECONDS,
+    AI_CONNECT_TIMEOUT_SECONDS, AI_READ_TIMEOUT_SECONDS, AI_POOL_SIZE, AI_KEEPALIVE_SECONDS,
     AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY, AZURE_OPENAI_API_VERSION,
     AZURE_OPENAI_MAX_COMPLETION_TOKENS, AZURE_OPENAI_REASONING_EFFORT,
 )
+from .ai_cache import get_ai_cache, correction_key, get_many, put_many
+from .ai_router import get_ai_router
+from .deadline import DeadlineExceeded, current_deadline
+from .monitoring import current_metrics, submit_in_context
+from .worker import WorkerSingleton
 
 
-def get_ai_client():
-    """Return an AI client for the configured provider, or None if unconfigured.
+def get_ai_client(provider=None):
+    """Return the worker-wide client for `provider` (default AI_PROVIDER), or
+    None if unconfigured.
 
     The two Anthropic providers (anthropic, foundry) expose the identical
     client.messages.create() surface; azure_openai exposes the OpenAI
@@ -19,9 +31,26 @@ def get_ai_client():
     the rest of this module stays provider-agnostic. Switching providers is an
     app-settings change only (AI_PROVIDER + the provider's creds + CLAUDE_MODEL) -
     no code change.
+
+    Each client is created once and shared by every validation and chunk on
+    the worker, so its HTTP connections (and their TLS sessions) are reused.
     """
-    if AI_PROVIDER == "azure_openai":
-        from openai import AzureOpenAI
+    return _clients.get(provider or AI_PROVIDER)
+
+
+def set_ai_client(client, provider=None):
+    """Replace the worker-wide client for `provider` (tests); set_ai_client(None)
+    drops every provider's client, so they are re-created from config."""
+    if client is None and provider is None:
+        _clients.clear()
+    else:
+        _clients.set(client, provider or AI_PROVIDER)
+
+
+def _new_ai_client(provider):
+    timeout = httpx.Timeout(AI_READ_TIMEOUT_SECONDS, connect=AI_CONNECT_TIMEOUT_SECONDS)
+    if provider == "azure_openai":
+        from openai import AzureOpenAI, DefaultHttpxClient as OpenAIHttpxClient
         if not (AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY):
             logging.warning("AZURE_OPENAI_ENDPOINT/AZURE_OPENAI_API_KEY not set - skipping AI validation")
             return None
@@ -29,60 +58,134 @@ def get_ai_client():
             azure_endpoint=AZURE_OPENAI_ENDPOINT,
             api_key=AZURE_OPENAI_API_KEY,
             api_version=AZURE_OPENAI_API_VERSION,
+            timeout=timeout,
+            http_client=OpenAIHttpxClient(**_http_options(timeout)),
         )
 
-    if AI_PROVIDER == "foundry":
+    if provider == "foundry":
         from anthropic import AnthropicFoundry
         resource = os.environ.get("FOUNDRY_RESOURCE")
         api_key = os.environ.get("FOUNDRY_API_KEY")
         if not (resource and api_key):
             logging.warning("FOUNDRY_RESOURCE/FOUNDRY_API_KEY not set - skipping AI validation")
             return None
-        return AnthropicFoundry(resource=resource, api_key=api_key)
+        return AnthropicFoundry(resource=resource, api_key=api_key, timeout=timeout,
+                                http_client=DefaultHttpxClient(**_http_options(timeout)))
 
     api_key = os.environ.get("ANTHROPIC_API_KEY")
     if not api_key:
         logging.warning("ANTHROPIC_API_KEY not set - skipping AI validation")
         return None
-    return Anthropic(api_key=api_key)
+    return Anthropic(api_key=api_key, timeout=timeout, http_client=DefaultHttpxClient(**_http_options(timeout)))
+
+
+_clients = WorkerSingleton(_new_ai_client)   # one client per provider
+
+
+def _http_options(timeout):
+    """httpx settings for a provider client: timeouts, a bounded keep-alive
+    pool and the hook that counts new vs reused connections."""
+    return {
+        "timeout": timeout,
+        "limits": httpx.Limits(max_connections=AI_POOL_SIZE, max_keepalive_connections=AI_POOL_SIZE,
+                               keepalive_expiry=AI_KEEPALIVE_SECONDS),
+        "event_hooks": {"request": [_trace_connections]},
+    }
+
+
+def _trace_connections(request):
+    """httpx request hook: count the request, and a new connection if httpcore
+    has to open one for it, into the current validation's metrics."""
+    metrics = current_metrics()
+    if metrics is None:
+        return
+    metrics.record_ai_http(requests=1)
 
+    def trace(event, info):
+        if event == "connection.connect_tcp.complete":
+            metrics.record_ai_http(new_connections=1)
 
-def _generate(client, prompt):
-    """Run one completion and return (response_text, input_tokens, output_tokens).
+    request.extensions["trace"] = trace
+
+
+def _generate(client, prompt, system=None, provider=None, timeout=None):
+    """Run one completion on `provider` (default AI_PROVIDER) and return
+    (response_text, input_tokens, output_tokens, cached_input_tokens).
 
     Hides the Anthropic Messages API vs OpenAI Chat Completions difference so the
     caller only deals with text. CLAUDE_MODEL carries the model/deployment name
-    for whichever provider is active.
+    for AI_PROVIDER, AI_MODEL_<PROVIDER> for a fallback. `system` is the stable
+    rules preamble: the Anthropic providers mark it for prompt caching
+    (AI_PROMPT_CACHING), Azure OpenAI caches a repeated prefix by itself.
+    input_tokens counts every input token, cached ones included. `timeout`
+    (seconds) overrides the client's read timeout for this call.
     """
-    if AI_PROVIDER == "azure_openai":
+    provider = provider or AI_PROVIDER
+    params = request_params(prompt, system, provider)
+    if timeout is not None:
+        params = dict(params, timeout=timeout)
+    if provider == "azure_openai":
+        return read_response(client.chat.completions.create(**params), provider)
+    return read_response(client.messages.create(**params), provider)
+
+
+def request_params(prompt, system=None, provider=None):
+    """Keyword arguments for one completion request to `provider` (default
+    AI_PROVIDER): client.chat.completions.create() for azure_openai,
+    client.messages.create() otherwise. Also the body of a provider batch
+    request (ai_batch.py)."""
+    provider = provider or AI_PROVIDER
+    model = CLAUDE_MODEL if provider == AI_PROVIDER else AI_FALLBACK_MODELS.get(provider, CLAUDE_MODEL)
+    if provider == "azure_openai":
         # GPT-5 reasoning models: use max_completion_tokens (not max_tokens), leave
         # temperature at its default (custom values are rejected), and ask for JSON.
-        response = client.chat.completions.create(
-            model=CLAUDE_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"},
-            max_completion_tokens=AZURE_OPENAI_MAX_COMPLETION_TOKENS,
-            reasoning_effort=AZURE_OPENAI_REASONING_EFFORT,
-        )
-        usage = getattr(response, "usage", None)
+        messages = [{"role": "system", "content": system}] if system else []
+        return {
+            "model": model,
+            "messages": messages + [{"role": "user", "content": prompt}],
+            "response_format": {"type": "json_object"},
+            "max_completion_tokens": AZURE_OPENAI_MAX_COMPLETION_TOKENS,
+            "reasoning_effort": AZURE_OPENAI_REASONING_EFFORT,
+        }
+
+    params = {
+        "model": model,
+        "max_tokens": CLAUDE_MAX_TOKENS,
+        "temperature": CLAUDE_TEMPERATURE,
+        "messages": [{"role": "user", "content": prompt}],
+    }
+    if system:
+        block = {"type": "text", "text": system}
+        if AI_PROMPT_CACHING:
+            block["cache_control"] = {"type": "ephemeral"}
+        params["system"] = [block]
+    return params
+
+
+def read_response(response, provider=None):
+    """(response_text, input_tokens, output_tokens, cached_input_tokens) from a
+    completion response of `provider` (default AI_PROVIDER; see _generate)."""
+    usage = getattr(response, "usage", None)
+    if (provider or AI_PROVIDER) == "azure_openai":
         in_tok = getattr(usage, "prompt_tokens", None) if usage else None
         out_tok = getattr(usage, "completion_tokens", None) if usage else None
-        return response.choices[0].message.content, in_tok, out_tok
-
-    response = client.messages.create(
-        model=CLAUDE_MODEL,
-        max_tokens=CLAUDE_MAX_TOKENS,
-        temperature=CLAUDE_TEMPERATURE,
-        messages=[{"role": "user", "content": prompt}],
-    )
-    usage = getattr(response, "usage", None)
+        details = getattr(usage, "prompt_tokens_details", None) if usage else None
+        cached_tok = getattr(details, "cached_tokens", None) or 0
+        return response.choices[0].message.content, in_tok, out_tok, cached_tok
+
     in_tok = getattr(usage, "input_tokens", None) if usage else None
     out_tok = getattr(usage, "output_tokens", None) if usage else None
-    return response.content[0].text, in_tok, out_tok
+    # Anthropic reports cache reads/writes separately from input_tokens
+    cache_read = (getattr(usage, "cache_read_input_tokens", None) or 0) if usage else 0
+    cache_write = (getattr(usage, "cache_creation_input_tokens", None) or 0) if usage else 0
+    if in_tok is not None:
+        in_tok += cache_read + cache_write
+    return response.content[0].text, in_tok, out_tok, cache_read
 
 
-def build_dynamic_prompt(ai_rules, document_text):
-    """Build Claude prompt dynamically from rules where UseAI=True"""
+def _rules_description(ai_rules):
+    """The AI rules as a bulleted list grouped by rule type. Sorted throughout,
+    so the same rules always give the same text (and prompt-cache key)."""
     rules_by_type = {}
     for rule in ai_rules:
         rule_type = rule.get('rule_type', 'Other')
@@ -93,72 +196,325 @@ def build_dynamic_prompt(ai_rules, document_text):
     rules_description = []
     for rule_type, rules in sorted(rules_by_type.items()):
         rules_description.append(f"\n**{rule_type} Rules:**")
-        for rule in rules:
+        for rule in sorted(rules, key=lambda r: (r.get('title', ''), r.get('expected_value') or '')):
             title = rule.get('title', 'Unknown rule')
             expected = rule.get('expected_value', '')
             if expected:
                 rules_description.append(f"- {title} (use: {expected})")
             else:
                 rules_description.append(f"- {title}")
+    return ''.join(rules_description)
+
 
+def build_system_prompt(ai_rules):
+    """The instructions and rules, identical for every chunk of every document
+    validated against the same AI rules - the part the provider can cache."""
     return f"""You are a professional document editor applying the Mace Control Centre Writing Style Guide.
 
 Apply ALL of the following corrections to the text:
-{''.join(rules_description)}
+{_rules_description(ai_rules)}
+
+The text is a JSON object mapping paragraph IDs to paragraph text.
+
+Return a JSON object with one field, "edits": a list with one entry per change,
+in the order the changes appear in each paragraph:
+  {{"id": "<paragraph ID>", "find": "<exact text to replace>", "replace": "<replacement>", "rule": "<rule title>"}}
+"find" is copied character for character from that paragraph: just the words being
+changed, with a neighbouring word or two if they would otherwise be ambiguous.
+To change a phrase that appears twice, give one entry per occurrence.
+Never return whole paragraphs. Return {{"edits": []}} if nothing needs changing."""
+
+
+def build_dynamic_prompt(paragraphs):
+    """The per-chunk user message. `paragraphs` maps paragraph ID -> text; the
+    model's edits name the same IDs, so they are merged back by ID rather than
+    by position."""
+    return f"""Paragraphs:
+{json.dumps(paragraphs, ensure_ascii=False, indent=1)}"""
+
+
+def estimate_tokens(text):
+    """Rough token count for sizing chunks (~4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+def chunk_paragraphs(paragraphs, max_tokens=None):
+    """Split {id: text} into paragraph-aligned chunks of about max_tokens
+    (default AI_CHUNK_TOKENS) estimated tokens each. A paragraph larger than
+    that goes on its own."""
+    max_tokens = max_tokens or AI_CHUNK_TOKENS
+    chunks, current, size = [], {}, 0
+    for para_id, text in paragraphs.items():
+        tokens = estimate_tokens(text) + 8  # ID, quotes and separators
+        if current and size + tokens > max_tokens:
+            chunks.append(current)
+            current, size = {}, 0
+        current[para_id] = text
+        size += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _parse_json(response_text):
+    json_start = response_text.find('{')
+    json_end = response_text.rfind('}') + 1
+
+    if json_start >= 0 and json_end > json_start:
+        json_text = response_text[json_start:json_end]
+        try:
+            return json.loads(json_text, strict=False)
+        except json.JSONDecodeError:
+            json_text = json_text.replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t')
+            return json.loads(json_text)
 
-Return a JSON object with two fields:
-1. "corrected_text": the full corrected text (preserve paragraph breaks as \\n\\n)
-2. "changes_made": total count of ALL changes made
+    raise ValueError("Could not parse JSON from Claude's response")
+
+
+def validate_edits(text, raw_edits):
+    """Keep the edits that apply to `text`, each located by its "find" text.
+
+    Repeats of the same "find" take successive occurrences. Edits whose text
+    is not in the paragraph, that change nothing or that overlap an earlier
+    edit are dropped. Returns [{'find', 'replace', 'rule', 'start'}] ordered
+    by position."""
+    located, searched_to = [], {}
+    for edit in raw_edits:
+        if not isinstance(edit, dict):
+            continue
+        find, replace = edit.get('find'), edit.get('replace')
+        if not (isinstance(find, str) and find and isinstance(replace, str)) or find == replace:
+            continue
+        start = text.find(find, searched_to.get(find, 0))
+        if start < 0:
+            continue
+        searched_to[find] = start + len(find)
+        located.append({'find': find, 'replace': replace, 'rule': str(edit.get('rule') or ''), 'start': start})
+    located.sort(key=lambda e: e['start'])
+    kept, end = [], 0
+    for edit in located:
+        if edit['start'] >= end:
+            kept.append(edit)
+            end = edit['start'] + len(edit['find'])
+    return kept
+
+
+def apply_edits(text, edits):
+    """`text` with validated edits (validate_edits) applied."""
+    for edit in reversed(edits):
+        start = edit['start']
+        text = text[:start] + edit['replace'] + text[start + len(edit['find']):]
+    return text
+
+
+def correct_chunk(providers, ai_rules, chunk):
+    """One AI call for one chunk, routed to the first healthy of `providers`
+    (ai_router). The model returns a list of edits, which are checked against
+    the paragraphs they name. Returns ({id: [edit]} for every ID in the chunk,
+    input_tokens, output_tokens, the provider that answered).
+
+    Under a request deadline (deadline.py) the chunk is only sent if a call is
+    expected to fit in the time left, and the call may not outlast it; raises
+    DeadlineExceeded otherwise, or when the call times out at the deadline
+    (which the router then does not hold against the provider)."""
+    deadline = current_deadline()
+    timeout = None
+    if deadline is not None:
+        if not deadline.allows(expected_call_seconds()):
+            raise DeadlineExceeded(f"{len(chunk)} paragraph(s) not sent")
+        timeout = deadline.remaining()
+    prompt, system = build_dynamic_prompt(chunk), build_system_prompt(ai_rules)
+
+    def call(provider):
+        try:
+            return _generate(get_ai_client(provider), prompt, system=system, provider=provider, timeout=timeout)
+        except Exception as e:
+            if timeout is not None and timeout < AI_READ_TIMEOUT_SECONDS and _timed_out(e):
+                raise DeadlineExceeded(f"{len(chunk)} paragraph(s) not answered in time") from e
+            raise
+
+    (response_text, in_tok, out_tok, cached_tok), provider = get_ai_router().route(call, providers)
+
+    # Track token usage for monitoring (SOC 2 CC7.2)
+    if in_tok is not None or out_tok is not None:
+        logging.info(f"AI tokens — input: {in_tok} ({cached_tok} cached), output: {out_tok}")
+    metrics = current_metrics()
+    if metrics:
+        metrics.record_claude_usage(in_tok or 0, out_tok or 0, cached_input_tokens=cached_tok)
+
+    return parse_edits(chunk, response_text), in_tok or 0, out_tok or 0, provider
+
+
+def _timed_out(e):
+    """Whether `e` is a provider call's timeout (either SDK, or httpx itself)."""
+    import anthropic
+    if isinstance(e, (httpx.TimeoutException, anthropic.APITimeoutError)):
+        return True
+    try:
+        import openai
+    except ImportError:
+        return False
+    return isinstance(e, openai.APITimeoutError)
+
+
+def expected_call_seconds():
+    """How long one AI call is expected to take: AI_PROVIDER's 95th percentile
+    latency on this worker (ai_router), or AI_CHUNK_SECONDS before any call."""
+    measured = get_ai_router().health(AI_PROVIDER).percentile(95)
+    return AI_CHUNK_SECONDS if measured is None else measured
+
+
+def parse_edits(chunk, response_text):
+    """{id: [edit]} for every ID in the chunk from the model's response, each
+    paragraph's edits checked against its text (validate_edits)."""
+    raw_edits = _parse_json(response_text).get('edits') or []
+    if not isinstance(raw_edits, list):
+        raise ValueError("AI response 'edits' is not a list")
+    by_id = {pid: [] for pid in chunk}
+    for edit in raw_edits:
+        if isinstance(edit, dict) and edit.get('id') in by_id:
+            by_id[edit['id']].append(edit)
+    chunk_edits = {pid: validate_edits(chunk[pid], edits) for pid, edits in by_id.items()}
+    dropped = len(raw_edits) - sum(len(edits) for edits in chunk_edits.values())
+    if dropped:
+        logging.warning(f"Ignored {dropped} AI edit(s) that do not match the source text")
+    return chunk_edits
 
-Text to correct:
-{document_text}"""
 
+def _shares(total, weights):
+    """Split an integer total across {key: weight}, proportionally."""
+    whole = sum(weights.values())
+    if not whole:
+        return {key: 0 for key in weights}
+    return {key: total * weight // whole for key, weight in weights.items()}
 
-def call_claude(ai_rules, document_text):
-    """Call Claude API for style validation.
 
-    Returns dict with 'corrected_text' and 'changes_made', or None if no API key.
+def rules_prompt_hash(ai_rules):
+    """Hash of the system prompt for `ai_rules`, part of every AI cache key."""
+    return hashlib.sha256(build_system_prompt(ai_rules).encode('utf-8')).hexdigest()
+
+
+def cache_entries(chunk, chunk_edits, in_tok, out_tok):
+    """One cache entry per paragraph of a corrected chunk: its edits (located
+    again on a hit, so they need no offsets) and its share of the tokens."""
+    edits = {pid: [{k: e[k] for k in ('find', 'replace', 'rule')} for e in chunk_edits[pid]] for pid in chunk}
+    changed = {pid: estimate_tokens(json.dumps(edits[pid])) for pid in chunk if edits[pid]}
+    inputs = {pid: estimate_tokens(text) for pid, text in chunk.items()}
+    outputs = _shares(out_tok, changed or inputs)
+    input_shares = _shares(in_tok, inputs)
+    return {pid: {'edits': edits[pid], 'input_tokens': input_shares[pid], 'output_tokens': outputs.get(pid, 0)}
+            for pid in chunk}
+
+
+def correct_paragraphs(ai_rules, paragraphs):
+    """Apply the AI rules to paragraphs given as {id: text}.
+
+    Paragraphs found in the AI correction cache (ai_cache.py) are answered
+    from it. The rest are split into chunks (chunk_paragraphs) sent
+    concurrently, at most AI_MAX_PARALLEL at a time, each to AI_PROVIDER or a
+    fallback (ai_router.py), and cached. Returns a
+    dict with 'edits' ({id: [edit]}, see validate_edits) and 'corrections'
+    ({id: corrected text}), both for every cached paragraph and every
+    paragraph in a chunk that succeeded, unchanged ones included;
+    'changes_made' (the number of edits), 'cached' (paragraphs answered from
+    the cache), 'errors' (one message per failed chunk) and 'skipped'
+    (paragraphs not sent because the request's time budget ran out, see
+    deadline.py), or None if AI is disabled or unconfigured. Raises if every
+    chunk that was sent failed.
     """
     if not ENABLE_CLAUDE_AI:
         logging.info("Claude AI validation is disabled (ENABLE_CLAUDE_AI=False)")
         return None
 
-    client = get_ai_client()
-    if client is None:
+    cache = get_ai_cache()
+    metrics = current_metrics()
+    prompt_hash = rules_prompt_hash(ai_rules)
+    edits = {}
+    pending = dict(paragraphs)
+    keys = {}
+    if cache is not None:
+        keys = {pid: correction_key(prompt_hash, text) for pid, text in paragraphs.items()}
+        found = get_many(cache, keys.values())
+        saved_in = saved_out = 0
+        for pid, text in paragraphs.items():
+            entry = found[keys[pid]]
+            if entry is None:
+                continue
+            edits[pid] = validate_edits(text, entry['edits'])
+            saved_in += entry['input_tokens']
+            saved_out += entry['output_tokens']
+            del pending[pid]
+        logging.info(f"AI cache: {len(edits)} of {len(paragraphs)} paragraph(s) already corrected")
+        if metrics:
+            metrics.record_claude_usage(0, 0, calls=0, cache_hits=len(edits), cache_misses=len(pending),
+                                        saved_input_tokens=saved_in, saved_output_tokens=saved_out)
+    cached = len(edits)
+    if not pending:
+        return _correction_result(paragraphs, edits, cached, [], 0)
+
+    providers = [p for p in [AI_PROVIDER] + AI_FALLBACK_PROVIDERS if get_ai_client(p) is not None]
+    if not providers:
         return None
 
     # Data classification warning for large documents
-    text_len = len(document_text)
+    text_len = sum(len(text) for text in pending.values())
     if text_len > 50000:
         logging.warning(
             f"Large document ({text_len} chars) being sent to external AI service. "
             "Ensure document classification permits external processing."
         )
 
-    prompt = build_dynamic_prompt(ai_rules, document_text)
+    chunks = chunk_paragraphs(pending)
+    logging.info(f"Calling AI ({CLAUDE_MODEL} via {AI_PROVIDER}) with {text_len} chars in "
+                 f"{len(chunks)} chunk(s), {len(ai_rules)} rules")
 
-    logging.info(f"Calling AI ({CLAUDE_MODEL} via {AI_PROVIDER}) with {text_len} chars, {len(ai_rules)} rules")
+    outcomes = []
+    if len(chunks) == 1:
+        try:
+            outcomes.append(correct_chunk(providers, ai_rules, chunks[0]))
+        except Exception as e:
+            outcomes.append(e)
+    else:
+        with ThreadPoolExecutor(max_workers=min(AI_MAX_PARALLEL, len(chunks)),
+                                thread_name_prefix="msv-ai") as pool:
+            futures = [submit_in_context(pool, correct_chunk, providers, ai_rules, chunk) for chunk in chunks]
+            for future in futures:
+                try:
+                    outcomes.append(future.result())
+                except Exception as e:
+                    outcomes.append(e)
 
-    response_text, in_tok, out_tok = _generate(client, prompt)
+    skipped = sum(len(chunk) for chunk, o in zip(chunks, outcomes) if isinstance(o, DeadlineExceeded))
+    if skipped:
+        current_deadline().skip(f"AI rules on {skipped} paragraph(s)")
+    failed = [o for o in outcomes if isinstance(o, Exception) and not isinstance(o, DeadlineExceeded)]
+    errors = [f"{type(o).__name__}: {o}" for o in failed]
+    if failed and len(failed) == len(chunks):
+        raise failed[0]
+    for error in errors:
+        logging.error(f"AI chunk failed: {error}")
 
-    # Track token usage for monitoring (SOC 2 CC7.2)
-    if in_tok is not None or out_tok is not None:
-        logging.info(f"AI tokens — input: {in_tok}, output: {out_tok}")
+    new_entries = {}
+    for chunk, outcome in zip(chunks, outcomes):
+        if isinstance(outcome, Exception):
+            continue
+        chunk_edits, in_tok, out_tok, provider = outcome
+        edits.update(chunk_edits)
+        # Cache keys name AI_PROVIDER and CLAUDE_MODEL: a fallback's answers are not cached
+        if cache is not None and provider == AI_PROVIDER:
+            for pid, entry in cache_entries(chunk, chunk_edits, in_tok, out_tok).items():
+                new_entries[keys[pid]] = entry
+    if new_entries:
+        put_many(cache, new_entries)
+    return _correction_result(paragraphs, edits, cached, errors, skipped)
 
-    json_start = response_text.find('{')
-    json_end = response_text.rfind('}') + 1
 
-    if json_start >= 0 and json_end > json_start:
-        json_text = response_text[json_start:json_end]
-        try:
-            result = json.loads(json_text, strict=False)
-        except json.JSONDecodeError:
-            json_text = json_text.replace('\n', '\\n').replace('\r', '\\r').replace('\t', '\\t')
-            result = json.loads(json_text)
-
-        return {
-            'corrected_text': result.get('corrected_text', ''),
-            'changes_made': result.get('changes_made', 0)
-        }
-
-    raise ValueError("Could not parse JSON from Claude's response")
+def _correction_result(paragraphs, edits, cached, errors, skipped):
+    return {
+        'edits': edits,
+        'corrections': {pid: apply_edits(paragraphs[pid], pid_edits) for pid, pid_edits in edits.items()},
+        'changes_made': sum(len(pid_edits) for pid_edits in edits.values()),
+        'cached': cached,
+        'errors': errors,
+        'skipped': skipped,
+    }
@@ -0,0 +1,257 @@
+"""AI provider routing: failover, circuit breaking and hedging
+
+AI_PROVIDER names the backend that normally serves the AI rules;
+AI_FALLBACK_PROVIDERS lists others (anthropic, foundry, azure_openai) to use
+when it cannot. Every AI call goes through ProviderRouter.route, which keeps
+per backend, for the worker:
+
+  - a rolling window of call latencies and outcomes (AI_LATENCY_WINDOW);
+  - a circuit breaker: after AI_CIRCUIT_FAILURES consecutive failures the
+    backend is skipped for AI_CIRCUIT_OPEN_SECONDS, then given another try
+    by a single call (half-open: a success closes the circuit, a failure
+    opens it again; other calls keep skipping it until then);
+  - optional hedging: once a backend has AI_HEDGE_MIN_SAMPLES latencies, a
+    call still unanswered at its AI_HEDGE_PERCENTILE-th percentile is also
+    sent to the next backend and the first answer wins. The slower call is
+    left to finish in the background and only updates the statistics.
+
+A failed call moves on to the next available backend. A call cut short by the
+request's time budget (DeadlineExceeded, see ai_client.correct_chunk) is not
+the backend's fault: it is not counted as a failure and is not failed over,
+as there is no time left for another call. The router only sees
+`request(provider)` callables, so it can be driven by stub providers; ai_client
+passes one that runs ai_client._generate for that provider.
+"""
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .config import (
+    AI_CIRCUIT_FAILURES, AI_CIRCUIT_OPEN_SECONDS, AI_HEDGE_PERCENTILE, AI_HEDGE_MIN_SAMPLES, AI_LATENCY_WINDOW,
+)
+from .deadline import DeadlineExceeded
+from .monitoring import current_metrics, submit_in_context
+from .worker import WorkerSingleton
+
+# Threads for hedged calls (a losing call holds one until it finishes)
+HEDGE_THREADS = 16
+
+
+class CircuitOpen(RuntimeError):
+    """The backend's circuit is open, or another call is already probing it."""
+
+
+class BackendHealth:
+    """Rolling latencies and outcomes, and the circuit, of one backend."""
+
+    def __init__(self, window, failure_threshold, open_seconds, clock):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.probing = False   # a half-open trial call is in flight
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def record(self, ok, seconds):
+        with self._lock:
+            self.probing = False
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(seconds)
+                self.consecutive_failures = 0
+                self.opened_at = None
+                return
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                self.opened_at = self._clock()
+
+    def available(self):
+        """Closed, or open long enough to be tried again and not being tried."""
+        with self._lock:
+            return self.opened_at is None or (not self.probing and self._due())
+
+    def acquire(self):
+        """Take the right to call the backend: always while closed; once open,
+        only for the single trial call once it is due."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or not self._due():
+                return False
+            self.probing = True
+            return True
+
+    def release(self):
+        """Give up a trial call without an outcome."""
+        with self._lock:
+            self.probing = False
+
+    def _due(self):
+        return self._clock() - self.opened_at >= self.open_seconds
+
+    def percentile(self, pct):
+        with self._lock:
+            ordered = sorted(self.latencies)
+        if not ordered:
+            return None
+        return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+    def snapshot(self):
+        with self._lock:
+            calls = len(self.outcomes)
+            errors = calls - sum(self.outcomes)
+            ordered = sorted(self.latencies)
+            state = "closed" if self.opened_at is None else "half-open" if self.probing else "open"
+        p50 = ordered[len(ordered) // 2] if ordered else None
+        return {
+            "circuit": state,
+            "calls": calls,
+            "error_rate": round(errors / calls, 3) if calls else 0.0,
+            "p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "p95_ms": round(self.percentile(95) * 1000) if ordered else None,
+        }
+
+
+class ProviderRouter:
+    """Routes each AI call to the best available backend. Thread-safe."""
+
+    def __init__(self, failure_threshold=None, open_seconds=None, hedge_percentile=None,
+                 hedge_min_samples=None, window=None, clock=time.monotonic):
+        self.failure_threshold = failure_threshold or AI_CIRCUIT_FAILURES
+        self.open_seconds = AI_CIRCUIT_OPEN_SECONDS if open_seconds is None else open_seconds
+        self.hedge_percentile = AI_HEDGE_PERCENTILE if hedge_percentile is None else hedge_percentile
+        self.hedge_min_samples = AI_HEDGE_MIN_SAMPLES if hedge_min_samples is None else hedge_min_samples
+        self.window = window or AI_LATENCY_WINDOW
+        self._clock = clock
+        self._health = {}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def health(self, provider):
+        with self._lock:
+            if provider not in self._health:
+                self._health[provider] = BackendHealth(self.window, self.failure_threshold,
+                                                       self.open_seconds, self._clock)
+            return self._health[provider]
+
+    def status(self):
+        """{provider: circuit, calls, error_rate, p50_ms, p95_ms} for every backend used."""
+        with self._lock:
+            providers = list(self._health)
+        return {provider: self.health(provider).snapshot() for provider in providers}
+
+    def route(self, request, providers):
+        """Run request(provider) on the first available of `providers` (in
+        order), failing over and hedging as configured. Returns (result,
+        provider). Raises the last error if every backend failed."""
+        order = [p for p in providers if self.health(p).available()]
+        if not order:
+            raise RuntimeError(f"No AI provider available: circuit open for {', '.join(providers)}")
+        delay = self._hedge_delay(order[0]) if len(order) > 1 else None
+        if delay is None:
+            return self._sequential(request, order)
+        return self._hedged(request, order, delay)
+
+    def _hedge_delay(self, provider):
+        health = self.health(provider)
+        if self.hedge_percentile <= 0 or len(health.latencies) < self.hedge_min_samples:
+            return None
+        return health.percentile(self.hedge_percentile)
+
+    def _timed(self, provider, request):
+        health = self.health(provider)
+        if not health.acquire():
+            raise CircuitOpen(f"circuit open for {provider}")
+        start = self._clock()
+        try:
+            result = request(provider)
+        except DeadlineExceeded:
+            health.release()
+            raise
+        except Exception:
+            health.record(False, self._clock() - start)
+            raise
+        health.record(True, self._clock() - start)
+        return result
+
+    def _sequential(self, request, order):
+        last_error = None
+        for n, provider in enumerate(order):
+            try:
+                result = self._timed(provider, request)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                last_error = e
+                logging.warning(f"AI provider {provider} failed: {type(e).__name__}: {e}")
+                continue
+            _record_route(provider, failover=n > 0)
+            return result, provider
+        raise last_error
+
+    def _hedged(self, request, order, delay):
+        pool = self._executor()
+        queue = list(order)
+        pending = {}
+        hedged = failover = False
+        last_error = None
+
+        def launch():
+            provider = queue.pop(0)
+            pending[submit_in_context(pool, self._timed, provider, request)] = provider
+
+        launch()
+        while pending:
+            done, _ = wait(pending, timeout=delay if queue else None, return_when=FIRST_COMPLETED)
+            if not done:
+                logging.info(f"AI call slower than {delay * 1000:.0f} ms: hedging to {queue[0]}")
+                hedged = True
+                launch()
+                continue
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    if isinstance(e, DeadlineExceeded):
+                        queue.clear()   # no time for another backend
+                    logging.warning(f"AI provider {provider} failed: {type(e).__name__}: {e}")
+                    continue
+                _record_route(provider, hedged=hedged, failover=failover)
+                return result, provider
+            if not pending and queue:
+                failover = True
+                launch()
+        raise last_error
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=HEDGE_THREADS, thread_name_prefix="msv-hedge")
+            return self._pool
+
+
+def _record_route(provider, hedged=False, failover=False):
+    metrics = current_metrics()
+    if metrics:
+        metrics.record_ai_route(provider, hedged=hedged, failover=failover)
+
+
+_router = WorkerSingleton(ProviderRouter)
+
+
+def get_ai_router():
+    """The worker's ProviderRouter: one set of circuit and latency stats per worker."""
+    return _router.get()
+
+
+def set_ai_router(router):
+    """Swap in a router with fresh stats (tests)."""
+    _router.set(router)
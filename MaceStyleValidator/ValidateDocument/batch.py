@@ -0,0 +1,379 @@
+"""Batch validation: many documents in one call
+
+ValidateDocument takes one document per HTTP call, and each call fetches its
+own token and rules. ValidateBatch takes up to BATCH_MAX_DOCUMENTS at once,
+either as file URLs (JSON: {"fileUrls": [...]}, or {"documents": [{"fileUrl":
+..., "itemId": ...}]}) or as a ZIP of documents (Content-Type:
+application/zip), and shares the per-call work between them:
+
+  - one Graph token and one copy of the rules for the whole batch;
+  - one AI pass: the AI paragraphs of every Word document are collected and
+    corrected together through the worker's AI client (ai_batch.AIBatch
+    .run_direct), so a paragraph that appears in several documents is sent
+    once;
+  - validation itself, which is CPU-bound, runs in a pool of BATCH_PROCESSES
+    processes (one per core by default), kept for the life of the worker. Each
+    document goes to its process with its AI corrections, so the processes do
+    not call the AI provider themselves (except for paragraphs whose AI call
+    failed here).
+
+The answer is NDJSON: one line per document (the fields of a ValidateDocument
+response, or "error"), in the order the documents finish, then a summary line.
+Documents given by URL are written back to SharePoint as by ValidateDocument
+when the function owns the writes; the others carry reportHtml and
+fixedFileContent. Like ValidateDocument, the batch has a time budget
+(deadline.py), which the pool processes are given too: documents not
+finished when it runs out are reported as not validated, and their
+validations stop rather than run on after the answer.
+"""
+import base64
+import json
+import logging
+import multiprocessing
+import os
+import posixpath
+import queue
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+import azure.functions as func
+
+from .access_control import check_access, get_caller_identity
+from .ai_batch import AIBatch
+from .ai_cache import get_ai_cache, set_ai_cache, put_many
+from .config import (
+    MAX_FILE_SIZE_BYTES, ENABLE_FUNCTION_SHAREPOINT_WRITES, AI_CACHE_MAX_MB,
+    BATCH_MAX_DOCUMENTS, BATCH_PROCESSES, BATCH_IO_CONCURRENCY, get_graph_token,
+)
+from .core import is_supported, validate_file
+from .deadline import Deadline, DeadlineExceeded, bind_deadline
+from .monitoring import ValidationMetrics, emit_audit_event, generate_request_id
+from .report import generate_report, final_status, status_description, document_links
+from .result_cache import ResultCache, get_result_cache, file_digest, rules_fingerprint, content_key
+from .sharepoint_client import fetch_validation_rules, download_file, FileTooLargeError
+from .transport import document_fields
+from .worker import WorkerSingleton
+from .write_back import new_job as new_write_back, run_write_back, report_path
+
+ZIP_CONTENT_TYPES = ("application/zip", "application/x-zip-compressed")
+
+
+class BatchRequestError(ValueError):
+    """The batch request cannot be read (answered 400)."""
+
+
+# -- the validation processes --------------------------------------------------
+
+def _init_process():
+    # A process answers AI corrections from the entries sent with each
+    # document: an in-memory cache, not the worker's shared store
+    if AI_CACHE_MAX_MB > 0:
+        set_ai_cache(ResultCache(AI_CACHE_MAX_MB * 1024 * 1024))
+
+
+def validate_document(extension, data, rules, ai_entries=None, expires_at=None):
+    """Validate one document, in a pool process. `expires_at` (time.time())
+    is when the batch's time budget runs out: the process starts no work
+    after it, as a single validation would not. Returns (issues,
+    fixes_applied, fixed file bytes or None, ai_complete, skipped) - the
+    picklable part of core.validate_file's result."""
+    deadline = None
+    if expires_at is not None:
+        if expires_at <= time.time():
+            raise DeadlineExceeded("the batch's time budget ran out before this document started")
+        deadline = Deadline(expires_at - time.time(), reserve_seconds=0)
+    cache = get_ai_cache()
+    if ai_entries and cache is not None:
+        put_many(cache, ai_entries)
+    with bind_deadline(deadline):
+        result, fixed_stream = validate_file(extension, BytesIO(data), rules)
+    return (result['issues'], result['fixes_applied'],
+            fixed_stream.getvalue() if result['fixes_applied'] else None, result['ai_complete'],
+            list(deadline.skipped) if deadline else [])
+
+
+def _new_pool():
+    if BATCH_PROCESSES > 0:
+        # spawn, not fork: the Functions worker process runs threads
+        return ProcessPoolExecutor(max_workers=BATCH_PROCESSES, initializer=_init_process,
+                                   mp_context=multiprocessing.get_context("spawn"))
+    return ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="msv-batch")
+
+
+_pool = WorkerSingleton(_new_pool, on_drop=lambda pool: pool.shutdown(wait=False, cancel_futures=True))
+
+
+def get_validation_pool():
+    """The worker-wide pool documents are validated in: BATCH_PROCESSES
+    processes (started on first use), or threads when BATCH_PROCESSES is 0."""
+    return _pool.get()
+
+
+def set_validation_pool(pool):
+    """Replace the pool (tests); None shuts the current one down, and the
+    next batch starts a new one from config."""
+    _pool.set(pool)
+
+
+# -- reading the request -------------------------------------------------------
+
+def read_batch(req):
+    """The documents of a ValidateBatch request: a list of dicts with name,
+    path (ZIP entry or URL), url, item_id, data (bytes, or None until
+    downloaded) and error. Raises BatchRequestError."""
+    content_type = (req.headers.get("Content-Type") or "").split(";", 1)[0].strip().lower()
+    if content_type in ZIP_CONTENT_TYPES:
+        return _read_zip(req.get_body())
+    try:
+        body = req.get_json()
+    except ValueError:
+        body = None
+    if not isinstance(body, dict):
+        raise BatchRequestError("Send JSON with fileUrls (or documents), or a ZIP of documents")
+    entries = body.get("documents") or [{"fileUrl": url} for url in body.get("fileUrls") or []]
+    documents = []
+    for fields in entries:
+        item_id, file_name, file_url = document_fields(fields)
+        if not file_url:
+            raise BatchRequestError("Every document needs a fileUrl")
+        documents.append(_document(file_name or posixpath.basename(file_url), file_url, url=file_url,
+                                   item_id=item_id))
+    _check_count(len(documents))
+    return documents
+
+
+def _read_zip(data):
+    try:
+        archive = zipfile.ZipFile(BytesIO(data))
+    except zipfile.BadZipFile:
+        raise BatchRequestError("The request body is not a valid ZIP archive")
+    entries = [info for info in archive.infolist()
+               if not info.is_dir() and not info.filename.startswith("__MACOSX/")]
+    _check_count(len(entries))
+    documents = []
+    for info in entries:
+        document = _document(posixpath.basename(info.filename), info.filename)
+        if info.file_size > MAX_FILE_SIZE_BYTES:
+            document["error"] = str(FileTooLargeError(info.file_size, MAX_FILE_SIZE_BYTES))
+        elif is_supported(_extension(document)):
+            # The sizes in a ZIP are declared, not checked: read no more than the limit
+            with archive.open(info) as f:
+                content = f.read(MAX_FILE_SIZE_BYTES + 1)
+            if len(content) > MAX_FILE_SIZE_BYTES:
+                document["error"] = str(FileTooLargeError(MAX_FILE_SIZE_BYTES, MAX_FILE_SIZE_BYTES, exact=False))
+            else:
+                document["data"] = content
+        documents.append(document)
+    return documents
+
+
+def _document(name, path, url=None, item_id=None):
+    return {"name": name, "path": path, "url": url, "item_id": item_id, "data": None, "error": None}
+
+
+def _check_count(count):
+    if not count:
+        raise BatchRequestError("The batch has no documents")
+    if count > BATCH_MAX_DOCUMENTS:
+        raise BatchRequestError(f"Too many documents ({count}); at most {BATCH_MAX_DOCUMENTS} per batch")
+
+
+def _extension(document):
+    return os.path.splitext(document["name"])[1].lower()
+
+
+# -- running the batch ---------------------------------------------------------
+
+def validate_batch(req):
+    """ValidateBatch: validate the request's documents and answer NDJSON."""
+    batch_id = generate_request_id()
+    denied = check_access(req)
+    if denied:
+        emit_audit_event({"event_type": "access_denied", "request_id": batch_id,
+                          "caller": get_caller_identity(req)})
+        return denied
+    caller = get_caller_identity(req)
+    try:
+        documents = read_batch(req)
+    except BatchRequestError as e:
+        return func.HttpResponse(json.dumps({"error": str(e)}), mimetype="application/json", status_code=400)
+
+    logging.info(f"[{batch_id}] Validating a batch of {len(documents)} document(s)")
+    # Functions buffers HTTP responses: the lines are sent together, in the
+    # order the documents finished
+    body = "".join(json.dumps(line) + "\n" for line in run_batch(batch_id, documents, caller))
+    return func.HttpResponse(body, mimetype="application/x-ndjson", status_code=200,
+                             headers={"X-Batch-Id": batch_id})
+
+
+def run_batch(batch_id, documents, caller):
+    """Validate `documents` (see read_batch), yielding one result per document
+    as each finishes, then a summary."""
+    started = time.monotonic()
+    deadline = Deadline()
+    for document in documents:
+        document["metrics"] = ValidationMetrics(request_id=generate_request_id(), filename=document["name"],
+                                                caller=caller)
+        document["metrics"].file_type = _extension(document)
+        if not document["error"] and not is_supported(_extension(document)):
+            document["error"] = f"Unsupported file type: {_extension(document)}"
+    token = get_graph_token() if any(d["url"] for d in documents) else None
+    rules = fetch_validation_rules(None)
+    fingerprint = rules_fingerprint(rules)
+    cache = get_result_cache()
+    results = queue.Queue()
+    closed = threading.Event()
+    counts = {"documents": len(documents), "validated": 0, "failed": 0, "notValidated": 0}
+
+    with bind_deadline(deadline), \
+            ThreadPoolExecutor(max_workers=BATCH_IO_CONCURRENCY, thread_name_prefix="msv-batch-io") as io:
+        list(io.map(lambda d: _download(token, d), documents))
+        ready = [d for d in documents if not d["error"]]
+
+        # One AI pass for every document, through this worker's AI client
+        ai = AIBatch(rules)
+        for document in ready:
+            ai.add(document["path"], document["data"])
+        ai.run_direct()
+
+        def finish(document, outcome):
+            if not closed.is_set():
+                results.put(_finish(document, outcome, token))
+
+        def validated(document, key, future):
+            try:
+                outcome = future.result()
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    set_validation_pool(None)
+                if not closed.is_set():
+                    results.put(_failed(document, f"{type(e).__name__}: {e}"))
+                return
+            # As for one document: a partial result, or one the AI failed on, is not cached
+            if cache and key and outcome[3] and not outcome[4]:
+                cache.put(key, {'issues': outcome[0], 'fixes_applied': outcome[1], 'fixed_bytes': outcome[2]})
+            try:
+                io.submit(finish, document, outcome)
+            except RuntimeError:
+                pass   # the batch ran out of time and has answered
+
+        pool = get_validation_pool()
+        # Cancelling the futures only stops documents not yet started: the
+        # running ones stop themselves at the batch's deadline
+        expires_at = time.time() + deadline.remaining() if deadline.budget_seconds > 0 else None
+        futures = []
+        for document in documents:
+            if document["error"]:
+                results.put(_failed(document, document["error"]))
+                continue
+            key = content_key(file_digest(BytesIO(document["data"])), fingerprint) if cache else None
+            cached = cache.get(key) if key else None
+            if cached:
+                document["metrics"].result_cache = "hit"
+                io.submit(finish, document,
+                          (cached['issues'], cached['fixes_applied'], cached.get('fixed_bytes'), True, []))
+                continue
+            future = pool.submit(validate_document, _extension(document), document["data"], rules,
+                                 ai.entries(document["path"]), expires_at)
+            future.add_done_callback(lambda f, d=document, k=key: validated(d, k, f))
+            futures.append(future)
+
+        answered = set()
+        while len(answered) < len(documents):
+            timeout = max(deadline.remaining(), 0) if deadline.budget_seconds > 0 else None
+            try:
+                line = results.get(timeout=timeout)
+            except queue.Empty:
+                break
+            answered.add(line["requestId"])
+            counts["failed" if "error" in line else "validated"] += 1
+            yield line
+
+        if len(answered) < len(documents):
+            closed.set()
+            for future in futures:
+                future.cancel()
+            for document in documents:
+                if document["metrics"].request_id not in answered:
+                    counts["notValidated"] += 1
+                    yield _failed(document, "Not validated: the batch's time budget ran out")
+
+    counts["durationMs"] = int((time.monotonic() - started) * 1000)
+    logging.info(f"[{batch_id}] Batch done: {counts}")
+    yield {"batchId": batch_id, "summary": counts}
+
+
+def _download(token, document):
+    if document["error"] or document["data"] is not None:
+        return
+    try:
+        file_stream = download_file(token, document["url"], max_bytes=MAX_FILE_SIZE_BYTES)
+        with file_stream:
+            document["data"] = file_stream.read()
+    except Exception as e:
+        document["error"] = f"Download failed: {type(e).__name__}: {e}"
+
+
+def _line(document):
+    return {"requestId": document["metrics"].request_id, "fileName": document["name"],
+            "fileUrl": document["url"] or document["path"]}
+
+
+def _failed(document, error):
+    metrics = document["metrics"]
+    metrics.fail(error)
+    emit_audit_event(metrics.to_audit_entry())
+    logging.warning(f"[{metrics.request_id}] {document['name']}: {error}")
+    line = _line(document)
+    line.update(status="Error", error=error)
+    return line
+
+
+def _finish(document, outcome, token):
+    """The result line of a validated document: report, and write-back when
+    the function owns the writes and the document came from SharePoint."""
+    issues, fixes_applied, fixed_bytes, _ai_complete, skipped = outcome
+    metrics = document["metrics"]
+    metrics.skipped_checks = list(skipped)
+    name, file_url = document["name"], document["url"]
+    try:
+        status = final_status(issues, fixes_applied, skipped=skipped)
+        remaining = [i for i in issues if isinstance(i, dict)]
+        document_url, library_url = document_links(file_url)
+        report_html = generate_report(name, issues, fixes_applied, document_url=document_url,
+                                      library_url=library_url, skipped=skipped)
+        line = _line(document)
+        line.update({
+            "status": status,
+            "description": status_description(status, issues, fixes_applied),
+            "issuesFound": len(remaining) + len(fixes_applied),
+            "issuesFixed": len(fixes_applied),
+            "remainingIssues": len(remaining),
+            "reportFileName": f"{os.path.splitext(name)[0]}_ValidationReport.html",
+        })
+        if skipped:
+            line["partial"] = True
+            line["skipped"] = skipped
+        if ENABLE_FUNCTION_SHAREPOINT_WRITES and file_url:
+            write_back = new_write_back(metrics.request_id, name, file_url, document["item_id"], status,
+                                        len(issues), len(fixes_applied), report_html,
+                                        report_path(name, file_url), fixed_bytes)
+            errors = run_write_back(write_back, token)
+            if errors:
+                metrics.write_back_errors = errors
+                line["writeBackErrors"] = errors
+            line["reportUrl"] = (write_back["done"].get("upload_report") or {}).get("web_url")
+            line["validationResultUrl"] = (write_back["done"].get("save_results") or {}).get("list_item_url")
+        else:
+            line["reportHtml"] = report_html
+            if fixed_bytes:
+                line["fixedFileContent"] = base64.b64encode(fixed_bytes).decode("ascii")
+    except Exception as e:
+        return _failed(document, f"{type(e).__name__}: {e}")
+    metrics.complete(status=status, issues=len(issues), fixes=len(fixes_applied))
+    emit_audit_event(metrics.to_audit_entry())
+    return line
@@ -1,7 +1,8 @@
 """Configuration and authentication for MaceStyle Validator"""
 import os
-import msal
-import requests
+import tempfile
+
+from .credentials import acquire_graph_token
 
 # Claude AI configuration
 # Toggle AI validation via the ENABLE_CLAUDE_AI app setting ("true"/"false"). Default off.
@@ -16,6 +17,22 @@ ENABLE_CLAUDE_AI = os.environ.get("ENABLE_CLAUDE_AI", "false").lower() == "true"
 #                    (e.g. "gpt-5-mini").
 AI_PROVIDER = os.environ.get("AI_PROVIDER", "anthropic")
 CLAUDE_MODEL = os.environ.get("CLAUDE_MODEL", "claude-haiku-4-5-20251001")
+# Fallback backends (ai_router.py), in order, for when AI_PROVIDER fails or is slow,
+# e.g. "azure_openai" or "foundry,azure_openai". Each uses the model or deployment
+# named by AI_MODEL_<PROVIDER> (e.g. AI_MODEL_AZURE_OPENAI=gpt-5-mini), else CLAUDE_MODEL.
+AI_FALLBACK_PROVIDERS = [p.strip() for p in os.environ.get("AI_FALLBACK_PROVIDERS", "").split(",")
+                         if p.strip() and p.strip() != AI_PROVIDER]
+AI_FALLBACK_MODELS = {p: os.environ.get(f"AI_MODEL_{p.upper()}") or CLAUDE_MODEL for p in AI_FALLBACK_PROVIDERS}
+# Circuit breaker: after AI_CIRCUIT_FAILURES consecutive failed calls a backend is
+# skipped for AI_CIRCUIT_OPEN_SECONDS, then tried again.
+AI_CIRCUIT_FAILURES = int(os.environ.get("AI_CIRCUIT_FAILURES", "3"))
+AI_CIRCUIT_OPEN_SECONDS = float(os.environ.get("AI_CIRCUIT_OPEN_SECONDS", "60"))
+# Hedging: a call still unanswered after the AI_HEDGE_PERCENTILE-th percentile of the
+# backend's last AI_LATENCY_WINDOW latencies is also sent to the next backend, and
+# the first answer wins. Off at 0; needs AI_HEDGE_MIN_SAMPLES latencies to start.
+AI_HEDGE_PERCENTILE = float(os.environ.get("AI_HEDGE_PERCENTILE", "0"))
+AI_HEDGE_MIN_SAMPLES = int(os.environ.get("AI_HEDGE_MIN_SAMPLES", "20"))
+AI_LATENCY_WINDOW = int(os.environ.get("AI_LATENCY_WINDOW", "100"))
 
 # Azure OpenAI settings (only used when AI_PROVIDER=azure_openai). The key defaults to the
 # shared Foundry resource key since GPT and Claude can co-live on one AIServices resource.
@@ -34,8 +51,147 @@ AZURE_OPENAI_REASONING_EFFORT = os.environ.get("AZURE_OPENAI_REASONING_EFFORT",
 # write directly (legacy behaviour) — but only if the flow's write actions are
 # removed, otherwise you get duplicate list items / report files.
 ENABLE_FUNCTION_SHAREPOINT_WRITES = False
+# Post-validation write-back (write_back.py), only used when the function owns writes.
+# "inline" finishes the SharePoint writes before responding; "background" responds
+# straight after validation and journals the writes to WRITE_BACK_JOURNAL_DIR until
+# they succeed. The default is under HOME, which on App Service is the /home share:
+# it survives a restart and every instance sees it.
+WRITE_BACK_MODE = os.environ.get("WRITE_BACK_MODE", "inline").lower()
+WRITE_BACK_CONCURRENCY = int(os.environ.get("WRITE_BACK_CONCURRENCY", "2"))
+WRITE_BACK_JOURNAL_DIR = os.environ.get(
+    "WRITE_BACK_JOURNAL_DIR",
+    os.path.join(os.environ.get("HOME") or tempfile.gettempdir(), "data", "macestyle-writeback"))
+WRITE_BACK_MAX_ATTEMPTS = int(os.environ.get("WRITE_BACK_MAX_ATTEMPTS", "5"))
 CLAUDE_MAX_TOKENS = 8192
 CLAUDE_TEMPERATURE = 0.3
+# AI requests (ai_client.correct_paragraphs): paragraphs go out in chunks of about
+# AI_CHUNK_TOKENS estimated input tokens, so each chunk's corrected text fits in the
+# response limit, with up to AI_MAX_PARALLEL chunks in flight at once.
+AI_CHUNK_TOKENS = int(os.environ.get("AI_CHUNK_TOKENS", "3000"))
+AI_MAX_PARALLEL = int(os.environ.get("AI_MAX_PARALLEL", "4"))
+# AI provider HTTP: one client per provider per worker (ai_client.get_ai_client)
+# with a keep-alive pool of AI_POOL_SIZE connections, so chunked calls reuse TLS
+# connections instead of opening one each.
+AI_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("AI_CONNECT_TIMEOUT_SECONDS", "10"))
+AI_READ_TIMEOUT_SECONDS = float(os.environ.get("AI_READ_TIMEOUT_SECONDS", "300"))
+AI_POOL_SIZE = int(os.environ.get("AI_POOL_SIZE", "16"))
+AI_KEEPALIVE_SECONDS = float(os.environ.get("AI_KEEPALIVE_SECONDS", "120"))
+# Mark the rules preamble for provider prompt caching (Anthropic and Foundry;
+# Azure OpenAI caches repeated prefixes automatically). It only takes effect
+# once the preamble reaches the model's minimum cacheable length.
+AI_PROMPT_CACHING = os.environ.get("AI_PROMPT_CACHING", "true").lower() == "true"
+# Which Word paragraphs the AI sees: "all" non-empty paragraphs, or only the
+# "candidates" that look like prose (no short table cells, codes or contents entries).
+AI_PARAGRAPH_SELECTION = os.environ.get("AI_PARAGRAPH_SELECTION", "all").lower()
+# AI correction cache (ai_cache.py): paragraphs already corrected by the same
+# provider, model and AI rules are not sent again. AI_CACHE_MAX_MB bounds the
+# per-worker copy (0 disables it); AI_CACHE_STORE=local|blob also keeps entries
+# in AI_CACHE_DIR or the Function App's storage account for every instance.
+AI_CACHE_MAX_MB = int(os.environ.get("AI_CACHE_MAX_MB", "64"))
+AI_CACHE_STORE = os.environ.get("AI_CACHE_STORE", "none").lower()
+AI_CACHE_DIR = os.environ.get("AI_CACHE_DIR", os.path.join(tempfile.gettempdir(), "macestyle-ai-cache"))
+AI_CACHE_TTL_SECONDS = int(os.environ.get("AI_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+# Offline batch mode (ai_batch.py) for library-wide re-validation: provider batch
+# jobs of up to AI_BATCH_MAX_REQUESTS chunks, polled every AI_BATCH_POLL_SECONDS
+# (the library sweep checks them once per sweep instead) and cancelled if not
+# finished within AI_BATCH_TIMEOUT_SECONDS.
+AI_BATCH_MAX_REQUESTS = int(os.environ.get("AI_BATCH_MAX_REQUESTS", "10000"))
+AI_BATCH_POLL_SECONDS = float(os.environ.get("AI_BATCH_POLL_SECONDS", "30"))
+AI_BATCH_TIMEOUT_SECONDS = float(os.environ.get("AI_BATCH_TIMEOUT_SECONDS", str(24 * 3600)))
+# Per-request time budget (deadline.py). Azure ends HTTP-triggered calls after
+# 230 s, so validation starts no new work once less than VALIDATION_RESERVE_SECONDS
+# (kept for the report and write-back) of VALIDATION_BUDGET_SECONDS is left, and
+# returns a partial result instead; 0 disables the budget. AI_CHUNK_SECONDS is the
+# expected duration of one AI call until the router has measured some.
+VALIDATION_BUDGET_SECONDS = float(os.environ.get("VALIDATION_BUDGET_SECONDS", "200"))
+VALIDATION_RESERVE_SECONDS = float(os.environ.get("VALIDATION_RESERVE_SECONDS", "20"))
+AI_CHUNK_SECONDS = float(os.environ.get("AI_CHUNK_SECONDS", "30"))
+# Asynchronous validation (jobs.py): ValidateDocumentAsync queues a job and
+# RunValidationJob works through it in stages, checkpointing to JOB_STORE
+# (local: JOB_STORE_DIR, blob: the Function App's storage account). Like the
+# write-back journal, JOB_STORE_DIR defaults to the /home share, so a job queued
+# on one instance is found by whichever instance takes its queue message, and
+# the sweep state survives a restart. A run starts no new work once
+# JOB_BUDGET_SECONDS less VALIDATION_RESERVE_SECONDS have passed (keep it under
+# functionTimeout) and queues the job again to resume. From run JOB_MAX_RUNS on,
+# a partial result is accepted and a failure is final.
+JOB_STORE = os.environ.get("JOB_STORE", "local").lower()
+JOB_STORE_DIR = os.environ.get(
+    "JOB_STORE_DIR",
+    os.path.join(os.environ.get("HOME") or tempfile.gettempdir(), "data", "macestyle-jobs"))
+JOB_BUDGET_SECONDS = float(os.environ.get("JOB_BUDGET_SECONDS", "240"))
+JOB_MAX_RUNS = int(os.environ.get("JOB_MAX_RUNS", "5"))
+# Library sweep (sweep.py): the SweepLibrary timer validates every supported
+# document changed since the last sweep, read with the drive delta API, with up
+# to SWEEP_CONCURRENCY documents in flight, in groups of SWEEP_BATCH_DOCUMENTS
+# whose AI work is submitted as provider batch jobs (ai_batch.py) and which are
+# validated by a later sweep, once the jobs have ended. Its delta link, the
+# versions it has validated and the batch jobs it is waiting for are kept in
+# JOB_STORE. A sweep starts no new document once
+# SWEEP_BUDGET_SECONDS less VALIDATION_RESERVE_SECONDS have passed; the next one
+# carries on. A document that fails is retried by the next SWEEP_MAX_ATTEMPTS-1
+# sweeps. Off unless ENABLE_LIBRARY_SWEEP=true.
+ENABLE_LIBRARY_SWEEP = os.environ.get("ENABLE_LIBRARY_SWEEP", "false").lower() == "true"
+SWEEP_CONCURRENCY = int(os.environ.get("SWEEP_CONCURRENCY", "4"))
+SWEEP_BUDGET_SECONDS = float(os.environ.get("SWEEP_BUDGET_SECONDS", "240"))
+SWEEP_MAX_ATTEMPTS = int(os.environ.get("SWEEP_MAX_ATTEMPTS", "3"))
+SWEEP_BATCH_DOCUMENTS = int(os.environ.get("SWEEP_BATCH_DOCUMENTS", "50"))
+# Batch validation (batch.py): ValidateBatch takes up to BATCH_MAX_DOCUMENTS
+# documents (file URLs, or a ZIP) in one call and validates them in a pool of
+# BATCH_PROCESSES processes (default one per core; 0 validates on threads in
+# the worker's own process). Downloads and write-backs run BATCH_IO_CONCURRENCY
+# at a time.
+BATCH_MAX_DOCUMENTS = int(os.environ.get("BATCH_MAX_DOCUMENTS", "50"))
+BATCH_PROCESSES = int(os.environ.get("BATCH_PROCESSES", str(os.cpu_count() or 1)))
+BATCH_IO_CONCURRENCY = int(os.environ.get("BATCH_IO_CONCURRENCY", "4"))
+
+# Microsoft Graph endpoint. Only overridden to point tests and benchmarks at a
+# local stand-in (see graph_stub.py).
+GRAPH_API_BASE = os.environ.get("GRAPH_API_BASE", "https://graph.microsoft.com/v1.0").rstrip("/")
+
+# Graph HTTP client (graph_client.py): timeouts, retries on 429/503/504 and a
+# client-side rate limit shared by every request in the worker.
+GRAPH_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("GRAPH_CONNECT_TIMEOUT_SECONDS", "5"))
+GRAPH_READ_TIMEOUT_SECONDS = float(os.environ.get("GRAPH_READ_TIMEOUT_SECONDS", "60"))
+GRAPH_MAX_RETRIES = int(os.environ.get("GRAPH_MAX_RETRIES", "4"))
+GRAPH_RATE_LIMIT_PER_SECOND = float(os.environ.get("GRAPH_RATE_LIMIT_PER_SECOND", "20"))
+GRAPH_POOL_SIZE = int(os.environ.get("GRAPH_POOL_SIZE", "16"))
+
+# Files above GRAPH_SIMPLE_UPLOAD_MAX_BYTES (Graph's 4 MB limit for a single
+# PUT .../content) are uploaded through an upload session in chunks of
+# GRAPH_UPLOAD_CHUNK_BYTES, which Graph requires to be a multiple of 320 KiB.
+GRAPH_SIMPLE_UPLOAD_MAX_BYTES = int(os.environ.get("GRAPH_SIMPLE_UPLOAD_MAX_BYTES", str(4 * 1024 * 1024)))
+GRAPH_UPLOAD_CHUNK_BYTES = int(os.environ.get("GRAPH_UPLOAD_CHUNK_BYTES", str(16 * 320 * 1024)))  # 5 MiB
+
+# Largest document the validator accepts (base64 or downloaded); bigger files get HTTP 413.
+MAX_FILE_SIZE_BYTES = int(os.environ.get("MAX_FILE_SIZE_BYTES", str(50 * 1024 * 1024)))
+# Downloads are streamed into a SpooledTemporaryFile that moves to local disk
+# once it passes DOWNLOAD_SPOOL_MAX_BYTES.
+DOWNLOAD_SPOOL_MAX_BYTES = int(os.environ.get("DOWNLOAD_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+
+# Style Rules cache. Warm workers reuse the rules they already hold for this
+# many seconds; after that the stale copy is still served while a background
+# refresh checks the list's lastModifiedDateTime. 0 disables the cache.
+STYLE_RULES_CACHE_TTL_SECONDS = int(os.environ.get("STYLE_RULES_CACHE_TTL_SECONDS", "300"))
+
+# Reported in logs/health and part of the result-cache key: bump it whenever a
+# validator change means old results must not be reused.
+VALIDATOR_VERSION = "5.1.0-governed"
+
+# Result cache (result_cache.py): identical bytes + rules return the stored
+# result. RESULT_CACHE_MAX_MB bounds the per-worker copy (0 disables the cache);
+# RESULT_CACHE_STORE=local|blob also keeps entries in RESULT_CACHE_DIR or the
+# Function App's storage account so other instances can reuse them.
+RESULT_CACHE_MAX_MB = int(os.environ.get("RESULT_CACHE_MAX_MB", "256"))
+RESULT_CACHE_STORE = os.environ.get("RESULT_CACHE_STORE", "none").lower()
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "macestyle-results"))
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get("RESULT_CACHE_TTL_SECONDS", str(24 * 3600)))
+
+# Paragraph cache (paragraph_cache.py): Word paragraphs already known to be
+# clean, and AI corrections already made, are not checked again. Entries per
+# worker (a key is ~100 bytes); 0 disables incremental re-validation.
+PARAGRAPH_CACHE_MAX_ENTRIES = int(os.environ.get("PARAGRAPH_CACHE_MAX_ENTRIES", "200000"))
 
 # SharePoint list IDs - must be set via env vars
 DOC_LIBRARY_LIST_ID = os.environ.get("SHAREPOINT_DOC_LIBRARY_ID")
@@ -43,7 +199,7 @@ VALIDATION_RESULTS_LIST_ID = os.environ.get("SHAREPOINT_VALIDATION_RESULTS_ID")
 
 
 def get_graph_token():
-    """Get Microsoft Graph API access token using MSAL"""
+    """Get Microsoft Graph API access token (shared MSAL app, cached until near expiry)"""
     tenant_id = os.environ.get("SHAREPOINT_TENANT_ID")
     client_id = os.environ.get("SHAREPOINT_CLIENT_ID")
     client_secret = os.environ.get("SHAREPOINT_CLIENT_SECRET")
@@ -54,15 +210,7 @@ def get_graph_token():
             "SHAREPOINT_CLIENT_ID, and SHAREPOINT_CLIENT_SECRET."
         )
 
-    authority = f"https://login.microsoftonline.com/{tenant_id}"
-    app = msal.ConfidentialClientApplication(
-        client_id, authority=authority, client_credential=client_secret
-    )
-    result = app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
-
-    if "access_token" in result:
-        return result["access_token"]
-    raise Exception(f"Failed to acquire token: {result.get('error_description', result)}")
+    return acquire_graph_token(tenant_id, client_id, client_secret)
 
 
 def get_site_info():
@@ -87,15 +235,8 @@ def get_style_rules_token():
     if not all([tenant_id, client_id, client_secret]):
         raise ValueError("Missing style rules credentials. Set STYLE_RULES_TENANT_ID/CLIENT_ID/CLIENT_SECRET.")
 
-    authority = f"https://login.microsoftonline.com/{tenant_id}"
-    app = msal.ConfidentialClientApplication(
-        client_id, authority=authority, client_credential=client_secret
-    )
-    result = app.acquire_token_for_client(scopes=["https://graph.microsoft.com/.default"])
-
-    if "access_token" in result:
-        return result["access_token"]
-    raise Exception(f"Failed to acquire style rules token: {result.get('error_description', result)}")
+    return acquire_graph_token(tenant_id, client_id, client_secret,
+                               error_message="Failed to acquire style rules token")
 
 
 def get_style_rules_site_info():
@@ -112,12 +253,8 @@ def get_style_rules_site_info():
 
 
 def get_site_id(token=None):
-    """Get SharePoint site ID from Graph API"""
+    """Get SharePoint site ID from Graph API (memoised per worker by sharepoint_client)"""
+    from .sharepoint_client import get_site_id as _get_site_id
     if token is None:
         token = get_graph_token()
-    site = get_site_info()
-    url = f"https://graph.microsoft.com/v1.0/sites/{site['hostname']}:{site['site_path']}"
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()["id"]
+    return _get_site_id(token)
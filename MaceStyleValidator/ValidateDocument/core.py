@@ -0,0 +1,63 @@
+"""Format dispatch: run the right validator for a file and serialise the fixed copy"""
+import os
+import tempfile
+from io import BytesIO
+
+from .word_validator import validate_word_document
+from .visio_validator import validate_visio_document
+from .excel_validator import validate_excel_document
+from .powerpoint_validator import validate_powerpoint_document
+
+WORD_EXTENSIONS = ['.docx', '.doc', '.docm', '.dotx', '.dotm']
+VISIO_EXTENSIONS = ['.vsdx', '.vsd']
+EXCEL_EXTENSIONS = ['.xlsx', '.xls', '.xlsm']
+POWERPOINT_EXTENSIONS = ['.pptx', '.ppt', '.pptm', '.potx', '.potm']
+SUPPORTED_EXTENSIONS = WORD_EXTENSIONS + VISIO_EXTENSIONS + EXCEL_EXTENSIONS + POWERPOINT_EXTENSIONS
+
+
+def is_supported(file_extension):
+    return file_extension in SUPPORTED_EXTENSIONS
+
+
+def validate_file(file_extension, file_stream, rules):
+    """Validate one document. Returns (result, fixed_stream): the validator's
+    result dict (issues, fixes_applied, document, and ai_complete - False when
+    an AI request failed, so the result should not be cached) and the fixed
+    file, rewound."""
+    if file_extension in WORD_EXTENSIONS:
+        result = validate_word_document(file_stream, rules)
+        fixed_stream = BytesIO()
+        result['document'].save(fixed_stream)
+
+    elif file_extension in VISIO_EXTENSIONS:
+        result = validate_visio_document(file_stream, rules)
+        tmp_out_path = None
+        try:
+            with tempfile.NamedTemporaryFile(suffix='.vsdx', delete=False) as tmp_out:
+                tmp_out_path = tmp_out.name
+            result['document'].save_vsdx(tmp_out_path)
+            with open(tmp_out_path, 'rb') as f:
+                fixed_stream = BytesIO(f.read())
+        finally:
+            if tmp_out_path:
+                try:
+                    os.unlink(tmp_out_path)
+                except Exception:
+                    pass
+
+    elif file_extension in EXCEL_EXTENSIONS:
+        result = validate_excel_document(file_stream, rules)
+        fixed_stream = BytesIO()
+        result['document'].save(fixed_stream)
+
+    elif file_extension in POWERPOINT_EXTENSIONS:
+        result = validate_powerpoint_document(file_stream, rules)
+        fixed_stream = BytesIO()
+        result['document'].save(fixed_stream)
+
+    else:
+        raise ValueError(f"Unsupported file type: {file_extension}")
+
+    result.setdefault('ai_complete', True)   # only Word documents go to the AI
+    fixed_stream.seek(0)
+    return result, fixed_stream
@@ -0,0 +1,68 @@
+"""Shared MSAL confidential clients for Microsoft Graph
+
+Building a ``msal.ConfidentialClientApplication`` per call throws away its
+token cache, so every validation paid a round trip to Azure AD (plus OpenID
+discovery) for a token it already had. Here one app is kept per (tenant,
+client) for the life of the worker; ``acquire_token_for_client`` then answers
+from the in-memory cache and only goes back to Azure AD when the token is
+within MSAL's five-minute expiry margin.
+"""
+import hashlib
+import logging
+
+import msal
+import requests
+
+from .worker import WorkerSingleton
+
+GRAPH_SCOPE = ["https://graph.microsoft.com/.default"]
+
+# One pooled HTTP session shared by every MSAL app (keep-alive to login.microsoftonline.com)
+_http_client = WorkerSingleton(requests.Session)
+
+
+def _new_app(tenant_id, client_id, secret_hash, client_secret):
+    return msal.ConfidentialClientApplication(
+        client_id,
+        authority=f"https://login.microsoftonline.com/{tenant_id}",
+        client_credential=client_secret,
+        http_client=_http_client.get(),
+    )
+
+
+_apps = WorkerSingleton(_new_app)
+
+
+def set_http_client(http_client):
+    """Swap the HTTP client MSAL uses (tests point it at a local token stub). Drops cached apps."""
+    _http_client.set(http_client)
+    _apps.clear()
+
+
+def reset():
+    """Forget every cached app and token (e.g. after a secret rotation)."""
+    _apps.clear()
+
+
+def _get_app(tenant_id, client_id, client_secret):
+    # The secret is part of the key (hashed, never stored in clear) so a rotated
+    # secret gets a fresh app instead of one that keeps failing.
+    secret_hash = hashlib.sha256(client_secret.encode("utf-8")).hexdigest()[:16]
+    return _apps.get(tenant_id, client_id, secret_hash, client_secret=client_secret)
+
+
+def acquire_token_result(tenant_id, client_id, client_secret, scopes=None):
+    """Return the raw MSAL result dict for an app-only Graph token (cached when still valid)."""
+    app = _get_app(tenant_id, client_id, client_secret)
+    result = app.acquire_token_for_client(scopes=scopes or GRAPH_SCOPE)
+    if "access_token" in result:
+        logging.debug(f"Graph token for client {client_id} from {result.get('token_source', 'identity_provider')}")
+    return result
+
+
+def acquire_graph_token(tenant_id, client_id, client_secret, error_message="Failed to acquire token"):
+    """Return an app-only Graph access token, raising if Azure AD refuses one."""
+    result = acquire_token_result(tenant_id, client_id, client_secret)
+    if "access_token" in result:
+        return result["access_token"]
+    raise Exception(f"{error_message}: {result.get('error_description', result)}")
@@ -0,0 +1,126 @@
+"""Per-request time budget for validation
+
+Azure Functions ends an HTTP-triggered call after 230 s, and a large document
+with AI rules enabled can take longer than that, failing the whole request.
+main() therefore gives each request a Deadline of VALIDATION_BUDGET_SECONDS,
+of which the last VALIDATION_RESERVE_SECONDS are kept for the report and the
+write-back. Validation consults it before starting each piece of work:
+
+  - hard-coded rules run in priority order (scheduled()), each only if its
+    estimated cost still fits in the time left; a rule that does not fit is
+    skipped, and cheaper ones after it still run;
+  - AI chunks (ai_client.correct_paragraphs) are not sent once the time left
+    is below the expected duration of one call, and each call's HTTP timeout
+    is capped at the time left.
+
+Whatever was not run is recorded in Deadline.skipped, and the request returns
+a partial result that says so rather than timing out. Like the request's
+metrics, the deadline is bound to the context (bind_deadline) and carried onto
+worker threads by monitoring.submit_in_context.
+"""
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from .config import VALIDATION_BUDGET_SECONDS, VALIDATION_RESERVE_SECONDS
+
+
+class DeadlineExceeded(Exception):
+    """Work not started because the request's time budget ran out."""
+
+
+class Deadline:
+    """The time budget of one validation request. Thread-safe."""
+
+    def __init__(self, budget_seconds=None, reserve_seconds=None, clock=time.monotonic):
+        self.budget_seconds = VALIDATION_BUDGET_SECONDS if budget_seconds is None else budget_seconds
+        self.reserve_seconds = VALIDATION_RESERVE_SECONDS if reserve_seconds is None else reserve_seconds
+        self.skipped = []   # what was not run, in the order it was given up
+        self._clock = clock
+        self._expires = clock() + self.budget_seconds
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        """Seconds left for validation work (the reserve excluded)."""
+        return self._expires - self.reserve_seconds - self._clock()
+
+    def allows(self, estimated_seconds=0.0):
+        """Whether work expected to take `estimated_seconds` fits in the time left."""
+        remaining = self.remaining()
+        return remaining > 0 and remaining >= estimated_seconds
+
+    def skip(self, what):
+        logging.warning(f"Time budget: skipped {what} ({self.remaining():.1f} s left)")
+        with self._lock:
+            self.skipped.append(what)
+
+    @property
+    def partial(self):
+        return bool(self.skipped)
+
+
+# Expected seconds for one hard-coded rule of each type on a large document,
+# used until a rule of the same type has run in the request. The text rules
+# scan every paragraph with many patterns; Font and Color only read run
+# formatting.
+RULE_COST_SECONDS = {
+    'Language': 1.0,
+    'Grammar': 1.0,
+    'Capitalisation': 0.5,
+    'Punctuation': 0.2,
+    'Font': 0.2,
+    'Color': 0.2,
+}
+DEFAULT_RULE_COST_SECONDS = 0.2
+
+
+def scheduled(rules, deadline=None):
+    """Yield `rules` in priority order (lowest number first, as in the Style
+    Rules list), each only while its estimated cost fits in the time left.
+    A rule's cost is what the slowest rule of its type took so far in this
+    request, else RULE_COST_SECONDS for its type. A rule that does not fit is
+    recorded as skipped and the next is tried, so one slow rule does not cost
+    the cheaper ones after it. Without a deadline (batch sweeps, tests) every
+    rule is yielded."""
+    deadline = deadline or current_deadline()
+    measured = {}   # rule_type -> slowest run so far
+    for rule in sorted(rules, key=lambda r: r.get('priority', 999)):
+        rule_type = rule.get('rule_type')
+        if deadline is not None:
+            cost = measured.get(rule_type, RULE_COST_SECONDS.get(rule_type, DEFAULT_RULE_COST_SECONDS))
+            if not deadline.allows(cost):
+                deadline.skip(f"rule '{rule.get('title', rule_type)}'")
+                continue
+        start = time.monotonic()
+        yield rule
+        measured[rule_type] = max(measured.get(rule_type, 0.0), time.monotonic() - start)
+
+
+_current_deadline = contextvars.ContextVar("macestyle_deadline", default=None)
+
+
+def set_current_deadline(deadline):
+    """Make `deadline` the current request's. Pass the returned token to
+    reset_current_deadline()."""
+    return _current_deadline.set(deadline)
+
+
+def reset_current_deadline(token):
+    _current_deadline.reset(token)
+
+
+@contextmanager
+def bind_deadline(deadline):
+    """Context-manager form of set_current_deadline()."""
+    token = set_current_deadline(deadline)
+    try:
+        yield deadline
+    finally:
+        reset_current_deadline(token)
+
+
+def current_deadline():
+    """The Deadline bound for this request, or None (no time budget)."""
+    return _current_deadline.get()
@@ -79,7 +79,21 @@ def _tracked_replace_in_run(run, compiled, repl):
         return 0
     if last < len(text):
         parts.append(('t', text[last:]))
+    _emit_tracked_parts(run, parts)
+    return n
+
+
+def tracked_replace_span(run, start, end, new):
+    """Propose replacing run.text[start:end] with `new` as a Word tracked
+    revision, leaving the rest of the run as normal text."""
+    text = run.text
+    parts = [('t', text[:start]), ('c', text[start:end], new), ('t', text[end:])]
+    _emit_tracked_parts(run, parts)
+
 
+def _emit_tracked_parts(run, parts):
+    """Replace `run` with plain runs for ('t', text) parts and a w:del + w:ins
+    pair for each ('c', old, new) part, all keeping the run's formatting."""
     r = run._r
     parent = r.getparent()
     idx = list(parent).index(r)
@@ -108,7 +122,6 @@ def _tracked_replace_in_run(run, compiled, repl):
         parent.insert(idx, ins_el)
         idx += 1
     parent.remove(r)
-    return n
 
 
 def iter_all_paragraphs(container):
@@ -134,6 +147,33 @@ def iter_all_paragraphs(container):
                 paras.extend(iter_all_paragraphs(cell))
     return paras
 
+
+class ParagraphSubset:
+    """Some of a document's paragraphs, each with its index in the whole
+    document. The text rules accept one in place of the document, so a
+    re-validation only checks the paragraphs that may have changed; `found`
+    collects the indices of paragraphs where a rule found or changed something
+    (the rest are clean)."""
+
+    def __init__(self, indexed_paragraphs):
+        self.indexed_paragraphs = list(indexed_paragraphs)
+        self.paragraphs = [p for _idx, p in self.indexed_paragraphs]
+        self.tables = []
+        self.found = set()
+
+
+def iter_indexed_paragraphs(doc):
+    """(paragraph_index, paragraph) pairs for a document or a ParagraphSubset."""
+    if isinstance(doc, ParagraphSubset):
+        return doc.indexed_paragraphs
+    return list(enumerate(iter_all_paragraphs(doc)))
+
+
+def _found(doc, para_idx):
+    """Record that a rule found or changed something in paragraph `para_idx`."""
+    if isinstance(doc, ParagraphSubset):
+        doc.found.add(para_idx)
+
 # ============================================
 # LANGUAGE VALIDATORS
 # ============================================
@@ -415,6 +455,7 @@ def check_british_spelling(doc, rule):
         matches = combined.findall(run.text)
         if not matches:
             continue
+        _found(doc, para_idx)
         if auto:
             before = run.text
             run.text = combined.sub(replace_preserve_case, run.text)
@@ -472,6 +513,7 @@ def check_contractions(doc, rule):
         matches = pattern.findall(run.text)
         if not matches:
             continue
+        _found(doc, para_idx)
         if auto:
             before = run.text
             run.text = pattern.sub(_expand, run.text)
@@ -510,6 +552,7 @@ def check_word_choice(doc, rule):
         for para_idx, run in _iter_runs(doc):
             if not toward_pat.search(run.text):
                 continue
+            _found(doc, para_idx)
             if auto:
                 before = run.text
                 run.text = toward_pat.sub(_toward, run.text)
@@ -527,11 +570,13 @@ def check_word_choice(doc, rule):
         # Flag usage of 'etc.'
         issue_count = 0
 
-        for paragraph in iter_all_paragraphs(doc):
+        for para_idx, paragraph in iter_indexed_paragraphs(doc):
             for run in paragraph.runs:
                 if run.text and 'etc.' in run.text.lower():
                     matches = len(re.findall(r'\betc\.?\b', run.text, re.IGNORECASE))
                     issue_count += matches
+                    if matches:
+                        _found(doc, para_idx)
 
         if issue_count > 0:
             issues.append(f"Found {issue_count} instances of 'etc.' - be specific instead")
@@ -560,6 +605,7 @@ def check_symbols(doc, rule):
         for para_idx, run in _iter_runs(doc):
             if '&' not in run.text:
                 continue
+            _found(doc, para_idx)
             if auto:
                 before = run.text
                 run.text = run.text.replace('&', 'and')
@@ -584,6 +630,7 @@ def check_symbols(doc, rule):
             matches = pct_pat.findall(run.text)
             if not matches:
                 continue
+            _found(doc, para_idx)
             if auto:
                 before = run.text
                 run.text = pct_pat.sub(r'\1 percent', run.text)
@@ -601,13 +648,15 @@ def check_symbols(doc, rule):
         # Detect incorrect apostrophes in plurals (e.g., CD's, SME's)
         issue_count = 0
 
-        for paragraph in iter_all_paragraphs(doc):
+        for para_idx, paragraph in iter_indexed_paragraphs(doc):
             for run in paragraph.runs:
                 if run.text:
                     # Pattern: word ending with 's followed by 's or other letters
                     # This is a simplified check
                     matches = re.findall(r"\b[A-Z]{2,}'s\b", run.text)  # e.g., CD's, SME's
                     issue_count += len(matches)
+                    if matches:
+                        _found(doc, para_idx)
 
         if issue_count > 0:
             issues.append(f"Found {issue_count} incorrect apostrophes in plurals (e.g., CD's should be CDs)")
@@ -641,6 +690,7 @@ def check_numbers(doc, rule):
             targets = [m for m in num_pat.findall(run.text) if _is_target(m)]
             if not targets:
                 continue
+            _found(doc, para_idx)
             if auto:
                 before = run.text
                 run.text = num_pat.sub(_comma, run.text)
@@ -665,7 +715,7 @@ def check_numbers(doc, rule):
 
 def _iter_runs(doc):
     """Yield (paragraph_index, run) for every non-empty run, tables included."""
-    for para_idx, paragraph in enumerate(iter_all_paragraphs(doc)):
+    for para_idx, paragraph in iter_indexed_paragraphs(doc):
         for run in paragraph.runs:
             if run.text:
                 yield para_idx, run
@@ -673,7 +723,12 @@ def _iter_runs(doc):
 
 def _flag_regex(doc, pattern, label):
     """Detection-only: count regex matches and report them as an issue."""
-    count = sum(len(pattern.findall(run.text)) for _idx, run in _iter_runs(doc))
+    count = 0
+    for para_idx, run in _iter_runs(doc):
+        matches = len(pattern.findall(run.text))
+        if matches:
+            count += matches
+            _found(doc, para_idx)
     issues = [f"Found {count} instance(s): {label}"] if count else []
     return {'issues': issues, 'fixes': [], 'changes': []}
 
@@ -696,8 +751,12 @@ def _replace_regex(doc, rule, pattern, repl, label):
             if run.text != before:
                 changes.append({'before': before, 'after': run.text, 'location': f'Paragraph {para_idx + 1}'})
                 fix_count += len(matches)
+                _found(doc, para_idx)
         else:
-            suggest_count += _tracked_replace_in_run(run, pattern, repl)
+            suggested = _tracked_replace_in_run(run, pattern, repl)
+            if suggested:
+                suggest_count += suggested
+                _found(doc, para_idx)
     fixes = []
     if fix_count:
         fixes.append(f"Fixed {fix_count} instance(s): {label}")
@@ -823,7 +882,7 @@ def check_reference_code_case(doc, rule):
     fix_count = 0
     auto = rule.get('auto_fix')
 
-    for para_idx, paragraph in enumerate(iter_all_paragraphs(doc)):
+    for para_idx, paragraph in iter_indexed_paragraphs(doc):
         for run in paragraph.runs:
             if not run.text:
                 continue
@@ -831,6 +890,7 @@ def check_reference_code_case(doc, rule):
                      if _looks_like_ref_code(m.group(0)) and any(c.islower() for c in m.group(0))]
             if not mixed:
                 continue
+            _found(doc, para_idx)
             issue_count += len(mixed)
             if auto:
                 before = run.text
@@ -919,15 +979,19 @@ _EMPHASIS_CAPS = re.compile(r'\b[A-Z]{2,}(?:\s+[A-Z]{2,})+\b')
 
 
 def _check_punct_egie(doc, rule):
-    n = sum(len(_EGIE_COMMA_AFTER.findall(r.text)) + len(_EGIE_NO_PUNCT_BEFORE.findall(r.text))
-            for _i, r in _iter_runs(doc))
+    n = 0
+    for para_idx, run in _iter_runs(doc):
+        matches = len(_EGIE_COMMA_AFTER.findall(run.text)) + len(_EGIE_NO_PUNCT_BEFORE.findall(run.text))
+        if matches:
+            n += matches
+            _found(doc, para_idx)
     return {'issues': [f"Found {n} instance(s): e.g./i.e. punctuation — comma/colon/hyphen before, "
                        f"no comma after"] if n else [], 'fixes': [], 'changes': []}
 
 
 def _check_numbers_below_ten(doc, rule):
     count = 0
-    for _idx, run in _iter_runs(doc):
+    for para_idx, run in _iter_runs(doc):
         text = run.text
         for m in _NUM_BELOW_TEN.finditer(text):
             if _NUM_EXCL_PREFIX.search(text[:m.start()]):
@@ -935,31 +999,41 @@ def _check_numbers_below_ten(doc, rule):
             if _UNIT_AFTER.match(text[m.end():]):
                 continue
             count += 1
+            _found(doc, para_idx)
     return {'issues': [f"Found {count} digit(s) below ten in running text — spell out (one to nine)"]
             if count else [], 'fixes': [], 'changes': []}
 
 
 def _check_caption_no_period(doc, rule):
     count = 0
-    for paragraph in iter_all_paragraphs(doc):
+    for para_idx, paragraph in iter_indexed_paragraphs(doc):
         style = (paragraph.style.name or '') if paragraph.style else ''
         if 'caption' in style.lower():
             t = paragraph.text.rstrip()
             if t.endswith('.') and not t.endswith('...'):
                 count += 1
+                _found(doc, para_idx)
     return {'issues': [f"Found {count} caption(s) ending with a full stop — remove it"]
             if count else [], 'fixes': [], 'changes': []}
 
 
 def _check_no_etc_with_egie(doc, rule):
-    count = sum(1 for p in iter_all_paragraphs(doc)
-                if _EGIE.search(p.text) and _ETC.search(p.text))
+    count = 0
+    for para_idx, paragraph in iter_indexed_paragraphs(doc):
+        if _EGIE.search(paragraph.text) and _ETC.search(paragraph.text):
+            count += 1
+            _found(doc, para_idx)
     return {'issues': [f"Found {count} paragraph(s) using 'etc.' alongside e.g./i.e. — drop 'etc.'"]
             if count else [], 'fixes': [], 'changes': []}
 
 
 def _check_proper_noun_derivations(doc, rule):
-    count = sum(len(_NATIONALITY.findall(r.text)) for _i, r in _iter_runs(doc))
+    count = 0
+    for para_idx, run in _iter_runs(doc):
+        matches = len(_NATIONALITY.findall(run.text))
+        if matches:
+            count += matches
+            _found(doc, para_idx)
     return {'issues': [f"Found {count} lowercase proper-noun derivation(s) — capitalise "
                        f"(e.g. 'welsh' to 'Welsh')"] if count else [], 'fixes': [], 'changes': []}
 
@@ -1012,8 +1086,12 @@ def check_date_format(doc, rule, table=False):
            else "DD MONTH YYYY (e.g. 01 February 2015)")
     label = f"numeric date — use {fmt}"
     if rule.get('auto_fix'):
-        n = sum(_tracked_replace_in_run(run, _NUMERIC_DATE, repl)
-                for _i, run in _iter_runs(doc))
+        n = 0
+        for para_idx, run in _iter_runs(doc):
+            proposed = _tracked_replace_in_run(run, _NUMERIC_DATE, repl)
+            if proposed:
+                n += proposed
+                _found(doc, para_idx)
         fixes = ([f"Proposed {n} date reformat(s) as tracked changes to accept or reject: {label}"]
                  if n else [])
         return {'issues': [], 'fixes': fixes, 'changes': []}
@@ -1044,7 +1122,7 @@ def _check_subsidiary_headings(doc, rule):
     issues, fixes, changes = [], [], []
     auto = rule.get("auto_fix")
     issue_count = fix_count = 0
-    for para_idx, paragraph in enumerate(iter_all_paragraphs(doc)):
+    for para_idx, paragraph in iter_indexed_paragraphs(doc):
         style = (paragraph.style.name or "") if paragraph.style else ""
         level = re.match(r"Heading\s+(\d+)", style)
         if not level or int(level.group(1)) < 2:
@@ -1057,6 +1135,7 @@ def _check_subsidiary_headings(doc, rule):
                 continue
             if run.text[i].islower():
                 issue_count += 1
+                _found(doc, para_idx)
                 if auto:
                     before = run.text
                     run.text = run.text[:i] + run.text[i].upper() + run.text[i + 1:]
@@ -1,6 +1,7 @@
 """Excel document (.xlsx) validation with AI write-back"""
 import re
 import logging
+from .deadline import scheduled
 
 
 def _normalise_issue(item, rule=None):
@@ -50,7 +51,7 @@ def validate_excel_document(file_stream, rules):
 
     # Hard-coded rules only — AI validation is skipped for Excel
     # (AI is designed for prose; spreadsheet cell text produces too many false positives)
-    for rule in hard_coded_rules:
+    for rule in scheduled(hard_coded_rules):
         result = None
         if rule['rule_type'] == 'Font':
             result = _check_fonts(wb, rule)
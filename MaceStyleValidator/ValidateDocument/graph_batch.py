@@ -0,0 +1,190 @@
+"""Microsoft Graph JSON batching ($batch)
+
+Collects several Graph requests and sends them in one POST to /$batch (up to
+20 per round trip). Requests may declare dependsOn so Graph runs them in
+order; a request whose dependency failed is not run (424 Failed Dependency).
+Requests joined by dependsOn must fit in one round trip. Sub-requests Graph
+throttles (429/503, and 504 for idempotent methods) are re-batched after the
+longest Retry-After, the same way graph_client retries single calls.
+
+    batch = GraphBatch(token)
+    a = batch.add("POST", f"/sites/{site_id}/lists/{list_id}/items", body)
+    batch.add("PATCH", f"/sites/{site_id}/lists/{list_id}/items/1/fields", fields, depends_on=[a])
+    responses = batch.execute()   # {request id: BatchResponse}
+"""
+import logging
+import time
+
+from .graph_client import get_graph_client, is_retryable, MAX_BACKOFF_SECONDS
+
+MAX_BATCH_REQUESTS = 20
+
+
+class BatchResponse:
+    """One sub-response from a $batch call."""
+
+    def __init__(self, request_id, status, headers=None, body=None):
+        self.id = request_id
+        self.status_code = status
+        self.headers = headers or {}
+        self.body = body
+
+    @property
+    def ok(self):
+        return 200 <= self.status_code < 300
+
+    def json(self):
+        return self.body if isinstance(self.body, dict) else {}
+
+    @property
+    def text(self):
+        return str(self.body)
+
+
+class GraphBatch:
+    """Builder for one or more Graph $batch round trips."""
+
+    def __init__(self, token, client=None, max_retries=3, sleep=time.sleep):
+        self.token = token
+        self.client = client
+        self.max_retries = max_retries
+        self._sleep = sleep
+        self._requests = []
+        self.round_trips = 0
+
+    def __len__(self):
+        return len(self._requests)
+
+    def __contains__(self, request_id):
+        return any(request["id"] == request_id for request in self._requests)
+
+    def add(self, method, url, body=None, headers=None, depends_on=None, request_id=None):
+        """Queue a request; `url` is relative to the Graph version root ("/sites/...").
+        Returns the request's batch id (pass it in another request's depends_on)."""
+        request_id = request_id or str(len(self._requests) + 1)
+        request = {"id": request_id, "method": method.upper(), "url": url}
+        if body is not None:
+            request["body"] = body
+            request["headers"] = {"Content-Type": "application/json", **(headers or {})}
+        elif headers:
+            request["headers"] = dict(headers)
+        if depends_on:
+            request["dependsOn"] = list(depends_on)
+        self._requests.append(request)
+        return request_id
+
+    def _chunks(self, requests):
+        """Split into batches of at most MAX_BATCH_REQUESTS without separating a
+        request from the dependencies it names (Graph requires them in the same
+        batch). Requests joined by dependsOn travel together; independent ones
+        fill each batch up to the limit, keeping their order. Raises ValueError
+        when requests joined by dependsOn are more than one batch can hold."""
+        ids = {request["id"] for request in requests}
+        parent = {request_id: request_id for request_id in ids}
+
+        def root(request_id):
+            while parent[request_id] != request_id:
+                parent[request_id] = parent[parent[request_id]]
+                request_id = parent[request_id]
+            return request_id
+
+        for request in requests:
+            # A dependency not in `requests` completed in an earlier round trip
+            for dependency in request.get("dependsOn", []):
+                if dependency in ids:
+                    parent[root(dependency)] = root(request["id"])
+
+        groups = {}
+        for request in requests:
+            groups.setdefault(root(request["id"]), []).append(request)
+        chunks, current = [], []
+        for group in groups.values():
+            if len(group) > MAX_BATCH_REQUESTS:
+                raise ValueError(f"Graph $batch: {len(group)} requests are joined by dependsOn "
+                                 f"(from request {group[0]['id']}); one batch holds at most {MAX_BATCH_REQUESTS}")
+            if len(current) + len(group) > MAX_BATCH_REQUESTS:
+                chunks.append(current)
+                current = []
+            current.extend(group)
+        if current:
+            chunks.append(current)
+        order = {request["id"]: n for n, request in enumerate(requests)}
+        return [sorted(chunk, key=lambda request: order[request["id"]]) for chunk in chunks]
+
+    def _send(self, requests):
+        client = self.client or get_graph_client()
+        response = client.post(
+            "/$batch", token=self.token,
+            headers={"Content-Type": "application/json", "Accept": "application/json"},
+            json={"requests": requests},
+        )
+        response.raise_for_status()
+        self.round_trips += 1
+        results = {}
+        for item in response.json().get("responses", []):
+            results[item["id"]] = BatchResponse(
+                item["id"], item.get("status", 500), item.get("headers"), item.get("body")
+            )
+        return results
+
+    def execute(self):
+        """Send every queued request. Returns {request id: BatchResponse}."""
+        results = {}
+        pending = list(self._requests)
+        attempt = 0
+        while pending:
+            retry = []
+            delays = []
+            for chunk in self._chunks(pending):
+                ids_in_chunk = {r["id"] for r in chunk}
+                to_send = []
+                for request in chunk:
+                    deps = request.get("dependsOn", [])
+                    failed = [d for d in deps if d in results and not results[d].ok]
+                    if failed:
+                        results[request["id"]] = BatchResponse(
+                            request["id"], 424, body={"error": {"code": "failedDependency",
+                                                                "message": f"Depends on failed {failed}"}})
+                        continue
+                    # Dependencies already completed in an earlier round trip are satisfied.
+                    kept = [d for d in deps if d in ids_in_chunk]
+                    request = dict(request)
+                    if kept:
+                        request["dependsOn"] = kept
+                    else:
+                        request.pop("dependsOn", None)
+                    to_send.append(request)
+                if not to_send:
+                    continue
+                sent = {r["id"]: r for r in to_send}
+                responses = self._send(to_send)
+                throttled = {rid for rid, sub in responses.items()
+                             if is_retryable(sent[rid]["method"], sub.status_code) and attempt < self.max_retries}
+                for request_id, sub in responses.items():
+                    deps = sent[request_id].get("dependsOn", [])
+                    if request_id in throttled or (sub.status_code == 424 and throttled.intersection(deps)):
+                        retry.append(next(r for r in self._requests if r["id"] == request_id))
+                        delays.append(_retry_after_seconds(sub.headers))
+                    else:
+                        results[request_id] = sub
+
+            if not retry:
+                break
+            known = [d for d in delays if d is not None]
+            delay = max(known) if known else min(MAX_BACKOFF_SECONDS, 2 ** attempt)
+            logging.warning(f"Graph $batch: {len(retry)} sub-request(s) throttled; retrying in {delay:.1f}s")
+            self._sleep(min(delay, MAX_BACKOFF_SECONDS))
+            pending = retry
+            attempt += 1
+        return results
+
+
+def _retry_after_seconds(headers):
+    """Retry-After from a sub-response's headers dict (any case), or None."""
+    for name, value in (headers or {}).items():
+        if name.lower() == "retry-after":
+            try:
+                return max(0.0, float(value))
+            except (TypeError, ValueError):
+                return None
+    return None
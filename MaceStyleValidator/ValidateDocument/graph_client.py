@@ -0,0 +1,198 @@
+"""Pooled, retrying Microsoft Graph HTTP client
+
+Every Graph call in the validator, the HTTP helpers in function_app.py and
+MaceyBot goes through one GraphClient per worker:
+
+  - one requests.Session with a sized connection pool (keep-alive, TLS reuse)
+  - connect/read timeouts on every call
+  - retries with exponential backoff and jitter on 429/503, honouring the
+    Retry-After header Graph sends when it throttles, and on 504 and
+    connection failures for idempotent methods only
+  - a client-side token bucket, so a library-wide Power Automate burst is
+    smoothed out here instead of being throttled by SharePoint
+  - per-call latency, retries and throttling recorded into the current
+    request's ValidationMetrics (see monitoring.bind_metrics)
+
+Paths starting with "/" are resolved against GRAPH_API_BASE; absolute URLs
+(e.g. @odata.nextLink) are used as-is.
+"""
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .config import (
+    GRAPH_API_BASE, GRAPH_CONNECT_TIMEOUT_SECONDS, GRAPH_READ_TIMEOUT_SECONDS,
+    GRAPH_MAX_RETRIES, GRAPH_RATE_LIMIT_PER_SECOND, GRAPH_POOL_SIZE,
+)
+from .monitoring import current_metrics
+from .worker import WorkerSingleton
+
+# Graph answers these when it is throttling or briefly unavailable; the request
+# was not applied, so it is safe to send again (even a POST).
+RETRY_STATUSES = {429, 503}
+# A 504 or a dropped connection says nothing about whether the request was
+# applied - the gateway may have timed out while Graph carried on - so these
+# are only retried where a duplicate would be harmless.
+IDEMPOTENT_RETRY_STATUSES = {504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "PATCH", "DELETE", "OPTIONS"}
+MAX_BACKOFF_SECONDS = 60
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` requests per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = clock()
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until one is available. Returns seconds waited."""
+        if not self.rate or self.rate <= 0:
+            return 0.0
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+            waited += wait
+
+
+def _retry_after_seconds(response):
+    """Seconds from a Retry-After header (Graph sends delta-seconds), or None."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def is_retryable(method, status_code):
+    """True when a response with `status_code` to a `method` request may be sent again."""
+    return status_code in RETRY_STATUSES or (
+        status_code in IDEMPOTENT_RETRY_STATUSES and method.upper() in IDEMPOTENT_METHODS)
+
+
+def _endpoint(url):
+    """Path only, for metrics - no query string (it can carry file names)."""
+    return urlsplit(url).path
+
+
+class GraphClient:
+    """Shared HTTP client for Microsoft Graph. Safe to use from several threads."""
+
+    def __init__(self, base_url=None, connect_timeout=None, read_timeout=None,
+                 max_retries=None, rate_per_second=None, pool_size=None, sleep=time.sleep):
+        self.base_url = (base_url or GRAPH_API_BASE).rstrip("/")
+        self.timeout = (connect_timeout or GRAPH_CONNECT_TIMEOUT_SECONDS,
+                        read_timeout or GRAPH_READ_TIMEOUT_SECONDS)
+        self.max_retries = GRAPH_MAX_RETRIES if max_retries is None else max_retries
+        self._sleep = sleep
+        self._bucket = TokenBucket(
+            GRAPH_RATE_LIMIT_PER_SECOND if rate_per_second is None else rate_per_second, sleep=sleep
+        )
+        pool_size = pool_size or GRAPH_POOL_SIZE
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, path):
+        return path if path.startswith("http") else f"{self.base_url}{path}"
+
+    def _backoff(self, attempt):
+        return min(MAX_BACKOFF_SECONDS, (2 ** attempt) * 0.5) * (0.5 + random.random() / 2)
+
+    def request(self, method, path, token=None, headers=None, **kwargs):
+        """Send one Graph request with retries. Returns the final requests.Response
+        (callers still decide whether to raise_for_status)."""
+        method = method.upper()
+        url = self.url(path)
+        headers = dict(headers or {})
+        if token:
+            headers.setdefault("Authorization", f"Bearer {token}")
+        kwargs.setdefault("timeout", self.timeout)
+        metrics = current_metrics()
+
+        attempt = 0
+        while True:
+            self._bucket.acquire()
+            start = time.monotonic()
+            try:
+                response = self.session.request(method, url, headers=headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if method not in IDEMPOTENT_METHODS or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logging.warning(f"Graph {method} {_endpoint(url)} failed ({type(e).__name__}); retry in {delay:.1f}s")
+                if metrics:
+                    metrics.record_graph_call(method, _endpoint(url), 0,
+                                              round((time.monotonic() - start) * 1000), retried=True)
+                self._sleep(delay)
+                attempt += 1
+                continue
+
+            elapsed_ms = round((time.monotonic() - start) * 1000)
+            will_retry = is_retryable(method, response.status_code) and attempt < self.max_retries
+            if metrics:
+                metrics.record_graph_call(method, _endpoint(url), response.status_code, elapsed_ms,
+                                          retried=will_retry, throttled=response.status_code == 429)
+            if not will_retry:
+                return response
+
+            delay = _retry_after_seconds(response)
+            if delay is None:
+                delay = self._backoff(attempt)
+            delay = min(delay, MAX_BACKOFF_SECONDS)
+            logging.warning(
+                f"Graph {method} {_endpoint(url)} returned {response.status_code}; "
+                f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s"
+            )
+            response.close()
+            self._sleep(delay)
+            attempt += 1
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.request("PATCH", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+
+_client = WorkerSingleton(GraphClient)
+
+
+def get_graph_client():
+    """The worker-wide GraphClient (created on first use)."""
+    return _client.get()
+
+
+def set_graph_client(client):
+    """Replace the worker-wide client (tests point it at graph_stub)."""
+    _client.set(client)
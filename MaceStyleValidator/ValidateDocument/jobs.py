@@ -0,0 +1,376 @@
+"""Asynchronous validation: queued jobs worked through in checkpointed stages
+
+ValidateDocument does everything inside one HTTP call. For documents that may
+take longer than an HTTP trigger is allowed to run, ValidateDocumentAsync
+accepts the same request, stores it as a job and answers 202 Accepted with a
+status URL (ValidationJobs/{jobId}). A queue message then hands the job to
+RunValidationJob, which works through its stages:
+
+  parse       get the document (download if only a URL was sent) and the rules
+  ai          send the document's AI chunks (ai_client.correct_chunk), keeping
+              each chunk's answer in the job as soon as it arrives
+  validate    the hard-coded rules, with the AI corrections answered from the
+              kept chunks (via the AI cache, as in ai_batch.py); the report
+  write_back  the SharePoint writes, when the function owns them (write_back.py
+              records the steps done, so none is repeated)
+
+The job is checkpointed to the job store (JOB_STORE) after every stage and
+every AI chunk. Each run has its own time budget (deadline.py): when it runs
+low, the worker saves the checkpoint and queues the job again, and the next run
+resumes where this one stopped. A run that fails (or is killed by a timeout or
+restart) is retried by the queue and resumes the same way.
+
+Locally the queue bindings work against Azurite (AzureWebJobsStorage=
+UseDevelopmentStorage=true); job_queue_stub.JobQueue runs jobs in-process for
+the tests.
+"""
+import base64
+import datetime
+import json
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import BytesIO
+
+import azure.functions as func
+from docx import Document
+
+from .access_control import check_access, get_caller_identity
+from .ai_cache import get_ai_cache, correction_key, put_many
+from .ai_client import get_ai_client, chunk_paragraphs, correct_chunk, cache_entries, rules_prompt_hash
+from .config import (
+    ENABLE_CLAUDE_AI, AI_PROVIDER, AI_FALLBACK_PROVIDERS, AI_MAX_PARALLEL, MAX_FILE_SIZE_BYTES,
+    ENABLE_FUNCTION_SHAREPOINT_WRITES, JOB_STORE, JOB_STORE_DIR, JOB_BUDGET_SECONDS, JOB_MAX_RUNS,
+    get_graph_token,
+)
+from .core import WORD_EXTENSIONS, is_supported, validate_file
+from .deadline import Deadline, DeadlineExceeded, bind_deadline
+from .monitoring import (
+    ValidationMetrics, bind_metrics, emit_audit_event, generate_request_id, submit_in_context, track_phase,
+)
+from .report import generate_report, final_status, status_description, document_links
+from .result_cache import LocalResultStore, BlobResultStore
+from .sharepoint_client import fetch_validation_rules, download_file, FileTooLargeError
+from .transport import parse_validation_request, document_fields
+from .word_validator import split_word_rules, select_ai_paragraphs
+from .worker import WorkerSingleton
+from .write_back import new_job as new_write_back, run_write_back, report_path
+
+STAGES = ("parse", "ai", "validate", "write_back")
+
+_JOB_ID = re.compile(r"msv-[0-9a-f]{12}")
+
+
+class JobStore:
+    """Job checkpoints (JSON) and the documents they refer to, one entry each
+    in a LocalResultStore or BlobResultStore."""
+
+    def __init__(self, store):
+        self.store = store
+
+    def load(self, job_id):
+        data = self.store.get(job_id)
+        return json.loads(data) if data else None
+
+    def save(self, job):
+        job["updated_at"] = _now()
+        self.store.put(job["id"], json.dumps(job).encode("utf-8"))
+
+    def get_document(self, job_id, name):
+        return self.store.get(f"{job_id}-{name}")
+
+    def put_document(self, job_id, name, data):
+        self.store.put(f"{job_id}-{name}", data)
+
+
+def _default_store():
+    if JOB_STORE == "blob":
+        try:
+            return BlobResultStore("macestyle-jobs")
+        except Exception as e:
+            logging.warning(f"Job blob store unavailable, using {JOB_STORE_DIR}: {e}")
+    return LocalResultStore(JOB_STORE_DIR)
+
+
+_store = WorkerSingleton(lambda: JobStore(_default_store()))
+
+
+def get_job_store():
+    """The JobStore for JOB_STORE (blob container or local directory)."""
+    return _store.get()
+
+
+def set_job_store(store):
+    """Keep jobs in `store` instead (tests)."""
+    _store.set(store)
+
+
+def _now():
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _json_response(body, status_code, headers=None):
+    return func.HttpResponse(json.dumps(body), mimetype="application/json", status_code=status_code,
+                             headers=headers)
+
+
+# -- HTTP: submit a job and ask for its status ---------------------------------
+
+def submit_job(req, enqueue, store=None):
+    """ValidateDocumentAsync: store the request as a job, queue it with
+    enqueue(message) and answer 202 with its status URL. Takes the same
+    request as ValidateDocument (any transport)."""
+    request_id = generate_request_id()
+    denied = check_access(req)
+    if denied:
+        emit_audit_event({"event_type": "access_denied", "request_id": request_id,
+                          "caller": get_caller_identity(req)})
+        return denied
+    caller = get_caller_identity(req)
+
+    req_body, file_bytes = parse_validation_request(req)
+    item_id, file_name, file_url = document_fields(req_body)
+    file_extension = os.path.splitext(file_name)[1].lower() if file_name else ''
+    if not is_supported(file_extension):
+        return _json_response({"error": f"Unsupported file type: {file_extension}"}, 400)
+    file_content_base64 = req_body.get('fileContent')
+    if file_bytes is None and file_content_base64:
+        decoded_size = len(file_content_base64) * 3 // 4 - file_content_base64[-2:].count('=')
+        if decoded_size > MAX_FILE_SIZE_BYTES:
+            return _json_response({"error": str(FileTooLargeError(decoded_size, MAX_FILE_SIZE_BYTES))}, 413)
+        file_bytes = base64.b64decode(file_content_base64)
+    if file_bytes is not None and len(file_bytes) > MAX_FILE_SIZE_BYTES:
+        return _json_response({"error": str(FileTooLargeError(len(file_bytes), MAX_FILE_SIZE_BYTES))}, 413)
+    if file_bytes is None and not file_url:
+        return _json_response({"error": "Either fileContent or fileUrl must be provided"}, 400)
+
+    store = store or get_job_store()
+    if file_bytes is not None:
+        store.put_document(request_id, "input", file_bytes)
+    job = {
+        "id": request_id,
+        "status": "queued",
+        "stage": STAGES[0],
+        "runs": 0,
+        "created_at": _now(),
+        "caller": caller,
+        "file_name": file_name,
+        "file_url": file_url,
+        "item_id": item_id,
+        "has_input": file_bytes is not None,
+    }
+    store.save(job)
+    enqueue(json.dumps({"job_id": request_id}))
+    emit_audit_event({"event_type": "validation_queued", "request_id": request_id,
+                      "filename": file_name, "caller": caller})
+    logging.info(f"[{request_id}] Validation job queued for {file_name}")
+
+    status_url = f"{req.url.split('/api/', 1)[0]}/api/ValidationJobs/{request_id}"
+    return _json_response({"jobId": request_id, "status": "queued", "statusUrl": status_url}, 202,
+                          headers={"Location": status_url})
+
+
+def job_status(req, job_id, store=None):
+    """ValidationJobs/{jobId}: where the job is and, once done, the same
+    fields a ValidateDocument JSON response carries."""
+    denied = check_access(req)
+    if denied:
+        return denied
+    store = store or get_job_store()
+    job = store.load(job_id) if _JOB_ID.fullmatch(job_id or '') else None
+    if job is None:
+        return _json_response({"error": f"Unknown job: {job_id}"}, 404)
+
+    body = {"jobId": job["id"], "status": job["status"], "stage": job["stage"], "runs": job["runs"],
+            "createdAt": job["created_at"], "updatedAt": job["updated_at"]}
+    if "ai" in job:
+        body["progress"] = {"aiChunks": job["ai"]["chunks"], "aiChunksDone": len(job["ai"]["done"])}
+    if job["status"] == "failed":
+        body["error"] = job.get("error")
+    if job["status"] == "done":
+        result = dict(job["result"])
+        result["reportHtml"] = store.get_document(job["id"], "report").decode("utf-8")
+        if result["issuesFixed"]:
+            result["fixedFileContent"] = base64.b64encode(store.get_document(job["id"], "fixed")).decode("ascii")
+        body["result"] = result
+    return _json_response(body, 200)
+
+
+# -- the queue worker -----------------------------------------------------------
+
+def run_job(message, enqueue, store=None):
+    """RunValidationJob: work on the job named by a queue message from its
+    checkpoint until it is done, or until this run's time budget runs low
+    (then queue it again with enqueue(message)). Raises to have the queue
+    retry a failed run, until JOB_MAX_RUNS runs have been made."""
+    store = store or get_job_store()
+    job_id = json.loads(message)["job_id"]
+    job = store.load(job_id)
+    if job is None:
+        logging.error(f"Validation job {job_id} not found")
+        return
+    if job["status"] in ("done", "failed"):
+        return  # delivered again after it finished
+
+    job["status"] = "running"
+    job["runs"] += 1
+    store.save(job)
+    metrics = ValidationMetrics(request_id=job_id, filename=job["file_name"], caller=job["caller"])
+    metrics.file_type = os.path.splitext(job["file_name"])[1].lower()
+    deadline = Deadline(JOB_BUDGET_SECONDS)
+    logging.info(f"[{job_id}] Run {job['runs']} of validation job, from stage {job['stage']}")
+
+    try:
+        with bind_metrics(metrics), bind_deadline(deadline):
+            for stage in STAGES[STAGES.index(job["stage"]):]:
+                if not deadline.allows():
+                    raise DeadlineExceeded(f"before {stage}")
+                with track_phase(metrics, stage):
+                    _STAGES[stage](job, store, deadline)
+                job["stage"] = STAGES[STAGES.index(stage) + 1] if stage != STAGES[-1] else "done"
+                store.save(job)
+    except DeadlineExceeded as e:
+        logging.info(f"[{job_id}] Time budget reached ({e}): checkpointed, resuming in a new run")
+        job["status"] = "queued"
+        store.save(job)
+        enqueue(message)
+        return
+    except Exception as e:
+        logging.error(f"[{job_id}] Validation job failed in stage {job['stage']}: {e}")
+        job["error"] = f"{type(e).__name__}: {e}"
+        if job["runs"] < JOB_MAX_RUNS:
+            job["status"] = "queued"
+            store.save(job)
+            raise
+        job["status"] = "failed"
+        store.save(job)
+        metrics.fail(str(e))
+        emit_audit_event(metrics.to_audit_entry())
+        return
+
+    job["status"] = "done"
+    store.save(job)
+    result = job["result"]
+    metrics.skipped_checks = result.get("skipped", [])
+    metrics.complete(status=result["status"], issues=result["issuesFound"], fixes=result["issuesFixed"])
+    emit_audit_event(metrics.to_audit_entry())
+    logging.info(f"[{job_id}] Validation job done in {job['runs']} run(s): {result['status']}")
+
+
+def _input(job, store):
+    return store.get_document(job["id"], "input")
+
+
+def _parse(job, store, deadline):
+    if not job["has_input"]:
+        file_stream = download_file(get_graph_token(), job["file_url"], max_bytes=MAX_FILE_SIZE_BYTES)
+        file_stream.seek(0)
+        store.put_document(job["id"], "input", file_stream.read())
+        job["has_input"] = True
+    # The rules are kept with the job, so a resumed run validates against the same ones
+    job["rules"] = fetch_validation_rules(None)
+
+
+def _ai(job, store, deadline):
+    """Send the AI chunks not already answered, checkpointing each answer."""
+    ai_rules, _ = split_word_rules(job["rules"])
+    extension = os.path.splitext(job["file_name"])[1].lower()
+    if not ai_rules or extension not in WORD_EXTENSIONS or not ENABLE_CLAUDE_AI or get_ai_cache() is None:
+        return  # nothing to send ahead: validation makes any AI calls itself
+    providers = [p for p in [AI_PROVIDER] + AI_FALLBACK_PROVIDERS if get_ai_client(p) is not None]
+    if not providers:
+        return
+
+    all_paras, positions = select_ai_paragraphs(Document(BytesIO(_input(job, store))), ai_rules)
+    chunks = chunk_paragraphs({f"p{pos}": all_paras[pos].text for pos in positions})
+    progress = job.setdefault("ai", {"chunks": len(chunks), "done": [], "entries": {}})
+    todo = [n for n in range(len(chunks)) if n not in progress["done"]]
+    if not todo:
+        return
+    prompt_hash = rules_prompt_hash(ai_rules)
+    # On its last run a job does not stop for time: what is left goes to validation
+    last_run = job["runs"] >= JOB_MAX_RUNS
+    suspended = False
+    with ThreadPoolExecutor(max_workers=min(AI_MAX_PARALLEL, len(todo)), thread_name_prefix="msv-job-ai") as pool:
+        futures = {submit_in_context(pool, correct_chunk, providers, ai_rules, chunks[n]): n for n in todo}
+        for future in as_completed(futures):
+            n = futures[future]
+            try:
+                chunk_edits, in_tok, out_tok, provider = future.result()
+            except DeadlineExceeded:
+                suspended = True
+                continue
+            except Exception as e:
+                # Left for validation to send again
+                logging.warning(f"[{job['id']}] AI chunk {n} failed: {type(e).__name__}: {e}")
+                progress["done"].append(n)
+                store.save(job)
+                continue
+            # Cache keys name AI_PROVIDER and CLAUDE_MODEL: a fallback's answers are not kept
+            if provider == AI_PROVIDER:
+                chunk = chunks[n]
+                for pid, entry in cache_entries(chunk, chunk_edits, in_tok, out_tok).items():
+                    progress["entries"][correction_key(prompt_hash, chunk[pid])] = entry
+            progress["done"].append(n)
+            store.save(job)
+    if suspended and not last_run:
+        raise DeadlineExceeded(f"{len(chunks) - len(progress['done'])} AI chunk(s) left")
+
+
+def _validate(job, store, deadline):
+    entries = job.get("ai", {}).get("entries")
+    cache = get_ai_cache()
+    if entries and cache is not None:
+        put_many(cache, entries)
+    extension = os.path.splitext(job["file_name"])[1].lower()
+    result, fixed_stream = validate_file(extension, BytesIO(_input(job, store)), job["rules"])
+    if deadline.partial and job["runs"] < JOB_MAX_RUNS:
+        raise DeadlineExceeded("validation incomplete")
+
+    document_url, library_url = document_links(job["file_url"])
+    report_html = generate_report(job["file_name"], result["issues"], result["fixes_applied"],
+                                  document_url=document_url, library_url=library_url, skipped=deadline.skipped)
+    store.put_document(job["id"], "report", report_html.encode("utf-8"))
+    if result["fixes_applied"]:
+        store.put_document(job["id"], "fixed", fixed_stream.getvalue())
+
+    status = final_status(result["issues"], result["fixes_applied"], skipped=deadline.skipped)
+    remaining = [i for i in result["issues"] if isinstance(i, dict)]
+    job["result"] = {
+        "requestId": job["id"],
+        "status": status,
+        "description": status_description(status, result["issues"], result["fixes_applied"],
+                                          skipped=deadline.skipped),
+        "issuesFound": len(remaining) + len(result["fixes_applied"]),
+        "issuesFixed": len(result["fixes_applied"]),
+        "remainingIssues": len(remaining),
+        "reportFileName": f"{os.path.splitext(job['file_name'])[0]}_ValidationReport.html",
+    }
+    # What the Validation Results item records, as for a single request
+    job["issues_count"] = len(result["issues"])
+    if deadline.partial:
+        job["result"]["partial"] = True
+        job["result"]["skipped"] = deadline.skipped
+
+
+def _write_back(job, store, deadline):
+    if not ENABLE_FUNCTION_SHAREPOINT_WRITES:
+        return
+    result = job["result"]
+    fixed_bytes = store.get_document(job["id"], "fixed") if result["issuesFixed"] and job["file_url"] else None
+    write_back = new_write_back(job["id"], job["file_name"], job["file_url"], job["item_id"], result["status"],
+                                job["issues_count"], result["issuesFixed"],
+                                store.get_document(job["id"], "report").decode("utf-8"),
+                                report_path(job["file_name"], job["file_url"]), fixed_bytes)
+    write_back["done"] = job.setdefault("write_back", {})
+    # Checkpoint each step as it succeeds, so a run that dies mid-way resumes after it
+    errors = run_write_back(write_back, on_step=lambda step: store.save(job))
+    store.save(job)
+    if errors:
+        raise RuntimeError(f"Write-back incomplete: {', '.join(errors)}")
+    result["reportUrl"] = (job["write_back"].get("upload_report") or {}).get("web_url")
+    result["validationResultUrl"] = (job["write_back"].get("save_results") or {}).get("list_item_url")
+
+
+_STAGES = {"parse": _parse, "ai": _ai, "validate": _validate, "write_back": _write_back}
@@ -15,11 +15,16 @@ import uuid
 import logging
 import datetime
 import functools
+import threading
+import contextvars
 from typing import Optional
 from contextlib import contextmanager
 
 logger = logging.getLogger("macestyle.monitoring")
 
+# Per-call Graph latencies kept in the audit entry (aggregates cover the rest)
+MAX_GRAPH_CALLS_RECORDED = 100
+
 
 class ValidationMetrics:
     """Tracks metrics for a single validation request."""
@@ -37,34 +42,107 @@ class ValidationMetrics:
         self.claude_calls: int = 0
         self.claude_input_tokens: int = 0
         self.claude_output_tokens: int = 0
+        self.claude_cached_input_tokens: int = 0
+        self.ai_cache_hits: int = 0
+        self.ai_cache_misses: int = 0
+        self.ai_saved_input_tokens: int = 0
+        self.ai_saved_output_tokens: int = 0
+        self.ai_http_requests: int = 0
+        self.ai_new_connections: int = 0
+        self.ai_providers: dict = {}
+        self.ai_hedged_calls: int = 0
+        self.ai_failovers: int = 0
         self.issues_found: int = 0
         self.fixes_applied: int = 0
         self.status: str = "in_progress"
         self.error: Optional[str] = None
         self.sharepoint_calls: int = 0
         self.report_uploaded: bool = False
+        self.write_back_errors: dict = {}
+        self.result_cache: str = ""
+        self.paragraph_cache: dict = {}
+        self.skipped_checks: list = []
+        self.graph_retries: int = 0
+        self.graph_throttled: int = 0
+        self.graph_time_ms: int = 0
+        self._graph_calls: list = []
+        self._lock = threading.Lock()
         self._timings: dict = {}
+        self._phase_offsets: dict = {}
+        self._clock_start = time.monotonic()
         self._current_phase: Optional[str] = None
         self._phase_start: Optional[float] = None
 
     def start_phase(self, phase: str):
-        """Begin timing a named phase (e.g. 'claude_api', 'sharepoint_upload')."""
+        """Begin timing a named phase (e.g. 'claude_api', 'sharepoint_upload').
+        One at a time; use track_phase() for phases that may overlap."""
         self._current_phase = phase
         self._phase_start = time.monotonic()
 
     def end_phase(self):
         """End the current phase and record its duration."""
         if self._current_phase and self._phase_start:
-            elapsed = time.monotonic() - self._phase_start
-            self._timings[self._current_phase] = round(elapsed * 1000)  # ms
+            self.record_phase(self._current_phase, self._phase_start, time.monotonic())
             self._current_phase = None
             self._phase_start = None
 
-    def record_claude_usage(self, input_tokens: int, output_tokens: int):
-        """Record token usage from a Claude API call."""
-        self.claude_calls += 1
-        self.claude_input_tokens += input_tokens
-        self.claude_output_tokens += output_tokens
+    def record_phase(self, phase: str, started: float, ended: float):
+        """Record a phase from time.monotonic() readings. Thread-safe, so phases
+        running concurrently on worker threads are each kept, together with
+        when they started relative to the request (to show the overlap)."""
+        with self._lock:
+            self._timings[phase] = round((ended - started) * 1000)  # ms
+            self._phase_offsets[phase] = round((started - self._clock_start) * 1000)
+
+    def record_claude_usage(self, input_tokens: int, output_tokens: int, calls: int = 1,
+                            cache_hits: int = 0, cache_misses: int = 0,
+                            saved_input_tokens: int = 0, saved_output_tokens: int = 0,
+                            cached_input_tokens: int = 0):
+        """Record token usage from Claude API calls (cached_input_tokens: the
+        part of input_tokens read from the provider's prompt cache), and AI
+        cache lookups with the tokens the hits saved (calls=0 when only the
+        cache was used). Thread-safe: chunked AI calls report from worker threads."""
+        with self._lock:
+            self.claude_calls += calls
+            self.claude_input_tokens += input_tokens
+            self.claude_output_tokens += output_tokens
+            self.claude_cached_input_tokens += cached_input_tokens
+            self.ai_cache_hits += cache_hits
+            self.ai_cache_misses += cache_misses
+            self.ai_saved_input_tokens += saved_input_tokens
+            self.ai_saved_output_tokens += saved_output_tokens
+
+    def record_ai_http(self, requests: int = 0, new_connections: int = 0):
+        """Record AI provider HTTP requests and the new connections (TCP + TLS)
+        they had to open; the rest reused a pooled connection (ai_client)."""
+        with self._lock:
+            self.ai_http_requests += requests
+            self.ai_new_connections += new_connections
+
+    def record_ai_route(self, provider: str, hedged: bool = False, failover: bool = False):
+        """Record which backend answered an AI call, and whether it was hedged
+        or had failed over from another (ai_router)."""
+        with self._lock:
+            self.ai_providers[provider] = self.ai_providers.get(provider, 0) + 1
+            if hedged:
+                self.ai_hedged_calls += 1
+            if failover:
+                self.ai_failovers += 1
+
+    def record_graph_call(self, method: str, endpoint: str, status: int, elapsed_ms: int,
+                          retried: bool = False, throttled: bool = False):
+        """Record one Microsoft Graph HTTP round trip (called by graph_client)."""
+        with self._lock:
+            self.sharepoint_calls += 1
+            self.graph_time_ms += elapsed_ms
+            if retried:
+                self.graph_retries += 1
+            if throttled:
+                self.graph_throttled += 1
+            if len(self._graph_calls) < MAX_GRAPH_CALLS_RECORDED:
+                self._graph_calls.append({
+                    "method": method, "endpoint": endpoint, "status": status, "ms": elapsed_ms,
+                })
 
     def complete(self, status: str, issues: int, fixes: int):
         """Mark the validation as complete."""
@@ -86,8 +164,9 @@ class ValidationMetrics:
 
     @property
     def estimated_cost_usd(self) -> float:
-        """Estimate Claude API cost (Haiku 4.5 pricing)."""
-        input_cost = (self.claude_input_tokens / 1_000_000) * 0.80
+        """Estimate Claude API cost (Haiku 4.5 pricing; prompt-cache reads at 10%)."""
+        uncached = self.claude_input_tokens - self.claude_cached_input_tokens
+        input_cost = (uncached / 1_000_000) * 0.80 + (self.claude_cached_input_tokens / 1_000_000) * 0.08
         output_cost = (self.claude_output_tokens / 1_000_000) * 4.00
         return round(input_cost + output_cost, 6)
 
@@ -112,22 +191,78 @@ class ValidationMetrics:
                 "issues_found": self.issues_found,
                 "fixes_applied": self.fixes_applied,
                 "report_uploaded": self.report_uploaded,
+                "write_back_errors": self.write_back_errors,
+                "result_cache": self.result_cache,
+                "paragraph_cache": self.paragraph_cache,
+                "partial": bool(self.skipped_checks),
+                "skipped_checks": self.skipped_checks,
             },
             "ai_usage": {
                 "claude_calls": self.claude_calls,
                 "input_tokens": self.claude_input_tokens,
                 "output_tokens": self.claude_output_tokens,
+                "cached_input_tokens": self.claude_cached_input_tokens,
                 "estimated_cost_usd": self.estimated_cost_usd,
+                "cache_hits": self.ai_cache_hits,
+                "cache_misses": self.ai_cache_misses,
+                "saved_input_tokens": self.ai_saved_input_tokens,
+                "saved_output_tokens": self.ai_saved_output_tokens,
+                "http_requests": self.ai_http_requests,
+                "new_connections": self.ai_new_connections,
+                "reused_connections": max(0, self.ai_http_requests - self.ai_new_connections),
+                "providers": self.ai_providers,
+                "hedged_calls": self.ai_hedged_calls,
+                "failovers": self.ai_failovers,
             },
             "performance": {
                 "total_ms": self.duration_ms,
                 "phases_ms": self._timings,
+                "phase_start_ms": self._phase_offsets,
                 "sharepoint_calls": self.sharepoint_calls,
+                "graph_time_ms": self.graph_time_ms,
+                "graph_retries": self.graph_retries,
+                "graph_throttled": self.graph_throttled,
+                "graph_calls": self._graph_calls,
             },
             "error": self.error,
         }
 
 
+_current_metrics: contextvars.ContextVar = contextvars.ContextVar("macestyle_metrics", default=None)
+
+
+def set_current_metrics(metrics: ValidationMetrics) -> contextvars.Token:
+    """Make `metrics` the current request's metrics for code that has no handle
+    on it (e.g. graph_client). Pass the returned token to reset_current_metrics().
+    Worker threads only see it when run under contextvars.copy_context()."""
+    return _current_metrics.set(metrics)
+
+
+def reset_current_metrics(token: contextvars.Token):
+    _current_metrics.reset(token)
+
+
+@contextmanager
+def bind_metrics(metrics: ValidationMetrics):
+    """Context-manager form of set_current_metrics()."""
+    token = set_current_metrics(metrics)
+    try:
+        yield metrics
+    finally:
+        reset_current_metrics(token)
+
+
+def submit_in_context(executor, fn, *args):
+    """executor.submit() that carries the caller's context (bound metrics and
+    all) onto the worker thread, so its Graph calls count against the request."""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def current_metrics() -> Optional[ValidationMetrics]:
+    """The ValidationMetrics bound by bind_metrics(), or None outside a request."""
+    return _current_metrics.get()
+
+
 def generate_request_id() -> str:
     """Generate a unique request correlation ID."""
     return f"msv-{uuid.uuid4().hex[:12]}"
@@ -206,6 +341,16 @@ def get_health_status() -> dict:
         "detail": f"API key configured ({provider})" if has_key else missing_msg,
     }
 
+    # Circuit state of the AI backends this worker has called (ai_router)
+    from .ai_router import get_ai_router
+    providers = get_ai_router().status()
+    if providers:
+        open_circuits = [p for p, state in providers.items() if state["circuit"] == "open"]
+        health["checks"]["ai_providers"] = {
+            "status": "degraded" if open_circuits else "healthy",
+            "providers": providers,
+        }
+
     # Check access control
     auth_mode = os.environ.get("MACESTYLE_AUTH_MODE", "api_key")
     has_api_key = bool(os.environ.get("MACESTYLE_API_KEY"))
@@ -227,9 +372,10 @@ def get_health_status() -> dict:
 
 @contextmanager
 def track_phase(metrics: ValidationMetrics, phase: str):
-    """Context manager to time a named phase."""
-    metrics.start_phase(phase)
+    """Context manager to time a named phase. Safe to use from several threads
+    at once (each phase keeps its own start time)."""
+    started = time.monotonic()
     try:
         yield
     finally:
-        metrics.end_phase()
+        metrics.record_phase(phase, started, time.monotonic())
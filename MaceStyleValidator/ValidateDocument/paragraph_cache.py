@@ -0,0 +1,81 @@
+"""Paragraph-level cache for incremental Word re-validation
+
+Most re-validations follow a small edit to a long document. This per-worker
+cache remembers clean paragraphs: those on which no text rule (Language,
+Punctuation, Grammar, Capitalisation) found or changed anything. Those rules
+only ever look inside one paragraph, so skipping a paragraph known to be
+clean cannot change any rule's result; only the remaining paragraphs are
+checked (keeping their real indices for the report). AI corrections have
+their own cache, shared across documents (ai_cache.py).
+
+Keys hash the paragraph's XML (its runs and run boundaries, which the rules
+match within, but also hyperlinks, fields and tracked changes, whose text
+paragraph.text includes and paragraph.runs does not), its style and a
+fingerprint of the rules that apply, so any edit to the paragraph or to the
+rules misses the cache.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .config import PARAGRAPH_CACHE_MAX_ENTRIES
+from .worker import WorkerSingleton
+
+
+def paragraph_key(paragraph, plan):
+    """Cache key for `paragraph` under the rule-plan fingerprint `plan`."""
+    style = paragraph.style.name if paragraph.style is not None else ""
+    digest = hashlib.sha256(plan.encode("utf-8"))
+    digest.update(style.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(paragraph._p.xml.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ParagraphCache:
+    """LRU of paragraph keys (value True: clean), bounded by entry count."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = WorkerSingleton(lambda: ParagraphCache(PARAGRAPH_CACHE_MAX_ENTRIES))
+
+
+def get_paragraph_cache():
+    """The worker-wide ParagraphCache (None when PARAGRAPH_CACHE_MAX_ENTRIES is 0)."""
+    if PARAGRAPH_CACHE_MAX_ENTRIES <= 0:
+        return None
+    return _cache.get()
+
+
+def set_paragraph_cache(cache):
+    """Use `cache` for paragraph outcomes; None starts an empty one (tests)."""
+    _cache.set(cache)
@@ -2,6 +2,7 @@
 import re
 import logging
 from pptx import Presentation
+from .deadline import scheduled
 
 
 def validate_powerpoint_document(file_stream, rules):
@@ -21,7 +22,7 @@ def validate_powerpoint_document(file_stream, rules):
 
     # Hard-coded rules only — AI validation is skipped for PowerPoint
     # (AI is designed for prose; slide text produces too many false positives)
-    for rule in hard_coded_rules:
+    for rule in scheduled(hard_coded_rules):
         result = None
         if rule['rule_type'] == 'Font':
             result = _check_fonts(prs, rule)
@@ -1,4 +1,5 @@
 """HTML validation report generation with Mace branding"""
+import os
 from datetime import datetime, timezone
 
 # MaceWay Control Centre logo, served from the site's SiteAssets library.
@@ -21,7 +22,66 @@ def _rule_type_badge(rule_type):
     return f'<span class="rule-type-badge">{rt}</span>'
 
 
-def generate_report(file_name, issues, fixes_applied, document_url=None, library_url=None):
+def final_status(issues, fixes_applied, skipped=None):
+    """The document's status after validation, as written back to SharePoint.
+    `skipped` are the checks not run in time (deadline.py): a partial result
+    with nothing left to fix still needs a person to look at it."""
+    remaining = [i for i in issues if isinstance(i, dict)]
+    if len(remaining) == 0:
+        if skipped:
+            return "Review Required"
+        # Not "Passed" — needs a human to actually confirm it. And not
+        # "Validate Now", which is the trigger value meaning "please validate
+        # this" — writing that back would re-arm the flow.
+        return "Auto-Fixed — Awaiting Review"
+    if len(fixes_applied) > 0:
+        return "Review Required"
+    return "Failed"
+
+
+def status_description(status, issues, fixes_applied, skipped=None):
+    """One-line summary of a validation for the flow (the response's "description")."""
+    issues_count = len(issues)
+    fixes_count = len(fixes_applied)
+    remaining_count = len([i for i in issues if isinstance(i, dict)])
+    if fixes_count > 0 and remaining_count == 0:
+        description = f"{status} — {fixes_count} issue{'s' if fixes_count != 1 else ''} auto-fixed"
+    elif fixes_count > 0:
+        description = f"{status} — {fixes_count} fixed, {remaining_count} remaining"
+    elif issues_count > 0:
+        description = f"{status} — {issues_count} issue{'s' if issues_count != 1 else ''} found"
+    else:
+        description = f"{status} — no issues found"
+    if skipped:
+        description += f" (partial: {len(skipped)} check{'s' if len(skipped) != 1 else ''} not run in time)"
+    return description
+
+
+def document_links(file_url):
+    """(document_url, library_url) for the report's back-links, or (None, None).
+
+    Builds an absolute, browser-openable URL to the source document. Robust to
+    whatever the flow sends: a full URL, a server-relative path (FileRef,
+    /sites/<site>/...), or a site-relative path (/<lib>/...). The library is
+    the document's parent folder.
+    """
+    document_url = None
+    if file_url:
+        if file_url.startswith('http'):
+            document_url = file_url
+        elif file_url.startswith('/'):
+            _site = os.environ.get('SHAREPOINT_SITE_URL', '').rstrip('/')
+            _host = 'https://' + _site.split('//', 1)[-1].split('/', 1)[0] if _site else ''
+            _site_path = _site[len(_host):] if _host else ''  # e.g. /sites/MaceWayControlCentre
+            if _site_path and file_url.startswith(_site_path):
+                document_url = _host + file_url          # already server-relative incl. /sites/<site>
+            elif _site:
+                document_url = _site + file_url          # site-relative (no /sites/<site> prefix)
+    library_url = document_url.rsplit('/', 1)[0] if document_url else None
+    return document_url, library_url
+
+
+def generate_report(file_name, issues, fixes_applied, document_url=None, library_url=None, skipped=None):
     """Generate validation report as HTML with Mace branding.
 
     Args:
@@ -30,6 +90,8 @@ def generate_report(file_name, issues, fixes_applied, document_url=None, library
         fixes_applied: List of dicts with keys: rule_name, rule_type, found_value, fixed_value, location.
         document_url: Absolute URL of the source document; if set, the "Document:" line links back to it.
         library_url: Absolute URL of the document's library/folder; if set, a "Library:" link is shown.
+        skipped: Checks not run because the request's time budget ran out (deadline.py); if set,
+            the report is marked as a partial validation and lists them.
     """
     remaining_issues = [i for i in issues if isinstance(i, dict)]
     remaining_count = len(remaining_issues)
@@ -44,19 +106,9 @@ def generate_report(file_name, issues, fixes_applied, document_url=None, library
     ai_change_count = sum(f.get('changes_made', len(f.get('changes', []))) for f in ai_fixes)
     ai_active = bool(ai_fixes)
 
-    if remaining_count == 0:
-        # Not "Passed" — the AI pass ran automatically with no human review yet.
-        # "Passed" is reserved for after someone actually confirms the result.
-        # NB: must not be "Validate Now" — that value already means "a human has
-        # asked for this to be validated" and is what triggers a run.
-        status = "Auto-Fixed — Awaiting Review"
-        status_color = "#17a2b8"
-    elif fixes_count > 0:
-        status = "Review Required"
-        status_color = "#f0ad4e"
-    else:
-        status = "Failed"
-        status_color = "#dc3545"
+    # The same status as written back to SharePoint (final_status)
+    status = final_status(issues, fixes_applied, skipped)
+    status_color = {"Auto-Fixed — Awaiting Review": "#17a2b8", "Review Required": "#f0ad4e"}.get(status, "#dc3545")
 
     # The "Remaining" summary tile tracks the same three states as the status badge,
     # so it reuses status_color rather than picking its own (previously it hardcoded
@@ -93,6 +145,8 @@ def generate_report(file_name, issues, fixes_applied, document_url=None, library
         description = f"{total_issues_found} issue{'s' if total_issues_found != 1 else ''} found. Manual correction required."
     else:
         description = "No issues found against the Mace Writing Style Guide. Please review and confirm."
+    if skipped:
+        description += f" Partial validation: {len(skipped)} check{'s' if len(skipped) != 1 else ''} not run."
 
     # Build fixes table rows
     fixes_rows = ''
@@ -179,7 +233,18 @@ def generate_report(file_name, issues, fixes_applied, document_url=None, library
             {details_items}
         </div>"""
 
-    if total_issues_found == 0:
+    if skipped:
+        skipped_items = ''.join(f'<li>{_escape_html(what)}</li>' for what in skipped)
+        partial_section = f"""<div class="section review-section">
+            <h2>Partial Validation</h2>
+            <p>The validation time limit was reached before these checks ran. Re-run the
+            validation to complete them.</p>
+            <ul>{skipped_items}</ul>
+        </div>"""
+    else:
+        partial_section = ''
+
+    if total_issues_found == 0 and not skipped:
         no_issues_section = """<div class="section awaiting-review-section">
             <h2>No Issues Found</h2>
             <p>The validator found nothing to flag against the Mace Control Centre Writing Style
@@ -331,6 +396,12 @@ def generate_report(file_name, issues, fixes_applied, document_url=None, library
             color: #e69500;
             border-bottom-color: #f0ad4e;
         }}
+        .review-section p, .review-section ul {{
+            color: #555;
+            font-size: 14px;
+            margin: 10px 0 0 0;
+        }}
+        .review-section ul {{ padding-left: 22px; }}
         table {{
             width: 100%;
             border-collapse: collapse;
@@ -437,6 +508,7 @@ def generate_report(file_name, issues, fixes_applied, document_url=None, library
         </div>
     </div>
 
+    {partial_section}
     {no_issues_section}
     {fixes_section}
     {detailed_changes_html}
@@ -0,0 +1,241 @@
+"""Validation result cache and request idempotency
+
+Power Automate retries and repeated "Validate Now" clicks send byte-identical
+documents against unchanged rules, and each one paid for a full validation
+(AI calls included). Two layers avoid that:
+
+  - Content cache: key = SHA-256 of the file bytes + a fingerprint of the rule
+    set and AI settings + VALIDATOR_VERSION. A hit skips validation and reuses
+    the stored issues, fixes and fixed file; the report is rebuilt from them.
+  - Idempotency: a repeated X-MS-Workflow-Run-Id for the same document gets the
+    exact response already returned, with no SharePoint writes. A retry that
+    arrives while the first call is still running waits for it.
+
+Entries live in a per-worker LRU bounded by RESULT_CACHE_MAX_MB, optionally
+backed by a shared store (RESULT_CACHE_STORE=local|blob) so other workers and
+restarts see them.
+"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .config import (
+    VALIDATOR_VERSION, ENABLE_CLAUDE_AI, AI_PROVIDER, CLAUDE_MODEL,
+    RESULT_CACHE_MAX_MB, RESULT_CACHE_STORE, RESULT_CACHE_DIR, RESULT_CACHE_TTL_SECONDS,
+)
+from .worker import WorkerSingleton
+
+# How long a retry waits for the original call with the same run id
+IN_FLIGHT_WAIT_SECONDS = 230
+
+
+def file_digest(stream, chunk_size=1024 * 1024):
+    """SHA-256 of a seekable stream, read in chunks (position is restored)."""
+    position = stream.tell()
+    stream.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b""):
+        digest.update(chunk)
+    stream.seek(position)
+    return digest.hexdigest()
+
+
+def rules_fingerprint(rules):
+    """Fingerprint of everything besides the file that decides the outcome:
+    the rules as loaded plus the AI backend that applies the AI rules."""
+    plan = {
+        "rules": sorted(json.dumps(rule, sort_keys=True, default=str) for rule in rules),
+        "ai": [ENABLE_CLAUDE_AI, AI_PROVIDER, CLAUDE_MODEL],
+    }
+    return hashlib.sha256(json.dumps(plan, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def content_key(file_sha256, fingerprint):
+    return f"result-{hashlib.sha256(f'{file_sha256}:{fingerprint}:{VALIDATOR_VERSION}'.encode()).hexdigest()}"
+
+
+def idempotency_key(run_id, file_name, item_id, response_format):
+    raw = f"{run_id}:{file_name}:{item_id}:{response_format}:{VALIDATOR_VERSION}"
+    return f"run-{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+
+def _dumps(entry):
+    """JSON-encode an entry; bytes values become {"__b64__": ...}."""
+    return json.dumps({k: {"__b64__": base64.b64encode(v).decode("ascii")} if isinstance(v, bytes) else v
+                       for k, v in entry.items()}, default=str).encode("utf-8")
+
+
+def _loads(data):
+    entry = json.loads(data)
+    return {k: base64.b64decode(v["__b64__"]) if isinstance(v, dict) and "__b64__" in v else v
+            for k, v in entry.items()}
+
+
+class LocalResultStore:
+    """One file per entry under a directory (e.g. /home/data/... shared by the app's instances)."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        tmp = f"{self._path(key)}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self._path(key))
+
+
+class BlobResultStore:
+    """Entries as blobs in the Function App's storage account (AzureWebJobsStorage)."""
+
+    def __init__(self, container_name="macestyle-results"):
+        from azure.storage.blob import ContainerClient
+        conn_str = os.environ.get("AzureWebJobsStorage", "")
+        self.container = ContainerClient.from_connection_string(conn_str, container_name)
+        try:
+            self.container.create_container()
+        except Exception:
+            pass  # already exists
+
+    def get(self, key):
+        try:
+            return self.container.get_blob_client(f"{key}.json").download_blob().readall()
+        except Exception:
+            return None
+
+    def put(self, key, data):
+        self.container.get_blob_client(f"{key}.json").upload_blob(data, overwrite=True)
+
+
+class ResultCache:
+    """Size-bounded LRU of result entries, write-through to an optional store."""
+
+    def __init__(self, max_bytes, store=None, ttl_seconds=RESULT_CACHE_TTL_SECONDS, clock=time.time):
+        self.max_bytes = max_bytes
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()   # key -> (serialised entry, stored at)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._in_flight = {}            # idempotency key -> threading.Event
+        self.hits = 0
+        self.misses = 0
+
+    def _fresh(self, stored_at):
+        return not self.ttl_seconds or self._clock() - stored_at < self.ttl_seconds
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item and self._fresh(item[1]):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _loads(item[0])
+        data = None
+        if self.store is not None:
+            try:
+                data = self.store.get(key)
+            except Exception as e:
+                logging.warning(f"Result store read failed: {e}")
+        if data is not None:
+            entry = _loads(data)
+            if self._fresh(entry.get("stored_at", 0)):
+                self._remember(key, data, entry["stored_at"])
+                with self._lock:
+                    self.hits += 1
+                return entry
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, entry):
+        entry = dict(entry, stored_at=self._clock())
+        data = _dumps(entry)
+        self._remember(key, data, entry["stored_at"])
+        if self.store is not None:
+            try:
+                self.store.put(key, data)
+            except Exception as e:
+                logging.warning(f"Result store write failed: {e}")
+
+    def _remember(self, key, data, stored_at):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._size -= len(old[0])
+            self._entries[key] = (data, stored_at)
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _key, (evicted, _at) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def begin(self, key, timeout=IN_FLIGHT_WAIT_SECONDS):
+        """Claim an idempotency key. Returns (owned, entry):
+        (False, entry) - already answered (or answered while we waited): replay it
+        (True, None)   - this caller owns the key and must call finish() afterwards
+        (False, None)  - another call holds it but did not answer in time: proceed"""
+        entry = self.get(key)
+        if entry is not None:
+            return False, entry
+        with self._lock:
+            event = self._in_flight.get(key)
+            if event is None:
+                self._in_flight[key] = threading.Event()
+                return True, None
+        event.wait(timeout)
+        return False, self.get(key)
+
+    def finish(self, key):
+        with self._lock:
+            event = self._in_flight.pop(key, None)
+        if event:
+            event.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+def _default_store():
+    if RESULT_CACHE_STORE == "local":
+        return LocalResultStore(RESULT_CACHE_DIR)
+    if RESULT_CACHE_STORE == "blob":
+        try:
+            return BlobResultStore()
+        except Exception as e:
+            logging.warning(f"Result cache blob store unavailable, using memory only: {e}")
+    return None
+
+
+_cache = WorkerSingleton(lambda: ResultCache(RESULT_CACHE_MAX_MB * 1024 * 1024, _default_store()))
+
+
+def get_result_cache():
+    """The worker-wide ResultCache (None when RESULT_CACHE_MAX_MB is 0)."""
+    if RESULT_CACHE_MAX_MB <= 0:
+        return None
+    return _cache.get()
+
+
+def set_result_cache(cache):
+    """Use `cache` for validation results (tests)."""
+    _cache.set(cache)
@@ -0,0 +1,101 @@
+"""Process-wide Style Rules cache
+
+Azure Functions keeps a Python worker alive between invocations, so the Style
+Rules list only needs fetching when it has actually changed. The cache serves:
+
+  - fresh copy  (younger than the TTL)     -> returned with no Graph calls
+  - stale copy  (older than the TTL)       -> returned immediately, while one
+                                              background thread re-validates it
+  - no copy     (cold worker)              -> loaded synchronously
+
+Re-validation first asks the list for its lastModifiedDateTime (one cheap
+call). Only when that has moved is the full item list downloaded again.
+"""
+import logging
+import threading
+import time
+
+
+class RulesCache:
+    """Stale-while-revalidate cache for the Style Rules list.
+
+    ``load()`` returns ``(rules, version)``; ``probe()`` returns the current
+    version (e.g. the list's lastModifiedDateTime) without downloading items.
+    Both are supplied per call so the cache holds no credentials itself.
+    """
+
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._rules = None
+        self._version = None
+        self._checked_at = 0.0
+        self._refreshing = False
+        self.hits = 0
+        self.stale_hits = 0
+        self.loads = 0
+
+    def get(self, load, probe):
+        """Return the cached rules, loading or refreshing them as needed."""
+        if self.ttl_seconds <= 0:
+            # Caching disabled - behave exactly like a direct fetch.
+            return load()[0]
+
+        with self._lock:
+            rules = self._rules
+            if rules is not None:
+                age = time.monotonic() - self._checked_at
+                if age < self.ttl_seconds:
+                    self.hits += 1
+                    return rules
+                self.stale_hits += 1
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(
+                        target=self._refresh, args=(load, probe),
+                        name="style-rules-refresh", daemon=True
+                    ).start()
+                return rules
+
+        # Cold worker: only one caller loads, the rest wait for its result.
+        with self._load_lock:
+            with self._lock:
+                if self._rules is not None:
+                    self.hits += 1
+                    return self._rules
+            rules, version = load()
+            self._store(rules, version)
+            return rules
+
+    def _refresh(self, load, probe):
+        try:
+            version = probe()
+            if version is not None and version == self._version:
+                with self._lock:
+                    self._checked_at = time.monotonic()
+                logging.info(f"Style Rules unchanged since {version} - cache extended")
+                return
+            rules, version = load()
+            self._store(rules, version)
+            logging.info(f"Style Rules refreshed in background ({len(rules)} rules, version {version})")
+        except Exception as e:
+            # Keep serving the stale copy; the next request past the TTL retries.
+            logging.warning(f"Background Style Rules refresh failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _store(self, rules, version):
+        with self._lock:
+            self._rules = rules
+            self._version = version
+            self._checked_at = time.monotonic()
+            self.loads += 1
+
+    def invalidate(self):
+        """Drop the cached copy so the next call loads synchronously."""
+        with self._lock:
+            self._rules = None
+            self._version = None
+            self._checked_at = 0.0
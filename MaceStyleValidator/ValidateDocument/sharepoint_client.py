@@ -1,40 +1,166 @@
 """SharePoint / Microsoft Graph API operations"""
 import os
 import logging
+import threading
+import tempfile
 import requests
-from io import BytesIO
-from urllib.parse import quote
+from urllib.parse import quote, unquote
 from datetime import datetime, timezone
-from .config import get_site_info, get_style_rules_token, get_style_rules_site_info, DOC_LIBRARY_LIST_ID
+from .config import (
+    get_site_info, get_style_rules_token, get_style_rules_site_info, DOC_LIBRARY_LIST_ID,
+    STYLE_RULES_CACHE_TTL_SECONDS, GRAPH_SIMPLE_UPLOAD_MAX_BYTES, MAX_FILE_SIZE_BYTES,
+    DOWNLOAD_SPOOL_MAX_BYTES, DOWNLOAD_CHUNK_BYTES
+)
+from .graph_client import get_graph_client
+from .rules_cache import RulesCache
+from .upload_session import create_upload_session, upload_in_chunks, stream_size
+
+
+# Site and list IDs never change for the life of a worker (short of a site
+# being moved or a list recreated), so they are resolved once and memoised.
+# A 404 while using a cached ID drops the cache and retries once.
+_site_ids = {}   # (hostname, site_path) -> site ID
+_list_ids = {}   # (site ID, list name) -> list ID
+_ids_lock = threading.Lock()
+
+# Fields the library sweep needs from each drive delta item
+DRIVE_DELTA_SELECT = "id,name,file,folder,deleted,root,cTag,size,parentReference"
+
+
+def invalidate_site_cache():
+    """Forget every memoised site and list ID."""
+    with _ids_lock:
+        _site_ids.clear()
+        _list_ids.clear()
+
+
+def _resolve_site_id(headers, site_info):
+    key = (site_info['hostname'], site_info['site_path'])
+    site_id = _site_ids.get(key)
+    if site_id:
+        return site_id
+    url = f"/sites/{site_info['hostname']}:{site_info['site_path']}"
+    response = get_graph_client().get(url, headers=headers)
+    response.raise_for_status()
+    site_id = response.json()["id"]
+    with _ids_lock:
+        _site_ids[key] = site_id
+    return site_id
 
 
 def get_site_id(token):
-    """Get SharePoint site ID"""
-    site_info = get_site_info()
+    """Get SharePoint site ID (resolved once per worker)"""
     headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-    url = f"https://graph.microsoft.com/v1.0/sites/{site_info['hostname']}:{site_info['site_path']}"
-    response = requests.get(url, headers=headers)
+    return _resolve_site_id(headers, get_site_info())
+
+
+def get_list_id(token, site_id, list_name):
+    """Get a list's ID by display name (resolved once per worker)"""
+    key = (site_id, list_name)
+    list_id = _list_ids.get(key)
+    if list_id:
+        return list_id
+    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
+    response = get_graph_client().get(f"/sites/{site_id}/lists/{list_name}?$select=id", headers=headers)
     response.raise_for_status()
-    return response.json()["id"]
+    list_id = response.json()["id"]
+    with _ids_lock:
+        _list_ids[key] = list_id
+    return list_id
 
 
-def fetch_validation_rules(token):
-    """Fetch rules from SharePoint 'Style Rules' list"""
-    rules_token = get_style_rules_token()
-    rules_site_info = get_style_rules_site_info()
-    headers = {"Authorization": f"Bearer {rules_token}", "Accept": "application/json"}
+def get_doc_library_list_id(token, site_id):
+    """List ID of the document library: SHAREPOINT_DOC_LIBRARY_ID, else the site's default drive list"""
+    if DOC_LIBRARY_LIST_ID:
+        return DOC_LIBRARY_LIST_ID
+    key = (site_id, "drive/list")
+    list_id = _list_ids.get(key)
+    if list_id:
+        return list_id
+    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
+    response = get_graph_client().get(f"/sites/{site_id}/drive/list?$select=id", headers=headers)
+    response.raise_for_status()
+    list_id = response.json()["id"]
+    with _ids_lock:
+        _list_ids[key] = list_id
+    return list_id
+
+
+def site_request(token, send):
+    """Run send(site_id) -> Response against the document site.
 
-    site_url = f"https://graph.microsoft.com/v1.0/sites/{rules_site_info['hostname']}:{rules_site_info['site_path']}"
-    site_response = requests.get(site_url, headers=headers)
-    site_response.raise_for_status()
-    site_id = site_response.json()["id"]
+    If it 404s while the site ID came from the memo, the ID may be stale:
+    drop the memo, re-resolve and send once more.
+    """
+    site_info = get_site_info()
+    was_cached = (site_info['hostname'], site_info['site_path']) in _site_ids
+    response = send(get_site_id(token))
+    if response.status_code == 404 and was_cached:
+        logging.info("Graph returned 404 with a memoised site ID - re-resolving and retrying once")
+        response.close()
+        invalidate_site_cache()
+        response = send(get_site_id(token))
+    return response
+
+
+def _style_rules_site(headers):
+    """Resolve the site ID that hosts the Style Rules list (resolved once per worker)"""
+    return _resolve_site_id(headers, get_style_rules_site_info())
 
-    list_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/Style Rules/items?expand=fields"
-    response = requests.get(list_url, headers=headers)
+
+def _style_rules_version(headers, site_id):
+    """The Style Rules list's lastModifiedDateTime - moves whenever an item is added, edited or deleted"""
+    list_url = f"/sites/{site_id}/lists/Style Rules?$select=id,lastModifiedDateTime"
+    response = get_graph_client().get(list_url, headers=headers)
     response.raise_for_status()
+    return response.json().get("lastModifiedDateTime")
+
+
+# Only the columns the validator reads (display names plus the field_N internal
+# names older copies of the list still use). Without $select Graph returns every
+# system column on every item.
+STYLE_RULE_FIELDS = (
+    "Title", "RuleType", "DocumentType", "CheckValue", "ExpectedValue", "AutoFix", "UseAI", "Priority",
+    "field_1", "field_2", "field_3", "field_4", "field_5", "field_6", "field_7",
+)
+# Graph pages list items at 200 by default; ask for the largest page it honours
+# so a typical rule list arrives in one round trip.
+STYLE_RULES_PAGE_SIZE = 999
+
+
+def _iter_style_rule_items(headers, site_id):
+    """Yield every Style Rules list item, following @odata.nextLink until the last page"""
+    url = (
+        f"/sites/{site_id}/lists/Style Rules/items"
+        f"?$select=id&$expand=fields($select={','.join(STYLE_RULE_FIELDS)})&$top={STYLE_RULES_PAGE_SIZE}"
+    )
+    pages = 0
+    while url:
+        response = get_graph_client().get(url, headers=headers)
+        response.raise_for_status()
+        page = response.json()
+        pages += 1
+        yield from page.get("value", [])
+        url = page.get("@odata.nextLink")
+    logging.info(f"Style Rules fetched in {pages} page(s)")
+
+
+def _load_validation_rules():
+    """Download and parse the whole Style Rules list. Returns (rules, version)."""
+    rules_token = get_style_rules_token()
+    headers = {"Authorization": f"Bearer {rules_token}", "Accept": "application/json"}
+    try:
+        site_id = _style_rules_site(headers)
+        version = _style_rules_version(headers, site_id)
+    except requests.HTTPError as e:
+        if e.response is None or e.response.status_code != 404:
+            raise
+        invalidate_site_cache()
+        site_id = _style_rules_site(headers)
+        version = _style_rules_version(headers, site_id)
 
     rules = []
-    for item in response.json().get("value", []):
+    for item in _iter_style_rule_items(headers, site_id):
         fields = item.get("fields", {})
         rules.append({
             'title': fields.get('Title'),
@@ -48,28 +174,143 @@ def fetch_validation_rules(token):
         })
 
     rules.sort(key=lambda x: x['priority'])
-    return rules
+    logging.info(f"Loaded {len(rules)} Style Rules (list modified {version})")
+    return rules, version
+
 
+def _probe_validation_rules():
+    """Cheap change check used by the background refresh (no item download)"""
+    rules_token = get_style_rules_token()
+    headers = {"Authorization": f"Bearer {rules_token}", "Accept": "application/json"}
+    return _style_rules_version(headers, _style_rules_site(headers))
 
-def download_file(token, file_path):
-    """Download file from SharePoint using Graph API"""
+
+_rules_cache = RulesCache(STYLE_RULES_CACHE_TTL_SECONDS)
+
+
+def fetch_validation_rules(token):
+    """Fetch rules from SharePoint 'Style Rules' list.
+
+    Served from the process-wide cache (see rules_cache.py), so warm workers
+    make no Graph calls here. Each caller gets its own copies of the rule dicts.
+    """
+    rules = _rules_cache.get(_load_validation_rules, _probe_validation_rules)
+    return [dict(rule) for rule in rules]
+
+
+class FileTooLargeError(Exception):
+    """The document is bigger than MAX_FILE_SIZE_BYTES."""
+
+    def __init__(self, size, limit, exact=True):
+        self.size = size
+        self.limit = limit
+        what = f"{size} bytes" if exact else f"more than {size} bytes"
+        super().__init__(f"File too large ({what}). Maximum allowed is {_format_size(limit)}.")
+
+
+def _format_size(size):
+    if size >= 1024 * 1024:
+        return f"{size / (1024 * 1024):.1f} MB"
+    return f"{size / 1024:.1f} KB"
+
+
+def download_file(token, file_path, max_bytes=None):
+    """Download file from SharePoint using Graph API
+
+    The body is streamed into a SpooledTemporaryFile (in memory up to
+    DOWNLOAD_SPOOL_MAX_BYTES, then on local disk) and the size limit is
+    checked against Content-Length and again while streaming, so an oversized
+    file is rejected before it is buffered. Returns the spooled file, rewound.
+    """
     if not file_path:
         raise ValueError("file_path cannot be None or empty")
 
     logging.info(f"Downloading file: {file_path}")
-    site_id = get_site_id(token)
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
-
     drive_relative_path = file_path
     if "Shared Documents/" in file_path:
         drive_relative_path = "/" + file_path.split("Shared Documents/", 1)[1]
+    return _download(token, f"/drive/root:{drive_relative_path}:/content", max_bytes)
 
-    url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:{drive_relative_path}:/content"
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
 
-    logging.info(f"File downloaded, size: {len(response.content)} bytes")
-    return BytesIO(response.content)
+def download_item(token, drive_item_id, max_bytes=None):
+    """Download a drive item by ID (as download_file; used by the library sweep)"""
+    logging.info(f"Downloading drive item: {drive_item_id}")
+    return _download(token, f"/drive/items/{drive_item_id}/content", max_bytes)
+
+
+def _download(token, drive_path, max_bytes):
+    max_bytes = max_bytes or MAX_FILE_SIZE_BYTES
+    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
+    response = site_request(token, lambda site_id: get_graph_client().get(
+        f"/sites/{site_id}{drive_path}", headers=headers, stream=True))
+    with response:
+        response.raise_for_status()
+        declared = int(response.headers.get("Content-Length") or 0)
+        if declared > max_bytes:
+            raise FileTooLargeError(declared, max_bytes)
+
+        spool = tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_MAX_BYTES)
+        size = 0
+        try:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_BYTES):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise FileTooLargeError(max_bytes, max_bytes, exact=False)
+                spool.write(chunk)
+        except BaseException:
+            spool.close()
+            raise
+
+    spool.seek(0)
+    logging.info(f"File downloaded, size: {size} bytes")
+    return spool
+
+
+def iter_drive_delta(token, delta_link=None):
+    """Walk the document library with the Graph delta API.
+
+    Yields one (items, delta_link) pair per page, following @odata.nextLink;
+    delta_link is None until the last page, which carries the link to ask for
+    the changes made after this walk. Without a delta_link the walk lists every
+    item in the drive (all folders, recursively). If Graph no longer accepts
+    the delta_link (410 Gone: the token expired or a resync is needed), the
+    walk starts again from the full listing.
+    """
+    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
+    if delta_link:
+        response = get_graph_client().get(delta_link, headers=headers)
+        if response.status_code == 410:
+            logging.warning("Drive delta link no longer valid (410) - starting a full listing")
+            response.close()
+            delta_link = None
+    if not delta_link:
+        response = site_request(token, lambda site_id: get_graph_client().get(
+            f"/sites/{site_id}/drive/root/delta?$select={DRIVE_DELTA_SELECT}", headers=headers))
+
+    pages = 0
+    while True:
+        response.raise_for_status()
+        page = response.json()
+        pages += 1
+        next_link = page.get("@odata.nextLink")
+        yield page.get("value", []), None if next_link else page.get("@odata.deltaLink")
+        if not next_link:
+            break
+        response = get_graph_client().get(next_link, headers=headers)
+    logging.info(f"Drive delta read in {pages} page(s)")
+
+
+def get_drive_item_url(token, drive_item_id):
+    """Server-relative URL of a drive item, in the form the flow sends as fileUrl
+    ("/sites/<site>/Shared Documents/Folder/file.docx"). Delta pages do not
+    carry parentReference.path, so the sweep asks for it when it needs it."""
+    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
+    response = site_request(token, lambda site_id: get_graph_client().get(
+        f"/sites/{site_id}/drive/items/{drive_item_id}?$select=name,parentReference", headers=headers))
+    response.raise_for_status()
+    item = response.json()
+    folder = unquote(item.get("parentReference", {}).get("path", "")).split("root:", 1)[-1].rstrip("/")
+    return f"{get_site_info()['site_path']}/Shared Documents{folder}/{item['name']}"
 
 
 def upload_file(token, file_stream, target_path):
@@ -78,20 +319,29 @@ def upload_file(token, file_stream, target_path):
         raise ValueError("target_path cannot be None or empty")
 
     logging.info(f"Uploading file to: {target_path}")
-    site_id = get_site_id(token)
     headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/octet-stream"}
 
     drive_relative_path = target_path
     if "Shared Documents/" in target_path:
         drive_relative_path = "/" + target_path.split("Shared Documents/", 1)[1]
 
-    file_stream.seek(0)
     encoded_path = quote(drive_relative_path, safe='/')
-    url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:{encoded_path}:/content"
-    response = requests.put(url, headers=headers, data=file_stream.read())
-    response.raise_for_status()
+    size = stream_size(file_stream)
+    if size > GRAPH_SIMPLE_UPLOAD_MAX_BYTES:
+        # Too big for one PUT: chunked, resumable upload session
+        response = site_request(token, lambda site_id: create_upload_session(
+            token, f"/sites/{site_id}/drive/root:{encoded_path}"))
+        response.raise_for_status()
+        logging.info(f"Uploading {size} bytes via upload session")
+        resp_json = upload_in_chunks(response.json()["uploadUrl"], file_stream, size)
+    else:
+        file_stream.seek(0)
+        content = file_stream.read()
+        response = site_request(token, lambda site_id: get_graph_client().put(
+            f"/sites/{site_id}/drive/root:{encoded_path}:/content", headers=headers, data=content))
+        response.raise_for_status()
+        resp_json = response.json()
 
-    resp_json = response.json()
     web_url = resp_json.get("webUrl")
     item_id = resp_json.get("id")
     logging.info(f"File uploaded: {web_url}")
@@ -100,30 +350,34 @@ def upload_file(token, file_stream, target_path):
 
 def update_drive_item_fields(token, drive_item_id, fields):
     """Update list item fields on a drive item (e.g. ValidationStatus on a report file)"""
-    site_id = get_site_id(token)
     headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/items/{drive_item_id}/listItem/fields"
-    response = requests.patch(url, headers=headers, json=fields)
+    response = site_request(token, lambda site_id: get_graph_client().patch(
+        f"/sites/{site_id}/drive/items/{drive_item_id}/listItem/fields", headers=headers, json=fields))
     if response.status_code >= 400:
         logging.warning(f"Could not update drive item fields (HTTP {response.status_code}): {response.text}")
     else:
         logging.info(f"Drive item {drive_item_id} fields updated")
 
 
-def update_validation_status(token, item_id, status, report_url):
-    """Update ValidationStatus column in document library"""
-    site_id = get_site_id(token)
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-
-    url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{DOC_LIBRARY_LIST_ID}/items/{item_id}/fields"
+def validation_status_fields(status, report_url=None):
+    """Fields written to the document library item when validation finishes"""
     data = {
         "ValidationStatus": status,
         "LastValidated": datetime.now(timezone.utc).isoformat()
     }
     if report_url:
         data["ValidationReport"] = report_url
+    return data
+
+
+def update_validation_status(token, item_id, status, report_url):
+    """Update ValidationStatus column in document library"""
+    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+    data = validation_status_fields(status, report_url)
 
-    response = requests.patch(url, headers=headers, json=data)
+    response = site_request(token, lambda site_id: get_graph_client().patch(
+        f"/sites/{site_id}/lists/{get_doc_library_list_id(token, site_id)}/items/{item_id}/fields",
+        headers=headers, json=data))
     if response.status_code >= 400:
         logging.warning(
             f"Could not update validation status (HTTP {response.status_code}): {response.text}. "
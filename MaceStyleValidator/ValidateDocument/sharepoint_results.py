@@ -2,10 +2,41 @@
 Save validation results to SharePoint Validation Results list
 """
 import os
+import json
 import logging
-import requests
 from datetime import datetime
 
+
+def _result_item_fields(filename, issues_count, fixes_count, status):
+    """Fields for a new Validation Results list item"""
+    return {
+        "Title": f"Validation: {filename}",
+        "FileName": filename,
+        "ValidationDate": datetime.utcnow().isoformat() + "Z",
+        "Status": status,
+        "IssuesFound": str(issues_count),
+        "IssuesFixed": str(fixes_count)
+    }
+
+
+def _link_field(description, url):
+    """Value for a SharePoint Hyperlink column"""
+    return {"Description": description, "Url": url}
+
+
+def _list_item_url(item_id):
+    site_url = os.environ.get("SHAREPOINT_SITE_URL", "")
+    return f"{site_url}/Lists/Validation%20Results/DispForm.aspx?ID={item_id}"
+
+
+def _drive_relative_path(file_url):
+    """URL-encoded path below the drive root for a "/.../Shared Documents/..." URL, or None"""
+    if "/Shared Documents/" not in file_url:
+        return None
+    import urllib.parse
+    return urllib.parse.quote(file_url.split("/Shared Documents/", 1)[1])
+
+
 def save_validation_result(token, site_id, filename, issues_count, fixes_count, status, html_report, report_url=None):
     """
     Save validation result to SharePoint Validation Results list
@@ -37,22 +68,15 @@ def save_validation_result(token, site_id, filename, issues_count, fixes_count,
     # Create list item
     # Use list ID for reliability (configurable via SHAREPOINT_VALIDATION_RESULTS_ID)
     from .config import VALIDATION_RESULTS_LIST_ID
-    list_id = VALIDATION_RESULTS_LIST_ID
-    list_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items"
-
-    item_data = {
-        "fields": {
-            "Title": f"Validation: {filename}",
-            "FileName": filename,
-            "ValidationDate": datetime.utcnow().isoformat() + "Z",
-            "Status": status,
-            "IssuesFound": str(issues_count),
-            "IssuesFixed": str(fixes_count)
-        }
-    }
+    from .graph_client import get_graph_client
+    from .sharepoint_client import get_list_id
+    list_id = VALIDATION_RESULTS_LIST_ID or get_list_id(token, site_id, "Validation Results")
+    list_url = f"/sites/{site_id}/lists/{list_id}/items"
+
+    item_data = {"fields": _result_item_fields(filename, issues_count, fixes_count, status)}
 
     logging.info(f"Creating list item with data: {item_data}")
-    response = requests.post(list_url, headers=headers, json=item_data)
+    response = get_graph_client().post(list_url, headers=headers, json=item_data)
     response.raise_for_status()
 
     item = response.json()
@@ -62,22 +86,14 @@ def save_validation_result(token, site_id, filename, issues_count, fixes_count,
     # Update ReportLink field if report_url provided
     if report_url:
         logging.info(f"Updating ReportLink field with URL: {report_url}")
-        update_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items/{item_id}"
-        update_data = {
-            "fields": {
-                "ReportLink": {
-                    "Description": "View HTML Report",
-                    "Url": report_url
-                }
-            }
-        }
+        update_url = f"/sites/{site_id}/lists/{list_id}/items/{item_id}"
+        update_data = {"fields": {"ReportLink": _link_field("View HTML Report", report_url)}}
 
-        response = requests.patch(update_url, headers=headers, json=update_data)
+        response = get_graph_client().patch(update_url, headers=headers, json=update_data)
         response.raise_for_status()
         logging.info(f"✓ Updated ReportLink field")
 
-    site_url = os.environ.get("SHAREPOINT_SITE_URL", "")
-    list_item_url = f"{site_url}/Lists/Validation%20Results/DispForm.aspx?ID={item_id}"
+    list_item_url = _list_item_url(item_id)
     logging.info(f"✓ Validation result saved: {list_item_url}")
 
     return {
@@ -97,6 +113,9 @@ def update_document_metadata(token, site_id, file_url, validation_result_url):
         file_url: Full SharePoint URL or path to the document
         validation_result_url: URL to the validation result
     """
+    from .graph_client import get_graph_client
+    from .sharepoint_client import get_doc_library_list_id
+
     logging.info(f"Updating document metadata with validation result link...")
     logging.info(f"File URL: {file_url}")
     logging.info(f"Validation result URL: {validation_result_url}")
@@ -111,28 +130,15 @@ def update_document_metadata(token, site_id, file_url, validation_result_url):
         # file_url format: /sites/StyleValidation/Shared Documents/filename.docx
         # We need to get the drive item by path
 
-        # Get the drive first
-        drive_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive"
-        drive_response = requests.get(drive_url, headers=headers)
-        drive_response.raise_for_status()
-        drive_id = drive_response.json()["id"]
-
-        logging.info(f"Drive ID: {drive_id}")
-
         # Parse the file path - file_url is like "/sites/StyleValidation/Shared Documents/test.docx"
         # We need the path relative to the drive root
-        if "/Shared Documents/" in file_url:
-            # Extract path after "Shared Documents"
-            relative_path = file_url.split("/Shared Documents/", 1)[1]
-            # URL encode the path
-            import urllib.parse
-            encoded_path = urllib.parse.quote(relative_path)
-
+        encoded_path = _drive_relative_path(file_url)
+        if encoded_path:
             # Get the drive item
-            item_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root:/{encoded_path}"
+            item_url = f"/sites/{site_id}/drive/root:/{encoded_path}"
             logging.info(f"Getting drive item: {item_url}")
 
-            item_response = requests.get(item_url, headers=headers)
+            item_response = get_graph_client().get(item_url, headers=headers)
             item_response.raise_for_status()
             item_data = item_response.json()
 
@@ -145,28 +151,18 @@ def update_document_metadata(token, site_id, file_url, validation_result_url):
             logging.info(f"Found list item ID: {list_item_id}")
 
             # Update the ValidationResultLink field
-            # First, get the list ID from the drive
-            list_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/list"
-            list_response = requests.get(list_url, headers=headers)
-            list_response.raise_for_status()
-            list_id = list_response.json()["id"]
+            # The library's list ID is memoised per worker (see sharepoint_client)
+            list_id = get_doc_library_list_id(token, site_id)
 
             logging.info(f"List ID: {list_id}")
 
             # Update the list item with ValidationResultLink
-            update_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/lists/{list_id}/items/{list_item_id}"
+            update_url = f"/sites/{site_id}/lists/{list_id}/items/{list_item_id}"
 
-            update_data = {
-                "fields": {
-                    "ValidationResultLink": {
-                        "Description": "View Validation Result",
-                        "Url": validation_result_url
-                    }
-                }
-            }
+            update_data = {"fields": {"ValidationResultLink": _link_field("View Validation Result", validation_result_url)}}
 
             logging.info(f"Updating list item with: {update_data}")
-            update_response = requests.patch(update_url, headers=headers, json=update_data)
+            update_response = get_graph_client().patch(update_url, headers=headers, json=update_data)
             update_response.raise_for_status()
 
             logging.info(f"✓ Successfully updated ValidationResultLink for document")
@@ -181,3 +177,114 @@ def update_document_metadata(token, site_id, file_url, validation_result_url):
         import traceback
         logging.error(f"Traceback: {traceback.format_exc()}")
         return False
+
+
+def write_back_results(token, site_id, filename, issues_count, fixes_count, status,
+                       report_url=None, report_drive_item_id=None, file_url=None, item_id=None):
+    """
+    Write every post-validation SharePoint update in two Graph $batch round trips
+
+    Replaces the sequential update_drive_item_fields / save_validation_result /
+    update_document_metadata / update_validation_status calls (8-10 round trips).
+
+    Batch 1 (independent): report file metadata, the Validation Results item,
+    and the source document's listItem id (looked up by path when file_url is given).
+    Batch 2 (needs batch 1 ids): ReportLink on the new results item, then the
+    document's final status and ValidationResultLink - the two document writes
+    are chained with dependsOn so they never race on the same list item.
+
+    Each write fails independently (logged, as before); the final status is
+    still written when the results item could not be created.
+
+    Returns:
+        dict with 'item_id', 'report_url', and 'list_item_url', or None if the
+        Validation Results item was not created
+    """
+    from .config import VALIDATION_RESULTS_LIST_ID
+    from .graph_batch import GraphBatch
+    from .sharepoint_client import get_list_id, get_doc_library_list_id, validation_status_fields
+
+    results_list_id = VALIDATION_RESULTS_LIST_ID or get_list_id(token, site_id, "Validation Results")
+    doc_list_id = get_doc_library_list_id(token, site_id)
+    site = f"/sites/{site_id}"
+
+    first = GraphBatch(token)
+    if report_drive_item_id:
+        first.add("PATCH", f"{site}/drive/items/{report_drive_item_id}/listItem/fields", {
+            "ValidationStatus": status,
+            "IssuesFound": issues_count,
+            "IssuesFixed": fixes_count
+        }, request_id="reportFields")
+    first.add("POST", f"{site}/lists/{results_list_id}/items",
+              {"fields": _result_item_fields(filename, issues_count, fixes_count, status)},
+              request_id="resultItem")
+    encoded_path = _drive_relative_path(file_url) if file_url else None
+    if encoded_path:
+        first.add("GET", f"{site}/drive/root:/{encoded_path}?$select=id&$expand=listItem($select=id)",
+                  request_id="document")
+    elif file_url:
+        logging.warning(f"File URL format not recognized: {file_url}")
+
+    logging.info(f"Writing validation results for {filename} ({len(first)} requests in batch 1)")
+    responses = first.execute()
+
+    report_fields = responses.get("reportFields")
+    if report_fields is not None and not report_fields.ok:
+        logging.warning(f"Could not update report metadata (HTTP {report_fields.status_code}): {report_fields.text}")
+
+    result_item = responses.get("resultItem")
+    validation_result_info = None
+    if result_item is None:
+        logging.error("Failed to save validation result: no response from Graph $batch")
+    elif result_item.ok:
+        result_item_id = result_item.json()["id"]
+        validation_result_info = {
+            "item_id": result_item_id,
+            "report_url": report_url,
+            "list_item_url": _list_item_url(result_item_id)
+        }
+        logging.info(f"✓ Created validation result item ID: {result_item_id}")
+    else:
+        logging.error(f"Failed to save validation result (HTTP {result_item.status_code}): {result_item.text}")
+
+    document = responses.get("document")
+    doc_item_id = None
+    if document is not None:
+        if document.ok:
+            doc_item_id = document.json().get("listItem", {}).get("id")
+        if not doc_item_id:
+            logging.warning(f"Could not find listItem ID for document (HTTP {document.status_code})")
+
+    second = GraphBatch(token)
+    if validation_result_info and report_url:
+        second.add("PATCH", f"{site}/lists/{results_list_id}/items/{validation_result_info['item_id']}",
+                   {"fields": {"ReportLink": _link_field("View HTML Report", report_url)}},
+                   request_id="reportLink")
+    status_id = None
+    if item_id:
+        status_id = second.add("PATCH", f"{site}/lists/{doc_list_id}/items/{item_id}/fields",
+                               validation_status_fields(status, report_url), request_id="finalStatus")
+    if validation_result_info and (doc_item_id or item_id):
+        link = _link_field("View Validation Result", validation_result_info["list_item_url"])
+        if doc_item_id:
+            url, body = f"{site}/lists/{doc_list_id}/items/{doc_item_id}", {"fields": {"ValidationResultLink": link}}
+        else:
+            # Same shape _update_metadata_by_item_id has always sent
+            url, body = f"{site}/lists/{doc_list_id}/items/{item_id}/fields", {"ValidationResultLink": json.dumps(link)}
+        # Serialised after the status write (normally the same list item; Graph
+        # runs batch requests without dependsOn in parallel).
+        second.add("PATCH", url, body, depends_on=[status_id] if status_id else None, request_id="resultLink")
+
+    if len(second):
+        responses = second.execute()
+        for request_id, what in (("reportLink", "ReportLink"), ("finalStatus", "final status"),
+                                 ("resultLink", "ValidationResultLink")):
+            if request_id not in second:
+                continue
+            response = responses.get(request_id)
+            if response is None:
+                logging.warning(f"Could not set {what}: no response from Graph $batch")
+            elif not response.ok:
+                logging.warning(f"Could not set {what} (HTTP {response.status_code}): {response.text}")
+
+    return validation_result_info
@@ -0,0 +1,320 @@
+"""Library sweep: validate the documents that changed since the last sweep
+
+ValidateDocument is called for one document at a time, when the flow sees it
+change; ListDocuments only lists the root folder. The nightly SweepLibrary
+timer instead walks the whole document library with the Graph drive delta API
+(sharepoint_client.iter_drive_delta), which on every sweep after the first
+returns only the items added, changed or deleted since the previous one:
+
+  - folders, deleted items, unsupported file types and files over
+    MAX_FILE_SIZE_BYTES are passed over;
+  - a file whose cTag (content version) was already validated is passed over
+    too - the sweep's own status and report writes change the item's metadata,
+    not its content, so they do not bring it back (a document the sweep fixed
+    does come back once, and is then found clean);
+  - the rest are validated in-process (core.validate_file, rules fetched
+    once per sweep) in groups of SWEEP_BATCH_DOCUMENTS. A group is
+    downloaded and its AI work submitted as provider batch jobs
+    (ai_batch.AIBatch.submit: each distinct paragraph not already in the AI
+    correction cache, once). Batch jobs take minutes to hours, far longer
+    than a sweep's budget, so the sweep does not wait for them: the jobs and
+    the group's items are saved in the sweep state, and each later sweep
+    checks them once (ai_batch.collect) until they have ended and their
+    edits are in the cache. The group is then validated first thing, its AI
+    corrections coming from the cache (direct calls only for requests that
+    failed). Jobs not ended after AI_BATCH_TIMEOUT_SECONDS are cancelled and
+    their documents validated with direct AI calls. A group with no AI work
+    left to ask for is validated straight away. Downloads and validations
+    run on a pool of SWEEP_CONCURRENCY threads. A validation still running
+    when the sweep's time budget ends gives a partial result (deadline.py),
+    marked Review Required; the document is validated again by the next
+    sweep. Results are written back to SharePoint when the function owns
+    the writes (ENABLE_FUNCTION_SHAREPOINT_WRITES), exactly as for a single
+    document (write_back.py).
+
+The sweep state - the delta link, the cTag validated for each item, the
+documents to retry and the AI batch jobs being waited for - is kept in the
+job store (JOB_STORE) and saved after each group. The new delta link is only kept once a sweep has been through
+every page: a sweep stopped by its time budget (SWEEP_BUDGET_SECONDS) leaves
+the old link, and the next sweep reads the same changes again and passes over
+the documents already validated. A document that fails is retried by the next
+sweeps, up to SWEEP_MAX_ATTEMPTS attempts in all.
+"""
+import datetime
+import json
+import logging
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from io import BytesIO
+
+from .ai_batch import AIBatch, collect as collect_ai_batch, cancel as cancel_ai_batch
+from .config import (
+    ENABLE_FUNCTION_SHAREPOINT_WRITES, MAX_FILE_SIZE_BYTES, SWEEP_CONCURRENCY, SWEEP_BUDGET_SECONDS,
+    SWEEP_MAX_ATTEMPTS, SWEEP_BATCH_DOCUMENTS, AI_BATCH_TIMEOUT_SECONDS, get_graph_token,
+)
+from .core import is_supported, validate_file
+from .deadline import Deadline, bind_deadline
+from .jobs import get_job_store
+from .monitoring import ValidationMetrics, bind_metrics, emit_audit_event, generate_request_id, track_phase
+from .report import generate_report, final_status, document_links
+from .sharepoint_client import fetch_validation_rules, iter_drive_delta, download_item, get_drive_item_url
+from .write_back import new_job as new_write_back, run_write_back, report_path
+
+STATE_KEY = "library-sweep"
+
+SWEEP_CALLER = {"auth_mode": "timer", "name": "SweepLibrary"}
+
+
+def load_state(store):
+    data = store.get(STATE_KEY)
+    state = json.loads(data) if data else {}
+    state.setdefault("delta_link", None)
+    state.setdefault("validated", {})   # drive item id -> cTag
+    state.setdefault("retry", {})       # drive item id -> {"item": delta item, "attempts": n}
+    state.setdefault("ai_batches", [])  # [{"jobs": AIBatch.submit() result, "items": [retry entry]}]
+    return state
+
+
+def save_state(store, state):
+    state["updated_at"] = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    store.put(STATE_KEY, json.dumps(state).encode("utf-8"))
+
+
+def _extension(item):
+    return os.path.splitext(item.get("name", ""))[1].lower()
+
+
+def _wanted(item):
+    return ("file" in item and is_supported(_extension(item))
+            and (item.get("size") or 0) <= MAX_FILE_SIZE_BYTES)
+
+
+def _item_metrics(item, rules):
+    metrics = ValidationMetrics(request_id=generate_request_id(), filename=item["name"], caller=SWEEP_CALLER)
+    metrics.file_type = _extension(item)
+    metrics.file_size_bytes = item.get("size")
+    metrics.rules_loaded = len(rules)
+    return metrics
+
+
+@contextmanager
+def _audited(metrics):
+    """Bind `metrics`; a failure inside is recorded and emitted as the
+    document's audit event before it propagates."""
+    with bind_metrics(metrics):
+        try:
+            yield
+        except Exception as e:
+            metrics.fail(str(e))
+            emit_audit_event(metrics.to_audit_entry())
+            raise
+
+
+def _ai_name(item):
+    # Unique per drive item (two folders may hold the same file name), with its extension
+    return f"{item['id']}/{item['name']}"
+
+
+def download(token, item, metrics):
+    """The content of one drive item, as bytes."""
+    with _audited(metrics), track_phase(metrics, "download"):
+        with download_item(token, item["id"], max_bytes=MAX_FILE_SIZE_BYTES) as file_stream:
+            return file_stream.read()
+
+
+def validate_item(token, item, data, rules, metrics, sweep_deadline):
+    """Validate and (when the function owns the writes) write back one
+    downloaded drive item, within what is left of the sweep's time budget.
+    Emits its audit event; returns the final status."""
+    name = item["name"]
+    deadline = Deadline(max(sweep_deadline.remaining(), 0), reserve_seconds=0)
+    with _audited(metrics):
+        with bind_deadline(deadline), track_phase(metrics, "validation"):
+            result, fixed_stream = validate_file(metrics.file_type, BytesIO(data), rules)
+        metrics.skipped_checks = list(deadline.skipped)
+        status = final_status(result["issues"], result["fixes_applied"], skipped=deadline.skipped)
+        if ENABLE_FUNCTION_SHAREPOINT_WRITES:
+            file_url = get_drive_item_url(token, item["id"])
+            document_url, library_url = document_links(file_url)
+            report_html = generate_report(name, result["issues"], result["fixes_applied"],
+                                          document_url=document_url, library_url=library_url,
+                                          skipped=deadline.skipped)
+            fixed_bytes = fixed_stream.getvalue() if result["fixes_applied"] else None
+            write_back = new_write_back(metrics.request_id, name, file_url, None, status,
+                                        len(result["issues"]), len(result["fixes_applied"]),
+                                        report_html, report_path(name, file_url), fixed_bytes)
+            errors = run_write_back(write_back, token)
+            if errors:
+                metrics.write_back_errors = errors
+                raise RuntimeError(f"Write-back incomplete: {', '.join(errors)}")
+    metrics.complete(status=status, issues=len(result["issues"]), fixes=len(result["fixes_applied"]))
+    emit_audit_event(metrics.to_audit_entry())
+    return status
+
+
+def collect_ai_batches(state):
+    """Check the AI batch jobs earlier sweeps submitted. The documents of
+    those that have ended (or were given up on after AI_BATCH_TIMEOUT_SECONDS)
+    go back to state["retry"], marked to be validated without another batch.
+    Returns the number of documents released."""
+    released, waiting = 0, []
+    for batch in state["ai_batches"]:
+        jobs, stats = batch["jobs"], {"errors": []}
+        try:
+            ended = collect_ai_batch(jobs, stats)
+            if not ended and time.time() - jobs["submitted_at"] > AI_BATCH_TIMEOUT_SECONDS:
+                cancel_ai_batch(jobs, stats, f"did not finish in {AI_BATCH_TIMEOUT_SECONDS:.0f}s")
+                ended = True
+        except Exception as e:
+            logging.warning(f"Sweep: could not check AI batch jobs {jobs['jobs']}: {e}")
+            ended = False
+        for error in stats["errors"]:
+            logging.error(f"Sweep: AI batch request failed: {error}")
+        if not ended:
+            waiting.append(batch)
+            continue
+        for entry in batch["items"]:
+            state["retry"][entry["item"]["id"]] = dict(entry, direct=True)
+            released += 1
+    state["ai_batches"] = waiting
+    return released
+
+
+def run_sweep(store=None, token=None, budget_seconds=None):
+    """Validate every supported document changed since the last sweep.
+    Returns counts: validated, partial (validated only in part, in time),
+    awaiting_ai (submitted as AI batch jobs, validated by a later sweep),
+    failed, unchanged, skipped, deleted, and complete (False when the time
+    budget stopped the sweep early)."""
+    store = store or get_job_store().store
+    state = load_state(store)
+    token = token or get_graph_token()
+    rules = fetch_validation_rules(None)
+    deadline = Deadline(SWEEP_BUDGET_SECONDS if budget_seconds is None else budget_seconds)
+    stats = Counter(validated=0, partial=0, awaiting_ai=0, failed=0, unchanged=0, skipped=0, deleted=0)
+    group = []   # retry entries ({"item": delta item, "attempts": n}) waiting to be validated together
+    complete = True
+    logging.info(f"Library sweep starting ({'incremental' if state['delta_link'] else 'full listing'})")
+
+    def failed(entry, e):
+        item, attempts = entry["item"], entry["attempts"] + 1
+        logging.warning(f"Sweep: {item['name']} failed (attempt {attempts}): {type(e).__name__}: {e}")
+        stats["failed"] += 1
+        if attempts < SWEEP_MAX_ATTEMPTS:
+            state["retry"][item["id"]] = {"item": item, "attempts": attempts}
+        else:
+            state["retry"].pop(item["id"], None)
+
+    def validate_group(pool):
+        """Download the grouped items and submit their AI work as batch jobs;
+        the documents are validated once the jobs have ended (a later
+        sweep), or now when there is no AI work left to ask for."""
+        entries = list(group)
+        group.clear()
+        if not entries:
+            return
+        metrics = {entry["item"]["id"]: _item_metrics(entry["item"], rules) for entry in entries}
+        downloads = [(entry, pool.submit(download, token, entry["item"], metrics[entry["item"]["id"]]))
+                     for entry in entries]
+        ai = AIBatch(rules)
+        fetched = []
+        for entry, future in downloads:
+            try:
+                data = future.result()
+            except Exception as e:
+                failed(entry, e)
+                continue
+            if not entry.get("direct"):
+                ai.add(_ai_name(entry["item"]), data)
+            fetched.append((entry, data))
+        try:
+            jobs = ai.submit()
+        except Exception as e:
+            # Validation sends whatever was not answered itself
+            logging.warning(f"Sweep: AI batch could not be submitted, validating with direct AI calls: {e}")
+            jobs = None
+        if jobs is not None:
+            # Only documents with paragraphs in the jobs wait for them
+            submitted = set(jobs["keys"].values())
+            waits = {entry["item"]["id"] for entry, _data in fetched
+                     if not entry.get("direct") and ai.keys.get(_ai_name(entry["item"]), set()) & submitted}
+            batched = [{"item": entry["item"], "attempts": entry["attempts"]}
+                       for entry, _data in fetched if entry["item"]["id"] in waits]
+            state["ai_batches"].append({"jobs": jobs, "items": batched})
+            for entry in batched:
+                state["retry"].pop(entry["item"]["id"], None)
+            stats["awaiting_ai"] += len(batched)
+            fetched = [(entry, data) for entry, data in fetched if entry["item"]["id"] not in waits]
+
+        validations = [(entry, pool.submit(validate_item, token, entry["item"], data, rules,
+                                           metrics[entry["item"]["id"]], deadline))
+                       for entry, data in fetched]
+        for entry, future in validations:
+            item = entry["item"]
+            try:
+                future.result()
+            except Exception as e:
+                failed(entry, e)
+                continue
+            if metrics[item["id"]].skipped_checks:
+                # Not recorded as validated: the next sweep validates it in
+                # full, first, without counting this as a failed attempt
+                state["retry"][item["id"]] = {"item": item, "attempts": entry["attempts"]}
+                stats["partial"] += 1
+                continue
+            state["validated"][item["id"]] = item.get("cTag")
+            state["retry"].pop(item["id"], None)
+            stats["validated"] += 1
+        save_state(store, state)
+
+    released = collect_ai_batches(state)
+    if released:
+        logging.info(f"Sweep: AI batch jobs ended for {released} document(s)")
+    awaiting = {entry["item"]["id"] for batch in state["ai_batches"] for entry in batch["items"]}
+
+    with ThreadPoolExecutor(max_workers=SWEEP_CONCURRENCY, thread_name_prefix="msv-sweep") as pool:
+        # Documents whose AI answers are in, and those that failed last time, go first
+        group.extend(sorted(state["retry"].values(), key=lambda entry: not entry.get("direct")))
+        queued = {entry["item"]["id"] for entry in group} | awaiting
+
+        new_delta_link = None
+        for items, delta_link in iter_drive_delta(token, state["delta_link"]):
+            for item in items:
+                if "deleted" in item:
+                    known = (item["id"] in state["validated"] or item["id"] in state["retry"]
+                             or item["id"] in awaiting)
+                    state["validated"].pop(item["id"], None)
+                    state["retry"].pop(item["id"], None)
+                    for batch in state["ai_batches"]:
+                        batch["items"] = [entry for entry in batch["items"] if entry["item"]["id"] != item["id"]]
+                    stats["deleted"] += known
+                    continue
+                if not _wanted(item):
+                    stats["skipped"] += "file" in item
+                    continue
+                if item["id"] in queued:
+                    continue   # a retry or awaiting its AI batch, already queued
+                if state["validated"].get(item["id"]) == item.get("cTag"):
+                    stats["unchanged"] += 1
+                    continue
+                if not deadline.allows():
+                    complete = False
+                    break
+                group.append({"item": item, "attempts": 0})
+                queued.add(item["id"])
+                if len(group) >= SWEEP_BATCH_DOCUMENTS:
+                    validate_group(pool)
+            if not complete:
+                break
+            new_delta_link = delta_link
+        validate_group(pool)
+
+    if complete:
+        state["delta_link"] = new_delta_link
+    save_state(store, state)
+    stats["complete"] = complete
+    logging.info(f"Library sweep {'done' if complete else 'stopped by its time budget'}: {dict(stats)}")
+    return dict(stats)
@@ -0,0 +1,124 @@
+"""Request/response transports for ValidateDocument
+
+The original contract (kept as the default) is JSON both ways, with the
+document as base64 in ``fileContent`` and the fixed file returned as base64
+in ``fixedFileContent``. A 30 MB document then sits in memory as JSON text,
+base64 text and raw bytes at once. Two binary alternatives avoid that:
+
+Request
+  - ``Content-Type: application/octet-stream``: the body is the document;
+    fileName / itemId / fileUrl come from the query string (or X-File-Name).
+  - ``Content-Type: multipart/form-data``: a ``file`` part holds the
+    document; every other part is a metadata field.
+
+Response
+  - ``Accept: multipart/mixed`` (or ``?response=multipart``): a JSON part with
+    the usual response fields minus the two large ones, then the fixed
+    document and the HTML report as raw parts.
+"""
+import json
+import re
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from email.utils import encode_rfc2231
+
+MULTIPART_MIXED = "multipart/mixed"
+METADATA_FIELDS = ("fileName", "itemId", "fileUrl", "ID", "FileLeafRef", "FileRef")
+
+
+def _content_type(req):
+    return (req.headers.get("Content-Type") or "").split(";", 1)[0].strip().lower()
+
+
+def _parse_form_data(req):
+    """Split multipart/form-data into ({field: value}, file bytes or None)."""
+    header = f"Content-Type: {req.headers.get('Content-Type')}\r\n\r\n".encode("latin-1")
+    message = BytesParser(policy=HTTP).parsebytes(header + req.get_body())
+    if not message.is_multipart():
+        raise ValueError("Malformed multipart/form-data body")
+    fields, file_bytes = {}, None
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        payload = part.get_payload(decode=True) or b""
+        if name == "file":
+            file_bytes = payload
+            filename = part.get_filename()
+            if filename:
+                fields.setdefault("fileName", filename)
+        elif name:
+            fields[name] = payload.decode(part.get_content_charset() or "utf-8")
+    return fields, file_bytes
+
+
+def parse_validation_request(req):
+    """Return (request fields, raw document bytes or None) for any supported transport.
+
+    For the JSON contract the document stays base64 in fields["fileContent"]
+    and the second value is None.
+    """
+    content_type = _content_type(req)
+    if content_type == "application/octet-stream":
+        fields = {k: req.params[k] for k in METADATA_FIELDS if req.params.get(k)}
+        if req.headers.get("X-File-Name"):
+            fields.setdefault("fileName", req.headers.get("X-File-Name"))
+        return fields, req.get_body()
+    if content_type == "multipart/form-data":
+        return _parse_form_data(req)
+    return req.get_json(), None
+
+
+def document_fields(fields):
+    """(item_id, file_name, file_url) from the request fields, under whichever
+    names the flow used (its own or the SharePoint columns')."""
+    item_id = fields.get('itemId') or fields.get('ID')
+    file_name = fields.get('fileName') or fields.get('FileLeafRef') or fields.get('Name')
+    file_url = (fields.get('fileUrl') or fields.get('FileRef') or
+                fields.get('ServerRelativeUrl') or fields.get('fileRef'))
+    return item_id, file_name, file_url
+
+
+def wants_multipart(req):
+    """True when the caller asked for the binary multipart/mixed response."""
+    accept = (req.headers.get("Accept") or "").lower()
+    return MULTIPART_MIXED in accept or req.params.get("response") == "multipart"
+
+
+def _attachment(name, filename):
+    """Content-Disposition for a response part. SharePoint file names may hold
+    quotes and non-ASCII characters: the quoted filename is an escaped ASCII
+    fallback, and filename* (RFC 2231/5987) carries the name exactly."""
+    filename = re.sub(r"[\x00-\x1f\x7f]", "", filename or "")
+    fallback = filename.encode("ascii", "replace").decode("ascii").replace("\\", "\\\\").replace('"', '\\"')
+    value = f'attachment; name="{name}"'
+    if not filename.isascii():
+        # Ahead of the fallback: parsers that keep the first filename (Python's email) get the real one
+        value += f"; filename*={encode_rfc2231(filename, 'utf-8')}"
+    return f'{value}; filename="{fallback}"'
+
+
+def multipart_response(response_data, fixed_bytes=None, fixed_filename=None,
+                       report_html=None, report_filename=None):
+    """Build a multipart/mixed body. Returns (body bytes, Content-Type header value)."""
+    boundary = f"msv-{uuid.uuid4().hex}"
+    parts = [({"Content-Type": "application/json; charset=utf-8"},
+              json.dumps(response_data).encode("utf-8"))]
+    if fixed_bytes is not None:
+        parts.append(({"Content-Type": "application/octet-stream",
+                       "Content-Disposition": _attachment("fixedFile", fixed_filename)},
+                      fixed_bytes))
+    if report_html is not None:
+        parts.append(({"Content-Type": "text/html; charset=utf-8",
+                       "Content-Disposition": _attachment("report", report_filename)},
+                      report_html.encode("utf-8")))
+
+    chunks = []
+    for headers, payload in parts:
+        chunks.append(f"--{boundary}\r\n".encode("latin-1"))
+        for name, value in headers.items():
+            chunks.append(f"{name}: {value}\r\n".encode("ascii"))
+        chunks.append(b"\r\n")
+        chunks.append(payload)
+        chunks.append(b"\r\n")
+    chunks.append(f"--{boundary}--\r\n".encode("latin-1"))
+    return b"".join(chunks), f'{MULTIPART_MIXED}; boundary="{boundary}"'
@@ -0,0 +1,101 @@
+"""Resumable chunked uploads (Graph driveItem createUploadSession)
+
+A single PUT .../content is limited to 4 MB and needs the whole body in
+memory. Larger files go through an upload session instead: the file is read
+from its (possibly disk-spilled) stream one chunk at a time and PUT to the
+session's pre-authenticated uploadUrl with a Content-Range header.
+
+Graph requires the byte ranges to arrive in order, so chunks are sent one
+after another. If a chunk fails after graph_client's own retries (or the
+connection drops mid-chunk), the session is asked for its nextExpectedRanges
+and the upload resumes from there rather than starting again.
+"""
+import logging
+
+import requests
+
+from .config import GRAPH_UPLOAD_CHUNK_BYTES
+from .graph_client import get_graph_client
+
+# Graph rejects chunk sizes that are not a multiple of 320 KiB (except the last)
+CHUNK_ALIGNMENT = 320 * 1024
+MAX_RESUMES = 5
+
+
+class UploadSessionError(Exception):
+    """The upload session could not be completed."""
+
+
+def stream_size(stream):
+    """Length of a seekable stream without reading it (position is restored)."""
+    position = stream.tell()
+    size = stream.seek(0, 2)
+    stream.seek(position)
+    return size
+
+
+def _aligned(chunk_size):
+    return max(CHUNK_ALIGNMENT, chunk_size - chunk_size % CHUNK_ALIGNMENT)
+
+
+def _next_expected_offset(body):
+    """First byte Graph still wants, from {"nextExpectedRanges": ["1310720-"]}."""
+    ranges = (body or {}).get("nextExpectedRanges") or []
+    if not ranges:
+        return None
+    return int(str(ranges[0]).split("-", 1)[0])
+
+
+def create_upload_session(token, item_path, client=None):
+    """Open an upload session for `item_path` ("/sites/{id}/drive/root:/a/b.docx").
+    Returns the raw requests.Response (site_request may want to retry a 404)."""
+    client = client or get_graph_client()
+    return client.post(
+        f"{item_path}:/createUploadSession", token=token,
+        json={"item": {"@microsoft.graph.conflictBehavior": "replace"}},
+    )
+
+
+def upload_in_chunks(upload_url, stream, size=None, chunk_size=None, client=None, max_resumes=MAX_RESUMES):
+    """PUT `stream` to an upload session in order. Returns the driveItem JSON."""
+    client = client or get_graph_client()
+    size = stream_size(stream) if size is None else size
+    chunk_size = _aligned(chunk_size or GRAPH_UPLOAD_CHUNK_BYTES)
+    offset = 0
+    resumes = 0
+
+    while True:
+        stream.seek(offset)
+        chunk = stream.read(min(chunk_size, size - offset))
+        end = offset + len(chunk) - 1
+        try:
+            # No Authorization header: the uploadUrl is pre-authenticated and
+            # Graph rejects chunks that carry a bearer token.
+            response = client.put(upload_url, data=chunk, headers={
+                "Content-Length": str(len(chunk)),
+                "Content-Range": f"bytes {offset}-{end}/{size}",
+            })
+            failure = None if response.status_code < 400 else f"HTTP {response.status_code}"
+        except (requests.ConnectionError, requests.Timeout) as e:
+            response, failure = None, type(e).__name__
+
+        if failure is None:
+            if response.status_code in (200, 201):
+                logging.info(f"Upload session complete: {size} bytes in {resumes} resume(s)")
+                return response.json()
+            offset = _next_expected_offset(response.json())
+            if offset is None:
+                offset = end + 1
+            continue
+
+        if response is not None and response.status_code == 404:
+            raise UploadSessionError("Upload session expired or was cancelled")
+        if resumes >= max_resumes:
+            raise UploadSessionError(f"Chunk {offset}-{end} failed ({failure}) after {resumes} resume(s)")
+        resumes += 1
+        status = client.get(upload_url)
+        if status.status_code == 404:
+            raise UploadSessionError("Upload session expired or was cancelled")
+        resume_at = _next_expected_offset(status.json()) if status.ok else None
+        offset = offset if resume_at is None else resume_at
+        logging.warning(f"Chunk upload failed ({failure}); resuming at byte {offset} of {size}")
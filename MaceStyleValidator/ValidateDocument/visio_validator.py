@@ -1,8 +1,10 @@
 """Visio document (.vsdx) validation"""
 import os
 import logging
+import shutil
 import tempfile
 from vsdx import VisioFile
+from .deadline import scheduled
 
 
 def validate_visio_document(file_stream, rules):
@@ -11,7 +13,7 @@ def validate_visio_document(file_stream, rules):
 
     # VisioFile expects a filename, not a stream
     with tempfile.NamedTemporaryFile(suffix='.vsdx', delete=False) as tmp:
-        tmp.write(file_stream.read())
+        shutil.copyfileobj(file_stream, tmp)
         tmp_path = tmp.name
     file_stream.seek(0)
     visio = VisioFile(tmp_path)
@@ -31,7 +33,7 @@ def validate_visio_document(file_stream, rules):
     # Hard-coded rules only — AI validation is skipped for Visio
     # (AI is designed for prose; diagram shape text produces too many false positives
     #  and text write-back corrupts the document)
-    for rule in hard_coded_rules:
+    for rule in scheduled(hard_coded_rules):
         result = None
         if rule['rule_type'] == 'Color':
             result = _check_colors(visio, rule)
@@ -1,19 +1,30 @@
 """Word document (.docx) validation"""
 import logging
+from difflib import SequenceMatcher
 from docx import Document
 from docx.shared import RGBColor
 from docx.oxml.ns import qn
 from docx.oxml import OxmlElement
 from docx.opc.constants import RELATIONSHIP_TYPE as RT
-from .ai_client import call_claude
+from .ai_client import correct_paragraphs
+from .config import AI_PARAGRAPH_SELECTION
+from .deadline import scheduled
+from .monitoring import current_metrics
+from .paragraph_cache import get_paragraph_cache, paragraph_key
+from .result_cache import rules_fingerprint
 from .enhanced_validators import (
     validate_language_rules,
     validate_punctuation_rules,
     validate_grammar_rules,
     validate_capitalisation_rules,
     iter_all_paragraphs,
+    tracked_replace_span,
+    ParagraphSubset,
 )
 
+# Rule types whose checks only look inside one paragraph (enhanced_validators)
+TEXT_RULE_TYPES = ('Language', 'Punctuation', 'Grammar', 'Capitalisation')
+
 
 def _normalise_issue(item, rule=None):
     """Ensure an issue item is a structured dict"""
@@ -46,6 +57,14 @@ def _normalise_fix(item, rule=None, changes=None):
     return result
 
 
+def split_word_rules(rules):
+    """(AI rules, hard-coded rules) among the rules that apply to Word."""
+    word_rules = [r for r in rules if r['doc_type'] in ['Word', 'Both', 'All']]
+    ai_rules = [r for r in word_rules if r.get('use_ai', False)]
+    hard_coded_rules = [r for r in word_rules if not r.get('use_ai', False)]
+    return ai_rules, hard_coded_rules
+
+
 def validate_word_document(file_stream, rules):
     """Validate Word document against rules"""
     logging.info("Loading Word document...")
@@ -55,49 +74,20 @@ def validate_word_document(file_stream, rules):
     issues = []
     fixes_applied = []
 
-    word_rules = [r for r in rules if r['doc_type'] in ['Word', 'Both', 'All']]
-    ai_rules = [r for r in word_rules if r.get('use_ai', False)]
-    hard_coded_rules = [r for r in word_rules if not r.get('use_ai', False)]
+    ai_rules, hard_coded_rules = split_word_rules(rules)
 
     logging.info(f"AI rules: {len(ai_rules)}, Hard-coded rules: {len(hard_coded_rules)}")
 
+    cache = get_paragraph_cache()
+
     # AI-powered style corrections
+    ai_complete = True
     if ai_rules:
         try:
-            all_paras = iter_all_paragraphs(doc)
-            full_text = "\n\n".join([p.text for p in all_paras if p.text.strip()])
-            if full_text.strip():
-                result = call_claude(ai_rules, full_text)
-                if result and result['changes_made'] > 0 and result['corrected_text']:
-                    corrected_paras = result['corrected_text'].split('\n\n')
-                    para_index = 0
-                    ai_changes = []
-
-                    for para in all_paras:
-                        if para.text.strip() and para_index < len(corrected_paras):
-                            original_text = para.text
-                            if len(para.runs) > 0:
-                                para.runs[0].text = corrected_paras[para_index]
-                                for run in para.runs[1:]:
-                                    run.text = ""
-                            if original_text != corrected_paras[para_index]:
-                                ai_changes.append({'before': original_text, 'after': corrected_paras[para_index], 'location': f'Paragraph {para_index + 1}'})
-                            para_index += 1
-
-                    ai_fix = {
-                        'rule_name': 'AI Style Corrections',
-                        'rule_type': 'AI',
-                        'found_value': f'{result["changes_made"]} style violations',
-                        'fixed_value': 'British English, contractions, symbols corrected',
-                        'location': 'Document-wide',
-                        'changes_made': result['changes_made']
-                    }
-                    if ai_changes:
-                        ai_fix['changes'] = ai_changes
-                    fixes_applied.append(ai_fix)
-                    logging.info(f"Claude corrections applied: {result['changes_made']}")
+            ai_complete = _apply_ai_corrections(doc, ai_rules, issues, fixes_applied)
         except Exception as e:
             logging.error(f"Claude validation failed: {e}")
+            ai_complete = False
             issues.append({
                 'rule_name': 'AI Style Validation',
                 'rule_type': 'AI',
@@ -106,21 +96,37 @@ def validate_word_document(file_stream, rules):
                 'priority': 1
             })
 
-    # Hard-coded rules
-    for rule in hard_coded_rules:
+    # Text rules only look inside one paragraph at a time, so they run on the
+    # paragraphs not already known to be clean (see paragraph_cache.py).
+    # Font and Color rules read run formatting and numbering, which the
+    # paragraph key does not cover: they always see the whole document.
+    text_rules = [r for r in hard_coded_rules if r['rule_type'] in TEXT_RULE_TYPES]
+    indexed = list(enumerate(iter_all_paragraphs(doc)))
+    keys = {}
+    if cache is not None and text_rules:
+        plan = 'clean:' + rules_fingerprint(text_rules)
+        keys = {idx: paragraph_key(p, plan) for idx, p in indexed}
+        indexed = [(idx, p) for idx, p in indexed if cache.get(keys[idx]) is None]
+        logging.info(f"Paragraph cache: {len(keys) - len(indexed)} of {len(keys)} paragraphs known clean")
+    subset = ParagraphSubset(indexed)
+
+    # Hard-coded rules, by priority while the request's time budget lasts
+    checked_text_rules = 0
+    for rule in scheduled(hard_coded_rules):
+        checked_text_rules += rule['rule_type'] in TEXT_RULE_TYPES
         result = None
         if rule['rule_type'] == 'Font':
             result = _check_fonts(doc, rule)
         elif rule['rule_type'] == 'Color':
             result = _check_colors(doc, rule)
         elif rule['rule_type'] == 'Language':
-            result = validate_language_rules(doc, rule)
+            result = validate_language_rules(subset, rule)
         elif rule['rule_type'] == 'Grammar':
-            result = validate_grammar_rules(doc, rule)
+            result = validate_grammar_rules(subset, rule)
         elif rule['rule_type'] == 'Punctuation':
-            result = validate_punctuation_rules(doc, rule)
+            result = validate_punctuation_rules(subset, rule)
         elif rule['rule_type'] == 'Capitalisation':
-            result = validate_capitalisation_rules(doc, rule)
+            result = validate_capitalisation_rules(subset, rule)
 
         if result:
             for item in result.get('issues', []):
@@ -129,8 +135,216 @@ def validate_word_document(file_stream, rules):
             for item in result.get('fixes', []):
                 fixes_applied.append(_normalise_fix(item, rule, changes=result_changes))
 
+    # Only a paragraph every text rule looked at is known clean
+    if keys and checked_text_rules == len(text_rules):
+        for idx, _p in subset.indexed_paragraphs:
+            if idx not in subset.found:
+                cache.put(keys[idx], True)
+    metrics = current_metrics()
+    if metrics:
+        metrics.paragraph_cache.update({
+            'paragraphs': len(keys) or len(subset.paragraphs),
+            'checked': len(subset.paragraphs),
+        })
+
     logging.info(f"Word validation complete. Issues: {len(issues)}, Fixes: {len(fixes_applied)}")
-    return {'document': doc, 'issues': issues, 'fixes_applied': fixes_applied}
+    return {'document': doc, 'issues': issues, 'fixes_applied': fixes_applied, 'ai_complete': ai_complete}
+
+
+def _apply_ai_corrections(doc, ai_rules, issues, fixes_applied):
+    """Run the AI rules over the document's text and apply the edits they return.
+
+    Paragraphs go to the AI identified by their position among the non-empty
+    paragraphs; corrections already in the AI cache come back without a call.
+    Like the deterministic rules, an edit made under an auto_fix rule is
+    applied; any other is proposed as a tracked change.
+
+    Returns False when a request to the AI failed, so some paragraphs were
+    not checked."""
+    all_paras, positions = select_ai_paragraphs(doc, ai_rules)
+    if not positions:
+        return True
+
+    result = correct_paragraphs(ai_rules, {f"p{pos}": all_paras[pos].text for pos in positions})
+    if result is None:
+        return True  # AI disabled or not configured
+    complete = not result['errors']
+    changes_made = result['changes_made']
+    # A position missing from the edits was in a chunk that failed: left as it was
+    edits = {pos: result['edits'][f"p{pos}"] for pos in positions if result['edits'].get(f"p{pos}")}
+    if result['errors']:
+        issues.append({
+            'rule_name': 'AI Style Validation',
+            'rule_type': 'AI',
+            'description': f"AI validation incomplete: {len(result['errors'])} request(s) failed "
+                           f"({result['errors'][0]})",
+            'location': 'N/A',
+            'priority': 1
+        })
+
+    metrics = current_metrics()
+    if metrics:
+        metrics.paragraph_cache['ai_cached'] = result['cached']
+        metrics.paragraph_cache['ai_sent'] = len(positions) - result['cached']
+    if changes_made <= 0:
+        return complete
+
+    auto_fix = {r.get('title', ''): bool(r.get('auto_fix')) for r in ai_rules}
+    default_auto = all(auto_fix.values())
+    ai_changes = []
+    suggested = 0
+    for pos, para_edits in sorted(edits.items()):
+        location = f'Paragraph {pos + 1}'
+        para_changes = []
+        # Right to left, so earlier offsets stay valid
+        for edit in reversed(para_edits):
+            tracked = not auto_fix.get(edit['rule'], default_auto)
+            if _apply_ai_edit(all_paras[pos], edit, tracked):
+                suggested += tracked
+            else:
+                # Spans runs or hyperlinks: cannot be a tracked change, so report it
+                issues.append({
+                    'rule_name': edit['rule'] or 'AI Style Validation',
+                    'rule_type': 'AI',
+                    'description': f"Suggested change: '{edit['find']}' to '{edit['replace']}'",
+                    'location': location,
+                    'priority': 5
+                })
+                continue
+            para_changes.append({'before': edit['find'], 'after': edit['replace'], 'location': location})
+        ai_changes.extend(reversed(para_changes))
+    if not ai_changes:
+        return complete
+    applied = len(ai_changes) - suggested
+
+    fixed_value = 'British English, contractions, symbols corrected'
+    if suggested:
+        fixed_value = (f'{applied} corrected, {suggested} proposed as tracked changes to accept or reject'
+                       if applied else f'{suggested} proposed as tracked changes to accept or reject')
+    fixes_applied.append({
+        'rule_name': 'AI Style Corrections',
+        'rule_type': 'AI',
+        'found_value': f'{changes_made} style violations',
+        'fixed_value': fixed_value,
+        'location': 'Document-wide',
+        'changes_made': len(ai_changes),
+        'changes': ai_changes,
+    })
+    logging.info(f"AI edits: {applied} applied, {suggested} proposed as tracked changes")
+    return complete
+
+
+def _apply_ai_edit(paragraph, edit, tracked):
+    """Apply one validated AI edit (ai_client.validate_edits) to the paragraph's
+    runs: in place, or as a tracked change when `tracked`. An edit within one
+    run keeps that run's formatting; one spanning runs is only applied as an
+    untracked fix. Returns False if the edit could not be applied."""
+    runs = paragraph.runs
+    start, end = edit['start'], edit['start'] + len(edit['find'])
+    if ''.join(r.text for r in runs) == paragraph.text:
+        offset = 0
+        for run in runs:
+            run_end = offset + len(run.text)
+            if offset <= start < run_end and end <= run_end:
+                a, b = start - offset, end - offset
+                if tracked:
+                    tracked_replace_span(run, a, b, edit['replace'])
+                else:
+                    run.text = run.text[:a] + edit['replace'] + run.text[b:]
+                return True
+            offset = run_end
+    if tracked:
+        return False
+    text = paragraph.text
+    _replace_paragraph_text(paragraph, text[:start] + edit['replace'] + text[end:])
+    return True
+
+
+def select_ai_paragraphs(doc, ai_rules):
+    """(non-empty paragraphs, positions among them of those sent to the AI
+    rules). AI_PARAGRAPH_SELECTION picks all of them or only the candidates."""
+    all_paras = [p for p in iter_all_paragraphs(doc) if p.text.strip()]
+    if AI_PARAGRAPH_SELECTION == 'candidates':
+        include_headings = _ai_rules_cover_headings(ai_rules)
+        positions = [pos for pos, para in enumerate(all_paras) if _is_ai_candidate(para, include_headings)]
+    else:
+        positions = list(range(len(all_paras)))
+    return all_paras, positions
+
+
+# Styles whose paragraphs are not running prose (contents entries, captions)
+_NON_PROSE_STYLES = ('TOC', 'Caption', 'Table of Figures', 'Header', 'Footer')
+# Minimum words for a paragraph to count as prose worth sending to the AI
+AI_MIN_WORDS = 4
+
+
+def _ai_rules_cover_headings(ai_rules):
+    """True if an AI rule is about headings or capitalisation, in which case
+    headings are sent too."""
+    return any(r.get('rule_type') == 'Capitalisation'
+               or 'heading' in f"{r.get('title', '')} {r.get('check_value', '')}".lower()
+               for r in ai_rules)
+
+
+def _is_ai_candidate(paragraph, include_headings=False):
+    """Heuristic for AI_PARAGRAPH_SELECTION=candidates: is this paragraph prose
+    the AI rules could apply to? Labels, short table cells, reference codes,
+    numbers and contents entries are not."""
+    style = paragraph.style.name if paragraph.style is not None else ''
+    if style.startswith(_NON_PROSE_STYLES):
+        return False
+    if (_is_heading(paragraph) or style == 'Title') and not include_headings:
+        return False
+    text = paragraph.text.strip()
+    if len(text.split()) < AI_MIN_WORDS and not _is_heading(paragraph):
+        return False
+    letters = sum(c.isalpha() for c in text)
+    if letters < len(text) / 2 or not any(c.islower() for c in text):
+        return False
+    return True
+
+
+def _replace_paragraph_text(paragraph, new_text):
+    """Rewrite a paragraph's text with the smallest edits to its runs, so the
+    formatting of untouched runs survives. Each changed span goes into the run
+    where it starts; text deleted from later runs is cut out of them."""
+    runs = paragraph.runs
+    if not runs:
+        return
+    if ''.join(r.text for r in runs) != paragraph.text:
+        # Text outside plain runs (e.g. hyperlinks): fall back to one run
+        runs[0].text = new_text
+        for run in runs[1:]:
+            run.text = ""
+        return
+    texts = [r.text for r in runs]
+    old_text = ''.join(texts)
+    opcodes = SequenceMatcher(None, old_text, new_text, autojunk=False).get_opcodes()
+    for tag, i1, i2, j1, j2 in reversed(opcodes):
+        if tag == 'equal':
+            continue
+        start = 0
+        target = len(texts) - 1
+        for k, t in enumerate(texts):
+            if start <= i1 < start + len(t):
+                target = k
+                break
+            start += len(t)
+        else:
+            start = len(old_text) - len(texts[target])
+        # cut [i1, i2) out of every run it spans, then insert into the target run
+        offset = 0
+        for k, t in enumerate(texts):
+            lo, hi = max(i1, offset), min(i2, offset + len(t))
+            if lo < hi:
+                texts[k] = t[:lo - offset] + t[hi - offset:]
+            offset += len(t)
+        at = i1 - start
+        texts[target] = texts[target][:at] + new_text[j1:j2] + texts[target][at:]
+        old_text = ''.join(texts)
+    for run, text in zip(runs, texts):
+        if run.text != text:
+            run.text = text
 
 
 def _is_heading(paragraph):
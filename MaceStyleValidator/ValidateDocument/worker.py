@@ -0,0 +1,56 @@
+"""Objects shared by every validation on a Functions worker
+
+A worker process serves many invocations, on several threads. The HTTP
+clients, caches, pools and stores they share are each held in a
+WorkerSingleton: created by its factory on first use (once, even when threads
+race for it) and replaced through set() - tests point them at stubs, and
+setting None drops the object so the next get() creates it again from config.
+
+    _client = WorkerSingleton(GraphClient)
+    _client.get()        # the worker's GraphClient
+    _client.set(stub)    # tests
+
+A singleton can hold one object per key instead (get(key) calls
+factory(key); keyword arguments go to the factory but are not part of the
+key); a factory may return None (not configured), which is not kept.
+"""
+import threading
+
+
+class WorkerSingleton:
+    """A lazily created, worker-wide object (or one per key)."""
+
+    def __init__(self, factory, on_drop=None):
+        self._factory = factory
+        self._on_drop = on_drop   # called with an object set() or clear() drops
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, *key, **kwargs):
+        value = self._values.get(key)
+        if value is None:
+            with self._lock:
+                value = self._values.get(key)
+                if value is None:
+                    value = self._factory(*key, **kwargs)
+                    if value is not None:
+                        self._values[key] = value
+        return value
+
+    def set(self, value, *key):
+        """Replace the object (for `key`); None drops it."""
+        with self._lock:
+            previous = self._values.pop(key, None)
+            if value is not None:
+                self._values[key] = value
+        if value is None and previous is not None and self._on_drop:
+            self._on_drop(previous)
+
+    def clear(self):
+        """Drop every key's object."""
+        with self._lock:
+            dropped = list(self._values.values())
+            self._values.clear()
+        if self._on_drop:
+            for previous in dropped:
+                self._on_drop(previous)
@@ -0,0 +1,263 @@
+"""Post-validation SharePoint write-back (only when ENABLE_FUNCTION_SHAREPOINT_WRITES)
+
+Once a document is validated the function may have to upload the fixed file,
+upload the HTML report, then save the Validation Results item and set the
+document's final status/links (sharepoint_results.write_back_results). The
+two uploads are independent and run concurrently (WRITE_BACK_CONCURRENCY
+threads); the list writes need the report's URL and go last. A failing step
+is logged and reported without stopping the others.
+
+WRITE_BACK_MODE=background returns the HTTP response straight after
+validation and finishes the write-back on a worker thread. Each background
+job is first written to a journal directory (WRITE_BACK_JOURNAL_DIR, by
+default under the App Service's persistent /home share), rewritten as each
+step succeeds and only removed once every step succeeded;
+retry_pending_write_backs() (run by the RetryWriteBacks timer) picks up
+whatever is left, skipping steps already done. A running job keeps touching
+its entry, so only one whose worker went away is taken for abandoned.
+"""
+import base64
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, nullcontext
+from io import BytesIO
+
+from .config import (
+    WRITE_BACK_CONCURRENCY, WRITE_BACK_JOURNAL_DIR, WRITE_BACK_MAX_ATTEMPTS, get_graph_token,
+)
+from .monitoring import emit_audit_event, current_metrics, track_phase, submit_in_context
+from .worker import WorkerSingleton
+
+# A journal entry claimed this long ago by a worker that never finished it is
+# assumed abandoned (the worker was recycled) and is retried.
+STALE_CLAIM_SECONDS = 15 * 60
+
+_background = WorkerSingleton(lambda: ThreadPoolExecutor(max_workers=WRITE_BACK_CONCURRENCY,
+                                                         thread_name_prefix="msv-writeback"))
+
+
+def _background_executor():
+    return _background.get()
+
+
+def report_path(file_name, file_url):
+    """Where the HTML report is uploaded: beside the document, or in /Validation Reports."""
+    report_filename = f"{os.path.splitext(file_name)[0]}_ValidationReport.html"
+    if file_url:
+        report_folder = os.path.dirname(file_url)
+        return f"{report_folder}/{report_filename}" if report_folder else f"/{report_filename}"
+    return f"/Validation Reports/{report_filename}"
+
+
+def new_job(request_id, file_name, file_url, item_id, status, issues_count, fixes_count,
+            report_html, report_path, fixed_bytes=None):
+    """Everything the write-back needs, as a JSON-serialisable dict (no token)."""
+    return {
+        "id": request_id or uuid.uuid4().hex,
+        "file_name": file_name,
+        "file_url": file_url,
+        "item_id": item_id,
+        "status": status,
+        "issues_count": issues_count,
+        "fixes_count": fixes_count,
+        "report_html": report_html,
+        "report_path": report_path,
+        "fixed_bytes": fixed_bytes if file_url else None,
+        "done": {},        # step -> result, filled in as steps succeed
+        "errors": {},      # step -> last error message
+        "attempts": 0,
+    }
+
+
+def run_write_back(job, token=None, on_step=None):
+    """Run every step of `job` not already in job["done"]. Returns {step: error}
+    for the steps that failed (empty when all succeeded). on_step(step) is
+    called as each step succeeds, e.g. to checkpoint the job."""
+    from .sharepoint_client import upload_file, get_site_id
+    from .sharepoint_results import write_back_results
+
+    token = token or get_graph_token()
+    metrics = current_metrics()
+    done, errors = job["done"], {}
+
+    def upload_fixed():
+        web_url, item_id = upload_file(token, BytesIO(job["fixed_bytes"]), job["file_url"])
+        return {"web_url": web_url, "item_id": item_id}
+
+    def upload_report():
+        web_url, item_id = upload_file(token, BytesIO(job["report_html"].encode("utf-8")), job["report_path"])
+        if metrics:
+            metrics.report_uploaded = True
+        return {"web_url": web_url, "item_id": item_id}
+
+    uploads = {}
+    if job.get("fixed_bytes") is not None and "upload_fixed" not in done:
+        uploads["upload_fixed"] = upload_fixed
+    if "upload_report" not in done:
+        uploads["upload_report"] = upload_report
+
+    if uploads:
+        with ThreadPoolExecutor(max_workers=WRITE_BACK_CONCURRENCY, thread_name_prefix="msv-upload") as pool:
+            futures = {submit_in_context(pool, _timed, metrics, step, fn): step for step, fn in uploads.items()}
+            for future in as_completed(futures):
+                step = futures[future]
+                try:
+                    done[step] = future.result()
+                except Exception as e:
+                    logging.error(f"Write-back step {step} failed for {job['file_name']}: {e}")
+                    errors[step] = str(e)
+                    continue
+                if on_step:
+                    on_step(step)
+
+    if "save_results" not in done:
+        report = done.get("upload_report") or {}
+        try:
+            with _phase(metrics, "write_back"):
+                info = write_back_results(
+                    token=token,
+                    site_id=get_site_id(token),
+                    filename=job["file_name"],
+                    issues_count=job["issues_count"],
+                    fixes_count=job["fixes_count"],
+                    status=job["status"],
+                    report_url=report.get("web_url"),
+                    report_drive_item_id=report.get("item_id"),
+                    file_url=job["file_url"],
+                    item_id=job["item_id"],
+                )
+            if info is None:
+                raise RuntimeError("Validation Results item was not created")
+            done["save_results"] = info
+            logging.info(f"Validation result saved: {info['list_item_url']}")
+            if on_step:
+                on_step("save_results")
+        except Exception as e:
+            logging.error(f"Failed to save validation result: {e}")
+            errors["save_results"] = str(e)
+
+    job["errors"] = errors
+    return errors
+
+
+def _phase(metrics, name):
+    # Background jobs run after the request's metrics were emitted: no timing
+    return track_phase(metrics, name) if metrics else nullcontext()
+
+
+def _timed(metrics, step, fn):
+    with _phase(metrics, step):
+        return fn()
+
+
+# -- background mode and its journal ------------------------------------------
+
+def _journal_path(job_id, suffix=".json"):
+    return os.path.join(WRITE_BACK_JOURNAL_DIR, f"{job_id}{suffix}")
+
+
+def _write_entry(job, path):
+    entry = dict(job)
+    if entry.get("fixed_bytes") is not None:
+        entry["fixed_bytes"] = base64.b64encode(entry["fixed_bytes"]).decode("ascii")
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(entry, f)
+    os.replace(tmp, path)
+
+
+def _read_entry(path):
+    with open(path, encoding="utf-8") as f:
+        job = json.load(f)
+    if job.get("fixed_bytes") is not None:
+        job["fixed_bytes"] = base64.b64decode(job["fixed_bytes"])
+    return job
+
+
+@contextmanager
+def _keep_claimed(path):
+    """Touch the claimed entry at `path` while the job runs, so a slow
+    write-back is not taken for abandoned and run a second time."""
+    stop = threading.Event()
+
+    def touch():
+        while not stop.wait(STALE_CLAIM_SECONDS / 3):
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                return
+
+    thread = threading.Thread(target=touch, name="msv-writeback-claim", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _run_claimed(job, claimed_path, token=None):
+    """Run a claimed journal entry; delete it on success, release it for retry otherwise."""
+    job["attempts"] += 1
+    try:
+        with _keep_claimed(claimed_path):
+            # Record each step as it succeeds: a worker recycled mid-job
+            # leaves an entry that does not repeat them
+            errors = run_write_back(job, token, on_step=lambda step: _write_entry(job, claimed_path))
+    except Exception as e:  # e.g. no token
+        errors = {"write_back": str(e)}
+        job["errors"] = errors
+    if not errors:
+        os.remove(claimed_path)
+        emit_audit_event({"event_type": "write_back_complete", "request_id": job["id"],
+                          "filename": job["file_name"], "attempts": job["attempts"]})
+        return True
+    if job["attempts"] >= WRITE_BACK_MAX_ATTEMPTS:
+        _write_entry(job, _journal_path(job["id"], ".failed"))
+        os.remove(claimed_path)
+        emit_audit_event({"event_type": "write_back_failed", "request_id": job["id"],
+                          "filename": job["file_name"], "attempts": job["attempts"], "errors": errors})
+    else:
+        _write_entry(job, claimed_path)
+        os.replace(claimed_path, _journal_path(job["id"]))
+    return False
+
+
+def submit_background(job, token=None):
+    """Journal `job`, then run it on a background thread. Returns the Future."""
+    os.makedirs(WRITE_BACK_JOURNAL_DIR, exist_ok=True)
+    claimed = _journal_path(job["id"], ".running")
+    _write_entry(job, claimed)
+    logging.info(f"Write-back for {job['file_name']} queued in the background ({claimed})")
+    return _background_executor().submit(_run_claimed, job, claimed, token)
+
+
+def retry_pending_write_backs():
+    """Retry journalled write-backs that failed or were abandoned. Returns the
+    number completed."""
+    if not os.path.isdir(WRITE_BACK_JOURNAL_DIR):
+        return 0
+    now = time.time()
+    candidates = glob.glob(_journal_path("*"))
+    candidates += [p for p in glob.glob(_journal_path("*", ".running"))
+                   if now - os.path.getmtime(p) > STALE_CLAIM_SECONDS]
+    completed = 0
+    for path in candidates:
+        job_id = os.path.basename(path).split(".", 1)[0]
+        # Atomic claim, under a name of our own: of several workers racing
+        # for the same entry (pending or stale) only one rename succeeds. The
+        # entry is touched first so the claimed name is not stale itself.
+        claimed = _journal_path(job_id, f".{uuid.uuid4().hex}.running")
+        try:
+            os.utime(path)
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            continue
+        completed += _run_claimed(_read_entry(claimed), claimed)
+    return completed
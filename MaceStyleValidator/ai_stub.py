@@ -0,0 +1,198 @@
+"""Local stand-in for the AI providers the validator talks to.
+
+Used by the offline tests and benchmarks — no API key, no network. It answers
+the client surface ai_client._generate uses (Anthropic ``messages.create`` and
+OpenAI ``chat.completions.create``) and the two batch interfaces ai_batch uses
+(Anthropic ``messages.batches``, OpenAI ``files`` + ``batches``):
+
+    stub = AIStub(latency=0.05)
+    ai_client.set_ai_client(stub)
+
+Like the model, it reads the paragraph JSON out of the prompt and returns an
+edit list, here one edit per American spelling in CORRECTIONS. Token counts
+are estimated from the text (~4 characters per token). Synchronous calls
+sleep ``latency`` seconds each; a batch job reports itself in progress for
+``batch_polls`` status checks before it ends.
+"""
+import itertools
+import json
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+CORRECTIONS = {
+    "organize": "organise",
+    "organized": "organised",
+    "color": "colour",
+    "center": "centre",
+    "program": "programme",
+    "finalize": "finalise",
+    "analyze": "analyse",
+    "behavior": "behaviour",
+}
+
+
+def _tokens(text):
+    return len(text) // 4 + 1
+
+
+class AIStub:
+    """In-process fake AI client for both provider surfaces."""
+
+    def __init__(self, corrections=CORRECTIONS, latency=0.0, batch_polls=1, fail_batch_requests=()):
+        self.corrections = corrections
+        self.latency = latency
+        self.batch_polls = batch_polls
+        self.fail_batch_requests = set(fail_batch_requests)
+        self.calls = 0              # synchronous completions
+        self.batch_jobs = 0
+        self.batch_requests = 0     # completions answered inside batch jobs
+        self.cancelled = []
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self._pattern = re.compile(r"\b(" + "|".join(map(re.escape, corrections)) + r")\b")
+        self._jobs = {}
+        self._files = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+        self.messages = SimpleNamespace(
+            create=self._messages_create,
+            batches=SimpleNamespace(create=self._anthropic_batch_create, retrieve=self._anthropic_batch_retrieve,
+                                    results=self._anthropic_batch_results, cancel=self._cancel))
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat_create))
+        self.files = SimpleNamespace(create=self._file_create, content=self._file_content)
+        self.batches = SimpleNamespace(create=self._openai_batch_create, retrieve=self._openai_batch_retrieve,
+                                       cancel=self._cancel)
+
+    # --- the model -------------------------------------------------------
+
+    def answer(self, prompt):
+        """The JSON edit list for a prompt built by ai_client.build_dynamic_prompt."""
+        paragraphs = json.loads(prompt.split("Paragraphs:\n", 1)[1])
+        edits = [{"id": pid, "find": m.group(0), "replace": self.corrections[m.group(0)], "rule": "British spelling"}
+                 for pid, text in paragraphs.items() for m in self._pattern.finditer(text)]
+        return json.dumps({"edits": edits})
+
+    def _complete(self, system, prompt):
+        text = self.answer(prompt)
+        in_tok, out_tok = _tokens(system or "") + _tokens(prompt), _tokens(text)
+        with self._lock:
+            self.input_tokens += in_tok
+            self.output_tokens += out_tok
+        return text, in_tok, out_tok
+
+    # --- synchronous surfaces ----------------------------------------------
+
+    def _messages_create(self, messages, system=None, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+        return self._anthropic_message(system, messages)
+
+    def _anthropic_message(self, system, messages):
+        text, in_tok, out_tok = self._complete(system[0]["text"] if system else "", messages[-1]["content"])
+        return SimpleNamespace(content=[SimpleNamespace(type="text", text=text)],
+                               usage=SimpleNamespace(input_tokens=in_tok, output_tokens=out_tok,
+                                                     cache_read_input_tokens=0, cache_creation_input_tokens=0))
+
+    def _chat_create(self, messages, **kwargs):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+        return _namespace(self._chat_completion(messages))
+
+    def _chat_completion(self, messages):
+        system = messages[0]["content"] if messages[0]["role"] == "system" else ""
+        text, in_tok, out_tok = self._complete(system, messages[-1]["content"])
+        return {
+            "id": f"chatcmpl-{next(self._ids)}", "object": "chat.completion", "created": int(time.time()),
+            "model": "stub",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": in_tok, "completion_tokens": out_tok, "total_tokens": in_tok + out_tok,
+                      "prompt_tokens_details": {"cached_tokens": 0}},
+        }
+
+    # --- batch surfaces ------------------------------------------------------
+
+    def _new_job(self, requests):
+        job_id = f"batch_{next(self._ids)}"
+        with self._lock:
+            self.batch_jobs += 1
+            self._jobs[job_id] = {"requests": requests, "polls": 0, "cancelled": False}
+        return job_id
+
+    def _poll(self, job_id):
+        job = self._jobs[job_id]
+        job["polls"] += 1
+        return job["cancelled"] or job["polls"] > self.batch_polls
+
+    def _cancel(self, job_id):
+        self._jobs[job_id]["cancelled"] = True
+        self.cancelled.append(job_id)
+
+    def _run_job(self, job_id, complete):
+        """{custom_id: completion, or None for a request that failed}"""
+        out = {}
+        for custom_id, params in self._jobs[job_id]["requests"]:
+            if custom_id in self.fail_batch_requests:
+                out[custom_id] = None
+                continue
+            with self._lock:
+                self.batch_requests += 1
+            out[custom_id] = complete(params)
+        return out
+
+    def _anthropic_batch_create(self, requests):
+        job_id = self._new_job([(r["custom_id"], r["params"]) for r in requests])
+        return SimpleNamespace(id=job_id, processing_status="in_progress")
+
+    def _anthropic_batch_retrieve(self, job_id):
+        return SimpleNamespace(id=job_id, processing_status="ended" if self._poll(job_id) else "in_progress")
+
+    def _anthropic_batch_results(self, job_id):
+        results = self._run_job(job_id, lambda p: self._anthropic_message(p.get("system"), p["messages"]))
+        for custom_id, message in results.items():
+            result = (SimpleNamespace(type="succeeded", message=message) if message is not None
+                      else SimpleNamespace(type="errored", error="overloaded_error"))
+            yield SimpleNamespace(custom_id=custom_id, result=result)
+
+    def _file_create(self, file, purpose):
+        file_id = f"file-{next(self._ids)}"
+        self._files[file_id] = file[1].decode("utf-8")
+        return SimpleNamespace(id=file_id, purpose=purpose)
+
+    def _file_content(self, file_id):
+        return SimpleNamespace(text=self._files[file_id])
+
+    def _openai_batch_create(self, input_file_id, endpoint, completion_window):
+        rows = [json.loads(line) for line in self._files[input_file_id].splitlines()]
+        return SimpleNamespace(id=self._new_job([(row["custom_id"], row["body"]) for row in rows]),
+                               status="validating")
+
+    def _openai_batch_retrieve(self, job_id):
+        job = self._jobs[job_id]
+        if not self._poll(job_id):
+            return SimpleNamespace(id=job_id, status="in_progress", output_file_id=None, error_file_id=None)
+        if "output_file_id" not in job:
+            results = self._run_job(job_id, lambda p: self._chat_completion(p["messages"]))
+            lines = [json.dumps({"custom_id": cid,
+                                 "response": ({"status_code": 200, "body": body} if body is not None
+                                              else {"status_code": 429, "body": {"error": "Too many requests"}}),
+                                 "error": None})
+                     for cid, body in results.items()]
+            job["output_file_id"] = f"file-{next(self._ids)}"
+            self._files[job["output_file_id"]] = "\n".join(lines)
+        status = "cancelled" if job["cancelled"] else "completed"
+        return SimpleNamespace(id=job_id, status=status, output_file_id=job["output_file_id"], error_file_id=None)
+
+
+def _namespace(value):
+    """A JSON-shaped dict as nested attributes, like the SDK's response objects."""
+    if isinstance(value, dict):
+        return SimpleNamespace(**{k: _namespace(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return [_namespace(v) for v in value]
+    return value
@@ -3,8 +3,6 @@ import datetime
 import json
 import logging
 import os
-import msal
-import requests
 
 app = func.FunctionApp()
 
@@ -15,6 +13,32 @@ def ValidateDocument(req: func.HttpRequest) -> func.HttpResponse:
     from ValidateDocument import main
     return main(req)
 
+@app.route(route="ValidateDocumentAsync", methods=["POST"], auth_level=func.AuthLevel.FUNCTION)
+@app.queue_output(arg_name="jobs", queue_name="macestyle-validation-jobs", connection="AzureWebJobsStorage")
+def ValidateDocumentAsync(req: func.HttpRequest, jobs: func.Out[str]) -> func.HttpResponse:
+    """Queue a validation job (same request as ValidateDocument); 202 with its status URL"""
+    from ValidateDocument.jobs import submit_job
+    return submit_job(req, jobs.set)
+
+@app.route(route="ValidationJobs/{job_id}", methods=["GET"], auth_level=func.AuthLevel.FUNCTION)
+def ValidationJobStatus(req: func.HttpRequest) -> func.HttpResponse:
+    """Status of a queued validation job, with its result once done"""
+    from ValidateDocument.jobs import job_status
+    return job_status(req, req.route_params.get("job_id"))
+
+@app.route(route="ValidateBatch", methods=["POST"], auth_level=func.AuthLevel.FUNCTION)
+def ValidateBatch(req: func.HttpRequest) -> func.HttpResponse:
+    """Validate many documents (file URLs or a ZIP) in one call; NDJSON, one line per document"""
+    from ValidateDocument.batch import validate_batch
+    return validate_batch(req)
+
+@app.queue_trigger(arg_name="msg", queue_name="macestyle-validation-jobs", connection="AzureWebJobsStorage")
+@app.queue_output(arg_name="jobs", queue_name="macestyle-validation-jobs", connection="AzureWebJobsStorage")
+def RunValidationJob(msg: func.QueueMessage, jobs: func.Out[str]) -> None:
+    """Work on a queued validation job from its checkpoint; queues it again to resume"""
+    from ValidateDocument.jobs import run_job
+    run_job(msg.get_body().decode("utf-8"), jobs.set)
+
 @app.route(route="HealthCheck", methods=["GET"], auth_level=func.AuthLevel.FUNCTION)
 def HealthCheck(req: func.HttpRequest) -> func.HttpResponse:
     """System health check — SOC 2 CC7.2 monitoring endpoint"""
@@ -37,17 +61,10 @@ def TestSharePoint(req: func.HttpRequest) -> func.HttpResponse:
         client_secret = os.environ.get("SHAREPOINT_CLIENT_SECRET")
         site_url = os.environ.get("SHAREPOINT_SITE_URL")
 
-        # Get access token using MSAL
-        authority = f"https://login.microsoftonline.com/{tenant_id}"
-        scope = ["https://graph.microsoft.com/.default"]
-
-        app = msal.ConfidentialClientApplication(
-            client_id,
-            authority=authority,
-            client_credential=client_secret
-        )
-
-        result = app.acquire_token_for_client(scopes=scope)
+        # Get access token (shared MSAL app - served from its token cache when warm)
+        from ValidateDocument.credentials import acquire_token_result
+        from ValidateDocument.graph_client import get_graph_client
+        result = acquire_token_result(tenant_id, client_id, client_secret)
 
         if "access_token" not in result:
             return func.HttpResponse(
@@ -69,8 +86,8 @@ def TestSharePoint(req: func.HttpRequest) -> func.HttpResponse:
             "Accept": "application/json"
         }
 
-        graph_site_url = f"https://graph.microsoft.com/v1.0/sites/{hostname}:{site_path}"
-        site_response = requests.get(graph_site_url, headers=headers)
+        graph_site_url = f"/sites/{hostname}:{site_path}"
+        site_response = get_graph_client().get(graph_site_url, headers=headers)
         site_response.raise_for_status()
         site_data = site_response.json()
 
@@ -110,17 +127,10 @@ def ListDocuments(req: func.HttpRequest) -> func.HttpResponse:
         client_secret = os.environ.get("SHAREPOINT_CLIENT_SECRET")
         site_url = os.environ.get("SHAREPOINT_SITE_URL")
 
-        # Get access token
-        authority = f"https://login.microsoftonline.com/{tenant_id}"
-        scope = ["https://graph.microsoft.com/.default"]
-
-        app_client = msal.ConfidentialClientApplication(
-            client_id,
-            authority=authority,
-            client_credential=client_secret
-        )
-
-        result = app_client.acquire_token_for_client(scopes=scope)
+        # Get access token (shared MSAL app - served from its token cache when warm)
+        from ValidateDocument.credentials import acquire_token_result
+        from ValidateDocument.graph_client import get_graph_client
+        result = acquire_token_result(tenant_id, client_id, client_secret)
 
         if "access_token" not in result:
             return func.HttpResponse(
@@ -142,14 +152,14 @@ def ListDocuments(req: func.HttpRequest) -> func.HttpResponse:
         }
 
         # Get site ID
-        graph_site_url = f"https://graph.microsoft.com/v1.0/sites/{hostname}:{site_path}"
-        site_response = requests.get(graph_site_url, headers=headers)
+        graph_site_url = f"/sites/{hostname}:{site_path}"
+        site_response = get_graph_client().get(graph_site_url, headers=headers)
         site_response.raise_for_status()
         site_id = site_response.json()["id"]
 
         # List files in default document library
-        files_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drive/root/children"
-        files_response = requests.get(files_url, headers=headers)
+        files_url = f"/sites/{site_id}/drive/root/children"
+        files_response = get_graph_client().get(files_url, headers=headers)
         files_response.raise_for_status()
         files_data = files_response.json()
 
@@ -180,3 +190,21 @@ def ListDocuments(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json",
             status_code=500
         )
+
+@app.timer_trigger(schedule="0 */5 * * * *", arg_name="timer", run_on_startup=False, use_monitor=False)
+def RetryWriteBacks(timer: func.TimerRequest) -> None:
+    """Retry background SharePoint write-backs left in the journal (WRITE_BACK_MODE=background)"""
+    from ValidateDocument.write_back import retry_pending_write_backs
+    completed = retry_pending_write_backs()
+    if completed:
+        logging.info(f"RetryWriteBacks: completed {completed} journalled write-back(s)")
+
+@app.timer_trigger(schedule="0 0 2 * * *", arg_name="timer", run_on_startup=False, use_monitor=True)
+def SweepLibrary(timer: func.TimerRequest) -> None:
+    """Nightly validation of the library documents changed since the last sweep (ENABLE_LIBRARY_SWEEP)"""
+    from ValidateDocument.config import ENABLE_LIBRARY_SWEEP
+    if not ENABLE_LIBRARY_SWEEP:
+        return
+    from ValidateDocument.sweep import run_sweep
+    stats = run_sweep()
+    logging.info(f"SweepLibrary: {json.dumps(stats)}")
@@ -0,0 +1,510 @@
+"""Local stand-in for the slice of Microsoft Graph the validator talks to.
+
+Used by the offline tests and benchmarks — no tenant, no network. Start it,
+point GRAPH_API_BASE at ``stub.base_url`` and the real client code runs
+unchanged against it:
+
+    with GraphStub(rules=load_fixture_rules()) as stub:
+        ...  # stub.base_url, stub.requests
+
+It mimics the behaviour that matters for performance work: Graph's default
+page size of 200 list items, @odata.nextLink paging, $top / $select /
+$expand=fields($select=...) trimming, and the system columns a live
+SharePoint list carries alongside the Style Rules fields. It also answers the
+Azure AD token endpoint (counted in ``token_requests``) via
+LoginRedirectSession.
+
+The document library supports the drive delta API: put_file / delete_file
+record each change, and root/delta answers with the items changed since the
+token in its delta link (folders included, deleted items as tombstones).
+"""
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+
+import requests
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "style_rules_fixture.json")
+
+LOGIN_HOST = "https://login.microsoftonline.com"
+SITE_ID = "stub.sharepoint.com,00000000-0000-0000-0000-000000000001,00000000-0000-0000-0000-000000000002"
+GRAPH_DEFAULT_PAGE_SIZE = 200
+
+
+def load_fixture_rules():
+    with open(FIXTURE) as f:
+        return json.load(f)
+
+
+def rule_to_list_item(index, rule):
+    """Shape a fixture rule the way Graph returns a Style Rules list item."""
+    fields = {
+        "@odata.etag": f"\"{index:08d}-0000-0000-0000-000000000000,3\"",
+        "id": str(index),
+        "Title": rule.get("title"),
+        "RuleType": rule.get("rule_type"),
+        "DocumentType": rule.get("doc_type"),
+        "CheckValue": rule.get("check_value"),
+        "ExpectedValue": rule.get("expected_value"),
+        "AutoFix": rule.get("auto_fix"),
+        "UseAI": rule.get("use_ai"),
+        "Priority": rule.get("priority"),
+        # System columns every SharePoint list item carries
+        "ContentType": "Item",
+        "Modified": "2026-01-05T09:12:44Z",
+        "Created": "2025-11-20T14:03:10Z",
+        "AuthorLookupId": "11",
+        "EditorLookupId": "11",
+        "_UIVersionString": "3.0",
+        "Attachments": False,
+        "Edit": "",
+        "LinkTitleNoMenu": rule.get("title"),
+        "LinkTitle": rule.get("title"),
+        "ItemChildCount": "0",
+        "FolderChildCount": "0",
+        "_ComplianceFlags": "",
+        "_ComplianceTag": "",
+        "_ComplianceTagWrittenTime": "",
+        "_ComplianceTagUserId": "",
+        "AppAuthorLookupId": "4",
+        "AppEditorLookupId": "4",
+    }
+    return {
+        "@odata.etag": fields["@odata.etag"],
+        "createdDateTime": fields["Created"],
+        "eTag": fields["@odata.etag"],
+        "id": str(index),
+        "lastModifiedDateTime": fields["Modified"],
+        "webUrl": f"https://stub.sharepoint.com/sites/Style/Lists/Style%20Rules/{index}_.000",
+        "createdBy": {"user": {"email": "author@stub.example", "displayName": "Rule Author"}},
+        "lastModifiedBy": {"user": {"email": "author@stub.example", "displayName": "Rule Author"}},
+        "parentReference": {"id": "00000000-0000-0000-0000-0000000000aa", "siteId": SITE_ID},
+        "contentType": {"id": "0x0100", "name": "Item"},
+        "fields@odata.context": "https://graph.microsoft.com/v1.0/$metadata#fields/$entity",
+        "fields": fields,
+    }
+
+
+def _select(obj, names):
+    return {k: v for k, v in obj.items() if k in names or k.startswith("@odata")}
+
+
+def _parse_expand_select(expand):
+    """fields($select=A,B) -> {'A', 'B'}; plain 'fields' -> None (all)."""
+    m = re.match(r"fields\(\$select=([^)]*)\)", expand or "")
+    return set(m.group(1).split(",")) if m else None
+
+
+class GraphStub:
+    """Threaded local HTTP server answering a subset of Graph v1.0."""
+
+    def __init__(self, rules=None, list_modified="2026-01-05T09:12:44Z",
+                 default_page_size=GRAPH_DEFAULT_PAGE_SIZE):
+        self.rules = rules if rules is not None else load_fixture_rules()
+        self.list_modified = list_modified
+        self.default_page_size = default_page_size
+        self.requests = []
+        self.batch_requests = []   # (method, path, query) for each $batch sub-request
+        self.bytes_sent = 0
+        self.token_requests = 0
+        self.token_lifetime = 3599
+        self._faults = []
+        self.latency = {}      # path substring -> seconds to wait before answering
+        self.site_id = SITE_ID
+        self.files = {}        # drive-relative path -> bytes
+        self.file_ids = {}     # drive-relative path -> drive item id
+        self.versions = {}     # drive-relative path -> change number of its last write
+        self.deleted = {}      # drive item id -> change number of its deletion
+        self.changes = 0
+        self.delta_expired = False   # answer delta links with 410 Gone
+        self.unsized_downloads = False   # send file content without a Content-Length
+        self.list_items = {}   # list id -> {item id: fields}
+        self.upload_sessions = {}  # session id -> {"path": drive path, "data": bytearray}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    # -- lifecycle -------------------------------------------------------
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1.0"
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub._dispatch(self, "GET")
+
+            def do_POST(self):
+                stub._dispatch(self, "POST")
+
+            def do_PUT(self):
+                stub._dispatch(self, "PUT")
+
+            def do_PATCH(self):
+                stub._dispatch(self, "PATCH")
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def inject_fault(self, status, times=1, retry_after=None, path=None):
+        """Answer the next `times` requests (optionally only those whose path
+        contains `path`) with `status` — e.g. 429 with a Retry-After header."""
+        with self._lock:
+            self._faults.append({"status": status, "times": times, "retry_after": retry_after, "path": path})
+
+    def _take_fault(self, path):
+        with self._lock:
+            for fault in self._faults:
+                if fault["times"] > 0 and (fault["path"] is None or fault["path"] in path):
+                    fault["times"] -= 1
+                    return fault
+        return None
+
+    def paths(self, method=None):
+        """Request paths seen so far, optionally filtered by HTTP method."""
+        return [p for m, p, _q in self.requests if method is None or m == method]
+
+    # -- routing ---------------------------------------------------------
+
+    def _dispatch(self, handler, method):
+        parts = urlsplit(handler.path)
+        path = unquote(parts.path)
+        query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+        with self._lock:
+            self.requests.append((method, path, query))
+
+        for fragment, seconds in list(self.latency.items()):
+            if fragment in path:
+                time.sleep(seconds)
+                break
+
+        extra_headers = {}
+        fault = self._take_fault(path)
+        if fault:
+            status = fault["status"]
+            payload = {"error": {"code": "throttled" if status == 429 else "serviceNotAvailable",
+                                 "message": "Injected by GraphStub"}}
+            if fault["retry_after"] is not None:
+                extra_headers["Retry-After"] = str(fault["retry_after"])
+        else:
+            status, payload = self.route(method, path, query, body, handler.headers)[:2]
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        for name, value in extra_headers.items():
+            handler.send_header(name, value)
+        if self.unsized_downloads and isinstance(payload, bytes):
+            handler.close_connection = True   # the body ends when the connection closes
+        else:
+            handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+        with self._lock:
+            self.bytes_sent += len(data)
+
+    def route(self, method, path, query, body, headers):
+        """Return (status, json-or-bytes) for one request. Subclass to extend."""
+        m = re.fullmatch(r"/([^/]+)/v2.0/.well-known/openid-configuration", path)
+        if method == "GET" and m:
+            authority = f"{LOGIN_HOST}/{m.group(1)}"
+            return 200, {
+                "issuer": f"{authority}/v2.0",
+                "authorization_endpoint": f"{authority}/oauth2/v2.0/authorize",
+                "token_endpoint": f"{authority}/oauth2/v2.0/token",
+            }
+
+        if method == "POST" and re.fullmatch(r"/[^/]+/oauth2/v2.0/token", path):
+            with self._lock:
+                self.token_requests += 1
+            return 200, {
+                "token_type": "Bearer",
+                "expires_in": self.token_lifetime,
+                "access_token": f"stub-token-{uuid.uuid4().hex}",
+            }
+
+        path = path[len("/v1.0"):] if path.startswith("/v1.0") else path
+
+        m = re.fullmatch(r"/upload/([^/]+)", path)
+        if m:
+            return self._upload_chunk(method, m.group(1), body, headers)
+
+        if method == "POST" and path == "/$batch":
+            return 200, self._batch(json.loads(body or b"{}").get("requests", []), headers)
+
+        if method == "GET" and re.fullmatch(r"/sites/[^/]+:/[^/]+.*", path) and "/lists" not in path:
+            return 200, {"id": self.site_id, "displayName": "Stub Site", "webUrl": "https://stub.sharepoint.com"}
+
+        m = re.fullmatch(r"/sites/([^/:]+)(/.*)", path)
+        if not m:
+            return self._not_found(method, path)
+        if m.group(1) != self.site_id:
+            # A site ID that no longer resolves (e.g. the site was moved/renamed)
+            return 404, {"error": {"code": "itemNotFound", "message": "Requested site could not be found"}}
+        return self.route_site(method, m.group(2), query, body)
+
+    def route_site(self, method, path, query, body):
+        """Routes under /sites/{site-id}."""
+        if method == "GET" and path == "/lists/Style Rules":
+            return 200, {"id": "style-rules-list", "lastModifiedDateTime": self.list_modified}
+
+        if method == "GET" and path == "/lists/Style Rules/items":
+            return 200, self._style_rule_items(f"/sites/{self.site_id}{path}", query)
+
+        if method == "GET" and path == "/drive":
+            return 200, {"id": "stub-drive"}
+
+        if method == "GET" and path == "/drive/list":
+            return 200, {"id": "doc-library-list"}
+
+        m = re.fullmatch(r"/lists/([^/]+)", path)
+        if method == "GET" and m:
+            return 200, {"id": "list-" + m.group(1).replace(" ", "-").lower()}
+
+        m = re.fullmatch(r"/drive/root:(/.+):/createUploadSession", path)
+        if m and method == "POST":
+            session_id = uuid.uuid4().hex
+            with self._lock:
+                self.upload_sessions[session_id] = {"path": m.group(1), "data": bytearray()}
+            return 200, {"uploadUrl": f"{self.base_url[:-len('/v1.0')]}/upload/{session_id}",
+                         "expirationDateTime": "2030-01-01T00:00:00Z", "nextExpectedRanges": ["0-"]}
+
+        m = re.fullmatch(r"/drive/root:(/.+):/content", path)
+        if m and method == "GET":
+            if m.group(1) not in self.files:
+                return self._not_found(method, path)
+            return 200, self.files[m.group(1)]
+        if m and method == "PUT":
+            return 201, self._store_file(m.group(1), body)
+
+        if method == "GET" and path == "/drive/root/delta":
+            if self.delta_expired and "token" in query and "$skiptoken" not in query:
+                return 410, {"error": {"code": "resyncRequired", "message": "Delta token expired"}}
+            return 200, self._delta(query)
+
+        m = re.fullmatch(r"/drive/items/([^/]+)(/content)?", path)
+        if m and method == "GET":
+            paths = [p for p, item_id in self.file_ids.items() if item_id == m.group(1) and p in self.files]
+            if not paths:
+                return self._not_found(method, path)
+            if m.group(2):
+                return 200, self.files[paths[0]]
+            folder, name = paths[0].rsplit("/", 1)
+            return 200, {"id": m.group(1), "name": name,
+                         "parentReference": {"driveId": "stub-drive", "path": f"/drive/root:{folder}"}}
+
+        m = re.fullmatch(r"/drive/root:(/.+)", path)
+        if m and method == "GET":
+            if m.group(1) not in self.files:
+                return self._not_found(method, path)
+            return 200, {"id": self.file_ids[m.group(1)], "name": m.group(1).rsplit("/", 1)[-1],
+                         "listItem": {"id": self.file_ids[m.group(1)].split("-")[-1]}}
+
+        m = re.fullmatch(r"/lists/([^/]+)/items", path)
+        if m and method == "POST":
+            items = self.list_items.setdefault(m.group(1), {})
+            item_id = str(len(items) + 1)
+            items[item_id] = json.loads(body or b"{}").get("fields", {})
+            return 201, {"id": item_id, "fields": items[item_id]}
+
+        if method == "PATCH":
+            data = json.loads(body or b"{}")
+            m = re.fullmatch(r"/lists/([^/]+)/items/([^/]+)(/fields)?", path)
+            if m:
+                fields = data if m.group(3) else data.get("fields", {})
+                self.list_items.setdefault(m.group(1), {}).setdefault(m.group(2), {}).update(fields)
+            return 200, data
+
+        return self._not_found(method, path)
+
+    def _batch(self, sub_requests, headers):
+        """Run $batch sub-requests in order. Like Graph, a request whose dependsOn
+        target did not succeed is answered 424 without running; injected faults
+        apply per sub-request (that is how Graph reports throttling in a batch)."""
+        if len(sub_requests) > 20:
+            return {"error": {"code": "BadRequest", "message": "Batch exceeds 20 requests"}}
+        responses, statuses = [], {}
+        for sub in sub_requests:
+            parts = urlsplit(sub["url"])
+            path = unquote(parts.path)
+            query = {k: v[0] for k, v in parse_qs(parts.query).items()}
+            with self._lock:
+                self.batch_requests.append((sub["method"], path, query))
+            sub_headers = {}
+            if any(not 200 <= statuses.get(dep, 0) < 300 for dep in sub.get("dependsOn", [])):
+                status, payload = 424, {"error": {"code": "failedDependency", "message": "Dependency failed"}}
+            else:
+                fault = self._take_fault(path)
+                if fault:
+                    status = fault["status"]
+                    payload = {"error": {"code": "throttled", "message": "Injected by GraphStub"}}
+                    if fault["retry_after"] is not None:
+                        sub_headers["Retry-After"] = str(fault["retry_after"])
+                else:
+                    body = json.dumps(sub["body"]).encode("utf-8") if "body" in sub else b""
+                    status, payload = self.route(sub["method"], path, query, body, headers)[:2]
+            if isinstance(payload, bytes):
+                payload = payload.decode("utf-8", "replace")
+            statuses[sub["id"]] = status
+            responses.append({"id": sub["id"], "status": status, "headers": sub_headers, "body": payload})
+        return {"responses": responses}
+
+    def _upload_chunk(self, method, session_id, body, headers):
+        """Upload-session endpoint: in-order Content-Range PUTs, GET for status."""
+        session = self.upload_sessions.get(session_id)
+        if session is None:
+            return 404, {"error": {"code": "itemNotFound", "message": "Upload session not found"}}
+        received = len(session["data"])
+        if method == "GET":
+            return 200, {"nextExpectedRanges": [f"{received}-"]}
+        if method != "PUT":
+            return self._not_found(method, "/upload")
+        if headers.get("Authorization"):
+            return 401, {"error": {"code": "unauthenticated", "message": "uploadUrl is pre-authenticated"}}
+        m = re.fullmatch(r"bytes (\d+)-(\d+)/(\d+)", headers.get("Content-Range", ""))
+        if not m or int(m.group(1)) != received or int(m.group(2)) - int(m.group(1)) + 1 != len(body):
+            return 416, {"error": {"code": "invalidRange", "message": f"Expected range {received}-"}}
+        session["data"].extend(body)
+        if len(session["data"]) < int(m.group(3)):
+            return 202, {"nextExpectedRanges": [f"{len(session['data'])}-"]}
+        del self.upload_sessions[session_id]
+        return 201, self._store_file(session["path"], bytes(session["data"]))
+
+    def put_file(self, drive_path, body):
+        """Add or replace a document in the library (a change the delta API reports)."""
+        return self._store_file(drive_path, body)
+
+    def delete_file(self, drive_path):
+        with self._lock:
+            del self.files[drive_path]
+            self.changes += 1
+            self.deleted[self.file_ids[drive_path]] = self.changes
+
+    def _store_file(self, drive_path, body):
+        with self._lock:
+            self.files[drive_path] = body
+            self.changes += 1
+            self.versions[drive_path] = self.changes
+            item_id = self.file_ids.setdefault(drive_path, f"stub-item-{len(self.file_ids) + 1}")
+            self.deleted.pop(item_id, None)
+        return {"id": item_id, "name": drive_path.rsplit("/", 1)[-1], "size": len(body),
+                "webUrl": f"https://stub.sharepoint.com/sites/Style/Shared%20Documents{drive_path}"}
+
+    def _not_found(self, method, path):
+        return 404, {"error": {"code": "itemNotFound", "message": f"Stub has no route for {method} {path}"}}
+
+    def _delta(self, query):
+        """Items changed after query['token'] (everything without one), parents
+        before children, paged like a list. The last page's deltaLink carries
+        the current change number as its token."""
+        since = int(query.get("token", "0"))
+        top = min(int(query.get("$top", self.default_page_size)), 999)
+        skip = int(query.get("$skiptoken", "0"))
+        with self._lock:
+            for drive_path in self.files:   # files placed directly in .files
+                self.file_ids.setdefault(drive_path, f"stub-item-{len(self.file_ids) + 1}")
+            changed = sorted(p for p in self.files if self.versions.get(p, 0) > since or not since)
+            items, folders = [], {}
+            for drive_path in changed:
+                parent_id = "stub-root"
+                parts = drive_path.strip("/").split("/")
+                for depth in range(1, len(parts)):
+                    folder = "/" + "/".join(parts[:depth])
+                    if folder not in folders:
+                        folders[folder] = f"stub-folder-{len(folders) + 1}"
+                        items.append({"id": folders[folder], "name": parts[depth - 1], "folder": {},
+                                      "parentReference": {"driveId": "stub-drive", "id": parent_id}})
+                    parent_id = folders[folder]
+                item_id = self.file_ids[drive_path]
+                items.append({"id": item_id, "name": parts[-1], "size": len(self.files[drive_path]),
+                              "cTag": f"\"c:{{{item_id}}},{self.versions.get(drive_path, 0)}\"",
+                              "file": {"mimeType": "application/octet-stream"},
+                              "parentReference": {"driveId": "stub-drive", "id": parent_id}})
+            items.extend({"id": item_id, "deleted": {"state": "deleted"},
+                          "parentReference": {"driveId": "stub-drive"}}
+                         for item_id, change in sorted(self.deleted.items()) if change > since)
+            current = self.changes
+        if not since:
+            items.insert(0, {"id": "stub-root", "name": "root", "root": {}, "folder": {}})
+
+        names = set(query["$select"].split(",")) | {"id"} if "$select" in query else None
+        page = [_select(item, names) if names else item for item in items[skip:skip + top]]
+        result = {"value": page}
+        link = f"{self.base_url}/sites/{self.site_id}/drive/root/delta"
+        select = f"&$select={query['$select']}" if "$select" in query else ""
+        if skip + top < len(items):
+            result["@odata.nextLink"] = f"{link}?token={since}&$skiptoken={skip + top}&$top={top}{select}"
+        else:
+            result["@odata.deltaLink"] = f"{link}?token={current}{select}"
+        return result
+
+    def _style_rule_items(self, path, query):
+        top = int(query.get("$top", self.default_page_size))
+        top = min(top, 999)
+        skip = int(query.get("$skiptoken", "0"))
+        page = self.rules[skip:skip + top]
+
+        field_names = _parse_expand_select(query.get("$expand") or query.get("expand"))
+        item_names = set(query["$select"].split(",")) if "$select" in query else None
+        items = []
+        for offset, rule in enumerate(page):
+            item = rule_to_list_item(skip + offset + 1, rule)
+            if field_names is not None:
+                item["fields"] = _select(item["fields"], field_names | {"id"})
+            if item_names is not None:
+                item = _select(item, item_names | {"fields", "fields@odata.context"})
+            items.append(item)
+
+        result = {"@odata.context": "https://graph.microsoft.com/v1.0/$metadata#Collection(listItem)", "value": items}
+        if skip + top < len(self.rules):
+            next_query = {k: v for k, v in query.items() if k != "$skiptoken"}
+            next_query["$skiptoken"] = str(skip + top)
+            qs = "&".join(f"{k}={v}" for k, v in next_query.items())
+            result["@odata.nextLink"] = f"{self.base_url}{path[len('/v1.0'):] if path.startswith('/v1.0') else path}?{qs}"
+        return result
+
+
+class LoginRedirectSession(requests.Session):
+    """HTTP client for MSAL that sends Azure AD traffic to the stub instead.
+
+    MSAL insists on an https authority, so rather than changing the authority
+    the login host is rewritten on the way out:
+        credentials.set_http_client(LoginRedirectSession(stub))
+    """
+
+    def __init__(self, stub):
+        super().__init__()
+        self.stub = stub
+
+    def request(self, method, url, *args, **kwargs):
+        if url.startswith(LOGIN_HOST):
+            host, port = self.stub._server.server_address[:2]
+            url = f"http://{host}:{port}" + url[len(LOGIN_HOST):]
+        return super().request(method, url, *args, **kwargs)
@@ -0,0 +1,36 @@
+"""In-memory stand-in for the Storage queue between ValidateDocumentAsync and
+RunValidationJob (jobs.py), for the offline tests — no Azurite, no network.
+
+    queue = JobQueue()
+    jobs.submit_job(req, queue.send)
+    queue.run(jobs.run_job)
+
+Like the Functions host, it delivers each message to the worker and, when the
+run raises, delivers it again, up to max_dequeue_count times before moving it
+to the poison list.
+"""
+from collections import deque
+
+
+class JobQueue:
+    def __init__(self, max_dequeue_count=5):
+        self.max_dequeue_count = max_dequeue_count
+        self.messages = deque()     # (message, times dequeued)
+        self.poison = []
+        self.deliveries = 0
+
+    def send(self, message):
+        self.messages.append((message, 0))
+
+    def run(self, worker, max_deliveries=100):
+        """Deliver messages to worker(message, send) until the queue is empty."""
+        while self.messages and self.deliveries < max_deliveries:
+            message, dequeued = self.messages.popleft()
+            self.deliveries += 1
+            try:
+                worker(message, self.send)
+            except Exception:
+                if dequeued + 1 >= self.max_dequeue_count:
+                    self.poison.append(message)
+                else:
+                    self.messages.append((message, dequeued + 1))
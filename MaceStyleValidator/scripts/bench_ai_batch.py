@@ -0,0 +1,93 @@
+"""Benchmark a library-wide re-validation: synchronous AI calls vs batch mode.
+
+Validates a generated library of Word documents (sharing boilerplate, as
+Mace documents do) against an AI rule, answered by ai_stub with a fixed
+latency per synchronous call. Synchronous mode validates document by
+document; batch mode (ai_batch.AIBatch) collects the AI work of the whole
+library, answers it in one provider batch job and then validates.
+
+  python3 scripts/bench_ai_batch.py [documents] [latency_ms]
+"""
+import os
+import sys
+import time
+from io import BytesIO
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from docx import Document
+
+from ai_stub import AIStub
+from ValidateDocument import ai_batch, ai_client
+from ValidateDocument.ai_batch import AIBatch
+from ValidateDocument.ai_cache import set_ai_cache
+from ValidateDocument.core import validate_file
+from ValidateDocument.result_cache import ResultCache
+
+RULES = [{"title": "British spelling", "rule_type": "Language", "doc_type": "Word", "check_value": "",
+          "expected_value": "", "auto_fix": True, "use_ai": True, "priority": 10}]
+BOILERPLATE = [
+    "This document is uncontrolled when printed; check the program site for the current version.",
+    "All personnel must complete the site induction before starting work in the work center.",
+    "The project manager will organize a review of this plan at each stage gate.",
+]
+
+
+def make_library(n):
+    library = []
+    for i in range(n):
+        doc = Document()
+        doc.add_heading(f"Method statement {i}", level=1)
+        for j in range(8):
+            doc.add_paragraph(f"Step {j} of package {i}: the team will organize access and color-code "
+                              f"the permits for zone {i % 7}-{j}.")
+        for text in BOILERPLATE:
+            doc.add_paragraph(text)
+        out = BytesIO()
+        doc.save(out)
+        library.append((f"doc{i}.docx", out.getvalue()))
+    return library
+
+
+def install(stub):
+    ai_client.ENABLE_CLAUDE_AI = ai_batch.ENABLE_CLAUDE_AI = True
+    ai_client.set_ai_client(stub)
+    set_ai_cache(ResultCache(256 * 1024 * 1024))
+
+
+def synchronous(library, latency):
+    stub = AIStub(latency=latency)
+    install(stub)
+    start = time.perf_counter()
+    for name, data in library:
+        validate_file(".docx", BytesIO(data), RULES)
+    return stub, time.perf_counter() - start
+
+
+def batched(library, latency):
+    stub = AIStub(latency=latency)
+    install(stub)
+    start = time.perf_counter()
+    batch = AIBatch(RULES, poll_seconds=0)
+    for name, data in library:
+        batch.add(name, data)
+    batch.run()
+    for _ in batch.validate():
+        pass
+    return stub, time.perf_counter() - start
+
+
+def main():
+    documents = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = (int(sys.argv[2]) if len(sys.argv) > 2 else 800) / 1000
+    library = make_library(documents)
+    print(f"Re-validating {documents} documents, {latency * 1000:.0f} ms per synchronous AI call (ai_stub)\n")
+    for label, run in (("synchronous", synchronous), ("batch mode", batched)):
+        stub, elapsed = run(library, latency)
+        print(f"  {label:<12} {stub.calls:5} sync calls  {stub.batch_jobs:2} batch job(s)  "
+              f"{stub.batch_requests:5} batch requests  {stub.input_tokens:8} in / {stub.output_tokens:6} out tokens  "
+              f"{elapsed:7.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Benchmark the Style Rules fetch against a local Graph stand-in.
+
+Compares the legacy request (one GET, expand=fields, no $select/$top/paging)
+with the paginated, field-selected fetch in sharepoint_client, using the
+testers' rule set (style_rules_fixture.json) shaped like the live list —
+including the SharePoint system columns. Also runs the list at 3x its size to
+show the legacy fetch silently truncating at Graph's 200-item default page.
+
+  python3 scripts/bench_rules_fetch.py [repeats]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import requests
+
+from graph_stub import GraphStub, SITE_ID, load_fixture_rules
+from ValidateDocument import sharepoint_client
+from ValidateDocument.graph_client import GraphClient, set_graph_client
+
+
+def legacy_fetch(base_url):
+    url = f"{base_url}/sites/{SITE_ID}/lists/Style Rules/items?expand=fields"
+    response = requests.get(url, headers={"Authorization": "Bearer stub"})
+    response.raise_for_status()
+    return response.json().get("value", [])
+
+
+def current_fetch():
+    headers = {"Authorization": "Bearer stub"}
+    return list(sharepoint_client._iter_style_rule_items(headers, SITE_ID))
+
+
+def measure(label, rules, fetch, repeats):
+    with GraphStub(rules=rules) as stub:
+        set_graph_client(GraphClient(base_url=stub.base_url, rate_per_second=0))
+        start = time.perf_counter()
+        for _ in range(repeats):
+            items = fetch(stub.base_url) if fetch is legacy_fetch else fetch()
+        elapsed_ms = (time.perf_counter() - start) * 1000 / repeats
+        calls = len(stub.requests) / repeats
+        kb = stub.bytes_sent / repeats / 1024
+    print(f"  {label:<28} {len(items):5}/{len(rules):<5} items  {calls:4.1f} calls  "
+          f"{kb:8.1f} KB  {elapsed_ms:7.1f} ms")
+
+
+def main():
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    live = load_fixture_rules()
+    grown = [dict(r, title=f"{r['title']} #{n}") for n in range(3) for r in live]
+
+    print(f"Style Rules fetch — mean of {repeats} runs against graph_stub\n")
+    for name, rules in (("live list", live), ("list grown 3x", grown)):
+        print(f"{name} ({len(rules)} rules)")
+        measure("legacy (expand=fields)", rules, legacy_fetch, repeats)
+        measure("paged + $select", rules, current_fetch, repeats)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Peak memory of ValidateDocument for the JSON/base64 and binary transports.
+
+Builds a Word document of roughly SIZE_MB (a large uncompressed image keeps
+it from shrinking on save), then runs main() once per transport in a fresh
+subprocess against graph_stub and reports:
+
+  - tracemalloc peak: Python allocations made while main() ran
+  - RSS growth:      ru_maxrss after main() minus ru_maxrss before it
+
+The request body is built before measuring starts (in production the
+Functions host hands it over already in memory), so the numbers are what the
+function itself adds on top.
+
+  python3 scripts/bench_transport_memory.py [SIZE_MB]
+"""
+import json
+import os
+import resource
+import struct
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+import zlib
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, ROOT)
+
+MODES = ("json", "binary")
+
+
+def _png(width, height):
+    """Random-noise RGB PNG stored without compression."""
+    raw = b"".join(b"\x00" + os.urandom(width * 3) for _ in range(height))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 0)) + chunk(b"IEND", b"")
+
+
+def build_document(path, size_mb):
+    from io import BytesIO
+    from docx import Document
+
+    doc = Document()
+    doc.add_paragraph("Project Execution Plan")
+    doc.add_paragraph("This document is used to measure memory use during validation.  ")
+    side = int((size_mb * 1024 * 1024 / 3) ** 0.5)
+    doc.add_picture(BytesIO(_png(side, side)))
+    doc.save(path)
+
+
+def _request(mode, content):
+    import base64
+    import azure.functions as func
+
+    if mode == "json":
+        body = json.dumps({"fileName": "bench.docx", "fileContent": base64.b64encode(content).decode()}).encode()
+        return func.HttpRequest(method="POST", url="/api/ValidateDocument", body=body,
+                                headers={"Content-Type": "application/json"})
+    return func.HttpRequest(method="POST", url="/api/ValidateDocument", body=content,
+                            headers={"Content-Type": "application/octet-stream", "Accept": "multipart/mixed"},
+                            params={"fileName": "bench.docx"})
+
+
+def child(mode, path):
+    from graph_stub import GraphStub, LoginRedirectSession
+    from ValidateDocument import main, credentials
+    from ValidateDocument.graph_client import GraphClient, set_graph_client
+
+    os.environ.update({
+        "SHAREPOINT_TENANT_ID": "bench-tenant", "SHAREPOINT_CLIENT_ID": "bench-client",
+        "SHAREPOINT_CLIENT_SECRET": "bench-secret",
+        "SHAREPOINT_SITE_URL": "https://stub.sharepoint.com/sites/Style",
+    })
+    with open(path, "rb") as f:
+        content = f.read()
+    req = _request(mode, content)
+    del content
+
+    with GraphStub() as stub:
+        credentials.set_http_client(LoginRedirectSession(stub))
+        set_graph_client(GraphClient(base_url=stub.base_url, rate_per_second=0))
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        tracemalloc.start()
+        response = main(req)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"status": response.status_code, "request_kb": len(req.get_body()) // 1024,
+                      "response_kb": len(response.get_body()) // 1024,
+                      "peak_kb": peak // 1024, "rss_kb": rss_after - rss_before}))
+
+
+def main():
+    size_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 20
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.docx")
+        build_document(path, size_mb)
+        print(f"ValidateDocument transport memory — {os.path.getsize(path) / 1048576:.1f} MB .docx\n")
+        print(f"  {'transport':<28} {'HTTP':>4} {'request':>10} {'response':>10} {'py peak':>10} {'RSS growth':>11}")
+        for mode in MODES:
+            out = subprocess.run([sys.executable, __file__, "--child", mode, path],
+                                 capture_output=True, text=True, check=True)
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            label = "JSON + base64" if mode == "json" else "octet-stream + multipart"
+            print(f"  {label:<28} {r['status']:>4} {r['request_kb'] / 1024:8.1f}MB {r['response_kb'] / 1024:8.1f}MB "
+                  f"{r['peak_kb'] / 1024:8.1f}MB {r['rss_kb'] / 1024:9.1f}MB")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3])
+    else:
+        main()
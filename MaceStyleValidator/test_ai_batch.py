@@ -0,0 +1,129 @@
+"""Offline AI batch mode: many documents' AI work as provider batch jobs, answered by ai_stub"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+from io import BytesIO
+
+import pytest
+from docx import Document
+
+from ai_stub import AIStub
+from ValidateDocument import ai_batch, ai_client
+from ValidateDocument.ai_batch import AIBatch
+from ValidateDocument.ai_cache import set_ai_cache
+from ValidateDocument.ai_router import ProviderRouter, set_ai_router
+from ValidateDocument.result_cache import ResultCache
+
+RULES = [{"title": "British spelling", "rule_type": "Language", "doc_type": "Word", "check_value": "",
+          "expected_value": "", "auto_fix": True, "use_ai": True, "priority": 10}]
+BOILERPLATE = "This document is uncontrolled when printed and the program owner will organize its review."
+
+
+def _docx(n):
+    doc = Document()
+    doc.add_heading(f"Method statement {n}", level=1)
+    doc.add_paragraph(f"Section {n}: we will organize deliveries to the site center before {8 + n % 3} am.")
+    doc.add_paragraph(BOILERPLATE)
+    out = BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    stub = AIStub()
+    for module in (ai_client, ai_batch):
+        monkeypatch.setattr(module, "ENABLE_CLAUDE_AI", True)
+    for backend in ("anthropic", "foundry", "azure_openai"):
+        ai_client.set_ai_client(stub, backend)
+    monkeypatch.setattr(ai_client, "AI_CHUNK_TOKENS", 200)
+    set_ai_cache(ResultCache(1024 * 1024))
+    set_ai_router(ProviderRouter())
+    yield stub
+    set_ai_cache(None)
+    set_ai_router(None)
+    ai_client.set_ai_client(None)
+
+
+def _provider(monkeypatch, name):
+    monkeypatch.setattr(ai_client, "AI_PROVIDER", name)
+    monkeypatch.setattr(ai_batch, "AI_PROVIDER", name)
+
+
+def _sweep(n=12, **kwargs):
+    batch = AIBatch(RULES, poll_seconds=0, **kwargs)
+    for i in range(n):
+        batch.add(f"doc{i}.docx", _docx(i))
+    return batch
+
+
+@pytest.mark.parametrize("provider", ["anthropic", "azure_openai"])
+def test_sweep_runs_ai_as_one_batch_job(stub, monkeypatch, provider):
+    _provider(monkeypatch, provider)
+    batch = _sweep()
+
+    stats = batch.run()
+    assert stats["paragraphs"] == 36 and stats["distinct"] == 25   # the shared boilerplate once
+    assert stats["jobs"] == 1 and stats["requests"] > 1 and stats["errors"] == []
+    assert stub.batch_requests == stats["requests"] and stub.calls == 0
+
+    results = list(batch.validate())
+    assert stub.calls == 0   # every correction came from the batch
+    assert len(results) == 12
+    name, result, fixed = results[5]
+    doc = Document(fixed)
+    assert doc.paragraphs[1].text == "Section 5: we will organise deliveries to the site centre before 10 am."
+    assert doc.paragraphs[2].text == BOILERPLATE.replace("program", "programme").replace("organize", "organise")
+
+
+def test_batch_matches_synchronous_validation(stub, monkeypatch):
+    _provider(monkeypatch, "anthropic")
+    batch = _sweep(3)
+    batch.run()
+    batched = [result["fixes_applied"] for _, result, _ in batch.validate()]
+
+    set_ai_cache(ResultCache(1024 * 1024))
+    synchronous = [result["fixes_applied"] for _, result, _ in _sweep(3).validate()]
+    assert stub.calls > 0
+    assert batched == synchronous
+
+
+def test_failed_batch_request_falls_back_to_a_direct_call(stub, monkeypatch):
+    _provider(monkeypatch, "azure_openai")
+    stub.fail_batch_requests = {"chunk-0"}
+    batch = _sweep(4)
+
+    stats = batch.run()
+    assert len(stats["errors"]) == 1 and "chunk-0" in stats["errors"][0]
+    results = list(batch.validate())
+    assert stub.calls >= 1
+    assert all("organize" not in p.text for _, _, fixed in results for p in Document(fixed).paragraphs)
+
+
+def test_unfinished_job_is_cancelled_at_the_deadline(stub, monkeypatch):
+    _provider(monkeypatch, "anthropic")
+    stub.batch_polls = 1000
+    batch = _sweep(2, timeout_seconds=0)
+
+    stats = batch.run()
+    assert stub.cancelled and "did not finish" in stats["errors"][0]
+    assert stub.batch_requests == 0
+
+
+def test_repeat_sweep_is_answered_from_the_cache(stub, monkeypatch):
+    _provider(monkeypatch, "anthropic")
+    _sweep().run()
+    stats = _sweep().run()
+    assert stats["cached"] == stats["distinct"] and stats["jobs"] == 0
+    assert stub.batch_jobs == 1
+
+
+def test_foundry_sends_directly(stub, monkeypatch):
+    _provider(monkeypatch, "foundry")
+    batch = _sweep(3)
+    stats = batch.run()
+    assert stats["jobs"] == 0 and stub.batch_jobs == 0 and stub.calls > 0
+    calls = stub.calls
+    list(batch.validate())
+    assert stub.calls == calls
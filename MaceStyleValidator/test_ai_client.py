@@ -0,0 +1,364 @@
+"""AI client tests: token-sized chunks, concurrent dispatch, edit lists merged by paragraph ID (fake providers, no network)"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from ValidateDocument import ai_client
+from ValidateDocument.ai_cache import set_ai_cache
+from ValidateDocument.ai_router import ProviderRouter, set_ai_router
+from ValidateDocument.monitoring import ValidationMetrics, bind_metrics
+from ValidateDocument.result_cache import ResultCache, LocalResultStore
+
+RULES = [{"title": "British spelling", "rule_type": "Language", "use_ai": True}]
+
+
+class FakeProvider:
+    """Answers like the model: reads the paragraph JSON out of the prompt and
+    returns an edit per 'organize' -> 'organise', paragraphs in reverse order."""
+
+    def __init__(self, delay=0.05, fail_on=None):
+        self.delay = delay
+        self.fail_on = fail_on
+        self.prompts = []
+        self.systems = []
+        self.cache_markers = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self.messages = SimpleNamespace(create=self._anthropic)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._openai))
+
+    def _answer(self, prompt):
+        with self._lock:
+            self.prompts.append(prompt)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.delay)
+            paragraphs = json.loads(prompt.split("Paragraphs:\n", 1)[1])
+            if self.fail_on and self.fail_on in paragraphs:
+                raise RuntimeError("overloaded")
+            edits = [{"id": pid, "find": "organize", "replace": "organise", "rule": "British spelling"}
+                     for pid in reversed(list(paragraphs)) for _ in range(paragraphs[pid].count("organize"))]
+            return json.dumps({"edits": edits})
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _cached(self, system):
+        """Prompt-cache behaviour: the first call with a preamble writes it, later ones read it."""
+        with self._lock:
+            hit = system in self.systems
+            self.systems.append(system)
+        return hit
+
+    def _anthropic(self, messages, system=None, **kwargs):
+        hit = self._cached(system[0]["text"])
+        self.cache_markers.append(system[0].get("cache_control"))
+        text = self._answer(messages[0]["content"])
+        return SimpleNamespace(content=[SimpleNamespace(text=text)],
+                               usage=SimpleNamespace(input_tokens=10, output_tokens=10,
+                                                     cache_read_input_tokens=50 if hit else 0,
+                                                     cache_creation_input_tokens=0 if hit else 50))
+
+    def _openai(self, messages, **kwargs):
+        assert messages[0]["role"] == "system"
+        hit = self._cached(messages[0]["content"])
+        text = self._answer(messages[1]["content"])
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+                               usage=SimpleNamespace(prompt_tokens=60, completion_tokens=10,
+                                                     prompt_tokens_details=SimpleNamespace(
+                                                         cached_tokens=50 if hit else 0)))
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    fake = FakeProvider()
+    monkeypatch.setattr(ai_client, "ENABLE_CLAUDE_AI", True)
+    for backend in ("anthropic", "foundry", "azure_openai"):
+        ai_client.set_ai_client(fake, backend)
+    monkeypatch.setattr(ai_client, "AI_CHUNK_TOKENS", 200)
+    monkeypatch.setattr(ai_client, "AI_MAX_PARALLEL", 3)
+    set_ai_cache(ResultCache(1024 * 1024))
+    set_ai_router(ProviderRouter())
+    yield fake
+    set_ai_cache(None)
+    set_ai_router(None)
+    ai_client.set_ai_client(None)
+
+
+def _paragraphs(n=40):
+    return {f"p{i}": f"Paragraph {i}: we organize the works and keep the site tidy." for i in range(n)}
+
+
+def test_chunks_are_paragraph_aligned_and_sized():
+    paragraphs = _paragraphs()
+    chunks = ai_client.chunk_paragraphs(paragraphs, max_tokens=100)
+    assert len(chunks) > 1
+    assert [pid for chunk in chunks for pid in chunk] == list(paragraphs)
+    for chunk in chunks:
+        assert sum(ai_client.estimate_tokens(t) + 8 for t in chunk.values()) <= 100
+
+    huge = {"p0": "x" * 4000, "p1": "short"}
+    assert ai_client.chunk_paragraphs(huge, max_tokens=100) == [{"p0": "x" * 4000}, {"p1": "short"}]
+
+
+@pytest.mark.parametrize("backend", ["anthropic", "foundry", "azure_openai"])
+def test_chunks_run_concurrently_and_merge_by_id(provider, monkeypatch, backend):
+    monkeypatch.setattr(ai_client, "AI_PROVIDER", backend)
+    paragraphs = _paragraphs()
+
+    result = ai_client.correct_paragraphs(RULES, paragraphs)
+
+    assert len(provider.prompts) > 3
+    assert 1 < provider.max_in_flight <= 3
+    assert result["errors"] == []
+    assert result["changes_made"] == 40
+    assert result["corrections"] == {pid: text.replace("organize", "organise") for pid, text in paragraphs.items()}
+
+
+def test_failed_chunk_leaves_the_rest(provider):
+    provider.fail_on = "p0"
+    result = ai_client.correct_paragraphs(RULES, _paragraphs())
+    assert len(result["errors"]) == 1 and "overloaded" in result["errors"][0]
+    assert "p0" not in result["corrections"]
+    assert result["corrections"]["p39"].count("organise") == 1
+
+
+def test_every_chunk_failing_raises(provider):
+    provider.fail_on = "p0"
+    with pytest.raises(RuntimeError):
+        ai_client.correct_paragraphs(RULES, {"p0": "We organize the site."})
+
+
+def test_only_changed_paragraphs_come_back(provider):
+    paragraphs = {"p0": "We organize the site.", "p1": "Nothing to change here."}
+    result = ai_client.correct_paragraphs(RULES, paragraphs)
+    assert result["corrections"] == {"p0": "We organise the site.", "p1": "Nothing to change here."}
+    assert result["edits"]["p1"] == [] and result["changes_made"] == 1
+    assert '"edits"' in provider.systems[0]
+
+
+def test_edits_are_validated_against_the_source():
+    text = "We organize and organize again."
+    edits = ai_client.validate_edits(text, [
+        {"find": "organize", "replace": "organise", "rule": "British spelling"},
+        {"find": "organize", "replace": "organise", "rule": "British spelling"},
+        {"find": "organize", "replace": "organise"},          # no third occurrence
+        {"find": "colour", "replace": "color"},               # not in the paragraph
+        {"find": "organize and", "replace": "organise and"},  # overlaps the first
+        {"find": "again", "replace": "again"},                # no change
+        "again -> once more",
+    ])
+    assert [(e["start"], e["find"]) for e in edits] == [(3, "organize"), (16, "organize")]
+    assert ai_client.apply_edits(text, edits) == "We organise and organise again."
+
+
+def test_output_is_edits_not_paragraphs(provider):
+    long_text = "Our programme sets out how we organize the works. " * 40
+    ai_client.correct_paragraphs(RULES, {"p0": long_text})
+    assert "Never return whole paragraphs" in provider.systems[0]
+
+
+@pytest.mark.parametrize("backend", ["anthropic", "foundry", "azure_openai"])
+def test_rules_preamble_is_a_cacheable_system_prefix(provider, monkeypatch, backend):
+    monkeypatch.setattr(ai_client, "AI_PROVIDER", backend)
+    metrics = ValidationMetrics("a", "a.docx", {})
+    with bind_metrics(metrics):
+        ai_client.correct_paragraphs(RULES, _paragraphs())
+
+    calls = len(provider.systems)
+    assert calls > 1 and len(set(provider.systems)) == 1
+    assert "British spelling" in provider.systems[0] and "organize" not in provider.systems[0]
+    if backend != "azure_openai":
+        assert provider.cache_markers == [{"type": "ephemeral"}] * calls
+    assert metrics.claude_input_tokens == 60 * calls
+    assert metrics.to_audit_entry()["ai_usage"]["cached_input_tokens"] == 50 * (calls - 1)
+
+
+def test_preamble_does_not_depend_on_rule_order():
+    rules = [{"title": t, "rule_type": k} for t, k in
+             (("Spelling", "Language"), ("Tone", "Language"), ("Serial comma", "Punctuation"))]
+    assert ai_client.build_system_prompt(rules) == ai_client.build_system_prompt(list(reversed(rules)))
+
+
+def test_repeat_paragraphs_come_from_the_cache(provider):
+    paragraphs = _paragraphs(10)
+    first_metrics, second_metrics = ValidationMetrics("a", "a.docx", {}), ValidationMetrics("b", "b.docx", {})
+    with bind_metrics(first_metrics):
+        first = ai_client.correct_paragraphs(RULES, paragraphs)
+    calls = len(provider.prompts)
+    # Another document sharing the same boilerplate, with different outer whitespace
+    shared = {"x1": "  " + paragraphs["p3"], "x2": paragraphs["p7"] + " "}
+    with bind_metrics(second_metrics):
+        second = ai_client.correct_paragraphs(RULES, shared)
+
+    assert len(provider.prompts) == calls
+    assert second["cached"] == 2 and second["changes_made"] == 2
+    assert second["corrections"] == {"x1": "  " + first["corrections"]["p3"],
+                                     "x2": first["corrections"]["p7"] + " "}
+    audit = second_metrics.to_audit_entry()["ai_usage"]
+    assert audit["claude_calls"] == 0 and audit["cache_hits"] == 2 and audit["cache_misses"] == 0
+    assert 0 < audit["saved_input_tokens"] < first_metrics.claude_input_tokens
+    assert first_metrics.ai_cache_misses == 10
+
+
+def test_rules_or_model_change_misses_the_cache(provider, monkeypatch):
+    paragraphs = {"p0": "We organize the site."}
+    ai_client.correct_paragraphs(RULES, paragraphs)
+    ai_client.correct_paragraphs(RULES + [{"title": "No jargon", "rule_type": "Language"}], paragraphs)
+    monkeypatch.setattr("ValidateDocument.ai_cache.CLAUDE_MODEL", "another-model")
+    ai_client.correct_paragraphs(RULES, paragraphs)
+    assert len(provider.prompts) == 3
+
+
+def test_local_store_is_shared_between_workers(provider, tmp_path):
+    paragraphs = {"p0": "We organize the site."}
+    set_ai_cache(ResultCache(1024 * 1024, LocalResultStore(str(tmp_path))))
+    ai_client.correct_paragraphs(RULES, paragraphs)
+    set_ai_cache(ResultCache(1024 * 1024, LocalResultStore(str(tmp_path))))  # a fresh worker
+    result = ai_client.correct_paragraphs(RULES, paragraphs)
+    assert len(provider.prompts) == 1
+    assert result["corrections"] == {"p0": "We organise the site."}
+
+
+def _word_doc():
+    from docx import Document
+    doc = Document()
+    doc.add_heading("Programme overview", level=1)
+    intro = doc.add_paragraph()
+    intro.add_run("We will ").bold = True
+    intro.add_run("organize the site compound before mobilisation.")
+    table = doc.add_table(rows=2, cols=2)
+    table.cell(0, 0).text = "Ref"
+    table.cell(0, 1).text = "MACE-PRJ-0042"
+    table.cell(1, 0).text = "Value"
+    table.cell(1, 1).text = "1,250,000"
+    doc.add_paragraph("The contractor will organize deliveries around school hours.")
+    return doc
+
+
+def _validate_with_fake_ai(monkeypatch, selection, auto_fix=True):
+    from io import BytesIO
+    from ValidateDocument import word_validator
+
+    sent = []
+
+    def fake_ai(ai_rules, paragraphs):
+        sent.append(dict(paragraphs))
+        edits = {pid: ai_client.validate_edits(text, [{"find": "organize", "replace": "organise",
+                                                       "rule": "British spelling"}])
+                 for pid, text in paragraphs.items()}
+        return {"edits": edits, "changes_made": 2, "cached": 0, "errors": []}
+
+    monkeypatch.setattr(word_validator, "correct_paragraphs", fake_ai)
+    monkeypatch.setattr(word_validator, "AI_PARAGRAPH_SELECTION", selection)
+    monkeypatch.setattr(word_validator, "get_paragraph_cache", lambda: None)
+    stream = BytesIO()
+    _word_doc().save(stream)
+    stream.seek(0)
+    rule = dict(RULES[0], doc_type="Word", auto_fix=auto_fix)
+    return word_validator.validate_word_document(stream, [rule]), sent[0]
+
+
+def test_candidate_mode_sends_prose_only(monkeypatch):
+    _, everything = _validate_with_fake_ai(monkeypatch, "all")
+    result, candidates = _validate_with_fake_ai(monkeypatch, "candidates")
+
+    assert len(everything) == 7
+    assert sorted(candidates.values()) == ["The contractor will organize deliveries around school hours.",
+                                           "We will organize the site compound before mobilisation."]
+    # IDs are positions among the non-empty paragraphs (body first, then table cells)
+    assert set(candidates) == {"p1", "p2"}
+    ai_fix = next(f for f in result["fixes_applied"] if f["rule_type"] == "AI")
+    assert [c["location"] for c in ai_fix["changes"]] == ["Paragraph 2", "Paragraph 3"]
+
+
+def test_edit_keeps_formatting_of_untouched_runs(monkeypatch):
+    result, _ = _validate_with_fake_ai(monkeypatch, "candidates")
+    intro = result["document"].paragraphs[1]
+    assert [(r.text, r.bold) for r in intro.runs] == [
+        ("We will ", True), ("organise the site compound before mobilisation.", None)]
+
+
+def test_suggest_only_rule_proposes_tracked_changes(monkeypatch):
+    from docx.oxml.ns import qn
+    result, _ = _validate_with_fake_ai(monkeypatch, "candidates", auto_fix=False)
+    intro = result["document"].paragraphs[1]
+    assert [t.text for t in intro._p.iter(qn("w:delText"))] == ["organize"]
+    assert [t.text for ins in intro._p.iter(qn("w:ins")) for t in ins.iter(qn("w:t"))] == ["organise"]
+    assert intro.runs[0].text == "We will " and intro.runs[0].bold
+    ai_fix = next(f for f in result["fixes_applied"] if f["rule_type"] == "AI")
+    assert ai_fix["fixed_value"] == "2 proposed as tracked changes to accept or reject"
+
+
+def test_provider_client_is_created_once_per_worker(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+    monkeypatch.setattr(ai_client, "AI_PROVIDER", "anthropic")
+    ai_client.set_ai_client(None)
+    try:
+        client = ai_client.get_ai_client()
+        assert ai_client.get_ai_client() is client
+        assert client.timeout.connect == ai_client.AI_CONNECT_TIMEOUT_SECONDS
+        ai_client.set_ai_client(None)
+        assert ai_client.get_ai_client() is not client
+    finally:
+        ai_client.set_ai_client(None)
+
+
+def test_chunks_reuse_pooled_connections(monkeypatch):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from ai_stub import AIStub
+
+    model = AIStub()
+
+    class Messages(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            text = model.answer(body["messages"][0]["content"])
+            payload = json.dumps({"id": "msg_1", "type": "message", "role": "assistant", "model": "stub",
+                                  "content": [{"type": "text", "text": text}], "stop_reason": "end_turn",
+                                  "stop_sequence": None, "usage": {"input_tokens": 10, "output_tokens": 5}})
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload.encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Messages)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+    monkeypatch.setenv("ANTHROPIC_BASE_URL", f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setattr(ai_client, "AI_PROVIDER", "anthropic")
+    monkeypatch.setattr(ai_client, "ENABLE_CLAUDE_AI", True)
+    monkeypatch.setattr(ai_client, "AI_CHUNK_TOKENS", 200)
+    monkeypatch.setattr(ai_client, "AI_MAX_PARALLEL", 2)
+    ai_client.set_ai_client(None)
+    set_ai_cache(None)
+    monkeypatch.setattr("ValidateDocument.ai_cache.AI_CACHE_MAX_MB", 0)
+    try:
+        metrics = ValidationMetrics("a", "a.docx", {})
+        with bind_metrics(metrics):
+            first = ai_client.correct_paragraphs(RULES, _paragraphs())
+            ai_client.correct_paragraphs(RULES, _paragraphs())
+    finally:
+        ai_client.set_ai_client(None)
+        server.shutdown()
+
+    assert first["changes_made"] == 40
+    usage = metrics.to_audit_entry()["ai_usage"]
+    assert usage["http_requests"] == metrics.claude_calls > 4
+    assert 1 <= usage["new_connections"] <= 2
+    assert usage["reused_connections"] == usage["http_requests"] - usage["new_connections"]
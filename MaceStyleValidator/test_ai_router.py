@@ -0,0 +1,195 @@
+"""AI provider router: failover, circuit breaker and hedging, driven by local stub providers"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from ai_stub import AIStub
+from ValidateDocument import ai_client
+from ValidateDocument.ai_cache import set_ai_cache
+from ValidateDocument.ai_router import ProviderRouter, set_ai_router
+from ValidateDocument.monitoring import ValidationMetrics, bind_metrics, get_health_status
+from ValidateDocument.result_cache import ResultCache
+
+PROVIDERS = ["anthropic", "azure_openai"]
+
+
+class Backend:
+    """request(provider) stand-in: answers after `delay`, or raises while `failing`."""
+
+    def __init__(self, name, delay=0.0, failing=False):
+        self.name, self.delay, self.failing, self.calls = name, delay, failing, 0
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.failing:
+            raise RuntimeError(f"{self.name} overloaded")
+        return f"answer from {self.name}"
+
+
+def _request(*backends):
+    by_name = {b.name: b for b in backends}
+    return lambda provider: by_name[provider]()
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_failed_call_fails_over_to_the_next_backend():
+    primary, fallback = Backend("anthropic", failing=True), Backend("azure_openai")
+    metrics = ValidationMetrics("r", "a.docx", {})
+    with bind_metrics(metrics):
+        result, provider = ProviderRouter().route(_request(primary, fallback), PROVIDERS)
+    assert (result, provider) == ("answer from azure_openai", "azure_openai")
+    usage = metrics.to_audit_entry()["ai_usage"]
+    assert usage["providers"] == {"azure_openai": 1} and usage["failovers"] == 1
+
+
+def test_circuit_opens_after_repeated_failures_and_recovers():
+    clock = Clock()
+    router = ProviderRouter(failure_threshold=3, open_seconds=60, clock=clock)
+    primary, fallback = Backend("anthropic", failing=True), Backend("azure_openai")
+    request = _request(primary, fallback)
+
+    for _ in range(5):
+        router.route(request, PROVIDERS)
+    assert primary.calls == 3   # skipped once its circuit opened
+    assert router.status()["anthropic"]["circuit"] == "open"
+    assert router.status()["anthropic"]["error_rate"] == 1.0
+
+    clock.now += 61
+    primary.failing = False
+    assert router.route(request, PROVIDERS)[1] == "anthropic"
+    assert router.status()["anthropic"]["circuit"] == "closed"
+
+
+def test_every_circuit_open_fails_fast():
+    router = ProviderRouter(failure_threshold=1, clock=Clock())
+    backend = Backend("anthropic", failing=True)
+    with pytest.raises(RuntimeError, match="overloaded"):
+        router.route(_request(backend), ["anthropic"])
+    with pytest.raises(RuntimeError, match="circuit open"):
+        router.route(_request(backend), ["anthropic"])
+    assert backend.calls == 1
+
+
+def test_half_open_circuit_lets_one_trial_call_through():
+    import threading
+    clock = Clock()
+    router = ProviderRouter(failure_threshold=1, open_seconds=60, clock=clock)
+    primary, fallback = Backend("anthropic", failing=True), Backend("azure_openai")
+    router.route(_request(primary, fallback), PROVIDERS)
+    clock.now += 61
+    primary.failing, primary.delay = False, 0.3
+
+    trial = threading.Thread(target=router.route, args=(_request(primary, fallback), PROVIDERS))
+    trial.start()
+    time.sleep(0.1)
+    assert router.status()["anthropic"]["circuit"] == "half-open"
+    assert router.route(_request(primary, fallback), PROVIDERS)[1] == "azure_openai"
+    trial.join()
+    assert primary.calls == 2 and router.status()["anthropic"]["circuit"] == "closed"
+
+
+def test_slow_call_is_hedged_to_the_second_backend():
+    router = ProviderRouter(hedge_percentile=95, hedge_min_samples=20)
+    for _ in range(20):
+        router.health("anthropic").record(True, 0.02)
+    primary, fallback = Backend("anthropic", delay=1.0), Backend("azure_openai", delay=0.01)
+    metrics = ValidationMetrics("r", "a.docx", {})
+
+    start = time.monotonic()
+    with bind_metrics(metrics):
+        result, provider = router.route(_request(primary, fallback), PROVIDERS)
+    assert provider == "azure_openai" and time.monotonic() - start < 0.5
+    assert metrics.ai_hedged_calls == 1
+
+
+def test_no_hedging_until_enough_samples():
+    router = ProviderRouter(hedge_percentile=95, hedge_min_samples=20)
+    primary, fallback = Backend("anthropic", delay=0.05), Backend("azure_openai")
+    assert router.route(_request(primary, fallback), PROVIDERS)[1] == "anthropic"
+    assert fallback.calls == 0
+
+
+class DownProvider:
+    """An Anthropic-surface client whose every call fails."""
+
+    def __init__(self):
+        self.messages = SimpleNamespace(create=self._create)
+
+    def _create(self, **kwargs):
+        raise RuntimeError("529 overloaded")
+
+
+def test_chunks_fail_over_through_generate(monkeypatch):
+    down, azure = DownProvider(), AIStub()
+    models = []
+    create = azure.chat.completions.create
+
+    def record_model(**kwargs):
+        models.append(kwargs["model"])
+        return create(**kwargs)
+
+    azure.chat.completions.create = record_model
+    monkeypatch.setattr(ai_client, "ENABLE_CLAUDE_AI", True)
+    monkeypatch.setattr(ai_client, "AI_PROVIDER", "anthropic")
+    monkeypatch.setattr(ai_client, "AI_FALLBACK_PROVIDERS", ["azure_openai"])
+    monkeypatch.setattr(ai_client, "AI_FALLBACK_MODELS", {"azure_openai": "gpt-5-mini"})
+    ai_client.set_ai_client(down, "anthropic")
+    ai_client.set_ai_client(azure, "azure_openai")
+    set_ai_router(ProviderRouter())
+    set_ai_cache(ResultCache(1024 * 1024))
+    rules = [{"title": "British spelling", "rule_type": "Language"}]
+    try:
+        first = ai_client.correct_paragraphs(rules, {"p0": "We organize the site."})
+        ai_client.correct_paragraphs(rules, {"p0": "We organize the site."})
+        health = get_health_status()["checks"]["ai_providers"]
+    finally:
+        ai_client.set_ai_client(None)
+        set_ai_router(None)
+        set_ai_cache(None)
+
+    assert first["corrections"] == {"p0": "We organise the site."}
+    assert models == ["gpt-5-mini", "gpt-5-mini"]   # fallback answers are not cached
+    assert health["providers"]["anthropic"]["error_rate"] == 1.0
+
+
+class SlowProvider:
+    """An Anthropic-surface client whose calls time out."""
+
+    def __init__(self):
+        self.messages = SimpleNamespace(create=self._create)
+
+    def _create(self, **kwargs):
+        raise httpx.ReadTimeout("timed out")
+
+
+def test_timeout_at_the_deadline_is_not_a_provider_failure(monkeypatch):
+    from ValidateDocument.deadline import Deadline, DeadlineExceeded, bind_deadline
+    monkeypatch.setattr(ai_client, "AI_PROVIDER", "anthropic")
+    monkeypatch.setattr(ai_client, "AI_CHUNK_SECONDS", 0.01)
+    router = ProviderRouter(failure_threshold=1)
+    set_ai_router(router)
+    ai_client.set_ai_client(SlowProvider(), "anthropic")
+    rules = [{"title": "British spelling", "rule_type": "Language"}]
+    try:
+        with bind_deadline(Deadline(5, reserve_seconds=0)), pytest.raises(DeadlineExceeded):
+            ai_client.correct_chunk(["anthropic"], rules, {"p0": "We organize the site."})
+        with pytest.raises(httpx.ReadTimeout):   # without a deadline it is the provider's
+            ai_client.correct_chunk(["anthropic"], rules, {"p0": "We organize the site."})
+    finally:
+        ai_client.set_ai_client(None)
+        set_ai_router(None)
+    assert router.status()["anthropic"]["calls"] == 1
@@ -0,0 +1,207 @@
+"""ValidateBatch: many documents per call, one AI pass, a process pool and NDJSON results"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import base64
+import json
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import azure.functions as func
+import pytest
+from docx import Document
+
+from ai_stub import AIStub
+from graph_stub import GraphStub
+from ValidateDocument import ai_batch, ai_client, batch, deadline, sharepoint_client
+from ValidateDocument.ai_cache import set_ai_cache
+from ValidateDocument.ai_router import ProviderRouter, set_ai_router
+from ValidateDocument.batch import validate_batch, set_validation_pool
+from ValidateDocument.graph_client import GraphClient, set_graph_client
+from ValidateDocument.result_cache import ResultCache
+
+RULES = [{"title": "British spelling", "rule_type": "Language", "doc_type": "Word", "check_value": "",
+          "expected_value": "", "auto_fix": True, "use_ai": True, "priority": 10}]
+
+
+def _docx(*paragraphs):
+    doc = Document()
+    for text in paragraphs:
+        doc.add_paragraph(text)
+    out = BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+def _zip(files):
+    out = BytesIO()
+    with zipfile.ZipFile(out, "w") as archive:
+        for name, data in files.items():
+            archive.writestr(name, data)
+    return out.getvalue()
+
+
+def _post(body, content_type="application/json"):
+    if not isinstance(body, bytes):
+        body = json.dumps(body).encode()
+    req = func.HttpRequest(method="POST", url="/api/ValidateBatch", body=body, headers={"Content-Type": content_type})
+    return validate_batch(req)
+
+
+def _lines(response):
+    assert response.status_code == 200 and response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_body().decode().splitlines()]
+    return {line["fileName"]: line for line in lines[:-1]}, lines[-1]
+
+
+def _fixed_text(line):
+    return [p.text for p in Document(BytesIO(base64.b64decode(line["fixedFileContent"]))).paragraphs]
+
+
+@pytest.fixture
+def env(monkeypatch):
+    stub = AIStub()
+    for module in (ai_client, ai_batch):
+        monkeypatch.setattr(module, "ENABLE_CLAUDE_AI", True)
+        monkeypatch.setattr(module, "AI_PROVIDER", "anthropic")
+    monkeypatch.setattr(ai_client, "AI_FALLBACK_PROVIDERS", [])
+    monkeypatch.setattr(ai_client, "AI_CHUNK_TOKENS", 20)   # one paragraph per chunk
+    monkeypatch.setattr(ai_client, "AI_MAX_PARALLEL", 2)
+    fetches = []
+    monkeypatch.setattr(batch, "fetch_validation_rules", lambda token: fetches.append(token) or RULES)
+    audit = []
+    monkeypatch.setattr(batch, "emit_audit_event", audit.append)
+    result_cache = ResultCache(1024 * 1024)
+    monkeypatch.setattr(batch, "get_result_cache", lambda: result_cache)
+    ai_client.set_ai_client(stub, "anthropic")
+    set_ai_router(ProviderRouter())
+    set_ai_cache(ResultCache(1024 * 1024))
+    pool = ThreadPoolExecutor(max_workers=2)
+    set_validation_pool(pool)
+    stub.fetches, stub.audit = fetches, audit
+    yield stub
+    set_validation_pool(None)
+    pool.shutdown(wait=True)   # nothing a test left running reaches the next test's stubs
+    ai_client.set_ai_client(None)
+    set_ai_router(None)
+    set_ai_cache(None)
+
+
+def test_zip_is_validated_in_worker_processes_with_one_ai_pass(env, monkeypatch):
+    # The pool processes start from the environment: AI on, but no client of their own
+    monkeypatch.setenv("ENABLE_CLAUDE_AI", "true")
+    monkeypatch.setenv("AI_PROVIDER", "anthropic")
+    monkeypatch.delenv("ANTHROPIC_API_KEY", raising=False)
+    monkeypatch.setattr(batch, "BATCH_PROCESSES", 2)
+    set_validation_pool(None)
+    shared = ["The team will organize the site.", "Access is from the north gate."]
+    body = _zip({"Alpha/plan.docx": _docx(*shared), "Beta/spec.docx": _docx(shared[0], "Then finalize the color scheme."),
+                 "Beta/notes.txt": b"not a document"})
+
+    results, summary = _lines(_post(body, "application/zip"))
+    assert summary["summary"]["documents"] == 3 and summary["summary"]["validated"] == 2
+    assert results["notes.txt"]["error"] == "Unsupported file type: .txt"
+    assert _fixed_text(results["plan.docx"])[0] == "The team will organise the site."
+    assert _fixed_text(results["spec.docx"]) == ["The team will organise the site.", "Then finalise the colour scheme."]
+    assert results["spec.docx"]["reportHtml"].lstrip().lower().startswith("<!doctype html")
+    assert env.calls == 3   # three distinct paragraphs, each sent once, from this process
+    assert env.fetches == [None] and len(env.audit) == 3
+
+
+def test_file_urls_share_one_token_and_are_written_back(env, monkeypatch):
+    monkeypatch.setenv("SHAREPOINT_SITE_URL", "https://stub.sharepoint.com/sites/Style")
+    monkeypatch.setattr(batch, "ENABLE_FUNCTION_SHAREPOINT_WRITES", True)
+    tokens = []
+    monkeypatch.setattr(batch, "get_graph_token", lambda: tokens.append(1) or "t")
+    sharepoint_client.invalidate_site_cache()
+    with GraphStub() as graph:
+        set_graph_client(GraphClient(base_url=graph.base_url, rate_per_second=0))
+        try:
+            for n in range(3):
+                graph.put_file(f"/Reports/doc{n}.docx", _docx(f"Plan {n}: organize the access routes."))
+            urls = [f"/sites/Style/Shared Documents/Reports/doc{n}.docx" for n in range(3)]
+            results, summary = _lines(_post({"fileUrls": urls + ["/sites/Style/Shared Documents/gone.docx"]}))
+        finally:
+            set_graph_client(None)
+            sharepoint_client.invalidate_site_cache()
+
+    assert tokens == [1] and env.fetches == [None]
+    assert results["gone.docx"]["status"] == "Error" and "Download failed" in results["gone.docx"]["error"]
+    assert summary["summary"] == {**summary["summary"], "validated": 3, "failed": 1}
+    for n in range(3):
+        line = results[f"doc{n}.docx"]
+        assert line["issuesFixed"] == 1 and line["reportUrl"] and "reportHtml" not in line
+        assert f"/Reports/doc{n}_ValidationReport.html" in graph.files
+        assert Document(BytesIO(graph.files[f"/Reports/doc{n}.docx"])).paragraphs[0].text == \
+            f"Plan {n}: organise the access routes."
+
+
+def test_documents_not_done_in_the_time_budget_are_reported(env, monkeypatch):
+    monkeypatch.setattr(deadline, "VALIDATION_BUDGET_SECONDS", 0.5)
+    monkeypatch.setattr(deadline, "VALIDATION_RESERVE_SECONDS", 0)
+    validate_document = batch.validate_document
+    late = []
+
+    def slow_for_big(extension, data, rules, ai_entries=None, expires_at=None):
+        if len(Document(BytesIO(data)).paragraphs) > 1:
+            time.sleep(1)
+            try:
+                return validate_document(extension, data, rules, ai_entries, expires_at)
+            except deadline.DeadlineExceeded as e:
+                late.append(e)
+                raise
+        return validate_document(extension, data, rules, ai_entries, expires_at)
+
+    monkeypatch.setattr(batch, "validate_document", slow_for_big)
+    body = _zip({"small.docx": _docx("We organize it."), "big.docx": _docx("One.", "Two.")})
+    results, summary = _lines(_post(body, "application/zip"))
+    assert results["small.docx"]["status"] != "Error"
+    assert results["big.docx"]["error"] == "Not validated: the batch's time budget ran out"
+    assert summary["summary"]["notValidated"] == 1
+
+    # The validation still running when the batch answered stopped itself
+    calls = env.calls
+    time.sleep(1)
+    assert len(late) == 1 and env.calls == calls
+
+
+def test_identical_documents_are_validated_once(env, monkeypatch):
+    calls = []
+    validate_document = batch.validate_document
+    monkeypatch.setattr(batch, "validate_document", lambda *args: calls.append(1) or validate_document(*args))
+    body = _zip({"a.docx": _docx("We organize it."), "b.docx": _docx("Something else.")})
+    _lines(_post(body, "application/zip"))
+    results, _ = _lines(_post(body, "application/zip"))
+    assert len(calls) == 2 and results["a.docx"]["issuesFixed"] == 1
+
+
+def test_result_the_ai_failed_on_is_validated_again(env, monkeypatch):
+    calls = []
+    validate_document = batch.validate_document
+    monkeypatch.setattr(batch, "validate_document", lambda *args: calls.append(1) or validate_document(*args))
+    answer = env.answer
+
+    def unavailable(prompt):
+        raise RuntimeError("provider unavailable")
+
+    monkeypatch.setattr(env, "answer", unavailable)
+    body = _zip({"a.docx": _docx("We organize it.")})
+    results, _ = _lines(_post(body, "application/zip"))
+    assert results["a.docx"]["issuesFixed"] == 0
+
+    monkeypatch.setattr(env, "answer", answer)
+    results, _ = _lines(_post(body, "application/zip"))
+    assert len(calls) == 2 and results["a.docx"]["issuesFixed"] == 1
+
+
+def test_bad_batches_are_rejected(env, monkeypatch):
+    monkeypatch.setattr(batch, "BATCH_MAX_DOCUMENTS", 2)
+    assert _post(b"not a zip", "application/zip").status_code == 400
+    assert _post({"fileUrls": []}).status_code == 400
+    assert _post({"fileUrls": ["/a.docx", "/b.docx", "/c.docx"]}).status_code == 400
+    assert _post({"documents": [{"fileName": "a.docx"}]}).status_code == 400
+    assert _post(b"[1, 2]").status_code == 400
+    assert env.fetches == []
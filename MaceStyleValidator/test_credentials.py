@@ -0,0 +1,59 @@
+"""Shared MSAL client tests against a local stub token endpoint (graph_stub.py)"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+
+from graph_stub import GraphStub, LoginRedirectSession
+from ValidateDocument import credentials
+from ValidateDocument.config import get_graph_token, get_style_rules_token
+
+
+@pytest.fixture
+def token_stub(monkeypatch):
+    for var in ("STYLE_RULES_TENANT_ID", "STYLE_RULES_CLIENT_ID", "STYLE_RULES_CLIENT_SECRET"):
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setenv("SHAREPOINT_TENANT_ID", "tenant-a")
+    monkeypatch.setenv("SHAREPOINT_CLIENT_ID", "client-a")
+    monkeypatch.setenv("SHAREPOINT_CLIENT_SECRET", "secret-a")
+    with GraphStub() as stub:
+        credentials.set_http_client(LoginRedirectSession(stub))
+        yield stub
+    credentials.set_http_client(None)
+
+
+def test_token_reused_across_calls(token_stub):
+    tokens = {get_graph_token() for _ in range(10)}
+    assert len(tokens) == 1
+    assert token_stub.token_requests == 1
+
+
+def test_rules_token_shares_the_app_when_credentials_match(token_stub):
+    # STYLE_RULES_* fall back to SHAREPOINT_*, so both helpers hit one app.
+    assert get_graph_token() == get_style_rules_token()
+    assert token_stub.token_requests == 1
+
+
+def test_separate_app_per_client(token_stub, monkeypatch):
+    get_graph_token()
+    monkeypatch.setenv("STYLE_RULES_CLIENT_ID", "client-b")
+    get_style_rules_token()
+    get_style_rules_token()
+    assert token_stub.token_requests == 2
+
+
+def test_token_near_expiry_is_refreshed(token_stub):
+    # MSAL treats tokens within five minutes of expiry as expired.
+    token_stub.token_lifetime = 120
+    first = get_graph_token()
+    second = get_graph_token()
+    assert first != second
+    assert token_stub.token_requests == 2
+
+
+def test_rotated_secret_gets_a_new_app(token_stub, monkeypatch):
+    get_graph_token()
+    monkeypatch.setenv("SHAREPOINT_CLIENT_SECRET", "secret-rotated")
+    get_graph_token()
+    assert token_stub.token_requests == 2
@@ -0,0 +1,116 @@
+"""Per-request time budget: rules by priority, AI chunks cut off, partial results instead of a timeout"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import time
+
+import pytest
+
+from ai_stub import AIStub
+from ValidateDocument import ai_client, deadline as deadline_module
+from ValidateDocument.ai_cache import set_ai_cache
+from ValidateDocument.ai_router import ProviderRouter, set_ai_router
+from ValidateDocument.deadline import Deadline, bind_deadline, scheduled
+from ValidateDocument.result_cache import ResultCache
+
+RULES = [{"title": "British spelling", "rule_type": "Language", "auto_fix": True, "use_ai": True}]
+PARAGRAPHS = {f"p{i}": f"Step {i}: the team will organize access to zone {i}." for i in range(6)}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_deadline_keeps_the_reserve():
+    clock = Clock()
+    deadline = Deadline(budget_seconds=100, reserve_seconds=20, clock=clock)
+    assert deadline.remaining() == 80 and deadline.allows(80)
+    clock.now += 50
+    assert not deadline.allows(31) and deadline.allows(30)
+    clock.now += 30
+    assert not deadline.allows()
+    assert not deadline.partial
+
+
+def test_rules_run_by_priority_until_the_budget_runs_low(monkeypatch):
+    monkeypatch.setattr(deadline_module, "RULE_COST_SECONDS", {"Grammar": 0.01})
+    rules = [{"title": name, "rule_type": "Grammar", "priority": p}
+             for name, p in (("low", 9), ("high", 1), ("medium", 5), ("unranked", None))]
+    rules[3].pop("priority")
+    deadline = Deadline(budget_seconds=0.3, reserve_seconds=0)
+    ran = []
+    for rule in scheduled(rules, deadline):
+        ran.append(rule["title"])
+        time.sleep(0.2)   # the next Grammar rule is expected to take as long: it does not fit
+    assert ran == ["high"]
+    assert deadline.skipped == ["rule 'medium'", "rule 'low'", "rule 'unranked'"]
+
+
+def test_a_slow_rule_type_does_not_skip_cheaper_rules_after_it(monkeypatch):
+    monkeypatch.setattr(deadline_module, "RULE_COST_SECONDS", {"Grammar": 0.01, "Punctuation": 0.01, "Font": 5})
+    rules = [{"title": "grammar", "rule_type": "Grammar", "priority": 1},
+             {"title": "fonts", "rule_type": "Font", "priority": 2},
+             {"title": "grammar again", "rule_type": "Grammar", "priority": 3},
+             {"title": "punctuation", "rule_type": "Punctuation", "priority": 4}]
+    deadline = Deadline(budget_seconds=0.3, reserve_seconds=0)
+    ran = []
+    for rule in scheduled(rules, deadline):
+        ran.append(rule["title"])
+        if rule["rule_type"] == "Grammar":
+            time.sleep(0.2)
+    assert ran == ["grammar", "punctuation"]
+    assert deadline.skipped == ["rule 'fonts'", "rule 'grammar again'"]
+
+
+def test_without_a_deadline_every_rule_runs():
+    rules = [{"title": "b", "priority": 2}, {"title": "a", "priority": 1}]
+    assert [r["title"] for r in scheduled(rules)] == ["a", "b"]
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    stub = AIStub(latency=0.2)
+    monkeypatch.setattr(ai_client, "ENABLE_CLAUDE_AI", True)
+    monkeypatch.setattr(ai_client, "AI_PROVIDER", "anthropic")
+    monkeypatch.setattr(ai_client, "AI_FALLBACK_PROVIDERS", [])
+    monkeypatch.setattr(ai_client, "AI_CHUNK_TOKENS", 20)   # one paragraph per chunk
+    monkeypatch.setattr(ai_client, "AI_MAX_PARALLEL", 1)
+    monkeypatch.setattr(ai_client, "AI_CHUNK_SECONDS", 0.01)
+    ai_client.set_ai_client(stub, "anthropic")
+    set_ai_router(ProviderRouter())
+    set_ai_cache(ResultCache(1024 * 1024))
+    yield stub
+    ai_client.set_ai_client(None)
+    set_ai_router(None)
+    set_ai_cache(None)
+
+
+def test_ai_chunks_stop_when_a_call_no_longer_fits(stub):
+    timeouts = []
+    create = stub.messages.create
+
+    def record_timeout(**kwargs):
+        timeouts.append(kwargs.get("timeout"))
+        return create(**kwargs)
+
+    stub.messages.create = record_timeout
+    with bind_deadline(Deadline(budget_seconds=0.5, reserve_seconds=0)) as deadline:
+        result = ai_client.correct_paragraphs(RULES, PARAGRAPHS)
+
+    assert 1 <= stub.calls < len(PARAGRAPHS)
+    assert result["skipped"] == len(PARAGRAPHS) - stub.calls and result["errors"] == []
+    assert len(result["corrections"]) == stub.calls
+    assert deadline.skipped == [f"AI rules on {result['skipped']} paragraph(s)"]
+    assert all(0 < t <= 0.5 for t in timeouts)   # no call may outlast the budget
+
+
+def test_no_time_left_sends_nothing_and_does_not_fail(stub):
+    with bind_deadline(Deadline(budget_seconds=0)) as deadline:
+        result = ai_client.correct_paragraphs(RULES, PARAGRAPHS)
+    assert stub.calls == 0 and result["skipped"] == len(PARAGRAPHS)
+    assert deadline.partial
@@ -0,0 +1,126 @@
+"""Graph $batch tests against graph_stub: chunking, dependsOn, throttled sub-requests, write-back"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+
+from graph_stub import GraphStub
+from ValidateDocument import sharepoint_client
+from ValidateDocument.graph_batch import GraphBatch, MAX_BATCH_REQUESTS
+from ValidateDocument.graph_client import GraphClient, set_graph_client
+from ValidateDocument.sharepoint_results import write_back_results
+
+DOC_PATH = "/sites/Style/Shared Documents/Reports/test.docx"
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setenv("SHAREPOINT_SITE_URL", "https://stub.sharepoint.com/sites/Style")
+    sharepoint_client.invalidate_site_cache()
+    with GraphStub() as graph:
+        set_graph_client(GraphClient(base_url=graph.base_url, rate_per_second=0))
+        yield graph
+    set_graph_client(None)
+    sharepoint_client.invalidate_site_cache()
+
+
+def test_batch_splits_at_twenty_requests(stub):
+    batch = GraphBatch("t")
+    ids = [batch.add("GET", f"/sites/{stub.site_id}/drive") for _ in range(MAX_BATCH_REQUESTS + 5)]
+    responses = batch.execute()
+    assert batch.round_trips == 2
+    assert stub.paths("POST") == ["/v1.0/$batch"] * 2
+    assert all(responses[i].status_code == 200 for i in ids)
+
+
+def test_independent_requests_fill_batches_around_a_chain(stub):
+    batch = GraphBatch("t")
+    ids = [batch.add("GET", f"/sites/{stub.site_id}/drive") for _ in range(15)]
+    chain = [batch.add("GET", f"/sites/{stub.site_id}/drive")]
+    for _ in range(9):
+        chain.append(batch.add("GET", f"/sites/{stub.site_id}/drive", depends_on=[chain[-1]]))
+    ids += [batch.add("GET", f"/sites/{stub.site_id}/drive") for _ in range(10)]
+    chunks = batch._chunks(batch._requests)
+    assert [len(chunk) for chunk in chunks] == [15, 20]   # the chain of 10 does not fit beside the first 15
+    assert all(len(chunk) <= MAX_BATCH_REQUESTS for chunk in chunks)
+    responses = batch.execute()
+    assert batch.round_trips == 2
+    assert all(responses[i].status_code == 200 for i in ids + chain)
+
+
+def test_dependency_chain_longer_than_a_batch_is_rejected(stub):
+    batch = GraphBatch("t")
+    previous = batch.add("GET", f"/sites/{stub.site_id}/drive")
+    for _ in range(MAX_BATCH_REQUESTS):
+        previous = batch.add("GET", f"/sites/{stub.site_id}/drive", depends_on=[previous])
+    with pytest.raises(ValueError, match="21 requests are joined by dependsOn"):
+        batch.execute()
+    assert stub.paths("POST") == []
+
+
+def test_failed_dependency_is_not_run(stub):
+    batch = GraphBatch("t")
+    missing = batch.add("GET", f"/sites/{stub.site_id}/drive/root:/nope.docx")
+    after = batch.add("PATCH", f"/sites/{stub.site_id}/lists/docs/items/1/fields", {"A": 1}, depends_on=[missing])
+    responses = batch.execute()
+    assert responses[missing].status_code == 404
+    assert responses[after].status_code == 424
+    assert "docs" not in stub.list_items
+
+
+def test_throttled_sub_requests_are_rebatched_after_retry_after(stub):
+    slept = []
+    stub.inject_fault(429, times=1, retry_after=3, path="/lists/docs/items/1")
+    batch = GraphBatch("t", sleep=slept.append)
+    first = batch.add("PATCH", f"/sites/{stub.site_id}/lists/docs/items/1/fields", {"A": 1})
+    second = batch.add("PATCH", f"/sites/{stub.site_id}/lists/docs/items/2/fields", {"B": 2})
+    responses = batch.execute()
+    assert slept == [3.0]
+    assert batch.round_trips == 2
+    assert responses[first].ok and responses[second].ok
+    # Only the throttled request went out again
+    assert [p for _m, p, _q in stub.batch_requests].count(f"/sites/{stub.site_id}/lists/docs/items/2/fields") == 1
+    assert stub.list_items["docs"]["1"] == {"A": 1}
+
+
+def test_write_back_uses_two_round_trips(stub):
+    stub.files["/Reports/test.docx"] = b"doc"
+    stub.file_ids["/Reports/test.docx"] = "stub-item-7"
+    results = write_back_results(
+        "t", stub.site_id, "test.docx", issues_count=3, fixes_count=1, status="Review Required",
+        report_url="https://stub/report.html", report_drive_item_id="stub-item-9",
+        file_url=DOC_PATH, item_id="7",
+    )
+    assert results["list_item_url"].endswith("DispForm.aspx?ID=1")
+    batches = [p for p in stub.paths("POST") if p.endswith("$batch")]
+    assert len(batches) == 2
+
+    result_item = stub.list_items["list-validation-results"]["1"]
+    assert result_item["Status"] == "Review Required"
+    assert result_item["ReportLink"]["Url"] == "https://stub/report.html"
+    document = stub.list_items["doc-library-list"]["7"]
+    assert document["ValidationStatus"] == "Review Required"
+    assert document["ValidationResultLink"]["Url"] == results["list_item_url"]
+
+
+def test_write_back_still_sets_status_when_results_item_fails(stub):
+    stub.inject_fault(400, times=1, path="/lists/list-validation-results/items")
+    results = write_back_results("t", stub.site_id, "test.docx", 0, 2, "Auto-Fixed — Awaiting Review", item_id="7")
+    assert results is None
+    assert stub.list_items["doc-library-list"]["7"]["ValidationStatus"] == "Auto-Fixed — Awaiting Review"
+    assert "ValidationResultLink" not in stub.list_items["doc-library-list"]["7"]
+
+
+def test_write_back_survives_a_missing_sub_response(stub, monkeypatch):
+    execute = GraphBatch.execute
+
+    def drop_result_item(self):
+        responses = execute(self)
+        responses.pop("resultItem", None)   # e.g. its chunk was never answered
+        return responses
+
+    monkeypatch.setattr(GraphBatch, "execute", drop_result_item)
+    results = write_back_results("t", stub.site_id, "test.docx", 0, 2, "Auto-Fixed — Awaiting Review", item_id="7")
+    assert results is None
+    assert stub.list_items["doc-library-list"]["7"]["ValidationStatus"] == "Auto-Fixed — Awaiting Review"
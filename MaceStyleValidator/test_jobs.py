@@ -0,0 +1,180 @@
+"""Asynchronous validation jobs: queued, run in checkpointed stages, resumed after a time budget or a failure"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import base64
+import json
+from io import BytesIO
+
+import azure.functions as func
+import pytest
+from docx import Document
+
+from ai_stub import AIStub
+from job_queue_stub import JobQueue
+from ValidateDocument import ai_client, deadline, jobs
+from ValidateDocument.ai_cache import set_ai_cache
+from ValidateDocument.ai_router import ProviderRouter, set_ai_router
+from ValidateDocument.jobs import JobStore, submit_job, job_status, run_job
+from ValidateDocument.result_cache import LocalResultStore, ResultCache
+
+RULES = [{"title": "British spelling", "rule_type": "Language", "doc_type": "Word", "check_value": "",
+          "expected_value": "", "auto_fix": True, "use_ai": True, "priority": 10}]
+
+
+def _docx(paragraphs=6):
+    doc = Document()
+    for i in range(paragraphs):
+        doc.add_paragraph(f"Step {i}: the team will organize access to zone {i}.")
+    out = BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+def _submit(store, queue, **fields):
+    req = func.HttpRequest(method="POST", url="http://localhost:7071/api/ValidateDocumentAsync",
+                           body=json.dumps(fields).encode(), headers={"Content-Type": "application/json"})
+    return submit_job(req, queue.send, store=store)
+
+
+def _status(store, job_id):
+    req = func.HttpRequest(method="GET", url=f"http://localhost:7071/api/ValidationJobs/{job_id}", body=b"")
+    response = job_status(req, job_id, store=store)
+    return response.status_code, json.loads(response.get_body())
+
+
+def _worker(store):
+    return lambda message, enqueue: run_job(message, enqueue, store=store)
+
+
+@pytest.fixture
+def env(monkeypatch, tmp_path):
+    stub = AIStub()
+    for module in (ai_client, jobs):
+        monkeypatch.setattr(module, "ENABLE_CLAUDE_AI", True)
+        monkeypatch.setattr(module, "AI_PROVIDER", "anthropic")
+        monkeypatch.setattr(module, "AI_FALLBACK_PROVIDERS", [])
+        monkeypatch.setattr(module, "AI_MAX_PARALLEL", 1)
+    monkeypatch.setattr(ai_client, "AI_CHUNK_TOKENS", 20)   # one paragraph per chunk
+    monkeypatch.setattr(ai_client, "AI_CHUNK_SECONDS", 0.01)
+    fetches = []
+    monkeypatch.setattr(jobs, "fetch_validation_rules", lambda token: fetches.append(token) or RULES)
+    monkeypatch.setattr(jobs, "emit_audit_event", lambda entry: None)
+    ai_client.set_ai_client(stub, "anthropic")
+    set_ai_router(ProviderRouter())
+    set_ai_cache(ResultCache(1024 * 1024))
+    stub.fetches = fetches
+    yield stub, JobStore(LocalResultStore(str(tmp_path))), JobQueue()
+    ai_client.set_ai_client(None)
+    set_ai_router(None)
+    set_ai_cache(None)
+
+
+def test_job_is_queued_and_runs_to_a_result(env):
+    stub, store, queue = env
+    response = _submit(store, queue, fileName="plan.docx", fileContent=base64.b64encode(_docx()).decode())
+    accepted = json.loads(response.get_body())
+    assert response.status_code == 202
+    assert accepted["statusUrl"] == f"http://localhost:7071/api/ValidationJobs/{accepted['jobId']}"
+    assert response.headers["Location"] == accepted["statusUrl"]
+    assert _status(store, accepted["jobId"])[1]["status"] == "queued"
+
+    queue.run(_worker(store))
+    code, body = _status(store, accepted["jobId"])
+    assert code == 200 and body["status"] == "done" and body["runs"] == 1
+    assert body["progress"] == {"aiChunks": 6, "aiChunksDone": 6}
+    assert stub.calls == 6   # the validate stage answered every paragraph from the kept chunks
+    result = body["result"]
+    assert result["issuesFixed"] == 1 and result["reportHtml"].lstrip().lower().startswith("<!doctype html")
+    fixed = Document(BytesIO(base64.b64decode(result["fixedFileContent"])))
+    assert fixed.paragraphs[3].text == "Step 3: the team will organise access to zone 3."
+
+
+def test_time_budget_checkpoints_and_resumes_without_repeating_chunks(env, monkeypatch):
+    stub, store, queue = env
+    stub.latency = 0.2
+    monkeypatch.setattr(jobs, "JOB_BUDGET_SECONDS", 0.5)
+    monkeypatch.setattr(deadline, "VALIDATION_RESERVE_SECONDS", 0)
+    job_id = json.loads(_submit(store, queue, fileName="plan.docx",
+                                fileContent=base64.b64encode(_docx()).decode()).get_body())["jobId"]
+
+    queue.run(_worker(store))
+    body = _status(store, job_id)[1]
+    assert body["status"] == "done" and body["runs"] > 1
+    assert stub.calls == 6 and stub.fetches == [None]   # no chunk sent twice, rules fetched once
+    assert "partial" not in body["result"]
+    fixed = Document(BytesIO(base64.b64decode(body["result"]["fixedFileContent"])))
+    assert all("organise" in p.text for p in fixed.paragraphs)
+
+
+def test_failed_run_is_retried_from_its_checkpoint(env, monkeypatch):
+    stub, store, queue = env
+    validate_file = jobs.validate_file
+    failures = []
+
+    def crash_once(*args):
+        if not failures:
+            failures.append(1)
+            raise RuntimeError("worker recycled")
+        return validate_file(*args)
+
+    monkeypatch.setattr(jobs, "validate_file", crash_once)
+    job_id = json.loads(_submit(store, queue, fileName="plan.docx",
+                                fileContent=base64.b64encode(_docx()).decode()).get_body())["jobId"]
+
+    queue.run(_worker(store))
+    body = _status(store, job_id)[1]
+    assert body["status"] == "done" and body["runs"] == 2 and queue.deliveries == 2
+    assert stub.calls == 6 and len(stub.fetches) == 1   # parse and ai stages not repeated
+
+
+def test_job_fails_after_its_last_run(env, monkeypatch):
+    stub, store, queue = env
+    monkeypatch.setattr(jobs, "JOB_MAX_RUNS", 2)
+
+    def corrupt(*args):
+        raise RuntimeError("corrupt file")
+
+    monkeypatch.setattr(jobs, "validate_file", corrupt)
+    job_id = json.loads(_submit(store, queue, fileName="plan.docx",
+                                fileContent=base64.b64encode(_docx()).decode()).get_body())["jobId"]
+
+    queue.run(_worker(store))
+    body = _status(store, job_id)[1]
+    assert body["status"] == "failed" and body["runs"] == 2
+    assert "corrupt file" in body["error"] and not queue.poison
+
+
+def test_write_back_steps_are_checkpointed_as_they_succeed(env, monkeypatch):
+    from ValidateDocument import sharepoint_client, sharepoint_results, write_back
+    stub, store, queue = env
+    monkeypatch.setattr(jobs, "ENABLE_FUNCTION_SHAREPOINT_WRITES", True)
+    monkeypatch.setattr(write_back, "get_graph_token", lambda: "t")
+    monkeypatch.setattr(sharepoint_client, "get_site_id", lambda token: "site")
+    monkeypatch.setattr(sharepoint_client, "upload_file", lambda token, stream, path: (f"https://stub{path}", "item-9"))
+    job_id = json.loads(_submit(store, queue, fileName="plan.docx",
+                                fileContent=base64.b64encode(_docx()).decode()).get_body())["jobId"]
+    saves = []
+
+    def save_results(**fields):
+        saves.append((store.load(job_id)["write_back"], fields["issues_count"]))
+        return {"list_item_url": "https://stub/DispForm.aspx?ID=1"}
+
+    monkeypatch.setattr(sharepoint_results, "write_back_results", save_results)
+    queue.run(_worker(store))
+    body = _status(store, job_id)[1]
+    assert body["status"] == "done" and body["runs"] == 1
+    assert body["result"]["validationResultUrl"].endswith("ID=1")
+    # The report upload was saved to the job before the list write began
+    assert saves == [({"upload_report": {"web_url": "https://stub/Validation Reports/plan_ValidationReport.html",
+                                         "item_id": "item-9"}}, 0)]
+
+
+def test_bad_requests_and_unknown_jobs(env):
+    stub, store, queue = env
+    assert _submit(store, queue, fileName="plan.docx").status_code == 400
+    assert _submit(store, queue, fileName="notes.txt", fileUrl="/notes.txt").status_code == 400
+    assert _status(store, "msv-000000000000")[0] == 404
+    assert _status(store, "../../etc/passwd")[0] == 404
+    assert not queue.messages
@@ -0,0 +1,118 @@
+"""Incremental Word re-validation: paragraphs known to be clean are not checked again"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+from io import BytesIO
+
+import pytest
+from docx import Document
+
+from ValidateDocument.monitoring import ValidationMetrics, bind_metrics
+from ValidateDocument.paragraph_cache import ParagraphCache, set_paragraph_cache
+from ValidateDocument.word_validator import validate_word_document
+
+CLEAN = "Section {n} describes the programme for the works."
+
+
+def _rule(check_value, rule_type="Punctuation", auto_fix=True, use_ai=False, expected=""):
+    return {"title": check_value, "rule_type": rule_type, "doc_type": "Word", "check_value": check_value,
+            "expected_value": expected, "auto_fix": auto_fix, "use_ai": use_ai, "priority": 10}
+
+
+RULES = [_rule("NoAmpersand", expected="and"), _rule("AvoidEtc", "Language", auto_fix=False),
+         _rule("BritishSpelling_color", "Language", expected="colour")]
+
+
+def _docx(paragraphs):
+    doc = Document()
+    for text in paragraphs:
+        doc.add_paragraph(text)
+    out = BytesIO()
+    doc.save(out)
+    out.seek(0)
+    return out
+
+
+def _validate(paragraphs, rules=RULES):
+    metrics = ValidationMetrics("req", "plan.docx", {})
+    with bind_metrics(metrics):
+        result = validate_word_document(_docx(paragraphs), rules)
+    return result, metrics.paragraph_cache
+
+
+@pytest.fixture(autouse=True)
+def cache():
+    cache = ParagraphCache(10_000)
+    set_paragraph_cache(cache)
+    yield cache
+    set_paragraph_cache(None)
+
+
+def _document(n=300):
+    paragraphs = [CLEAN.format(n=i) for i in range(n)]
+    paragraphs[10] = "Bring drawings, specifications, etc. to the meeting."  # flagged, never clean
+    return paragraphs
+
+
+def test_edit_rechecks_only_changed_paragraphs():
+    paragraphs = _document()
+    first, stats = _validate(paragraphs)
+    assert stats == {"paragraphs": 300, "checked": 300}
+
+    paragraphs[150] = "Design & build was selected."
+    second, stats = _validate(paragraphs)
+    assert stats["checked"] == 2   # the edited paragraph and the one with a standing issue
+
+    assert [i["description"] for i in second["issues"]] == [i["description"] for i in first["issues"]]
+    fix = next(f for f in second["fixes_applied"] if f["rule_name"] == "NoAmpersand")
+    assert fix["changes"] == [{"before": "Design & build was selected.",
+                               "after": "Design and build was selected.", "location": "Paragraph 151"}]
+
+
+def test_incremental_result_matches_full_validation(cache):
+    paragraphs = _document(60)
+    _validate(paragraphs)
+    paragraphs[5] = "The color of the cladding & roof."
+    incremental, _ = _validate(paragraphs)
+    cache.clear()
+    full, stats = _validate(paragraphs)
+    assert stats["checked"] == 60
+    assert incremental["issues"] == full["issues"]
+    assert incremental["fixes_applied"] == full["fixes_applied"]
+
+
+def test_rule_change_misses_the_cache():
+    paragraphs = _document(20)
+    _validate(paragraphs)
+    _, stats = _validate(paragraphs, RULES + [_rule("PercentSymbol", expected="percent")])
+    assert stats["checked"] == 20
+
+
+
+def _docx_with_link(link_text):
+    from docx.opc.constants import RELATIONSHIP_TYPE
+    from docx.oxml import OxmlElement
+    from docx.oxml.ns import qn
+    doc = Document()
+    paragraph = doc.add_paragraph("Bring the drawings, e.g. the plans and ")
+    link = OxmlElement("w:hyperlink")
+    link.set(qn("r:id"), doc.part.relate_to("https://example.com/sections", RELATIONSHIP_TYPE.HYPERLINK,
+                                            is_external=True))
+    run = OxmlElement("w:r")
+    text = OxmlElement("w:t")
+    text.text = link_text
+    run.append(text)
+    link.append(run)
+    paragraph._p.append(link)
+    out = BytesIO()
+    doc.save(out)
+    out.seek(0)
+    return out
+
+
+def test_edit_inside_a_hyperlink_misses_the_cache():
+    rules = [_rule("NoEtcWithEgIe", "Grammar", auto_fix=False)]
+    assert not validate_word_document(_docx_with_link("sections"), rules)["issues"]
+    warm = validate_word_document(_docx_with_link("sections etc."), rules)
+    assert any("'etc.' alongside e.g./i.e." in str(issue) for issue in warm["issues"])
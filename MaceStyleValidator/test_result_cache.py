@@ -0,0 +1,56 @@
+"""Result cache tests: byte-bounded LRU, TTL, shared store and in-flight idempotency"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import threading
+
+from ValidateDocument.result_cache import (
+    ResultCache, LocalResultStore, content_key, rules_fingerprint, file_digest,
+)
+from io import BytesIO
+
+
+def test_key_changes_with_bytes_and_rules():
+    rules = [{"title": "No double spaces", "rule_type": "Formatting"}]
+    a = content_key(file_digest(BytesIO(b"doc")), rules_fingerprint(rules))
+    assert a == content_key(file_digest(BytesIO(b"doc")), rules_fingerprint(list(reversed(rules))))
+    assert a != content_key(file_digest(BytesIO(b"doc2")), rules_fingerprint(rules))
+    assert a != content_key(file_digest(BytesIO(b"doc")), rules_fingerprint(rules + [{"title": "x"}]))
+
+
+def test_lru_is_bounded_by_bytes():
+    cache = ResultCache(max_bytes=4000)   # ~1.1 KB per entry once encoded
+    for key in "abc":
+        cache.put(key, {"fixed_bytes": b"x" * 800})
+    cache.get("a")                      # a is now most recently used
+    cache.put("d", {"fixed_bytes": b"x" * 800})
+    assert cache.get("b") is None       # least recently used went first
+    assert cache.get("a")["fixed_bytes"] == b"x" * 800
+
+
+def test_ttl_expires_entries():
+    now = [1000.0]
+    cache = ResultCache(max_bytes=10_000, ttl_seconds=60, clock=lambda: now[0])
+    cache.put("k", {"issues": []})
+    now[0] += 61
+    assert cache.get("k") is None
+
+
+def test_local_store_shared_between_workers(tmp_path):
+    ResultCache(10_000, LocalResultStore(str(tmp_path))).put("k", {"issues": [{"rule": "r"}], "fixed_bytes": b"\x00\x01"})
+    entry = ResultCache(10_000, LocalResultStore(str(tmp_path))).get("k")
+    assert entry["issues"] == [{"rule": "r"}]
+    assert entry["fixed_bytes"] == b"\x00\x01"
+
+
+def test_concurrent_retry_waits_for_the_first_call():
+    cache = ResultCache(10_000)
+    assert cache.begin("run") == (True, None)
+    seen = []
+    waiter = threading.Thread(target=lambda: seen.append(cache.begin("run", timeout=5)))
+    waiter.start()
+    cache.put("run", {"body": b"response"})
+    cache.finish("run")
+    waiter.join()
+    assert seen == [(False, {"body": b"response", "stored_at": seen[0][1]["stored_at"]})]
@@ -0,0 +1,95 @@
+"""Offline tests for the process-wide Style Rules cache (no SharePoint needed)"""
+import sys
+import os
+import threading
+import time
+sys.path.insert(0, os.path.dirname(__file__))
+
+from ValidateDocument.rules_cache import RulesCache
+
+
+class FakeRulesList:
+    """Stands in for the Style Rules list: counts full loads and change probes."""
+
+    def __init__(self):
+        self.version = "2026-01-01T00:00:00Z"
+        self.rules = [{'title': 'Rule A', 'priority': 1}]
+        self.loads = 0
+        self.probes = 0
+        self.probed = threading.Event()
+
+    def load(self):
+        self.loads += 1
+        return list(self.rules), self.version
+
+    def probe(self):
+        self.probes += 1
+        self.probed.set()
+        return self.version
+
+
+def _wait_for_refresh(cache):
+    for _ in range(200):
+        if not cache._refreshing:
+            return
+        time.sleep(0.01)
+    raise AssertionError("background refresh did not finish")
+
+
+def test_warm_hits_make_no_calls():
+    source = FakeRulesList()
+    cache = RulesCache(ttl_seconds=60)
+    first = cache.get(source.load, source.probe)
+    for _ in range(5):
+        assert cache.get(source.load, source.probe) == first
+    assert source.loads == 1
+    assert source.probes == 0
+    assert cache.hits == 5
+
+
+def test_stale_copy_served_while_unchanged_list_is_probed():
+    source = FakeRulesList()
+    cache = RulesCache(ttl_seconds=60)
+    cache.get(source.load, source.probe)
+    cache._checked_at -= 120  # age the entry past its TTL
+
+    rules = cache.get(source.load, source.probe)
+    assert rules[0]['title'] == 'Rule A'
+    assert source.probed.wait(2)
+    _wait_for_refresh(cache)
+    assert source.loads == 1, "unchanged list must not be downloaded again"
+    assert cache.stale_hits == 1
+    # The probe extended the TTL, so the next call is a plain hit.
+    cache.get(source.load, source.probe)
+    assert source.probes == 1
+
+
+def test_changed_list_is_reloaded_in_background():
+    source = FakeRulesList()
+    cache = RulesCache(ttl_seconds=60)
+    cache.get(source.load, source.probe)
+    source.version = "2026-02-01T00:00:00Z"
+    source.rules = [{'title': 'Rule B', 'priority': 1}]
+    cache._checked_at -= 120
+
+    stale = cache.get(source.load, source.probe)
+    assert stale[0]['title'] == 'Rule A'
+    assert source.probed.wait(2)
+    _wait_for_refresh(cache)
+    assert source.loads == 2
+    assert cache.get(source.load, source.probe)[0]['title'] == 'Rule B'
+
+
+def test_zero_ttl_disables_cache():
+    source = FakeRulesList()
+    cache = RulesCache(ttl_seconds=0)
+    cache.get(source.load, source.probe)
+    cache.get(source.load, source.probe)
+    assert source.loads == 2
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            fn()
+            print(f"  ✓ {name}")
@@ -0,0 +1,67 @@
+"""Style Rules fetch against a local Graph stand-in (graph_stub.py) — no network.
+
+Checks the fetch follows @odata.nextLink past Graph's 200-item default page,
+asks only for the columns the validator reads, and parses the testers' rule
+set (style_rules_fixture.json) identically to the fixture.
+"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import pytest
+
+from graph_stub import GraphStub, load_fixture_rules
+from ValidateDocument import sharepoint_client
+from ValidateDocument.graph_client import GraphClient, set_graph_client
+
+
+@pytest.fixture
+def rules_env(monkeypatch):
+    monkeypatch.setenv("SHAREPOINT_SITE_URL", "https://stub.sharepoint.com/sites/Style")
+    monkeypatch.setattr(sharepoint_client, "get_style_rules_token", lambda: "stub-token")
+
+    def serve(stub):
+        set_graph_client(GraphClient(base_url=stub.base_url))
+    yield serve
+    set_graph_client(None)
+
+
+def test_fixture_round_trips(rules_env):
+    fixture = load_fixture_rules()
+    with GraphStub(rules=fixture) as stub:
+        rules_env(stub)
+        rules, version = sharepoint_client._load_validation_rules()
+
+    assert version == stub.list_modified
+    assert len(rules) == len(fixture)
+    by_title = {r['title']: r for r in rules}
+    for expected in fixture:
+        got = by_title[expected['title']]
+        for key in ('rule_type', 'doc_type', 'check_value', 'auto_fix', 'use_ai', 'priority'):
+            assert got[key] == expected[key], (expected['title'], key)
+
+
+def test_large_list_is_not_truncated(rules_env):
+    # Six copies of the live list: well past Graph's 200-item default page
+    # and past our own page size, so paging has to follow nextLink.
+    fixture = load_fixture_rules()
+    big = [dict(r, title=f"{r['title']} #{n}") for n in range(6) for r in fixture]
+    with GraphStub(rules=big) as stub:
+        rules_env(stub)
+        rules, _version = sharepoint_client._load_validation_rules()
+        item_pages = [q for m, p, q in stub.requests if p.endswith("/items")]
+
+    assert len(rules) == len(big)
+    assert len(item_pages) == 2
+    assert all(q.get("$top") == str(sharepoint_client.STYLE_RULES_PAGE_SIZE) for q in item_pages)
+
+
+def test_only_rule_columns_requested(rules_env):
+    with GraphStub() as stub:
+        rules_env(stub)
+        sharepoint_client._load_validation_rules()
+        query = next(q for m, p, q in stub.requests if p.endswith("/items"))
+
+    assert query["$select"] == "id"
+    assert query["$expand"].startswith("fields($select=")
+    assert "CheckValue" in query["$expand"]
@@ -0,0 +1,126 @@
+"""SharePoint write-path tests against graph_stub: memoised site/list IDs and 404 invalidation"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+from io import BytesIO
+
+import pytest
+
+from graph_stub import GraphStub
+from ValidateDocument import sharepoint_client
+from ValidateDocument.graph_client import GraphClient, set_graph_client
+from ValidateDocument.monitoring import ValidationMetrics, bind_metrics
+
+DOC_PATH = "/sites/Style/Shared Documents/Reports/test.docx"
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setenv("SHAREPOINT_SITE_URL", "https://stub.sharepoint.com/sites/Style")
+    sharepoint_client.invalidate_site_cache()
+    with GraphStub() as graph:
+        set_graph_client(GraphClient(base_url=graph.base_url, rate_per_second=0))
+        yield graph
+    set_graph_client(None)
+    sharepoint_client.invalidate_site_cache()
+
+
+def _site_lookups(stub):
+    return [p for p in stub.paths("GET") if ":/sites/Style" in p]
+
+
+def test_site_resolved_once_across_write_path(stub):
+    metrics = ValidationMetrics(request_id="msv-test", filename="test.docx", caller={})
+    with bind_metrics(metrics):
+        web_url, item_id = sharepoint_client.upload_file("t", BytesIO(b"fixed"), DOC_PATH)
+        assert sharepoint_client.download_file("t", DOC_PATH).read() == b"fixed"
+        sharepoint_client.update_drive_item_fields("t", item_id, {"ValidationStatus": "Failed"})
+        sharepoint_client.update_validation_status("t", "7", "Failed", web_url)
+        sharepoint_client.update_validation_status("t", "7", "Failed", web_url)
+        sharepoint_client.get_site_id("t")
+
+    assert len(_site_lookups(stub)) == 1
+    assert stub.paths("GET").count(f"/v1.0/sites/{stub.site_id}/drive/list") == 1
+    # 1 site + 1 library list + upload + download + 3 PATCHes
+    assert metrics.sharepoint_calls == 7
+
+
+def test_stale_site_id_is_re_resolved_on_404(stub):
+    sharepoint_client.upload_file("t", BytesIO(b"v1"), DOC_PATH)
+    stub.site_id = stub.site_id.replace("0001", "0009")  # site moved: old ID now 404s
+    stub.files["/Reports/test.docx"] = b"v2"
+
+    assert sharepoint_client.download_file("t", DOC_PATH).read() == b"v2"
+    assert len(_site_lookups(stub)) == 2
+
+
+def test_genuine_404_still_raises(stub):
+    import requests
+    sharepoint_client.get_site_id("t")
+    with pytest.raises(requests.HTTPError):
+        sharepoint_client.download_file("t", "/sites/Style/Shared Documents/missing.docx")
+    # One re-resolve attempt, then the real error surfaces
+    assert len(_site_lookups(stub)) == 2
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    from ValidateDocument import upload_session
+    monkeypatch.setattr(sharepoint_client, "GRAPH_SIMPLE_UPLOAD_MAX_BYTES", upload_session.CHUNK_ALIGNMENT)
+    monkeypatch.setattr(upload_session, "GRAPH_UPLOAD_CHUNK_BYTES", upload_session.CHUNK_ALIGNMENT)
+    return upload_session.CHUNK_ALIGNMENT
+
+
+def test_large_upload_uses_chunked_session(stub, small_chunks):
+    content = os.urandom(3 * small_chunks + 100)
+    web_url, item_id = sharepoint_client.upload_file("t", BytesIO(content), DOC_PATH)
+
+    assert stub.files["/Reports/test.docx"] == content
+    assert item_id == stub.file_ids["/Reports/test.docx"]
+    assert len([p for p in stub.paths("PUT") if p.startswith("/upload/")]) == 4
+    assert not [p for p in stub.paths("PUT") if p.endswith(":/content")]
+
+
+def test_chunked_upload_resumes_after_failure(stub, small_chunks):
+    content = os.urandom(2 * small_chunks + 5)
+    stub.inject_fault(500, times=1, path="/upload/")
+    sharepoint_client.upload_file("t", BytesIO(content), DOC_PATH)
+
+    assert stub.files["/Reports/test.docx"] == content
+    # The failed chunk was re-sent after asking the session where to resume
+    assert len([p for p in stub.paths("GET") if p.startswith("/upload/")]) == 1
+    assert len([p for p in stub.paths("PUT") if p.startswith("/upload/")]) == 4
+
+
+def test_download_spills_large_files_to_disk(stub, monkeypatch):
+    monkeypatch.setattr(sharepoint_client, "DOWNLOAD_SPOOL_MAX_BYTES", 1024)
+    stub.files["/Reports/test.docx"] = content = os.urandom(10_000)
+    stub.file_ids["/Reports/test.docx"] = "stub-item-1"
+
+    spooled = sharepoint_client.download_file("t", DOC_PATH)
+    assert spooled._rolled  # on disk, not in memory
+    assert spooled.read() == content
+
+
+def test_oversized_download_rejected_before_buffering(stub):
+    stub.files["/Reports/test.docx"] = os.urandom(5000)
+    stub.file_ids["/Reports/test.docx"] = "stub-item-1"
+
+    with pytest.raises(sharepoint_client.FileTooLargeError) as e:
+        sharepoint_client.download_file("t", DOC_PATH, max_bytes=4096)
+    assert e.value.size == 5000
+    assert str(e.value) == "File too large (5000 bytes). Maximum allowed is 4.0 KB."
+    assert sharepoint_client.download_file("t", DOC_PATH, max_bytes=5000).read() == stub.files["/Reports/test.docx"]
+
+
+def test_download_without_content_length_is_capped_while_streaming(stub, monkeypatch):
+    monkeypatch.setattr(sharepoint_client, "DOWNLOAD_CHUNK_BYTES", 1024)
+    stub.files["/Reports/test.docx"] = os.urandom(5000)
+    stub.file_ids["/Reports/test.docx"] = "stub-item-1"
+    stub.unsized_downloads = True
+
+    with pytest.raises(sharepoint_client.FileTooLargeError) as e:
+        sharepoint_client.download_file("t", DOC_PATH, max_bytes=4096)
+    assert e.value.size == 4096 and "more than 4096 bytes" in str(e.value)
+    assert sharepoint_client.download_file("t", DOC_PATH, max_bytes=5000).read() == stub.files["/Reports/test.docx"]
@@ -0,0 +1,218 @@
+"""Library sweep against graph_stub: drive delta walk, incremental re-runs, retries and the time budget"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import threading
+import time
+from io import BytesIO
+
+import pytest
+from docx import Document
+
+from ai_stub import AIStub
+from graph_stub import GraphStub, load_fixture_rules
+from ValidateDocument import ai_batch, ai_client, sharepoint_client, sweep
+from ValidateDocument.ai_cache import set_ai_cache
+from ValidateDocument.ai_router import ProviderRouter, set_ai_router
+from ValidateDocument.graph_client import GraphClient, set_graph_client
+from ValidateDocument.result_cache import LocalResultStore, ResultCache
+
+AI_RULES = [{"title": "British spelling", "rule_type": "Language", "doc_type": "Word", "check_value": "",
+             "expected_value": "", "auto_fix": True, "use_ai": True, "priority": 10}]
+
+
+def make_docx(text="The project will utilise the site office.  "):
+    doc = Document()
+    doc.add_paragraph(text)
+    out = BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+@pytest.fixture
+def library(monkeypatch, tmp_path):
+    monkeypatch.setenv("SHAREPOINT_SITE_URL", "https://stub.sharepoint.com/sites/Style")
+    monkeypatch.setattr(sweep, "fetch_validation_rules", lambda token: load_fixture_rules())
+    monkeypatch.setattr(sweep, "ENABLE_FUNCTION_SHAREPOINT_WRITES", False)
+    audit = []
+    monkeypatch.setattr(sweep, "emit_audit_event", audit.append)
+    sharepoint_client.invalidate_site_cache()
+    with GraphStub(default_page_size=3) as stub:
+        set_graph_client(GraphClient(base_url=stub.base_url, rate_per_second=0))
+        stub.put_file("/plan.docx", make_docx())
+        stub.put_file("/Projects/Alpha/spec.docx", make_docx())
+        stub.put_file("/Projects/Alpha/notes.txt", b"not a document")
+        stub.put_file("/Projects/Beta/budget.xlsx", b"PK not really a workbook")
+        stub.audit = audit
+        yield stub, LocalResultStore(str(tmp_path))
+    set_graph_client(None)
+    sharepoint_client.invalidate_site_cache()
+
+
+def _validated(stub):
+    return sorted(entry["document"]["filename"] for entry in stub.audit if entry["validation"]["status"] != "error")
+
+
+def test_first_sweep_walks_every_folder_then_only_changes(library):
+    stub, store = library
+    stats = sweep.run_sweep(store=store, token="t")
+    assert stats["complete"] and stats["validated"] == 2 and stats["failed"] == 1   # budget.xlsx is corrupt
+    assert stats["skipped"] == 1   # notes.txt
+    assert _validated(stub) == ["plan.docx", "spec.docx"]
+    assert sweep.load_state(store)["delta_link"]
+
+    stub.audit.clear()
+    stub.requests.clear()
+    stats = sweep.run_sweep(store=store, token="t")
+    assert stats["validated"] == 0 and stub.audit[0]["document"]["filename"] == "budget.xlsx"   # only the retry
+    assert not [p for p in stub.paths("GET") if p.endswith("plan.docx") or "stub-item-1" in p]
+
+    stub.audit.clear()
+    stub.put_file("/Projects/Alpha/spec.docx", make_docx("Revised spec.  "))
+    stub.put_file("/Projects/Gamma/new.docx", make_docx())
+    stub.delete_file("/plan.docx")
+    stats = sweep.run_sweep(store=store, token="t")
+    assert stats["validated"] == 2 and stats["deleted"] == 1
+    assert _validated(stub) == ["new.docx", "spec.docx"]
+    assert "stub-item-1" not in sweep.load_state(store)["validated"]
+
+
+def test_failed_document_is_retried_then_given_up(library, monkeypatch):
+    stub, store = library
+    monkeypatch.setattr(sweep, "SWEEP_MAX_ATTEMPTS", 2)
+    sweep.run_sweep(store=store, token="t")
+    assert list(sweep.load_state(store)["retry"].values())[0]["attempts"] == 1
+    assert sweep.run_sweep(store=store, token="t")["failed"] == 1
+    assert sweep.load_state(store)["retry"] == {}
+    assert sweep.run_sweep(store=store, token="t")["failed"] == 0
+
+
+def test_time_budget_stops_the_sweep_and_the_next_one_carries_on(library):
+    stub, store = library
+    stats = sweep.run_sweep(store=store, token="t", budget_seconds=0)
+    assert not stats["complete"] and stats.get("validated", 0) == 0
+    assert sweep.load_state(store)["delta_link"] is None
+
+    stats = sweep.run_sweep(store=store, token="t")
+    assert stats["complete"] and stats["validated"] == 2
+
+
+def test_partial_validation_is_marked_for_review_and_done_again(library, monkeypatch):
+    from ValidateDocument.deadline import current_deadline
+    stub, store = library
+    validate_file = sweep.validate_file
+
+    def out_of_time(*args):
+        current_deadline().skip("rule 'British spelling'")
+        return validate_file(*args)
+
+    monkeypatch.setattr(sweep, "validate_file", out_of_time)
+    stats = sweep.run_sweep(store=store, token="t")
+    assert stats["partial"] == 2 and stats["validated"] == 0
+    assert {e["validation"]["status"] for e in stub.audit if e["validation"].get("partial")} == {"Review Required"}
+
+    monkeypatch.setattr(sweep, "validate_file", validate_file)
+    assert sweep.run_sweep(store=store, token="t")["validated"] == 2
+
+
+def test_expired_delta_link_relists_without_revalidating(library):
+    stub, store = library
+    sweep.run_sweep(store=store, token="t")
+    stub.delta_expired = True
+    stub.audit.clear()
+    stats = sweep.run_sweep(store=store, token="t")
+    assert stats["complete"] and stats["validated"] == 0 and stats["unchanged"] == 2
+
+
+def test_documents_in_flight_are_bounded(library, monkeypatch):
+    stub, store = library
+    for n in range(12):
+        stub.put_file(f"/Bulk/doc{n}.docx", make_docx())
+    monkeypatch.setattr(sweep, "SWEEP_CONCURRENCY", 3)
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def slow_validate(token, item, data, rules, metrics, deadline):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    monkeypatch.setattr(sweep, "validate_item", slow_validate)
+    stats = sweep.run_sweep(store=store, token="t")
+    assert stats["validated"] == 15 and peak[0] == 3
+
+
+def test_sweep_writes_results_back_beside_the_document(library, monkeypatch):
+    stub, store = library
+    monkeypatch.setattr(sweep, "ENABLE_FUNCTION_SHAREPOINT_WRITES", True)
+    stub.delete_file("/Projects/Beta/budget.xlsx")
+    stats = sweep.run_sweep(store=store, token="t")
+    assert stats["validated"] == 2 and stats["failed"] == 0
+    assert "/Projects/Alpha/spec_ValidationReport.html" in stub.files
+    fixed = Document(BytesIO(stub.files["/Projects/Alpha/spec.docx"]))
+    assert fixed.paragraphs[0].text != "The project will utilise the site office.  "
+
+
+@pytest.fixture
+def ai(library, monkeypatch):
+    stub, store = library
+    ai = AIStub(batch_polls=0)
+    for module in (ai_client, ai_batch):
+        monkeypatch.setattr(module, "ENABLE_CLAUDE_AI", True)
+        monkeypatch.setattr(module, "AI_PROVIDER", "anthropic")
+    monkeypatch.setattr(ai_client, "AI_FALLBACK_PROVIDERS", [])
+    monkeypatch.setattr(sweep, "fetch_validation_rules", lambda token: AI_RULES)
+    monkeypatch.setattr(sweep, "ENABLE_FUNCTION_SHAREPOINT_WRITES", True)
+    stub.put_file("/plan.docx", make_docx("The team will organize the site."))
+    stub.put_file("/Projects/Alpha/spec.docx", make_docx("The team will organize the site."))
+    ai_client.set_ai_client(ai, "anthropic")
+    set_ai_router(ProviderRouter())
+    set_ai_cache(ResultCache(1024 * 1024))
+    yield ai
+    ai_client.set_ai_client(None)
+    set_ai_router(None)
+    set_ai_cache(None)
+
+
+def _fixed(stub, path):
+    return Document(BytesIO(stub.files[path])).paragraphs[0].text
+
+
+def test_ai_work_is_sent_as_one_batch_job_and_collected_by_the_next_sweep(library, ai):
+    stub, store = library
+    stats = sweep.run_sweep(store=store, token="t")
+    assert stats["awaiting_ai"] == 2 and stats["validated"] == 0 and stats["complete"]
+    assert ai.batch_jobs == 1 and ai.calls == 0 and not ai.cancelled   # the sweep did not wait for it
+    assert _fixed(stub, "/plan.docx") == "The team will organize the site."
+
+    stats = sweep.run_sweep(store=store, token="t")
+    assert stats["validated"] == 2 and stats["awaiting_ai"] == 0
+    assert ai.batch_jobs == 1 and ai.batch_requests == 1 and ai.calls == 0   # the shared paragraph once
+    for path in ("/plan.docx", "/Projects/Alpha/spec.docx"):
+        assert _fixed(stub, path) == "The team will organise the site."
+    assert sweep.load_state(store)["ai_batches"] == []
+
+
+def test_running_batch_job_is_left_running_until_it_ends(library, ai):
+    stub, store = library
+    ai.batch_polls = 1000
+    sweep.run_sweep(store=store, token="t")
+    stats = sweep.run_sweep(store=store, token="t")
+    assert stats["validated"] == 0 and stats["partial"] == 0 and stats["complete"]
+    assert not ai.cancelled and len(sweep.load_state(store)["ai_batches"]) == 1
+
+    ai.batch_polls = 0
+    assert sweep.run_sweep(store=store, token="t")["validated"] == 2
+
+
+def test_batch_job_not_ended_in_time_is_cancelled_and_validated_directly(library, ai, monkeypatch):
+    stub, store = library
+    ai.batch_polls = 1000
+    sweep.run_sweep(store=store, token="t")
+    monkeypatch.setattr(sweep, "AI_BATCH_TIMEOUT_SECONDS", 0)
+    stats = sweep.run_sweep(store=store, token="t")
+    assert ai.cancelled and ai.batch_jobs == 1 and ai.calls >= 1   # direct calls, no second batch
+    assert stats["validated"] == 2 and _fixed(stub, "/plan.docx") == "The team will organise the site."
@@ -0,0 +1,72 @@
+"""Binary request/response transports for ValidateDocument (octet-stream, multipart)"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import json
+from email.parser import BytesParser
+from email.policy import HTTP
+
+import azure.functions as func
+
+from ValidateDocument.transport import parse_validation_request, wants_multipart, multipart_response
+
+
+def _request(body, headers=None, params=None):
+    return func.HttpRequest(method="POST", url="/api/ValidateDocument", body=body,
+                            headers=headers or {}, params=params or {})
+
+
+def test_json_contract_unchanged():
+    req = _request(json.dumps({"fileName": "a.docx", "fileContent": "UEs="}).encode(),
+                   {"Content-Type": "application/json"})
+    fields, file_bytes = parse_validation_request(req)
+    assert fields["fileContent"] == "UEs="
+    assert file_bytes is None
+
+
+def test_octet_stream_takes_metadata_from_query():
+    req = _request(b"PK\x03\x04raw", {"Content-Type": "application/octet-stream"},
+                   {"fileName": "a.docx", "itemId": "7"})
+    fields, file_bytes = parse_validation_request(req)
+    assert fields == {"fileName": "a.docx", "itemId": "7"}
+    assert file_bytes == b"PK\x03\x04raw"
+
+
+def test_multipart_form_data():
+    content = bytes(range(256)) * 4
+    body = (b"--XyZ\r\n"
+            b'Content-Disposition: form-data; name="itemId"\r\n\r\n'
+            b"42\r\n"
+            b"--XyZ\r\n"
+            b'Content-Disposition: form-data; name="file"; filename="plan.docx"\r\n'
+            b"Content-Type: application/octet-stream\r\n\r\n" + content + b"\r\n"
+            b"--XyZ--\r\n")
+    req = _request(body, {"Content-Type": "multipart/form-data; boundary=XyZ"})
+    fields, file_bytes = parse_validation_request(req)
+    assert fields == {"itemId": "42", "fileName": "plan.docx"}
+    assert file_bytes == content
+
+
+def test_multipart_response_round_trips():
+    assert wants_multipart(_request(b"", {"Accept": "multipart/mixed"}))
+    assert not wants_multipart(_request(b"", {"Accept": "application/json"}))
+
+    fixed = os.urandom(2048)
+    body, content_type = multipart_response({"status": "Failed"}, fixed, "a.docx", "<html>é</html>", "a_Report.html")
+    message = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+    parts = list(message.iter_parts())
+    assert json.loads(parts[0].get_payload(decode=True)) == {"status": "Failed"}
+    assert parts[1].get_filename() == "a.docx"
+    assert parts[1].get_payload(decode=True) == fixed
+    assert parts[2].get_payload(decode=True).decode("utf-8") == "<html>é</html>"
+
+
+def test_multipart_response_file_names_with_quotes_and_accents():
+    name = 'Café "Plan" v2.docx'
+    body, content_type = multipart_response({}, b"doc", name, "<html></html>", 'Report "A".html')
+    message = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+    parts = list(message.iter_parts())
+    assert parts[1].get_filename() == name
+    assert parts[2].get_filename() == 'Report "A".html'
+    assert b"filename*=utf-8''Caf%C3%A9%20%22Plan%22%20v2.docx; filename=\"Caf? \\\"Plan\\\" v2.docx\"" in body
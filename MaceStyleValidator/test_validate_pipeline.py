@@ -0,0 +1,303 @@
+"""End-to-end ValidateDocument main() tests against graph_stub (no tenant, no network)"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import json
+from io import BytesIO
+
+import azure.functions as func
+import pytest
+from docx import Document
+
+import ValidateDocument
+from graph_stub import GraphStub, LoginRedirectSession
+from ValidateDocument import credentials, sharepoint_client
+from ValidateDocument.graph_client import GraphClient, set_graph_client
+from ValidateDocument.result_cache import set_result_cache
+
+DOC_PATH = "/sites/Style/Shared Documents/Reports/plan.docx"
+
+
+def make_docx(text="The project will utilise the site office.  "):
+    doc = Document()
+    doc.add_paragraph(text)
+    out = BytesIO()
+    doc.save(out)
+    return out.getvalue()
+
+
+def validate_request(headers=None, **fields):
+    return func.HttpRequest(method="POST", url="/api/ValidateDocument", body=json.dumps(fields).encode(),
+                            headers={"Content-Type": "application/json", **(headers or {})})
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    for var in ("STYLE_RULES_TENANT_ID", "STYLE_RULES_CLIENT_ID", "STYLE_RULES_CLIENT_SECRET", "STYLE_RULES_SITE_URL"):
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setenv("SHAREPOINT_TENANT_ID", "tenant-a")
+    monkeypatch.setenv("SHAREPOINT_CLIENT_ID", "client-a")
+    monkeypatch.setenv("SHAREPOINT_CLIENT_SECRET", "secret-a")
+    monkeypatch.setenv("SHAREPOINT_SITE_URL", "https://stub.sharepoint.com/sites/Style")
+    audit = []
+    monkeypatch.setattr(ValidateDocument, "emit_audit_event", audit.append)
+    sharepoint_client.invalidate_site_cache()
+    sharepoint_client._rules_cache.invalidate()
+    set_result_cache(None)
+    with GraphStub() as stub:
+        credentials.set_http_client(LoginRedirectSession(stub))
+        set_graph_client(GraphClient(base_url=stub.base_url, rate_per_second=0))
+        stub.audit = audit
+        yield stub
+    set_graph_client(None)
+    credentials.set_http_client(None)
+    sharepoint_client.invalidate_site_cache()
+    sharepoint_client._rules_cache.invalidate()
+    set_result_cache(None)
+
+
+def test_rules_fetch_overlaps_download(pipeline):
+    pipeline.files["/Reports/plan.docx"] = make_docx()
+    pipeline.file_ids["/Reports/plan.docx"] = "stub-item-1"
+    pipeline.latency = {"/lists/Style Rules/items": 0.4, "/drive/root:/Reports/plan.docx:/content": 0.4}
+
+    response = ValidateDocument.main(validate_request(fileName="plan.docx", fileUrl=DOC_PATH))
+    assert response.status_code == 200
+
+    perf = pipeline.audit[-1]["performance"]
+    phases, starts = perf["phases_ms"], perf["phase_start_ms"]
+    assert phases["fetch_rules"] >= 400 and phases["download"] >= 400
+    # The download started before the rules fetch finished
+    assert starts["download"] < starts["fetch_rules"] + phases["fetch_rules"]
+    assert starts["validation"] >= max(starts["download"] + phases["download"],
+                                       starts["fetch_rules"] + phases["fetch_rules"]) - 5
+
+
+def test_json_contract_round_trip(pipeline):
+    import base64
+    content = base64.b64encode(make_docx()).decode()
+    response = ValidateDocument.main(validate_request(fileName="plan.docx", fileContent=content))
+    body = json.loads(response.get_body())
+    assert response.status_code == 200
+    assert body["status"] in ("Auto-Fixed — Awaiting Review", "Review Required", "Failed")
+    assert body["reportHtml"].lstrip().lower().startswith("<!doctype html")
+
+
+@pytest.fixture
+def function_writes(pipeline, monkeypatch, tmp_path):
+    from ValidateDocument import write_back
+    monkeypatch.setattr(ValidateDocument, "ENABLE_FUNCTION_SHAREPOINT_WRITES", True)
+    monkeypatch.setattr(write_back, "WRITE_BACK_JOURNAL_DIR", str(tmp_path))
+    pipeline.files["/Reports/plan.docx"] = make_docx()
+    pipeline.file_ids["/Reports/plan.docx"] = "stub-item-7"
+    return pipeline
+
+
+def _content_puts(stub):
+    return [p for p in stub.paths("PUT") if p.endswith(":/content")]
+
+
+def test_fixed_file_and_report_upload_concurrently(function_writes):
+    stub = function_writes
+    stub.latency = {":/content": 0.3}
+
+    response = ValidateDocument.main(validate_request(fileName="plan.docx", fileUrl=DOC_PATH, itemId="7"))
+    body = json.loads(response.get_body())
+    assert response.status_code == 200
+    assert body["validationResultUrl"].endswith("DispForm.aspx?ID=1")
+    assert "/Reports/plan_ValidationReport.html" in stub.files
+    assert stub.list_items["doc-library-list"]["7"]["ValidationStatus"] == body["status"]
+
+    audit = stub.audit[-1]
+    starts, phases = audit["performance"]["phase_start_ms"], audit["performance"]["phases_ms"]
+    assert body["issuesFixed"] > 0
+    # Both uploads were in flight at once, and the list writes waited for them
+    assert abs(starts["upload_fixed"] - starts["upload_report"]) < phases["upload_report"]
+    assert starts["write_back"] >= starts["upload_report"] + phases["upload_report"] - 5
+    assert audit["validation"]["write_back_errors"] == {}
+
+
+def test_background_write_back_is_journalled_and_retried(function_writes, monkeypatch, tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from ValidateDocument import write_back
+    stub = function_writes
+    monkeypatch.setattr(ValidateDocument, "WRITE_BACK_MODE", "background")
+    background = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(write_back, "_background_executor", lambda: background)
+    stub.inject_fault(503, times=10, retry_after=0, path="/lists/list-validation-results/items")
+
+    response = ValidateDocument.main(validate_request(fileName="plan.docx", fileUrl=DOC_PATH, itemId="7"))
+    assert json.loads(response.get_body())["writeBack"] == "pending"
+    background.shutdown(wait=True)
+
+    # The results item could not be saved: the job stays in the journal
+    entries = list(tmp_path.glob("*.json"))
+    assert len(entries) == 1
+    assert "save_results" in json.loads(entries[0].read_text())["errors"]
+    uploads = len(_content_puts(stub))
+
+    stub._faults.clear()
+    assert write_back.retry_pending_write_backs() == 1
+    assert list(tmp_path.iterdir()) == []
+    assert "1" in stub.list_items["list-validation-results"]
+    assert len(_content_puts(stub)) == uploads  # the report was not uploaded again
+
+
+def test_running_write_back_is_checkpointed_and_kept_claimed(function_writes, monkeypatch, tmp_path):
+    import time
+    from ValidateDocument import sharepoint_results, write_back
+    monkeypatch.setattr(write_back, "STALE_CLAIM_SECONDS", 0.3)
+    claimed = tmp_path / "job-1.running"
+    seen = {}
+
+    def slow_save(**kwargs):
+        time.sleep(0.5)
+        seen["done"] = set(json.loads(claimed.read_text())["done"])
+        seen["age"] = time.time() - claimed.stat().st_mtime
+        raise RuntimeError("list unavailable")
+
+    monkeypatch.setattr(sharepoint_results, "write_back_results", slow_save)
+    job = write_back.new_job("job-1", "plan.docx", DOC_PATH, "7", "Passed", 0, 0, "<html></html>",
+                             "/Reports/plan_ValidationReport.html")
+    assert write_back.submit_background(job, token="t").result() is False
+
+    # The upload was journalled before the list write started, and the claim
+    # was kept fresh while the slow step ran
+    assert seen["done"] == {"upload_report"} and seen["age"] < 0.3
+    assert set(json.loads((tmp_path / "job-1.json").read_text())["done"]) == {"upload_report"}
+
+
+def test_stale_write_back_is_claimed_by_one_worker(function_writes, monkeypatch, tmp_path):
+    import os
+    import threading
+    from ValidateDocument import write_back
+    job = write_back.new_job("job-1", "plan.docx", DOC_PATH, "7", "Passed", 0, 0, "<html></html>",
+                             "/Reports/plan_ValidationReport.html")
+    stale = tmp_path / "job-1.running"
+    write_back._write_entry(job, str(stale))
+    os.utime(stale, (0, 0))   # its worker went away long ago
+    runs = []
+    monkeypatch.setattr(write_back, "_run_claimed", lambda job, claimed, token=None: runs.append(claimed) or True)
+    both_checked, real_getmtime = threading.Barrier(2), os.path.getmtime
+
+    def getmtime(path):
+        mtime = real_getmtime(path)
+        both_checked.wait(timeout=5)   # two RetryWriteBacks runs both find the entry stale
+        return mtime
+
+    monkeypatch.setattr(write_back.os.path, "getmtime", getmtime)
+    workers = [threading.Thread(target=write_back.retry_pending_write_backs) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert len(runs) == 1
+
+
+def test_retry_waits_for_the_original_run_only_within_its_budget(pipeline, monkeypatch):
+    import time
+    from ValidateDocument import deadline
+    from ValidateDocument.result_cache import get_result_cache, idempotency_key
+    monkeypatch.setattr(deadline, "VALIDATION_BUDGET_SECONDS", 1)
+    monkeypatch.setattr(deadline, "VALIDATION_RESERVE_SECONDS", 0)
+    pipeline.files["/Reports/plan.docx"] = make_docx()
+    pipeline.file_ids["/Reports/plan.docx"] = "stub-item-1"
+    # The original call is still running (and never answers)
+    run_key = idempotency_key("08585-run-1", "plan.docx", None, "json")
+    assert get_result_cache().begin(run_key) == (True, None)
+
+    start = time.monotonic()
+    response = ValidateDocument.main(validate_request(fileName="plan.docx", fileUrl=DOC_PATH,
+                                                      headers={"x-ms-workflow-run-id": "08585-run-1"}))
+    assert response.status_code == 200 and time.monotonic() - start < 5
+    get_result_cache().finish(run_key)
+
+
+def test_identical_document_reuses_cached_result(pipeline):
+    import base64
+    content = base64.b64encode(make_docx()).decode()
+    first = json.loads(ValidateDocument.main(validate_request(fileName="plan.docx", fileContent=content)).get_body())
+    second = json.loads(ValidateDocument.main(validate_request(fileName="plan.docx", fileContent=content)).get_body())
+
+    assert [a["validation"]["result_cache"] for a in pipeline.audit] == ["miss", "hit"]
+    assert "validation" not in pipeline.audit[-1]["performance"]["phases_ms"]
+    for field in ("status", "issuesFound", "issuesFixed", "fixedFileContent"):
+        assert second[field] == first[field]
+    assert second["requestId"] != first["requestId"]
+
+
+def test_workflow_run_id_replays_response(pipeline):
+    pipeline.files["/Reports/plan.docx"] = make_docx()
+    pipeline.file_ids["/Reports/plan.docx"] = "stub-item-1"
+    request = dict(fileName="plan.docx", fileUrl=DOC_PATH, headers={"x-ms-workflow-run-id": "08585-run-1"})
+
+    first = ValidateDocument.main(validate_request(**request))
+    calls = len(pipeline.requests)
+    again = ValidateDocument.main(validate_request(**request))
+
+    assert again.get_body() == first.get_body()
+    assert len(pipeline.requests) == calls  # no download, no token, no writes
+    assert pipeline.audit[-1]["event_type"] == "validation_replayed"
+
+    other_run = dict(request, headers={"x-ms-workflow-run-id": "08585-run-2"})
+    assert json.loads(ValidateDocument.main(validate_request(**other_run)).get_body())["requestId"] != \
+        json.loads(first.get_body())["requestId"]
+
+
+def test_exhausted_time_budget_returns_a_partial_result(pipeline, monkeypatch):
+    import base64
+    from ValidateDocument import deadline
+    monkeypatch.setattr(deadline, "VALIDATION_RESERVE_SECONDS", deadline.VALIDATION_BUDGET_SECONDS)
+    content = base64.b64encode(make_docx()).decode()
+
+    response = ValidateDocument.main(validate_request(fileName="plan.docx", fileContent=content))
+    body = json.loads(response.get_body())
+    assert response.status_code == 200
+    assert body["partial"] is True and body["skipped"]
+    assert body["status"] == "Review Required"   # nothing left to fix, but not every check ran
+    assert "not run in time" in body["description"]
+    assert "Partial Validation" in body["reportHtml"]
+    assert pipeline.audit[-1]["validation"]["partial"] is True
+
+    # A partial result is not reused for the same document
+    ValidateDocument.main(validate_request(fileName="plan.docx", fileContent=content))
+    assert [a["validation"]["result_cache"] for a in pipeline.audit] == ["miss", "miss"]
+
+
+def test_result_the_ai_failed_on_is_not_reused(pipeline, monkeypatch):
+    import base64
+    from ValidateDocument import word_validator
+
+    def unavailable(rules, paragraphs):
+        raise RuntimeError("provider unavailable")
+
+    monkeypatch.setattr(word_validator, "correct_paragraphs", unavailable)
+    content = base64.b64encode(make_docx()).decode()
+    for _ in range(2):
+        body = json.loads(ValidateDocument.main(validate_request(fileName="plan.docx", fileContent=content)).get_body())
+        assert "AI validation failed" in body["reportHtml"]
+    assert [a["validation"]["result_cache"] for a in pipeline.audit] == ["miss", "miss"]
+
+
+def test_oversized_document_is_refused_without_waiting_for_the_rules(pipeline, monkeypatch):
+    import base64
+    import time
+    fetches = []
+
+    def slow_rules(token):
+        fetches.append(token)
+        time.sleep(1)
+        return []
+
+    monkeypatch.setattr(ValidateDocument, "fetch_validation_rules", slow_rules)
+    monkeypatch.setattr(ValidateDocument, "MAX_FILE_SIZE_BYTES", 1000)
+    content = base64.b64encode(make_docx()).decode()
+    assert ValidateDocument.main(validate_request(fileName="plan.docx", fileContent=content)).status_code == 413
+    assert fetches == []   # inline content is measured before any I/O
+
+    pipeline.files["/Reports/plan.docx"] = make_docx()
+    start = time.monotonic()
+    response = ValidateDocument.main(validate_request(fileName="plan.docx", fileUrl=DOC_PATH))
+    assert response.status_code == 413 and "Maximum allowed" in json.loads(response.get_body())["error"]
+    assert time.monotonic() - start < 0.8 and len(fetches) == 1
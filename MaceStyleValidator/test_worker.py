@@ -0,0 +1,47 @@
+"""WorkerSingleton: created once per worker (or per key), replaced and dropped through set()"""
+import sys
+import os
+sys.path.insert(0, os.path.dirname(__file__))
+
+import threading
+import time
+
+from ValidateDocument.worker import WorkerSingleton
+
+
+def test_racing_threads_create_one_object():
+    created = []
+
+    def factory():
+        time.sleep(0.01)
+        created.append(object())
+        return created[-1]
+
+    singleton = WorkerSingleton(factory)
+    seen = []
+    threads = [threading.Thread(target=lambda: seen.append(singleton.get())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(created) == 1 and all(value is created[0] for value in seen)
+
+
+def test_set_none_drops_the_object_and_the_next_get_recreates_it():
+    dropped = []
+    singleton = WorkerSingleton(list, on_drop=dropped.append)
+    first = singleton.get()
+    singleton.set(["stub"])
+    assert singleton.get() == ["stub"] and dropped == []
+    singleton.set(None)
+    assert dropped == [["stub"]] and singleton.get() is not first
+
+
+def test_keyed_objects_are_kept_per_key_and_unconfigured_ones_not_at_all():
+    calls = []
+    singleton = WorkerSingleton(lambda key: calls.append(key) or (None if key == "off" else key.upper()))
+    assert singleton.get("a") == "A" and singleton.get("a") == "A"
+    assert singleton.get("off") is None and singleton.get("off") is None
+    assert calls == ["a", "off", "off"]
+    singleton.clear()
+    assert singleton.get("a") == "A" and calls[-1] == "a"
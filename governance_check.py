@@ -205,8 +205,8 @@ def check_prompt_injection_resilience():
     # Check if output is validated before use
     results.append({
         "check": "Output schema validation",
-        "passed": "corrected_text" in content and "changes_made" in content,
-        "detail": "Validates expected output schema from Claude",
+        "passed": "def validate_edits" in content and "changes_made" in content,
+        "detail": "Validates the edit list returned by Claude before applying it",
     })
 
     return results